@@ -2,14 +2,311 @@
 Handlers for the JupyterLab Cell Monitor extension.
 """
 
+import asyncio
+import gzip
 import json
-import tornado
+import logging
 import os
+import re
+import tornado
 from urllib.parse import urljoin
 from notebook.base.handlers import APIHandler
 from tornado.httpclient import AsyncHTTPClient, HTTPRequest
 from jupyter_server.utils import url_path_join
 import tornado.web
+from tornado.ioloop import IOLoop
+
+from .spool import EventSpool, SpoolReplayer
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# FastAPIの流量制御ヘッダー（拡張機能に転送し、送信間隔の調整に使用する）
+BACKPRESSURE_HEADERS = ('Retry-After', 'X-Ingest-Backoff-Ms')
+
+# FastAPIへの転送時の圧縮方式（gzip / zstd / none）とボディ形式（json / msgpack）
+PROXY_COMPRESSION = os.environ.get('CELL_MONITOR_PROXY_COMPRESSION', 'gzip').lower()
+PROXY_PAYLOAD_FORMAT = os.environ.get('CELL_MONITOR_PROXY_FORMAT', 'json').lower()
+
+# これより小さいボディは圧縮しない（圧縮のオーバーヘッドの方が大きいため）
+MIN_COMPRESS_BYTES = 1024
+
+# 上流バッチの集約設定: 件数（ブラウザからのリクエスト数）・サイズ・時間のいずれかでフラッシュ
+PROXY_BATCH_MAX_REQUESTS = int(os.environ.get('CELL_MONITOR_PROXY_BATCH_MAX_REQUESTS', '50'))
+PROXY_BATCH_MAX_BYTES = int(os.environ.get('CELL_MONITOR_PROXY_BATCH_MAX_BYTES', str(512 * 1024)))
+PROXY_FLUSH_INTERVAL_MS = int(os.environ.get('CELL_MONITOR_PROXY_FLUSH_INTERVAL_MS', '500'))
+# FastAPIへの同時送信数の上限
+PROXY_MAX_INFLIGHT = int(os.environ.get('CELL_MONITOR_PROXY_MAX_INFLIGHT', '4'))
+
+# 上流がバッチ全体を拒否した場合に、分割して再送するステータス（不正なボディの切り分け）
+SPLITTABLE_STATUS_CODES = (400, 413, 422)
+
+TEST_ID_PATTERN = re.compile(r'e2e_test_[a-f0-9]+_\d+')
+
+# FastAPIに到達できない間のバッチをディスクにスプールする
+PROXY_SPOOL_ENABLED = os.environ.get('CELL_MONITOR_SPOOL_ENABLED', 'true').lower() == 'true'
+
+# スプールに保存したことを示す上流応答の代わりの値
+SPOOLED = object()
+
+
+def encode_payload(raw_body, compression=None, payload_format=None):
+    """
+    FastAPIへ転送するボディとヘッダーを作成する
+
+    JSONの場合は受信したボディをそのまま使い、再シリアライズしない。
+    zstd / MessagePack のライブラリがない場合は gzip / JSON にフォールバックする。
+
+    Returns:
+        (ボディ, ヘッダー辞書)
+    """
+    compression = compression or PROXY_COMPRESSION
+    payload_format = payload_format or PROXY_PAYLOAD_FORMAT
+
+    if payload_format == 'msgpack' and msgpack is not None:
+        body = msgpack.packb(json.loads(raw_body), use_bin_type=True)
+        headers = {'Content-Type': 'application/msgpack'}
+    else:
+        body = raw_body
+        headers = {'Content-Type': 'application/json'}
+
+    if len(body) < MIN_COMPRESS_BYTES or compression == 'none':
+        return body, headers
+
+    if compression == 'zstd' and zstandard is not None:
+        body = zstandard.ZstdCompressor(level=3).compress(body)
+        headers['Content-Encoding'] = 'zstd'
+    else:
+        body = gzip.compress(body, compresslevel=5)
+        headers['Content-Encoding'] = 'gzip'
+    return body, headers
+
+
+def json_array_items(raw_body):
+    """
+    JSON配列ボディの要素部分（外側の角括弧を除いたバイト列）を返す
+
+    JSON全体を解析せずに複数リクエストの配列を連結するために使用する。
+
+    Raises:
+        ValueError: ボディがJSON配列でない場合
+    """
+    stripped = raw_body.strip()
+    if not (stripped.startswith(b'[') and stripped.endswith(b']')):
+        raise ValueError("Request body is not a JSON array")
+    return stripped[1:-1].strip()
+
+
+def create_upstream_client():
+    """
+    上流送信用のHTTPクライアントを作成
+
+    pycurl が利用可能な場合は keep-alive で接続を再利用する curl 実装を使用する。
+    いずれの実装も max_clients で同時接続数を制限する。
+    """
+    try:
+        from tornado.curl_httpclient import CurlAsyncHTTPClient
+        return CurlAsyncHTTPClient(force_instance=True, max_clients=PROXY_MAX_INFLIGHT)
+    except ImportError:
+        return AsyncHTTPClient(force_instance=True, max_clients=PROXY_MAX_INFLIGHT)
+
+
+class UpstreamBatchAggregator:
+    """
+    ノートブックサーバー上の全ユーザーのイベントを集約し、大きなバッチでFastAPIに転送する
+
+    - ブラウザからのリクエストボディ（JSON配列）を解析せずに連結
+    - 件数・サイズ・時間のいずれかでフラッシュ
+    - 同時送信数を制限し、HTTP接続を再利用
+    - 各ブラウザリクエストはバッチの上流応答を受け取る（429・エラーもそのまま伝播）
+    - 上流に到達できない・5xxの場合はディスクにスプールし、復旧後に順次再送
+    """
+
+    def __init__(
+        self,
+        target_url,
+        max_requests=PROXY_BATCH_MAX_REQUESTS,
+        max_bytes=PROXY_BATCH_MAX_BYTES,
+        flush_interval_ms=PROXY_FLUSH_INTERVAL_MS,
+        max_inflight=PROXY_MAX_INFLIGHT,
+        http_client=None,
+        spool=None,
+    ):
+        self.target_url = target_url
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval_ms / 1000
+        self.http_client = http_client
+
+        self._items = []
+        self._waiters = []
+        self._buffered_bytes = 0
+        self._flush_handle = None
+        self._semaphore = asyncio.Semaphore(max_inflight)
+
+        # スプールと再送（スプール中のバッチがある間は新しいバッチもスプールし順序を保つ）
+        self.spool = spool
+        self.replayer = SpoolReplayer(spool, self._post) if spool is not None else None
+
+        # 統計
+        self.stats = {
+            "received_requests": 0,
+            "upstream_requests": 0,
+            "split_batches": 0,
+            "upstream_errors": 0,
+        }
+
+    async def submit(self, raw_body):
+        """
+        ブラウザからのリクエストボディをバッチに追加し、上流の応答を待つ
+
+        Returns:
+            上流（FastAPI）の HTTPResponse。空配列の場合は None
+        """
+        items = json_array_items(raw_body)
+        self.stats["received_requests"] += 1
+        if not items:
+            return None
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._items.append(items)
+        self._waiters.append(waiter)
+        self._buffered_bytes += len(items)
+
+        if len(self._items) >= self.max_requests or self._buffered_bytes >= self.max_bytes:
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.flush_interval, self.flush)
+
+        return await waiter
+
+    def flush(self):
+        """バッファ中のイベントを1つのバッチとして送信開始"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._items:
+            return
+
+        items, waiters = self._items, self._waiters
+        self._items, self._waiters, self._buffered_bytes = [], [], 0
+        asyncio.ensure_future(self._send_batch(items, waiters))
+
+    async def _send_batch(self, items, waiters):
+        """バッチを送信し、結果を各ブラウザリクエストに返す"""
+        raw_body = b'[' + b','.join(items) + b']'
+
+        if self.replayer is not None and self.replayer.is_running:
+            # 再送中は新しいバッチもスプールの末尾に追加し、送信順序を保つ
+            if await self._spool_batch(raw_body):
+                self._resolve(waiters, SPOOLED)
+                return
+
+        try:
+            response = await self._post(raw_body)
+        except Exception as e:
+            self.stats["upstream_errors"] += 1
+            if await self._spool_batch(raw_body):
+                self._resolve(waiters, SPOOLED)
+                return
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+
+        if response.code >= 500 and await self._spool_batch(raw_body):
+            self.stats["upstream_errors"] += 1
+            self._resolve(waiters, SPOOLED)
+            return
+
+        # 1件の不正なボディやサイズ超過でバッチ全体が拒否された場合は分割して再送
+        if response.code in SPLITTABLE_STATUS_CODES and len(items) > 1:
+            self.stats["split_batches"] += 1
+            middle = len(items) // 2
+            await asyncio.gather(
+                self._send_batch(items[:middle], waiters[:middle]),
+                self._send_batch(items[middle:], waiters[middle:]),
+            )
+            return
+
+        if response.code >= 400:
+            self.stats["upstream_errors"] += 1
+        self._resolve(waiters, response)
+
+    @staticmethod
+    def _resolve(waiters, result):
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(result)
+
+    async def _spool_batch(self, raw_body):
+        """バッチをスプールに保存して再送を開始（スプール無効・保存失敗時は False）"""
+        if self.spool is None:
+            return False
+        try:
+            await self.spool.append(raw_body)
+        except Exception as e:
+            logger.error(f"Failed to spool cell monitor batch: {e}")
+            return False
+        self.replayer.ensure_running()
+        return True
+
+    async def _post(self, raw_body):
+        """同時送信数を制限してFastAPIにPOSTする"""
+        if self.http_client is None:
+            self.http_client = create_upstream_client()
+
+        async with self._semaphore:
+            payload, headers = encode_payload(raw_body)
+            self.stats["upstream_requests"] += 1
+            response = await self.http_client.fetch(
+                HTTPRequest(url=self.target_url, method='POST', headers=headers, body=payload),
+                raise_error=False
+            )
+
+            # 圧縮・MessagePack未対応のサーバーには非圧縮JSONで再送
+            if response.code == 415 and payload is not raw_body:
+                logger.warning("FastAPI server rejected encoded payload, resending as plain JSON")
+                self.stats["upstream_requests"] += 1
+                response = await self.http_client.fetch(
+                    HTTPRequest(
+                        url=self.target_url,
+                        method='POST',
+                        headers={'Content-Type': 'application/json'},
+                        body=raw_body
+                    ),
+                    raise_error=False
+                )
+            return response
+
+    def get_statistics(self):
+        """集約統計を取得"""
+        return {
+            **self.stats,
+            "buffered_requests": len(self._items),
+            "buffered_bytes": self._buffered_bytes,
+        }
+
+    async def get_spool_status(self):
+        """スプールの深さと再送状況を取得（スプール無効時は None）"""
+        if self.spool is None:
+            return None
+        return {
+            **self.spool.stats,
+            **(await self.spool.depth()),
+            "replaying": self.replayer.is_running,
+        }
+
 
 class CellMonitorProxyHandler(APIHandler):
     """
@@ -24,53 +321,82 @@ class CellMonitorProxyHandler(APIHandler):
     # FastAPIサーバーのURLを設定（環境変数またはデフォルト値）
     FASTAPI_SERVER_URL = os.environ.get('FASTAPI_URL', 'http://fastapi:8000')
 
+    # ノートブックサーバー内で共有する上流バッチ集約（初回リクエスト時に作成）
+    aggregator = None
+
+    @classmethod
+    def get_aggregator(cls):
+        if cls.aggregator is None:
+            cls.aggregator = UpstreamBatchAggregator(
+                urljoin(cls.FASTAPI_SERVER_URL, '/api/v1/events'),
+                spool=EventSpool() if PROXY_SPOOL_ENABLED else None,
+            )
+        return cls.aggregator
+
+    def _detect_test_id(self):
+        """テストモード時のみボディを解析し、E2EテストIDを検出する"""
+        if os.environ.get('CELL_MONITOR_TEST_MODE', 'false').lower() != 'true':
+            return None
+
+        data = json.loads(self.request.body)
+        if isinstance(data, list) and len(data) > 0 and isinstance(data[0], dict):
+            match = TEST_ID_PATTERN.search(data[0].get('code', '') or '')
+            if match:
+                self.log.info(f"Detected test ID for routing: {match.group(0)}")
+                return match.group(0)
+        return None
+
+    async def _forward_test_events(self, test_id):
+        """テスト用エンドポイントに非圧縮JSONのまま直接転送"""
+        target_url = urljoin(self.FASTAPI_SERVER_URL, f'/api/v1/test/events/{test_id}')
+        self.log.info(f"Routing to test endpoint: {target_url}")
+        return await AsyncHTTPClient().fetch(
+            HTTPRequest(
+                url=target_url,
+                method='POST',
+                headers={'Content-Type': 'application/json'},
+                body=self.request.body
+            ),
+            raise_error=False
+        )
+
     @tornado.web.authenticated
     async def post(self):
         # クライアントからのデータを取得
         try:
-            body = self.request.body.decode('utf-8')
-            data = json.loads(body)
-            self.log.info(f"Received cell execution data via proxy: {len(data)} items")
-
-            test_id = None
-            # テストモードが有効な場合のみ、テストIDの検出とルーティングを行う
-            is_test_mode = os.environ.get('CELL_MONITOR_TEST_MODE', 'false').lower() == 'true'
-
-            if is_test_mode and isinstance(data, list) and len(data) > 0:
-                first_event = data[0]
-                if isinstance(first_event, dict):
-                    code = first_event.get('code', '')
-                    if 'e2e_test_' in code:
-                        import re
-                        match = re.search(r'e2e_test_[a-f0-9]+_\d+', code)
-                        if match:
-                            test_id = match.group(0)
-                            self.log.info(f"Detected test ID for routing: {test_id}")
+            self.log.debug(f"Received cell execution data via proxy: {len(self.request.body)} bytes")
 
             # 適切なエンドポイントを選択
+            test_id = self._detect_test_id()
             if test_id:
-                # テスト用エンドポイントに送信
-                target_url = urljoin(self.FASTAPI_SERVER_URL, f'/api/v1/test/events/{test_id}')
-                self.log.info(f"Routing to test endpoint: {target_url}")
+                response = await self._forward_test_events(test_id)
             else:
-                # 通常のエンドポイントに送信
-                target_url = urljoin(self.FASTAPI_SERVER_URL, '/api/v1/events')
-                self.log.info(f"Routing to normal endpoint: {target_url}")
+                # 通常のエンドポイントには他ユーザーのイベントと集約して送信
+                response = await self.get_aggregator().submit(self.request.body)
 
-            # リクエストオブジェクトを作成
-            request = HTTPRequest(
-                url=target_url,
-                method='POST',
-                headers={'Content-Type': 'application/json'},
-                body=body
-            )
+            if response is None:
+                self.write({"status": "success", "message": "No events to send"})
+                return
+
+            if response is SPOOLED:
+                # FastAPIに到達できないためローカルに保存済み（復旧後に再送される）
+                self.set_status(202)
+                self.write({"status": "spooled", "message": "Data spooled until FastAPI server recovers"})
+                return
 
-            # 非同期HTTPクライアントでリクエストを実行
-            http_client = AsyncHTTPClient()
-            response = await http_client.fetch(request, raise_error=False)
+            # 流量制御ヘッダーをクライアントに転送
+            for header in BACKPRESSURE_HEADERS:
+                if header in response.headers:
+                    self.set_header(header, response.headers[header])
 
             # FastAPIからのレスポンスをクライアントに転送
-            if response.code >= 400:
+            if response.code == 429:
+                self.log.warning(
+                    f"FastAPI server is busy, Retry-After: {response.headers.get('Retry-After')}"
+                )
+                self.set_status(429)
+                self.write({"error": "Server is busy", "retry_after": response.headers.get('Retry-After')})
+            elif response.code >= 400:
                 self.log.error(f"Error from FastAPI server: {response.code} - {response.body}")
                 self.set_status(response.code)
                 self.write({"error": "Failed to process cell data"})
@@ -78,9 +404,14 @@ class CellMonitorProxyHandler(APIHandler):
                 if test_id:
                     self.log.info(f"Successfully proxied test data to FastAPI server (test_id: {test_id})")
                 else:
-                    self.log.info("Successfully proxied data to FastAPI server")
+                    self.log.debug("Successfully proxied data to FastAPI server")
                 self.write({"status": "success", "message": "Data sent to FastAPI server"})
 
+        except ValueError as e:
+            self.log.warning(f"Invalid cell execution data: {str(e)}")
+            self.set_status(400)
+            self.write({"error": str(e)})
+
         except Exception as e:
             self.log.error(f"Error in proxy handler: {str(e)}")
             self.set_status(500)
@@ -89,7 +420,11 @@ class CellMonitorProxyHandler(APIHandler):
     @tornado.web.authenticated
     async def get(self):
         # ヘルスチェック用エンドポイント
-        self.write({"status": "ok", "message": "Cell monitor proxy is running"})
+        status = {"status": "ok", "message": "Cell monitor proxy is running"}
+        if self.aggregator is not None:
+            status["aggregator"] = self.aggregator.get_statistics()
+            status["spool"] = await self.aggregator.get_spool_status()
+        self.write(status)
 
 
 def setup_handlers(web_app):
@@ -107,3 +442,13 @@ def setup_handlers(web_app):
 
     web_app.add_handlers(host_pattern, handlers)
     print(f"Cell Monitor: Proxy handler registered at {cell_monitor_path}")
+
+    # 前回起動時にスプールされたまま残っているバッチの再送を開始
+    if PROXY_SPOOL_ENABLED:
+        IOLoop.current().add_callback(_resume_spool_replay)
+
+
+def _resume_spool_replay():
+    aggregator = CellMonitorProxyHandler.get_aggregator()
+    if aggregator.replayer is not None:
+        aggregator.replayer.ensure_running()
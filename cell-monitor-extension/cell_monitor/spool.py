@@ -0,0 +1,304 @@
+"""
+Disk-backed spool for the Cell Monitor proxy.
+
+FastAPIサーバーに到達できない間の上流バッチをSQLite（WALモード）に追記保存し、
+復旧後に送信レートを制限しつつ指数バックオフ付きで再送します。
+再送の上限回数を超えたバッチはデッドレターテーブルに移し、後続のバッチの再送を妨げません。
+送信済みの行は削除し、定期的に空きページを解放（auto_vacuum=INCREMENTAL）して
+WALをチェックポイントし、ファイルを縮小します。
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# スプールの保存先・上限・再送レート
+SPOOL_PATH = os.environ.get('CELL_MONITOR_SPOOL_PATH')
+SPOOL_MAX_BYTES = int(os.environ.get('CELL_MONITOR_SPOOL_MAX_BYTES', str(200 * 1024 * 1024)))
+SPOOL_REPLAY_BATCHES_PER_SEC = float(os.environ.get('CELL_MONITOR_SPOOL_REPLAY_RATE', '5'))
+# 1バッチあたりの最大再送回数（サーバーがエラーを返した回数。超えたバッチはデッドレターテーブルに移す）
+SPOOL_MAX_ATTEMPTS = int(os.environ.get('CELL_MONITOR_SPOOL_MAX_ATTEMPTS', '20'))
+# デッドレターテーブルに保持する最大バッチ数（超えた分は古い順に削除）
+DEAD_LETTER_MAX_BATCHES = 1000
+
+# 再送失敗時の指数バックオフ（秒）
+REPLAY_BACKOFF_INITIAL = 1.0
+REPLAY_BACKOFF_MAX = 60.0
+
+# この件数を削除するごとに空きページを解放し、WALをチェックポイントしてファイルを縮小
+COMPACT_EVERY_ACKS = 500
+
+# 再送しても成功しない（内容に問題がある）ためスプールから破棄するステータス
+NON_RETRYABLE_STATUS_CODES = (400, 413, 415, 422)
+
+
+def default_spool_path():
+    """Jupyterのデータディレクトリ配下のスプールファイルパス"""
+    if SPOOL_PATH:
+        return SPOOL_PATH
+    try:
+        from jupyter_core.paths import jupyter_data_dir
+        base_dir = jupyter_data_dir()
+    except ImportError:
+        base_dir = os.path.expanduser('~/.local/share/jupyter')
+    return os.path.join(base_dir, 'cell_monitor', 'spool.sqlite3')
+
+
+class EventSpool:
+    """
+    上流バッチの追記型スプール（SQLite WAL）
+
+    SQLiteの操作は専用スレッドで実行し、ノートブックサーバーのイベントループを止めない。
+    """
+
+    def __init__(self, path=None, max_bytes=SPOOL_MAX_BYTES):
+        self.path = path or default_spool_path()
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cell-monitor-spool')
+        self._conn = None
+        self._acks_since_compact = 0
+
+        # 統計
+        self.stats = {
+            "spooled_batches": 0,
+            "replayed_batches": 0,
+            "dropped_batches": 0,
+            "dead_lettered_batches": 0,
+        }
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            # 削除した行の空きページをファイルから解放できるようにする（テーブル作成前に設定）
+            self._conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            if self._conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                # auto_vacuum なしで作成済みのスプールは VACUUM で変換する
+                self._conn.execute('VACUUM')
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS spool ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' created_at REAL NOT NULL,'
+                ' attempts INTEGER NOT NULL DEFAULT 0,'
+                ' payload BLOB NOT NULL)'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS dead_letter ('
+                ' id INTEGER PRIMARY KEY,'
+                ' created_at REAL NOT NULL,'
+                ' failed_at REAL NOT NULL,'
+                ' attempts INTEGER NOT NULL,'
+                ' payload BLOB NOT NULL)'
+            )
+            self._conn.commit()
+        return self._conn
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    # --- 同期処理（スプール専用スレッドで実行） ---
+
+    def _append_sync(self, payload):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT INTO spool (created_at, payload) VALUES (?, ?)',
+                (time.time(), sqlite3.Binary(payload)),
+            )
+        self._enforce_limit_sync(conn)
+
+    def _enforce_limit_sync(self, conn):
+        """上限サイズを超えた場合は古いバッチから破棄する"""
+        total = conn.execute('SELECT COALESCE(SUM(LENGTH(payload)), 0) FROM spool').fetchone()[0]
+        dropped = 0
+        while total > self.max_bytes:
+            row = conn.execute('SELECT id, LENGTH(payload) FROM spool ORDER BY id LIMIT 1').fetchone()
+            if row is None:
+                break
+            with conn:
+                conn.execute('DELETE FROM spool WHERE id = ?', (row[0],))
+            total -= row[1]
+            dropped += 1
+        if dropped:
+            self.stats["dropped_batches"] += dropped
+            logger.error(f"Cell Monitor spool exceeded {self.max_bytes} bytes, dropped {dropped} oldest batches")
+
+    def _peek_sync(self):
+        row = self._connect().execute(
+            'SELECT id, attempts, payload FROM spool ORDER BY id LIMIT 1'
+        ).fetchone()
+        return (row[0], row[1], bytes(row[2])) if row else None
+
+    def _ack_sync(self, spool_id):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM spool WHERE id = ?', (spool_id,))
+        self._acks_since_compact += 1
+        remaining = conn.execute('SELECT COUNT(*) FROM spool').fetchone()[0]
+        if self._acks_since_compact >= COMPACT_EVERY_ACKS or remaining == 0:
+            self._compact_sync(conn)
+
+    def _compact_sync(self, conn):
+        """
+        送信済み行の空きページをファイルから解放し、WALファイルを切り詰める
+
+        DELETE だけでは空きページがファイル内に残るため、incremental_vacuum で末尾から解放し、
+        その変更をチェックポイントで本体に反映してからWALを切り詰める。
+        incremental_vacuum はステップごとに1ページずつ解放するため、最後まで実行する executescript を使う。
+        """
+        conn.executescript('PRAGMA incremental_vacuum;')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self._acks_since_compact = 0
+
+    def _mark_attempt_sync(self, spool_id):
+        conn = self._connect()
+        with conn:
+            conn.execute('UPDATE spool SET attempts = attempts + 1 WHERE id = ?', (spool_id,))
+
+    def _dead_letter_sync(self, spool_id):
+        """バッチをデッドレターテーブルに移し、保持数を超えた古いバッチを削除する"""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT INTO dead_letter (id, created_at, failed_at, attempts, payload)'
+                ' SELECT id, created_at, ?, attempts, payload FROM spool WHERE id = ?',
+                (time.time(), spool_id),
+            )
+            conn.execute('DELETE FROM spool WHERE id = ?', (spool_id,))
+            conn.execute(
+                'DELETE FROM dead_letter WHERE id NOT IN'
+                ' (SELECT id FROM dead_letter ORDER BY id DESC LIMIT ?)',
+                (DEAD_LETTER_MAX_BATCHES,),
+            )
+
+    def _depth_sync(self):
+        row = self._connect().execute(
+            'SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0), MIN(created_at) FROM spool'
+        ).fetchone()
+        return {
+            "batches": row[0],
+            "bytes": row[1],
+            "oldest_age_seconds": round(time.time() - row[2], 1) if row[2] else None,
+            "dead_letter_batches": self._connect().execute('SELECT COUNT(*) FROM dead_letter').fetchone()[0],
+        }
+
+    # --- 非同期API ---
+
+    async def append(self, payload):
+        """上流バッチ（JSON配列のバイト列）をスプールに追記"""
+        await self._run(self._append_sync, payload)
+        self.stats["spooled_batches"] += 1
+
+    async def peek(self):
+        """最も古いバッチを取得（(id, 試行回数, ペイロード) または None）"""
+        return await self._run(self._peek_sync)
+
+    async def ack(self, spool_id):
+        """送信済みバッチを削除"""
+        await self._run(self._ack_sync, spool_id)
+
+    async def mark_attempt(self, spool_id):
+        """再送失敗（サーバーのエラー応答）を記録"""
+        await self._run(self._mark_attempt_sync, spool_id)
+
+    async def dead_letter(self, spool_id):
+        """再送の上限回数を超えたバッチをデッドレターテーブルに移す"""
+        await self._run(self._dead_letter_sync, spool_id)
+        self.stats["dead_lettered_batches"] += 1
+
+    async def depth(self):
+        """スプール中のバッチ数・サイズ・最古バッチの経過時間"""
+        return await self._run(self._depth_sync)
+
+
+class SpoolReplayer:
+    """スプールしたバッチをレート制限と指数バックオフ付きで再送する"""
+
+    def __init__(self, spool, send, rate=SPOOL_REPLAY_BATCHES_PER_SEC, max_attempts=SPOOL_MAX_ATTEMPTS):
+        """
+        Args:
+            spool: EventSpool
+            send: ペイロードを上流に送信し HTTPResponse を返すコルーチン関数
+            rate: 1秒あたりの最大再送バッチ数
+            max_attempts: 1バッチあたりの最大再送回数
+        """
+        self.spool = spool
+        self.send = send
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.max_attempts = max_attempts
+        self._task = None
+        self._backoff = REPLAY_BACKOFF_INITIAL
+
+    @property
+    def is_running(self):
+        return self._task is not None and not self._task.done()
+
+    def ensure_running(self):
+        """再送タスクが動いていなければ開始"""
+        if not self.is_running:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                entry = await self.spool.peek()
+            except Exception as e:
+                logger.error(f"Failed to read cell monitor spool: {e}")
+                await asyncio.sleep(REPLAY_BACKOFF_MAX)
+                continue
+            if entry is None:
+                logger.info("Cell Monitor spool drained")
+                return
+
+            spool_id, attempts, payload = entry
+            try:
+                response = await self.send(payload)
+            except Exception as e:
+                # サーバーに到達できない間はバッチの問題ではないため、試行回数に数えない
+                logger.warning(f"Spool replay failed: {e}")
+                await self._wait_backoff()
+                continue
+
+            if response.code < 400 or response.code in NON_RETRYABLE_STATUS_CODES:
+                if response.code >= 400:
+                    self.spool.stats["dropped_batches"] += 1
+                    logger.error(f"Spooled batch {spool_id} rejected by server ({response.code}), dropped")
+                else:
+                    self.spool.stats["replayed_batches"] += 1
+                await self.spool.ack(spool_id)
+                self._backoff = REPLAY_BACKOFF_INITIAL
+                await asyncio.sleep(self.interval)
+            elif response.code == 429:
+                await asyncio.sleep(self._retry_after(response))
+            else:
+                logger.warning(f"Spool replay got {response.code} (attempt {attempts + 1})")
+                await self._retry_later(spool_id, attempts)
+
+    def _retry_after(self, response):
+        """429応答の Retry-After（秒）。解釈できない場合は現在のバックオフ"""
+        try:
+            return float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            return self._backoff
+
+    async def _retry_later(self, spool_id, attempts):
+        if attempts + 1 >= self.max_attempts:
+            # 再送を続けても成功しないバッチで後続のバッチが止まらないよう、デッドレターに移す
+            logger.error(f"Spooled batch {spool_id} failed {attempts + 1} times, moved to dead letter")
+            await self.spool.dead_letter(spool_id)
+            self._backoff = REPLAY_BACKOFF_INITIAL
+            return
+        await self.spool.mark_attempt(spool_id)
+        await self._wait_backoff()
+
+    async def _wait_backoff(self):
+        await asyncio.sleep(self._backoff)
+        self._backoff = min(self._backoff * 2, REPLAY_BACKOFF_MAX)
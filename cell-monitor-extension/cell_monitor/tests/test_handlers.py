@@ -0,0 +1,160 @@
+"""
+上流バッチ集約のテスト
+
+UpstreamBatchAggregator のブラウザリクエストの連結と件数・時間によるフラッシュ、
+バッチ全体を拒否された場合の分割再送、上流障害時のスプール、
+各ブラウザリクエストへの応答の受け渡しをテストします。
+"""
+
+import asyncio
+import json
+
+import pytest
+from tornado.httpclient import HTTPResponse
+
+from cell_monitor.handlers import SPOOLED, UpstreamBatchAggregator
+
+
+class FakeHTTPClient:
+    """送信されたボディを記録し、respond(イベントのリスト) の戻り値を応答するHTTPクライアント"""
+
+    def __init__(self, respond=lambda events: 200):
+        self.respond = respond
+        self.bodies = []
+
+    async def fetch(self, request, raise_error=True):
+        self.bodies.append(request.body)
+        result = self.respond(json.loads(request.body))
+        if isinstance(result, Exception):
+            raise result
+        return HTTPResponse(request, result)
+
+
+class FakeSpool:
+    """追記されたバッチを記録するスプール（再送対象は常に空）"""
+
+    def __init__(self):
+        self.appended = []
+
+    async def append(self, payload):
+        self.appended.append(payload)
+
+    async def peek(self):
+        return None
+
+
+def _body(*events):
+    return json.dumps(list(events)).encode()
+
+
+def _aggregator(client, **kwargs):
+    options = {"max_requests": 10, "flush_interval_ms": 10, "max_inflight": 2}
+    options.update(kwargs)
+    return UpstreamBatchAggregator("http://fastapi/api/v1/events", http_client=client, **options)
+
+
+class TestUpstreamBatchAggregator:
+    """UpstreamBatchAggregatorクラスのテストケース"""
+
+    async def test_concatenates_requests_into_one_batch(self):
+        """複数のブラウザリクエストを1回のPOSTに連結し、全員に同じ応答を返すかテスト"""
+        client = FakeHTTPClient()
+        aggregator = _aggregator(client)
+
+        responses = await asyncio.gather(
+            aggregator.submit(_body({"id": 1}, {"id": 2})),
+            aggregator.submit(_body({"id": 3})),
+        )
+
+        assert [json.loads(body) for body in client.bodies] == [[{"id": 1}, {"id": 2}, {"id": 3}]]
+        assert responses[0] is responses[1]
+        assert responses[0].code == 200
+        assert aggregator.get_statistics()["upstream_requests"] == 1
+
+    async def test_flushes_when_request_limit_reached(self):
+        """件数の上限に達した場合はフラッシュ間隔を待たずに送信するかテスト"""
+        client = FakeHTTPClient()
+        aggregator = _aggregator(client, max_requests=2, flush_interval_ms=60000)
+
+        await asyncio.wait_for(
+            asyncio.gather(aggregator.submit(_body({"id": 1})), aggregator.submit(_body({"id": 2}))),
+            timeout=1,
+        )
+
+        assert len(client.bodies) == 1
+
+    async def test_empty_array_is_not_sent(self):
+        """空配列のリクエストは送信せずに None を返すかテスト"""
+        client = FakeHTTPClient()
+        aggregator = _aggregator(client)
+
+        assert await aggregator.submit(b"[]") is None
+        assert client.bodies == []
+
+    @pytest.mark.parametrize("status", [400, 413, 422])
+    async def test_bisects_rejected_batch(self, status):
+        """バッチ全体が拒否された場合は分割して再送し、不正なリクエストのみにエラーを返すかテスト"""
+        client = FakeHTTPClient(
+            lambda events: status if any(event.get("bad") for event in events) else 200
+        )
+        aggregator = _aggregator(client)
+
+        responses = await asyncio.gather(
+            aggregator.submit(_body({"id": 1})),
+            aggregator.submit(_body({"id": 2, "bad": True})),
+            aggregator.submit(_body({"id": 3})),
+        )
+
+        assert [response.code for response in responses] == [200, status, 200]
+        assert aggregator.stats["split_batches"] >= 1
+        # 正常なイベントはすべて送信されている
+        accepted = [json.loads(body) for body in client.bodies]
+        assert [{"id": 1}] in accepted and [{"id": 3}] in accepted
+
+    async def test_single_rejected_request_is_not_split(self):
+        """1リクエストのみのバッチが拒否された場合は分割せずにエラーを返すかテスト"""
+        client = FakeHTTPClient(lambda events: 422)
+        aggregator = _aggregator(client)
+
+        response = await aggregator.submit(_body({"id": 1}, {"id": 2}))
+
+        assert response.code == 422
+        assert len(client.bodies) == 1
+        assert aggregator.stats["split_batches"] == 0
+        assert aggregator.stats["upstream_errors"] == 1
+
+    @pytest.mark.parametrize("failure", [503, ConnectionRefusedError("down")])
+    async def test_spools_on_server_error_or_exception(self, failure):
+        """5xx・接続エラーの場合はバッチをスプールして SPOOLED を返すかテスト"""
+        client = FakeHTTPClient(lambda events: failure)
+        spool = FakeSpool()
+        aggregator = _aggregator(client, spool=spool)
+
+        responses = await asyncio.gather(
+            aggregator.submit(_body({"id": 1})), aggregator.submit(_body({"id": 2}))
+        )
+
+        assert responses == [SPOOLED, SPOOLED]
+        assert [json.loads(payload) for payload in spool.appended] == [[{"id": 1}, {"id": 2}]]
+        assert aggregator.stats["upstream_errors"] == 1
+
+    async def test_propagates_failure_without_spool(self):
+        """スプールが無効な場合は5xx応答・例外をそのままブラウザリクエストに返すかテスト"""
+        aggregator = _aggregator(FakeHTTPClient(lambda events: 503))
+        assert (await aggregator.submit(_body({"id": 1}))).code == 503
+
+        aggregator = _aggregator(FakeHTTPClient(lambda events: ConnectionRefusedError("down")))
+        with pytest.raises(ConnectionRefusedError):
+            await aggregator.submit(_body({"id": 1}))
+
+    async def test_spools_new_batches_while_replaying(self):
+        """スプールの再送中は順序を保つため新しいバッチも送信せずにスプールするかテスト"""
+        client = FakeHTTPClient()
+        spool = FakeSpool()
+        aggregator = _aggregator(client, spool=spool)
+        aggregator.replayer._task = asyncio.get_running_loop().create_future()
+
+        assert await aggregator.submit(_body({"id": 1})) is SPOOLED
+        assert client.bodies == []
+        assert len(spool.appended) == 1
+        aggregator.replayer._task.cancel()
@@ -0,0 +1,198 @@
+"""
+スプールと再送のテスト
+
+EventSpool の追記・ACK・上限サイズを超えた場合の古いバッチの破棄と、
+送信済み行の削除後にファイルが縮小されること、
+SpoolReplayer の再送・429応答の Retry-After・再送不可のステータスでの破棄と、
+再送の上限回数を超えたバッチのデッドレターへの移動をテストします。
+"""
+
+import asyncio
+import os
+import sqlite3
+import time
+
+import pytest
+from tornado.httpclient import HTTPRequest, HTTPResponse
+
+from cell_monitor.spool import EventSpool, SpoolReplayer
+
+
+def _response(code, headers=None):
+    return HTTPResponse(HTTPRequest("http://fastapi/api/v1/events"), code, headers=headers)
+
+
+class FakeSender:
+    """送信されたペイロードと送信時の試行回数を記録し、用意した応答を順に返す"""
+
+    def __init__(self, spool, *responses):
+        self.spool = spool
+        self.responses = list(responses)
+        self.sent = []
+
+    async def __call__(self, payload):
+        entry = await self.spool.peek()
+        self.sent.append((payload, entry[1], time.monotonic()))
+        return self.responses.pop(0) if self.responses else _response(200)
+
+
+async def _replay(spool, send, **kwargs):
+    replayer = SpoolReplayer(spool, send, rate=0, **kwargs)
+    replayer._backoff = 0.01
+    replayer.ensure_running()
+    await asyncio.wait_for(replayer._task, timeout=5)
+    return replayer
+
+
+class TestEventSpool:
+    """EventSpoolクラスのテストケース"""
+
+    async def test_appends_and_acks_in_order(self, tmp_path):
+        """古い順に取り出し、ACKしたバッチが削除されるかテスト"""
+        spool = EventSpool(str(tmp_path / "spool.sqlite3"))
+        await spool.append(b'[{"id": 1}]')
+        await spool.append(b'[{"id": 2}]')
+
+        spool_id, attempts, payload = await spool.peek()
+        assert (attempts, payload) == (0, b'[{"id": 1}]')
+        await spool.mark_attempt(spool_id)
+        assert (await spool.peek())[1] == 1
+
+        await spool.ack(spool_id)
+        assert (await spool.peek())[2] == b'[{"id": 2}]'
+        assert (await spool.depth())["batches"] == 1
+        assert spool.stats["spooled_batches"] == 2
+
+    async def test_evicts_oldest_batches_over_size_cap(self, tmp_path):
+        """上限サイズを超えた場合は古いバッチから破棄するかテスト"""
+        spool = EventSpool(str(tmp_path / "spool.sqlite3"), max_bytes=250)
+        for index in range(3):
+            await spool.append(bytes([index]) * 100)
+
+        depth = await spool.depth()
+        assert depth["batches"] == 2
+        assert depth["bytes"] == 200
+        assert (await spool.peek())[2] == bytes([1]) * 100
+        assert spool.stats["dropped_batches"] == 1
+
+    async def test_file_shrinks_after_drain(self, tmp_path):
+        """送信済み行を削除した後、本体ファイルとWALが縮小されるかテスト"""
+        path = str(tmp_path / "spool.sqlite3")
+        spool = EventSpool(path)
+        for _ in range(40):
+            await spool.append(os.urandom(64 * 1024))
+        await spool.depth()
+        spool._connect().execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        full_size = os.path.getsize(path)
+
+        while (entry := await spool.peek()) is not None:
+            await spool.ack(entry[0])
+
+        assert os.path.getsize(path) < full_size / 10
+        assert os.path.getsize(path + "-wal") == 0
+
+    async def test_converts_existing_spool_to_incremental_vacuum(self, tmp_path):
+        """auto_vacuum なしで作成済みのスプールを変換し、既存のバッチを保持するかテスト"""
+        path = str(tmp_path / "spool.sqlite3")
+        conn = sqlite3.connect(path)
+        conn.execute(
+            'CREATE TABLE spool (id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL,'
+            ' attempts INTEGER NOT NULL DEFAULT 0, payload BLOB NOT NULL)'
+        )
+        conn.execute("INSERT INTO spool (created_at, payload) VALUES (?, ?)", (time.time(), b"[1]"))
+        conn.commit()
+        conn.close()
+
+        spool = EventSpool(path)
+
+        assert (await spool.peek())[2] == b"[1]"
+        assert spool._connect().execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+
+
+class TestSpoolReplayer:
+    """SpoolReplayerクラスのテストケース"""
+
+    async def test_replays_all_batches_and_acks(self, tmp_path):
+        """スプール中のバッチを古い順に再送し、成功したバッチを削除するかテスト"""
+        spool = EventSpool(str(tmp_path / "spool.sqlite3"))
+        await spool.append(b"[1]")
+        await spool.append(b"[2]")
+        send = FakeSender(spool)
+
+        await _replay(spool, send)
+
+        assert [payload for payload, _, _ in send.sent] == [b"[1]", b"[2]"]
+        assert await spool.peek() is None
+        assert spool.stats["replayed_batches"] == 2
+
+    async def test_waits_retry_after_on_429(self, tmp_path):
+        """429応答の場合は試行回数を増やさず Retry-After の秒数だけ待って再送するかテスト"""
+        spool = EventSpool(str(tmp_path / "spool.sqlite3"))
+        await spool.append(b"[1]")
+        send = FakeSender(spool, _response(429, {"Retry-After": "0.2"}))
+
+        await _replay(spool, send)
+
+        (_, first_attempts, first_at), (_, second_attempts, second_at) = send.sent
+        assert second_at - first_at >= 0.2
+        assert first_attempts == second_attempts == 0
+        assert spool.stats["replayed_batches"] == 1
+
+    async def test_retries_server_errors_with_backoff(self, tmp_path):
+        """5xx応答の場合は試行回数を記録して再送するかテスト"""
+        spool = EventSpool(str(tmp_path / "spool.sqlite3"))
+        await spool.append(b"[1]")
+        send = FakeSender(spool, _response(503))
+
+        await _replay(spool, send)
+
+        assert [attempts for _, attempts, _ in send.sent] == [0, 1]
+        assert await spool.peek() is None
+
+    @pytest.mark.parametrize("status", [400, 413, 415, 422])
+    async def test_drops_non_retryable_batches(self, tmp_path, status):
+        """再送しても成功しないステータスの場合はバッチを破棄して次に進むかテスト"""
+        spool = EventSpool(str(tmp_path / "spool.sqlite3"))
+        await spool.append(b"[1]")
+        await spool.append(b"[2]")
+        send = FakeSender(spool, _response(status))
+
+        await _replay(spool, send)
+
+        assert [payload for payload, _, _ in send.sent] == [b"[1]", b"[2]"]
+        assert await spool.peek() is None
+        assert spool.stats["dropped_batches"] == 1
+        assert spool.stats["replayed_batches"] == 1
+
+    async def test_moves_batch_to_dead_letter_after_max_attempts(self, tmp_path):
+        """5xx応答が上限回数続いたバッチはデッドレターに移し、後続のバッチを再送するかテスト"""
+        spool = EventSpool(str(tmp_path / "spool.sqlite3"))
+        await spool.append(b"[1]")
+        await spool.append(b"[2]")
+        send = FakeSender(spool, _response(500), _response(500), _response(500))
+
+        await _replay(spool, send, max_attempts=3)
+
+        assert [payload for payload, _, _ in send.sent] == [b"[1]"] * 3 + [b"[2]"]
+        assert await spool.peek() is None
+        assert (await spool.depth())["dead_letter_batches"] == 1
+        dead = spool._connect().execute("SELECT attempts, payload FROM dead_letter").fetchall()
+        assert [(attempts, bytes(payload)) for attempts, payload in dead] == [(2, b"[1]")]
+        assert spool.stats["dead_lettered_batches"] == 1
+        assert spool.stats["replayed_batches"] == 1
+
+    async def test_unreachable_server_does_not_count_attempts(self, tmp_path):
+        """サーバーに到達できない間の再送失敗は試行回数に数えないかテスト"""
+        spool = EventSpool(str(tmp_path / "spool.sqlite3"))
+        await spool.append(b"[1]")
+        failures = [ConnectionError("refused")] * 3
+
+        async def send(payload):
+            if failures:
+                raise failures.pop()
+            return _response(200)
+
+        await _replay(spool, send, max_attempts=2)
+
+        assert (await spool.depth())["dead_letter_batches"] == 0
+        assert spool.stats["replayed_batches"] == 1
@@ -169,7 +169,27 @@ export class DataTransmissionService {
     while (retries <= maxRetries) {
       try {
         // Phase 2.1: 接続プール付きaxiosインスタンスを使用
-        await this.axiosInstance.post(serverUrl, data);
+        const response = await this.axiosInstance.post(serverUrl, data);
+
+        // サーバー過負荷（429）: Retry-After 待機後に再送し、以降の送信間隔も広げる
+        if (response.status === 429) {
+          const retryAfterMs = this.getRetryAfterMs(response.headers);
+          this.loadDistributionService.applyBackpressure(retryAfterMs);
+          if (retries >= maxRetries) {
+            handleDataTransmissionError(
+              new Error('Server is busy (429)'),
+              'Progress data transmission - max retries exceeded',
+              { eventCount: data.length, retryAttempt: retries }
+            );
+            break;
+          }
+          this.logger.warn('Server is busy, retrying later', { retryAfterMs, eventCount: data.length });
+          await new Promise(resolve => setTimeout(resolve, retryAfterMs));
+          retries++;
+          continue;
+        }
+
+        this.updateBackpressure(response.headers);
         this.logger.info('Student progress data sent successfully', { eventCount: data.length });
 
         if (data.length > 0 && showNotifications) {
@@ -203,6 +223,26 @@ export class DataTransmissionService {
     }
   }
 
+  /**
+   * 429応答の Retry-After（秒）をミリ秒に変換（未指定時は5秒）
+   */
+  private getRetryAfterMs(headers: any): number {
+    const retryAfter = Number(headers?.['retry-after']);
+    return Number.isFinite(retryAfter) && retryAfter > 0 ? retryAfter * 1000 : 5000;
+  }
+
+  /**
+   * 成功応答の流量制御ヒントを送信間隔に反映
+   */
+  private updateBackpressure(headers: any): void {
+    const backoffMs = Number(headers?.['x-ingest-backoff-ms']);
+    if (Number.isFinite(backoffMs) && backoffMs > 0) {
+      this.loadDistributionService.applyBackpressure(backoffMs);
+    } else {
+      this.loadDistributionService.relaxBackpressure();
+    }
+  }
+
   /**
    * レガシーセル実行データを送信（後方互換性のため）
    */
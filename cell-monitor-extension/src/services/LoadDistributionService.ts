@@ -7,8 +7,13 @@ import { SettingsManager } from '../core/SettingsManager';
 import { IStudentProgressData } from '../types/interfaces';
 import { createLogger } from '../utils/logger';
 
+// サーバーの流量制御ヒントによる追加遅延の上限（ミリ秒）
+const MAX_BACKPRESSURE_DELAY_MS = 60000;
+
 export class LoadDistributionService {
   private logger = createLogger('LoadDistributionService');
+  // サーバーの流量制御ヒントに基づく追加遅延（送信間隔の拡大）
+  private backpressureDelayMs = 0;
 
   constructor(_settingsManager: SettingsManager) {
     // settingsManagerは将来の拡張で使用予定
@@ -30,20 +35,56 @@ export class LoadDistributionService {
     const combinedSeed = `${userEmail}-${cellId}-${Math.floor(timestamp/1000)}`;
     const dynamicHash = this.hashString(combinedSeed);
     const baseDelay = (dynamicHash % 2000) + 200; // 0.2-2.2秒で動的変動
+    const totalDelay = baseDelay + this.backpressureDelayMs;
     
     this.logger.debug('Load distribution delay calculated', {
       userEmail: userEmail.substring(0, 5) + '***', // プライバシー保護
-      delay: baseDelay,
+      delay: totalDelay,
+      backpressureDelay: this.backpressureDelayMs,
       eventCount: data.length
     });
 
     // 遅延実行
-    await new Promise(resolve => setTimeout(resolve, baseDelay));
+    await new Promise(resolve => setTimeout(resolve, totalDelay));
     
     // 既存の送信機能を実行（指数バックオフ付き）
     await originalSendFunction(data);
   }
 
+  /**
+   * サーバーの流量制御ヒント（X-Ingest-Backoff-Ms / Retry-After）を反映し送信間隔を広げる
+   */
+  applyBackpressure(hintMs: number): void {
+    if (!Number.isFinite(hintMs) || hintMs <= 0) return;
+
+    this.backpressureDelayMs = Math.min(
+      MAX_BACKPRESSURE_DELAY_MS,
+      Math.max(this.backpressureDelayMs, hintMs)
+    );
+    this.logger.info('Server backpressure applied', {
+      backpressureDelay: this.backpressureDelayMs
+    });
+  }
+
+  /**
+   * ヒントのない応答を受けたら追加遅延を段階的に縮める
+   */
+  relaxBackpressure(): void {
+    if (this.backpressureDelayMs === 0) return;
+
+    this.backpressureDelayMs = this.backpressureDelayMs < 200 ? 0 : Math.floor(this.backpressureDelayMs / 2);
+    this.logger.debug('Server backpressure relaxed', {
+      backpressureDelay: this.backpressureDelayMs
+    });
+  }
+
+  /**
+   * 現在の追加遅延（ミリ秒）
+   */
+  getBackpressureDelay(): number {
+    return this.backpressureDelayMs;
+  }
+
   /**
    * 文字列ハッシュ関数（一意性確保）
    */
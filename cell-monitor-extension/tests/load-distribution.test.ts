@@ -210,4 +210,29 @@ describe('LoadDistributionService', () => {
       expect(maxDelay - minDelay).toBeGreaterThan(100); // 最低100ms の差
     });
   });
-});
\ No newline at end of file
+
+  describe('backpressure', () => {
+    it('should grow delay from server hint and cap it', () => {
+      loadDistributionService.applyBackpressure(3000);
+      expect(loadDistributionService.getBackpressureDelay()).toBe(3000);
+
+      // 小さいヒントでは縮めない
+      loadDistributionService.applyBackpressure(1000);
+      expect(loadDistributionService.getBackpressureDelay()).toBe(3000);
+
+      loadDistributionService.applyBackpressure(120000);
+      expect(loadDistributionService.getBackpressureDelay()).toBe(60000);
+    });
+
+    it('should relax delay gradually without hints', () => {
+      loadDistributionService.applyBackpressure(400);
+
+      loadDistributionService.relaxBackpressure();
+      expect(loadDistributionService.getBackpressureDelay()).toBe(200);
+
+      loadDistributionService.relaxBackpressure();
+      loadDistributionService.relaxBackpressure();
+      expect(loadDistributionService.getBackpressureDelay()).toBe(0);
+    });
+  });
+});
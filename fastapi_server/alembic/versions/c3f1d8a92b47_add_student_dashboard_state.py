@@ -0,0 +1,114 @@
+"""Add student dashboard state
+
+Revision ID: c3f1d8a92b47
+Revises: a40bf42ecebf
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c3f1d8a92b47"
+down_revision: Union[str, None] = "a40bf42ecebf"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "student_dashboard_state",
+        sa.Column("student_id", sa.Integer(), nullable=False),
+        sa.Column("cell_executions", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("error_count", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("last_notebook_path", sa.String(), nullable=True),
+        sa.Column("last_activity_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("latest_session_start", sa.DateTime(timezone=True), nullable=True),
+        sa.Column(
+            "significant_error_cells",
+            postgresql.JSONB(astext_type=sa.Text()),
+            server_default="{}",
+            nullable=False,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.ForeignKeyConstraint(
+            ["student_id"],
+            ["students.id"],
+        ),
+        sa.PrimaryKeyConstraint("student_id"),
+    )
+
+    # 既存の実行履歴・セッションから集計を作成
+    from sqlalchemy import text
+
+    connection = op.get_bind()
+    connection.execute(
+        text(
+            """
+        INSERT INTO student_dashboard_state (
+            student_id, cell_executions, error_count, last_notebook_path,
+            last_activity_at, latest_session_start, significant_error_cells
+        )
+        SELECT
+            s.id,
+            COALESCE(ce.cell_executions, 0),
+            COALESCE(ce.error_count, 0),
+            last_nb.path,
+            ce.last_activity_at,
+            ss.latest_session_start,
+            COALESCE(sig.cells, '{}'::jsonb)
+        FROM students s
+        LEFT JOIN (
+            SELECT student_id,
+                   COUNT(*) AS cell_executions,
+                   SUM(CASE WHEN status = 'error' THEN 1 ELSE 0 END) AS error_count,
+                   MAX(executed_at) AS last_activity_at
+            FROM cell_executions
+            GROUP BY student_id
+        ) ce ON ce.student_id = s.id
+        LEFT JOIN (
+            SELECT DISTINCT ON (e.student_id) e.student_id, n.path
+            FROM cell_executions e
+            JOIN notebooks n ON n.id = e.notebook_id
+            ORDER BY e.student_id, e.executed_at DESC
+        ) last_nb ON last_nb.student_id = s.id
+        LEFT JOIN (
+            SELECT student_id, MAX(start_time) AS latest_session_start
+            FROM sessions
+            GROUP BY student_id
+        ) ss ON ss.student_id = s.id
+        LEFT JOIN (
+            SELECT latest.student_id,
+                   jsonb_object_agg(
+                       latest.cell_id::text,
+                       jsonb_build_object(
+                           'consecutive_count', latest.consecutive_error_count,
+                           'last_error_time', latest.executed_at
+                       )
+                   ) AS cells
+            FROM (
+                SELECT DISTINCT ON (student_id, cell_id)
+                       student_id, cell_id, consecutive_error_count, executed_at
+                FROM cell_executions
+                WHERE is_significant_error = true
+                ORDER BY student_id, cell_id, executed_at DESC
+            ) latest
+            GROUP BY latest.student_id
+        ) sig ON sig.student_id = s.id
+    """
+        )
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("student_dashboard_state")
@@ -0,0 +1,86 @@
+"""Add cell and active session unique indexes
+
+Revision ID: e7b4c2d9f015
+Revises: c3f1d8a92b47
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e7b4c2d9f015"
+down_revision: Union[str, None] = "c3f1d8a92b47"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    from sqlalchemy import text
+
+    connection = op.get_bind()
+
+    # 同じ (notebook_id, cell_id) の重複セルを最小IDのセルに統合
+    connection.execute(
+        text(
+            """
+            WITH canonical AS (
+                SELECT id, MIN(id) OVER (PARTITION BY notebook_id, cell_id) AS keep_id
+                FROM cells
+            )
+            UPDATE cell_executions e
+            SET cell_id = canonical.keep_id
+            FROM canonical
+            WHERE e.cell_id = canonical.id AND canonical.id <> canonical.keep_id
+            """
+        )
+    )
+    connection.execute(
+        text(
+            """
+            DELETE FROM cells c
+            USING cells keep
+            WHERE keep.notebook_id = c.notebook_id
+              AND keep.cell_id = c.cell_id
+              AND keep.id < c.id
+            """
+        )
+    )
+
+    # 学生ごとに複数あるアクティブセッションは最小ID以外を終了させる
+    connection.execute(
+        text(
+            """
+            UPDATE sessions s
+            SET is_active = false, end_time = now()
+            FROM sessions keep
+            WHERE keep.student_id = s.student_id
+              AND keep.is_active = true AND keep.end_time IS NULL
+              AND s.is_active = true AND s.end_time IS NULL
+              AND keep.id < s.id
+            """
+        )
+    )
+
+    op.create_index(
+        "uq_cells_notebook_id_cell_id",
+        "cells",
+        ["notebook_id", "cell_id"],
+        unique=True,
+    )
+    op.create_index(
+        "uq_sessions_active_student_id",
+        "sessions",
+        ["student_id"],
+        unique=True,
+        postgresql_where=sa.text("is_active = true AND end_time IS NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("uq_sessions_active_student_id", table_name="sessions")
+    op.drop_index("uq_cells_notebook_id_cell_id", table_name="cells")
@@ -1,12 +1,12 @@
 """
 管理者用API
 
-連続エラー検出システムの設定管理を提供
+連続エラー検出システムの設定管理と、失敗イベントのデッドレター管理を提供
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import Any
+from typing import Any, List, Optional
 from pydantic import BaseModel
 
 from db.session import get_db
@@ -16,6 +16,7 @@ from crud.crud_settings import (
     get_all_settings,
     create_setting
 )
+from core.retry_queue import event_retry_queue
 
 router = APIRouter()
 
@@ -33,6 +34,11 @@ class CreateSettingRequest(BaseModel):
     description: str = None
 
 
+class ReplayDeadLettersRequest(BaseModel):
+    """デッドレター再投入リクエスト（ids 省略時は全件）"""
+    ids: Optional[List[str]] = None
+
+
 @router.get("/settings")
 async def get_all_system_settings(db: Session = Depends(get_db)):
     """全設定値を取得"""
@@ -132,4 +138,33 @@ async def get_consecutive_error_status(db: Session = Depends(get_db)):
         "error_detection_enabled": enabled,
         "cache_ttl_seconds": cache_ttl,
         "status": "active" if enabled else "disabled"
-    }
\ No newline at end of file
+    }
+
+
+@router.get("/retry-queue")
+async def get_retry_queue_status():
+    """遅延リトライ待ち件数とデッドレター件数を取得"""
+    try:
+        return await event_retry_queue.get_statistics()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"リトライキューを参照できません: {str(e)}")
+
+
+@router.get("/dead-letters")
+async def get_dead_letters(count: int = Query(50, ge=1, le=1000)):
+    """最大試行回数を超えて処理に失敗したイベントを新しい順に取得"""
+    try:
+        dead_letters = await event_retry_queue.list_dead_letters(count=count)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"デッドレターを参照できません: {str(e)}")
+    return {"count": len(dead_letters), "dead_letters": dead_letters}
+
+
+@router.post("/dead-letters/replay")
+async def replay_dead_letters(request: ReplayDeadLettersRequest):
+    """デッドレターを遅延リトライキューに再投入（ワーカーが次回の取り出しで再処理）"""
+    try:
+        replayed = await event_retry_queue.replay_dead_letters(request.ids)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"デッドレターを再投入できません: {str(e)}")
+    return {"message": f"{replayed} 件のイベントを再投入しました", "replayed": replayed}
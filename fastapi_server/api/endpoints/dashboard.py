@@ -1,10 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+from datetime import datetime, timedelta, timezone
 
 from db.session import get_db
+from db.executor import run_db, run_influx, run_redis
 from crud import crud_student, crud_execution, crud_notebook
+from crud.crud_dashboard_version import DashboardChanges, dashboard_version_index
+from crud.crud_help_state import HELP_STOP, help_state_index
+from core.influx_query_cache import aligned_now, influx_query_cache, window_ttl
+from core.influxdb_batch_writer import batch_writer
+from core.influx_rollup import choose_available_rollup
 from schemas.progress import StudentProgress
 from influxdb_client import InfluxDBClient
 
@@ -13,76 +21,45 @@ router = APIRouter()
 
 @router.get("/overview")
 async def get_dashboard_overview(
+    request: Request,
     time_range: str = Query("1h", description="Time range for metrics (1h, 24h, 7d)"),
+    since: Optional[int] = Query(
+        None, description="Return only students changed after this dashboard version"
+    ),
     db: Session = Depends(get_db),
 ):
     """
     Get dashboard overview with student activities, metrics, and activity chart
+
+    With ``since``, only the students changed after that version and the metrics that
+    changed are returned (no activity chart). 304 is returned when nothing changed,
+    and in both modes when ``If-None-Match`` matches the current ETag.
+    The full response falls back when the version is unknown or too old.
+    Its ETag also carries ``time_range`` and the activity chart cache slot, because
+    the chart and ``helpCount`` change with time without bumping the version.
     """
     try:
-        # Get active students from PostgreSQL
-        students_data = crud_student.get_active_students_with_sessions(db)
-
-        # Transform to dashboard format
-        students = []
-        for student_data in students_data:
-            # Get latest session info (safely handle None case)
-            latest_session = student_data.get("latest_session") or {}
-
-            # Get consecutive error information for the student
-            consecutive_error_info = crud_execution.get_student_consecutive_error_info(
-                db, student_data["id"]
-            )
-
-            # Determine status - help takes priority, then significant errors
-            if student_data.get("is_requesting_help", False):
-                status = "help"
-            elif consecutive_error_info.get("has_significant_error", False):
-                status = "significant_error"
-            else:
-                status = determine_student_status(latest_session)
-
-            students.append(
-                {
-                    "emailAddress": student_data["email"],
-                    "userName": student_data.get(
-                        "name", student_data["email"].split("@")[0]
-                    ),
-                    "teamName": student_data.get(
-                        "team_name", "未割り当て"
-                    ),  # チーム名を追加
-                    "currentNotebook": latest_session.get("notebook_path", "なし"),
-                    "lastActivity": format_last_activity(
-                        latest_session.get("updated_at")
-                    ),
-                    "status": status,
-                    "isRequestingHelp": student_data.get("is_requesting_help", False),
-                    "cellExecutions": latest_session.get("cell_executions", 0),
-                    "errorCount": latest_session.get("error_count", 0),
-                    # 連続エラー検出情報を追加
-                    "consecutiveErrorCount": consecutive_error_info.get("consecutive_count", 0),
-                    "hasSignificantError": consecutive_error_info.get("has_significant_error", False),
-                    "significantErrorCells": consecutive_error_info.get("error_cells", []),
-                }
-            )
-
-        # Calculate metrics
-        total_students = len(students)
-        total_active = len([s for s in students if s["status"] == "active"])
-        # 有意なエラーのみカウント（連続エラー検出対応）
-        significant_error_count = len([s for s in students if s["status"] == "significant_error"])
-        # 従来のエラーカウント（後方互換性のため）
-        error_count = len([s for s in students if s["status"] in ["error", "significant_error"]])
-        total_executions = sum(s["cellExecutions"] for s in students)
+        changes = await run_redis(dashboard_version_index.get_changes, since)
+        headers = {}
+        if changes is not None:
+            if_none_match = request.headers.get("if-none-match")
+            if since is not None and changes.student_ids is not None:
+                headers["ETag"] = f'W/"{changes.version}"'
+                if not changes.student_ids or _etag_matches(
+                    if_none_match, headers["ETag"]
+                ):
+                    return Response(status_code=304, headers=headers)
+                return JSONResponse(
+                    await _get_overview_delta(db, since, changes), headers=headers
+                )
+            slot = _activity_chart_slot(time_range)
+            headers["ETag"] = f'W/"{changes.version}-{time_range}-{slot}"'
+            if _etag_matches(if_none_match, headers["ETag"]):
+                return Response(status_code=304, headers=headers)
 
-        metrics = {
-            "totalStudents": total_students,
-            "totalActive": total_active,
-            "errorCount": error_count,
-            "significantErrorCount": significant_error_count,  # 連続エラー検出対応
-            "totalExecutions": total_executions,
-            "helpCount": 0,  # Will be updated after getting chart data
-        }
+        # Get active students from PostgreSQL (runs on the DB thread pool)
+        students, _ = await run_db(_collect_overview_students, db)
+        metrics = _calculate_overview_metrics(students)
 
         # Get activity chart data from InfluxDB
         activity_chart = await get_activity_chart(time_range)
@@ -95,11 +72,21 @@ async def get_dashboard_overview(
         )
         metrics["helpCount"] = help_count
 
-        return {
-            "students": students,
-            "metrics": metrics,
-            "activityChart": activity_chart,
-        }
+        version = changes.version if changes is not None else None
+        if version is not None:
+            await run_redis(dashboard_version_index.remember_metrics, version, metrics)
+        return JSONResponse(
+            jsonable_encoder(
+                {
+                    "students": students,
+                    "metrics": metrics,
+                    "activityChart": activity_chart,
+                    "version": version,
+                    "full": True,
+                }
+            ),
+            headers=headers,
+        )
 
     except Exception as e:
         print(f"Dashboard overview error: {e}")
@@ -108,59 +95,134 @@ async def get_dashboard_overview(
         )
 
 
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an ``If-None-Match`` header matches ``etag`` (weak comparison)"""
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip() for candidate in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates or etag[2:] in candidates
+
+
+async def _get_overview_delta(db: Session, since: int, changes: DashboardChanges) -> dict:
+    """Build the students and metrics that changed after ``since``"""
+    # The caller only builds a delta when the changed students are known
+    students, changed_students = await run_db(
+        _collect_overview_students, db, set(changes.student_ids or ())
+    )
+    metrics = _calculate_overview_metrics(students)
+    # helpCount comes from the activity chart, which the delta does not include
+    del metrics["helpCount"]
+
+    # Metrics served at ``since`` are shared through Redis, so any API process can diff them
+    previous = changes.metrics
+    await run_redis(
+        dashboard_version_index.remember_metrics,
+        changes.version,
+        {**(previous or {}), **metrics},
+    )
+
+    return jsonable_encoder(
+        {
+            "students": changed_students,
+            "metrics": {
+                key: value
+                for key, value in metrics.items()
+                if previous is None or previous.get(key) != value
+            },
+            "version": changes.version,
+            "since": since,
+            "full": False,
+        }
+    )
+
+
+def _calculate_overview_metrics(students: List[dict]) -> dict:
+    """Calculate class metrics from dashboard student rows"""
+    total_students = len(students)
+    total_active = len([s for s in students if s["status"] == "active"])
+    # 有意なエラーのみカウント（連続エラー検出対応）
+    significant_error_count = len([s for s in students if s["status"] == "significant_error"])
+    # 従来のエラーカウント（後方互換性のため）
+    error_count = len([s for s in students if s["status"] in ["error", "significant_error"]])
+    total_executions = sum(s["cellExecutions"] for s in students)
+
+    return {
+        "totalStudents": total_students,
+        "totalActive": total_active,
+        "errorCount": error_count,
+        "significantErrorCount": significant_error_count,  # 連続エラー検出対応
+        "totalExecutions": total_executions,
+        "helpCount": 0,  # Will be updated after getting chart data
+    }
+
+
+def _collect_overview_students(
+    db: Session, changed_ids: Optional[Set[int]] = None
+) -> Tuple[List[dict], List[dict]]:
+    """
+    Build dashboard student rows from PostgreSQL (runs on the DB thread pool)
+
+    Returns all rows and, when ``changed_ids`` is given, the rows of those students.
+    """
+    students_data = crud_student.get_active_students_with_sessions(db)
+
+    # Transform to dashboard format
+    students = []
+    changed_students = []
+    for student_data in students_data:
+        # Get latest session info (safely handle None case)
+        latest_session = student_data.get("latest_session") or {}
+
+        # Consecutive error information maintained alongside the student counters
+        consecutive_error_info = student_data["consecutive_error_info"]
+
+        # Determine status - help takes priority, then significant errors
+        if student_data.get("is_requesting_help", False):
+            status = "help"
+        elif consecutive_error_info.get("has_significant_error", False):
+            status = "significant_error"
+        else:
+            status = determine_student_status(latest_session)
+
+        students.append(
+            {
+                "emailAddress": student_data["email"],
+                "userName": student_data.get(
+                    "name", student_data["email"].split("@")[0]
+                ),
+                "teamName": student_data.get(
+                    "team_name", "未割り当て"
+                ),  # チーム名を追加
+                "currentNotebook": latest_session.get("notebook_path", "なし"),
+                "lastActivity": format_last_activity(
+                    latest_session.get("updated_at")
+                ),
+                "status": status,
+                "isRequestingHelp": student_data.get("is_requesting_help", False),
+                "cellExecutions": latest_session.get("cell_executions", 0),
+                "errorCount": latest_session.get("error_count", 0),
+                # 連続エラー検出情報を追加
+                "consecutiveErrorCount": consecutive_error_info.get("consecutive_count", 0),
+                "hasSignificantError": consecutive_error_info.get("has_significant_error", False),
+                "significantErrorCells": consecutive_error_info.get("error_cells", []),
+            }
+        )
+        if changed_ids is not None and student_data["id"] in changed_ids:
+            changed_students.append(students[-1])
+
+    return students, changed_students
+
+
 @router.get("/students/{email}/activity")
 async def get_student_activity(email: str, db: Session = Depends(get_db)):
     """
     Get detailed activity for a specific student
     """
     try:
-        student = crud_student.get_student_by_email(db, email)
-        if not student:
+        activity = await run_db(_collect_student_activity, db, email)
+        if activity is None:
             raise HTTPException(status_code=404, detail="Student not found")
-
-        # Get recent executions
-        recent_executions = crud_execution.get_recent_executions(
-            db, student.id, limit=50
-        )
-
-        # Get session history
-        sessions = crud_student.get_student_sessions(db, student.id, limit=10)
-
-        return {
-            "student": {
-                "emailAddress": student.email,
-                "name": student.name,
-                "teamName": student.team.team_name if student.team else "未割り当て",
-            },
-            "recentExecutions": [
-                {
-                    "cellId": exec.cell_id,
-                    "executionTime": exec.duration,
-                    "hasError": exec.status == "error",
-                    "timestamp": exec.executed_at.isoformat(),
-                    "status": exec.status,
-                    "output": exec.output,
-                    "errorMessage": exec.error_message,
-                    "codeContent": exec.code_content,  # セルのコード内容を追加
-                    "cellIndex": exec.cell_index,  # セルの位置を追加
-                    "cellType": exec.cell_type,  # セルの種類を追加
-                    "executionCount": exec.execution_count,  # 実行カウントを追加
-                }
-                for exec in recent_executions
-            ],
-            "sessions": [
-                {
-                    "id": session.id,
-                    "sessionId": session.session_id,
-                    "startedAt": session.start_time.isoformat(),
-                    "endedAt": (
-                        session.end_time.isoformat() if session.end_time else None
-                    ),
-                    "isActive": session.is_active,
-                }
-                for session in sessions
-            ],
-        }
+        return activity
 
     except HTTPException:
         raise
@@ -174,6 +236,57 @@ async def get_student_activity(email: str, db: Session = Depends(get_db)):
         )
 
 
+def _collect_student_activity(db: Session, email: str) -> Optional[dict]:
+    """Build a student's activity detail (runs on the DB thread pool; None if not found)"""
+    student = crud_student.get_student_by_email(db, email)
+    if not student:
+        return None
+
+    # Get recent executions
+    recent_executions = crud_execution.get_recent_executions(
+        db, student.id, limit=50
+    )
+
+    # Get session history
+    sessions = crud_student.get_student_sessions(db, student.id, limit=10)
+
+    return {
+        "student": {
+            "emailAddress": student.email,
+            "name": student.name,
+            "teamName": student.team.team_name if student.team else "未割り当て",
+        },
+        "recentExecutions": [
+            {
+                "cellId": exec.cell_id,
+                "executionTime": exec.duration,
+                "hasError": exec.status == "error",
+                "timestamp": exec.executed_at.isoformat(),
+                "status": exec.status,
+                "output": exec.output,
+                "errorMessage": exec.error_message,
+                "codeContent": exec.code_content,  # セルのコード内容を追加
+                "cellIndex": exec.cell_index,  # セルの位置を追加
+                "cellType": exec.cell_type,  # セルの種類を追加
+                "executionCount": exec.execution_count,  # 実行カウントを追加
+            }
+            for exec in recent_executions
+        ],
+        "sessions": [
+            {
+                "id": session.id,
+                "sessionId": session.session_id,
+                "startedAt": session.start_time.isoformat(),
+                "endedAt": (
+                    session.end_time.isoformat() if session.end_time else None
+                ),
+                "isActive": session.is_active,
+            }
+            for session in sessions
+        ],
+    }
+
+
 @router.get("/metrics")
 async def get_class_metrics(
     time_range: str = Query("1h", description="Time range for metrics (1h, 24h, 7d)"),
@@ -183,23 +296,19 @@ async def get_class_metrics(
     Get class-wide metrics for specific time range
     """
     try:
-        # Calculate time window
+        # Calculate time window (aligned to the cache slot of its aggregation window)
+        span, _, window_seconds = _ACTIVITY_WINDOWS.get(time_range, _ACTIVITY_WINDOWS["1h"])
+        ttl = window_ttl(window_seconds)
         now = datetime.utcnow()
-        if time_range == "1h":
-            start_time = now - timedelta(hours=1)
-        elif time_range == "24h":
-            start_time = now - timedelta(days=1)
-        elif time_range == "7d":
-            start_time = now - timedelta(days=7)
-        else:
-            start_time = now - timedelta(hours=1)
+        end_time = aligned_now(ttl)
+        start_time = end_time - span
 
         # Get metrics from InfluxDB
-        activity_data = await get_influxdb_metrics(start_time, now)
+        activity_data = await get_influxdb_metrics(start_time, end_time, window_seconds)
 
         # Get PostgreSQL metrics
-        total_students = crud_student.get_total_students_count(db)
-        active_sessions = crud_student.get_active_sessions_count(db)
+        total_students = await run_db(crud_student.get_total_students_count, db)
+        active_sessions = await run_db(crud_student.get_active_sessions_count, db)
 
         return {
             "timeRange": time_range,
@@ -237,30 +346,27 @@ async def dismiss_help_request(email: str, db: Session = Depends(get_db)):
 
         await connection_manager.broadcast(json.dumps(dismiss_message))
 
-        # Also record a help_stop event in InfluxDB to properly update the help status
-        from db.influxdb_client import influx_client, write_api
-        from influxdb_client import Point
-        from core.config import settings
-        import uuid
-
+        # Also record a help_stop event in InfluxDB through the batched line-protocol path
         try:
-            # Create a Point directly for InfluxDB
-            help_stop_point = (
-                Point("student_progress")
-                .tag("emailAddress", email)
-                .tag("event", "help_stop")
-                .field("eventId", str(uuid.uuid4()))
-                .field("userName", email.split("@")[0])
-                .field("sessionId", f"dashboard-dismiss-{email}")
-                .field("success", True)
-                .time(datetime.utcnow())
+            await batch_writer.add_progress_point(
+                {
+                    "eventType": "help_stop",
+                    "emailAddress": email,
+                    "userName": email.split("@")[0],
+                    "sessionId": f"dashboard-dismiss-{email}",
+                    "eventTime": datetime.utcnow().isoformat(),
+                }
             )
-
-            write_api.write(bucket=settings.INFLUXDB_BUCKET, record=help_stop_point)
             print(f"Help stop event recorded for email {email}")
         except Exception as e:
             print(f"Failed to record help_stop event: {e}")
 
+        # Clear the help state shown on the dashboard and bump the dashboard version
+        student = await run_db(crud_student.get_student_by_email, db, email)
+        await run_redis(help_state_index.record, email, HELP_STOP)
+        if student:
+            await run_redis(dashboard_version_index.bump, [student.id])
+
         return {
             "success": True,
             "message": f"Help request dismissed for student {email}",
@@ -281,12 +387,12 @@ async def resolve_student_error(email: str, db: Session = Depends(get_db)):
     """
     try:
         # Get student from database
-        student = crud_student.get_student_by_email(db, email)
+        student = await run_db(crud_student.get_student_by_email, db, email)
         if not student:
             raise HTTPException(status_code=404, detail="Student not found")
         
         # Reset consecutive error status
-        result = crud_execution.resolve_consecutive_errors(db, student.id)
+        result = await run_db(crud_execution.resolve_consecutive_errors, db, student.id)
         if not result:
             raise HTTPException(status_code=500, detail="Failed to reset error status")
         
@@ -307,26 +413,18 @@ async def resolve_student_error(email: str, db: Session = Depends(get_db)):
         except Exception as e:
             print(f"Failed to broadcast error resolution: {e}")
         
-        # Record resolution event in InfluxDB
+        # Record resolution event in InfluxDB through the batched line-protocol path
         try:
-            from db.influxdb_client import write_api
-            from influxdb_client import Point
-            from core.config import settings
-            import uuid
-            
-            error_resolved_point = (
-                Point("student_progress")
-                .tag("emailAddress", email)
-                .tag("event", "error_resolved")
-                .field("eventId", str(uuid.uuid4()))
-                .field("userName", email.split("@")[0])
-                .field("sessionId", f"dashboard-resolve-{email}")
-                .field("resolvedBy", "instructor")
-                .field("success", True)
-                .time(datetime.utcnow())
+            await batch_writer.add_progress_point(
+                {
+                    "eventType": "error_resolved",
+                    "emailAddress": email,
+                    "userName": email.split("@")[0],
+                    "sessionId": f"dashboard-resolve-{email}",
+                    "resolvedBy": "instructor",
+                    "eventTime": datetime.utcnow().isoformat(),
+                }
             )
-            
-            write_api.write(bucket=settings.INFLUXDB_BUCKET, record=error_resolved_point)
             print(f"Error resolution event recorded for email {email}")
         except Exception as e:
             print(f"Failed to record error_resolved event: {e}")
@@ -403,107 +501,44 @@ def determine_student_status(session_data):
     return "idle"
 
 
+# Time range → (range length, Flux aggregation window, window length in seconds)
+_ACTIVITY_WINDOWS = {
+    "1h": (timedelta(hours=1), "5m", 300),  # 5-minute buckets for 1 hour
+    "24h": (timedelta(hours=24), "1h", 3600),  # 1-hour buckets for 24 hours
+    "7d": (timedelta(days=7), "4h", 14400),  # 4-hour buckets for 7 days
+}
+
+
+def _activity_chart_slot(time_range: str) -> int:
+    """Start of the activity chart cache slot for ``time_range`` (UNIX seconds)"""
+    _, _, window_seconds = _ACTIVITY_WINDOWS.get(time_range, _ACTIVITY_WINDOWS["7d"])
+    ttl = window_ttl(window_seconds)
+    return int(aligned_now(ttl).replace(tzinfo=timezone.utc).timestamp())
+
+
 async def get_activity_chart(time_range: str):
-    """Get activity chart data from InfluxDB"""
+    """Get activity chart data from InfluxDB (cached per aggregation window)"""
     try:
-        from db.influxdb_client import query_progress_data
-        from core.config import settings
-
-        # Calculate time range for query
-        now = datetime.utcnow()
-        if time_range == "1h":
-            start_time = now - timedelta(hours=1)
-            window = "5m"  # 5-minute buckets for 1 hour
-        elif time_range == "24h":
-            start_time = now - timedelta(hours=24)
-            window = "1h"  # 1-hour buckets for 24 hours
-        else:  # 7d
-            start_time = now - timedelta(days=7)
-            window = "4h"  # 4-hour buckets for 7 days
-
-        # InfluxDB Flux query to get cell execution counts and error counts over time
-        executions_query = f"""
-        from(bucket: "{settings.INFLUXDB_BUCKET}")
-          |> range(start: {start_time.strftime("%Y-%m-%dT%H:%M:%SZ")})
-          |> filter(fn: (r) => r._measurement == "student_progress")
-          |> filter(fn: (r) => r.event == "cell_executed")
-          |> aggregateWindow(every: {window}, fn: count, createEmpty: true)
-          |> yield(name: "executions")
-        """
-
-        errors_query = f"""
-        from(bucket: "{settings.INFLUXDB_BUCKET}")
-          |> range(start: {start_time.strftime("%Y-%m-%dT%H:%M:%SZ")})
-          |> filter(fn: (r) => r._measurement == "student_progress")
-          |> filter(fn: (r) => r.event == "cell_executed")
-          |> filter(fn: (r) => r._field == "success")
-          |> filter(fn: (r) => r._value == false)
-          |> aggregateWindow(every: {window}, fn: count, createEmpty: true)
-          |> yield(name: "errors")
-        """
-
-        help_query = f"""
-        from(bucket: "{settings.INFLUXDB_BUCKET}")
-          |> range(start: {start_time.strftime("%Y-%m-%dT%H:%M:%SZ")})
-          |> filter(fn: (r) => r._measurement == "student_progress")
-          |> filter(fn: (r) => r.event == "help")
-          |> aggregateWindow(every: {window}, fn: count, createEmpty: true)
-          |> yield(name: "help")
-        """
-
-        # Execute queries
-        executions_result = query_progress_data(executions_query)
-        errors_result = query_progress_data(errors_query)
-        help_result = query_progress_data(help_query)
-
-        # Process execution counts
-        execution_data = {}
-        for table in executions_result:
-            for record in table:
-                time_key = record.get_time().isoformat()
-                execution_count = (
-                    record.get_value() if record.get_value() is not None else 0
-                )
-                execution_data[time_key] = execution_count
-
-        # Process error counts
-        error_data = {}
-        for table in errors_result:
-            for record in table:
-                time_key = record.get_time().isoformat()
-                error_count = (
-                    record.get_value() if record.get_value() is not None else 0
-                )
-                error_data[time_key] = error_count
-
-        # Process help counts
-        help_data = {}
-        for table in help_result:
-            for record in table:
-                time_key = record.get_time().isoformat()
-                help_count = record.get_value() if record.get_value() is not None else 0
-                help_data[time_key] = help_count
-
-        # Combine data
-        chart_data = []
-        all_times = (
-            set(execution_data.keys()) | set(error_data.keys()) | set(help_data.keys())
+        span, window, window_seconds = _ACTIVITY_WINDOWS.get(
+            time_range, _ACTIVITY_WINDOWS["7d"]
+        )
+        # Align the query to the cache slot so that concurrent viewers share one query
+        ttl = window_ttl(window_seconds)
+        now = aligned_now(ttl)
+        start_time = now - span
+
+        chart_data = await influx_query_cache.get_or_load(
+            ("activity_chart", time_range, now),
+            ttl,
+            lambda: _query_activity_chart(start_time, window, window_seconds),
         )
-        for time_key in sorted(all_times):
-            chart_data.append(
-                {
-                    "time": time_key,
-                    "executionCount": execution_data.get(time_key, 0),
-                    "errorCount": error_data.get(time_key, 0),
-                    "helpCount": help_data.get(time_key, 0),
-                }
-            )
 
         # If no real data, provide empty data structure instead of mock data
         if not chart_data:
             print(
                 f"No InfluxDB data found for time range {time_range}, returning empty data"
             )
+            chart_data = []
             # Generate time points with zero values
             if time_range == "1h":
                 for i in range(12):
@@ -537,114 +572,104 @@ async def get_activity_chart(time_range: str):
         return []
 
 
-async def get_influxdb_metrics(start_time: datetime, end_time: datetime):
-    """Get metrics from InfluxDB"""
-    try:
-        from db.influxdb_client import query_progress_data
-        from core.config import settings
-
-        # Query for total cell executions
-        executions_query = f"""
-        from(bucket: "{settings.INFLUXDB_BUCKET}")
-          |> range(start: {start_time.strftime("%Y-%m-%dT%H:%M:%SZ")}, stop: {end_time.strftime("%Y-%m-%dT%H:%M:%SZ")})
-          |> filter(fn: (r) => r._measurement == "student_progress")
-          |> filter(fn: (r) => r.event == "cell_executed")
-          |> count()
-        """
-
-        # Query for execution durations (for average calculation)
-        duration_query = f"""
-        from(bucket: "{settings.INFLUXDB_BUCKET}")
-          |> range(start: {start_time.strftime("%Y-%m-%dT%H:%M:%SZ")}, stop: {end_time.strftime("%Y-%m-%dT%H:%M:%SZ")})
-          |> filter(fn: (r) => r._measurement == "student_progress")
-          |> filter(fn: (r) => r.event == "cell_executed")
-          |> filter(fn: (r) => r._field == "duration")
-          |> filter(fn: (r) => r._value > 0)
-          |> mean()
-        """
-
-        # Query for error rate
-        error_query = f"""
-        from(bucket: "{settings.INFLUXDB_BUCKET}")
-          |> range(start: {start_time.strftime("%Y-%m-%dT%H:%M:%SZ")}, stop: {end_time.strftime("%Y-%m-%dT%H:%M:%SZ")})
-          |> filter(fn: (r) => r._measurement == "student_progress")
-          |> filter(fn: (r) => r.event == "cell_executed")
-          |> filter(fn: (r) => r._field == "success")
-          |> filter(fn: (r) => r._value == false)
-          |> count()
-        """
-
-        # Query for active users
-        users_query = f"""
-        from(bucket: "{settings.INFLUXDB_BUCKET}")
-          |> range(start: {start_time.strftime("%Y-%m-%dT%H:%M:%SZ")}, stop: {end_time.strftime("%Y-%m-%dT%H:%M:%SZ")})
-          |> filter(fn: (r) => r._measurement == "student_progress")
-          |> filter(fn: (r) => r.event == "cell_executed")
-          |> distinct(column: "emailAddress")
-          |> count()
-        """
-
-        # Execute queries
-        total_executions = 0
-        average_duration = 0.0
-        error_count = 0
-        active_users = 0
-
-        try:
-            # Get total executions
-            exec_result = query_progress_data(executions_query)
-            for table in exec_result:
-                for record in table:
-                    if record.get_value():
-                        total_executions = int(record.get_value())
-                        break
-        except Exception as e:
-            print(f"Error querying executions: {e}")
-
-        try:
-            # Get average duration
-            dur_result = query_progress_data(duration_query)
-            for table in dur_result:
-                for record in table:
-                    if record.get_value():
-                        average_duration = (
-                            float(record.get_value()) / 1000
-                        )  # Convert ms to seconds
-                        break
-        except Exception as e:
-            print(f"Error querying duration: {e}")
-
-        try:
-            # Get error count
-            err_result = query_progress_data(error_query)
-            for table in err_result:
-                for record in table:
-                    if record.get_value():
-                        error_count = int(record.get_value())
-                        break
-        except Exception as e:
-            print(f"Error querying errors: {e}")
+async def _query_activity_chart(
+    start_time: datetime, window: str, window_seconds: int
+) -> List[dict]:
+    """
+    Run the execution, error and help counts as one Flux script
 
-        try:
-            # Get active users count
-            users_result = query_progress_data(users_query)
-            for table in users_result:
-                for record in table:
-                    if record.get_value():
-                        active_users = int(record.get_value())
-                        break
-        except Exception as e:
-            print(f"Error querying users: {e}")
+    Reads the coarsest per-minute/per-hour rollup that fits the window, or the raw
+    events when rollups are disabled, not yet backfilled or stale.
+    """
+    from db.influxdb_client import query_progress_data
+    from core.config import settings
+
+    rollup = await choose_available_rollup(window_seconds, start_time)
+    if rollup is not None:
+        query = f"""
+    data = from(bucket: "{settings.INFLUXDB_BUCKET}")
+      |> range(start: {start_time.strftime("%Y-%m-%dT%H:%M:%SZ")})
+      |> filter(fn: (r) => r._measurement == "{rollup.measurement}")
+
+    data
+      |> filter(fn: (r) => r._field == "executions")
+      |> group()
+      |> aggregateWindow(every: {window}, fn: sum, createEmpty: true)
+      |> yield(name: "executions")
+
+    data
+      |> filter(fn: (r) => r._field == "errors")
+      |> group()
+      |> aggregateWindow(every: {window}, fn: sum, createEmpty: true)
+      |> yield(name: "errors")
+
+    data
+      |> filter(fn: (r) => r._field == "help")
+      |> group()
+      |> aggregateWindow(every: {window}, fn: sum, createEmpty: true)
+      |> yield(name: "help")
+    """
+    else:
+        query = f"""
+    data = from(bucket: "{settings.INFLUXDB_BUCKET}")
+      |> range(start: {start_time.strftime("%Y-%m-%dT%H:%M:%SZ")})
+      |> filter(fn: (r) => r._measurement == "{settings.INFLUX_PROGRESS_MEASUREMENT}")
+
+    data
+      |> filter(fn: (r) => r.event == "cell_executed")
+      |> aggregateWindow(every: {window}, fn: count, createEmpty: true)
+      |> yield(name: "executions")
+
+    data
+      |> filter(fn: (r) => r.event == "cell_executed")
+      |> filter(fn: (r) => r._field == "success")
+      |> filter(fn: (r) => r._value == false)
+      |> aggregateWindow(every: {window}, fn: count, createEmpty: true)
+      |> yield(name: "errors")
+
+    data
+      |> filter(fn: (r) => r.event == "help")
+      |> aggregateWindow(every: {window}, fn: count, createEmpty: true)
+      |> yield(name: "help")
+    """
+    result = await run_influx(query_progress_data, query)
+
+    # Split counts by yield name
+    series: Dict[str, Dict[str, int]] = {"executions": {}, "errors": {}, "help": {}}
+    for table in result:
+        for record in table:
+            counts = series.get(record.values.get("result"))
+            if counts is None:
+                continue
+            time_key = record.get_time().isoformat()
+            counts[time_key] = record.get_value() if record.get_value() is not None else 0
+
+    # Combine data
+    execution_data, error_data, help_data = (
+        series["executions"],
+        series["errors"],
+        series["help"],
+    )
+    all_times = set(execution_data.keys()) | set(error_data.keys()) | set(help_data.keys())
+    return [
+        {
+            "time": time_key,
+            "executionCount": execution_data.get(time_key, 0),
+            "errorCount": error_data.get(time_key, 0),
+            "helpCount": help_data.get(time_key, 0),
+        }
+        for time_key in sorted(all_times)
+    ]
 
-        # Calculate error rate
-        error_rate = (error_count / total_executions) if total_executions > 0 else 0.0
 
-        return {
-            "totalExecutions": total_executions,
-            "averageExecutionTime": round(average_duration, 2),
-            "errorRate": round(error_rate, 3),
-            "activeUsers": active_users,
-        }
+async def get_influxdb_metrics(start_time: datetime, end_time: datetime, window_seconds: int):
+    """Get metrics from InfluxDB (cached per aggregation window)"""
+    try:
+        return await influx_query_cache.get_or_load(
+            ("metrics", start_time, end_time),
+            window_ttl(window_seconds),
+            lambda: _query_influxdb_metrics(start_time, end_time, window_seconds),
+        )
 
     except Exception as e:
         print(f"InfluxDB metrics error: {e}")
@@ -654,3 +679,95 @@ async def get_influxdb_metrics(start_time: datetime, end_time: datetime):
             "errorRate": 0,
             "activeUsers": 0,
         }
+
+
+async def _query_influxdb_metrics(
+    start_time: datetime, end_time: datetime, window_seconds: int
+) -> dict:
+    """
+    Run the execution, duration, error and active user queries as one Flux script
+
+    Reads the coarsest rollup that fits the aggregation window, or the raw events
+    when rollups are disabled, not yet backfilled or stale.
+    """
+    from db.influxdb_client import query_progress_data
+    from core.config import settings
+
+    rollup = await choose_available_rollup(window_seconds, start_time)
+    if rollup is not None:
+        query = f"""
+    data = from(bucket: "{settings.INFLUXDB_BUCKET}")
+      |> range(start: {start_time.strftime("%Y-%m-%dT%H:%M:%SZ")}, stop: {end_time.strftime("%Y-%m-%dT%H:%M:%SZ")})
+      |> filter(fn: (r) => r._measurement == "{rollup.measurement}")
+
+    data |> filter(fn: (r) => r._field == "executions") |> group() |> sum() |> yield(name: "executions")
+    data |> filter(fn: (r) => r._field == "errors") |> group() |> sum() |> yield(name: "errors")
+    data |> filter(fn: (r) => r._field == "duration_sum") |> group() |> sum() |> yield(name: "duration_sum")
+    data |> filter(fn: (r) => r._field == "duration_count") |> group() |> sum() |> yield(name: "duration_count")
+
+    // Active users
+    data
+      |> filter(fn: (r) => r._field == "executions")
+      |> group()
+      |> distinct(column: "emailAddress")
+      |> count()
+      |> yield(name: "users")
+    """
+    else:
+        query = f"""
+    executions = from(bucket: "{settings.INFLUXDB_BUCKET}")
+      |> range(start: {start_time.strftime("%Y-%m-%dT%H:%M:%SZ")}, stop: {end_time.strftime("%Y-%m-%dT%H:%M:%SZ")})
+      |> filter(fn: (r) => r._measurement == "{settings.INFLUX_PROGRESS_MEASUREMENT}")
+      |> filter(fn: (r) => r.event == "cell_executed")
+
+    // Total cell executions
+    executions
+      |> count()
+      |> yield(name: "executions")
+
+    // Execution durations (for average calculation)
+    executions
+      |> filter(fn: (r) => r._field == "duration")
+      |> filter(fn: (r) => r._value > 0)
+      |> mean()
+      |> yield(name: "duration")
+
+    // Error rate
+    executions
+      |> filter(fn: (r) => r._field == "success")
+      |> filter(fn: (r) => r._value == false)
+      |> count()
+      |> yield(name: "errors")
+
+    // Active users
+    executions
+      |> distinct(column: "emailAddress")
+      |> count()
+      |> yield(name: "users")
+    """
+    result = await run_influx(query_progress_data, query)
+
+    # First non-empty value of each yield
+    values = {}
+    for table in result:
+        for record in table:
+            name = record.values.get("result")
+            if name not in values and record.get_value():
+                values[name] = record.get_value()
+
+    total_executions = int(values.get("executions", 0))
+    if "duration_count" in values:
+        values["duration"] = values.get("duration_sum", 0.0) / values["duration_count"]
+    average_duration = float(values.get("duration", 0.0)) / 1000  # Convert ms to seconds
+    error_count = int(values.get("errors", 0))
+    active_users = int(values.get("users", 0))
+
+    # Calculate error rate
+    error_rate = (error_count / total_executions) if total_executions > 0 else 0.0
+
+    return {
+        "totalExecutions": total_executions,
+        "averageExecutionTime": round(average_duration, 2),
+        "errorRate": round(error_rate, 3),
+        "activeUsers": active_users,
+    }
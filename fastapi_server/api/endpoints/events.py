@@ -3,14 +3,30 @@ import json
 import logging
 import uuid
 from datetime import datetime, timezone
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List, Dict, Any, Optional
+from fastapi import APIRouter, Depends, HTTPException, Response
+from typing import List, Dict, Any, Optional, Set, Tuple
 from sqlalchemy.orm import Session
 
-from db.redis_client import get_redis_client, PROGRESS_CHANNEL, safe_redis_publish
+from core.config import settings
+from db.redis_client import (
+    get_redis_client,
+    PROGRESS_CHANNEL,
+    PROGRESS_PUBLISHED_KEY,
+    claim_event_ids,
+    release_event_ids,
+    safe_redis_publish_batch,
+    safe_redis_xadd_batch,
+    progress_stream_name,
+    student_shard,
+)
 from db.session import get_db
+from db.executor import run_db
+from crud import crud_ingest
 from schemas.event import EventData
-from core.unified_connection_manager import unified_manager, ClientType
+from core.admission_control import ingest_admission_controller
+from core.retry_queue import event_retry_queue
+from core.batch_progress_notifier import batch_progress_notifier
+from core.ingest_codec import EVENT_BATCH_OPENAPI_EXTRA, read_event_batch
 
 router = APIRouter()
 
@@ -30,9 +46,10 @@ class BatchProcessingError(Exception):
         self.partial_success = partial_success
 
 
-@router.post("/events", status_code=202)
+@router.post("/events", status_code=202, openapi_extra=EVENT_BATCH_OPENAPI_EXTRA)
 async def receive_events(
-    events: List[EventData], 
+    response: Response,
+    events: List[EventData] = Depends(read_event_batch),
     redis_client=Depends(get_redis_client),
     db: Session = Depends(get_db)
 ):
@@ -46,6 +63,8 @@ async def receive_events(
     - データベース永続化
     - リアルタイム通知統合
     - 詳細エラー追跡
+    - 流量制御（ワーカーの処理待ち件数が上限を超えた場合は 429 + Retry-After）
+    - 圧縮（Content-Encoding: gzip / zstd）・MessagePack（application/msgpack）ボディ
     """
     # Phase 3強化: バッチ処理前検証
     if len(events) > MAX_BATCH_SIZE:
@@ -57,6 +76,16 @@ async def receive_events(
     if not events:
         return {"message": "No events received"}
 
+    # 流量制御: ワーカーが追いついていない場合は受け付けず、再送時期を通知する
+    admission = await ingest_admission_controller.check()
+    if not admission.admitted:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Ingest backlog {admission.backlog} exceeds limit, retry later",
+            headers=admission.headers(),
+        )
+    response.headers.update(admission.headers())
+
     # バッチID生成（トランザクション追跡用）
     batch_id = str(uuid.uuid4())[:8]
     start_time = datetime.now(timezone.utc)
@@ -68,11 +97,13 @@ async def receive_events(
         "event_types": {},
         "processing_stages": {
             "validation": {"status": "pending", "duration_ms": 0},
+            "deduplication": {"status": "pending", "duration_ms": 0},
             "redis_publish": {"status": "pending", "duration_ms": 0},
             "db_persistence": {"status": "pending", "duration_ms": 0},
             "realtime_notify": {"status": "pending", "duration_ms": 0}
         },
         "failed_events": [],
+        "dedup_hits": 0,
         "retry_count": 0
     }
 
@@ -109,7 +140,8 @@ async def receive_events(
                 "failed_events_count": len(e.failed_events),
                 "warning": str(e)
             }
-        raise HTTPException(status_code=500, detail=str(e))
+        # 有効なイベントが1件もない場合は再送しても成功しないため、クライアントエラーとして返す
+        raise HTTPException(status_code=422, detail=str(e))
         
     except Exception as e:
         # 完全失敗の場合
@@ -133,9 +165,10 @@ async def _process_events_transaction(
     
     処理段階:
     1. イベント検証
-    2. Redis発行（パイプライン）
-    3. データベース永続化（バッチ）
-    4. リアルタイム通知
+    2. eventIdによる重複排除
+    3. データベース永続化（バッチ一括）
+    4. Redis発行（パイプライン）
+    5. リアルタイム通知
     """
     successful_events = 0
     failed_events = []
@@ -169,13 +202,67 @@ async def _process_events_transaction(
     
     if not validated_events:
         raise BatchProcessingError("No valid events to process", failed_events)
+    validation_failures = len(failed_events)
+    
+    # Stage 1.5: eventIdによる重複排除（再送・オフラインキュー再生の破棄）
+    stage_start = datetime.now(timezone.utc)
+    if settings.INGEST_DEDUP_WINDOW_SECONDS > 0:
+        validated_events, dedup_hits = await _deduplicate_events(validated_events)
+        batch_stats["dedup_hits"] = dedup_hits
+        batch_stats["processing_stages"]["deduplication"]["status"] = "completed"
+        batch_stats["processing_stages"]["deduplication"]["duration_ms"] = int(
+            (datetime.now(timezone.utc) - stage_start).total_seconds() * 1000
+        )
+    else:
+        batch_stats["processing_stages"]["deduplication"]["status"] = "skipped"
+    
+    if not validated_events:
+        # 全件が重複の場合は処理済みとして受理する（冪等）
+        for stage in ("db_persistence", "redis_publish", "realtime_notify"):
+            batch_stats["processing_stages"][stage]["status"] = "skipped"
+        batch_stats["successful_events"] = 0
+        batch_stats["failed_events"] = failed_events
+        batch_stats["validation_success_rate"] = (len(events) - len(failed_events)) / len(events) * 100
+        return batch_stats
+    
+    # Stage 2: データベース永続化（バッチ一括）
+    # Redis発行より先に行い、永続化済みイベントにはワーカー側でのDB書き込みを省略させる
+    stage_start = datetime.now(timezone.utc)
+    persisted: Dict[int, Dict[str, Any]] = {}
+    if settings.INGEST_BULK_PERSIST:
+        try:
+            db_result = await _enhanced_database_persist(db, validated_events, batch_id)
+            persisted = db_result.pop("persisted")
+            
+            duration_seconds = (datetime.now(timezone.utc) - stage_start).total_seconds()
+            rows_written = db_result["executions"]
+            batch_stats["processing_stages"]["db_persistence"]["status"] = "completed"
+            batch_stats["processing_stages"]["db_persistence"]["duration_ms"] = int(duration_seconds * 1000)
+            batch_stats["processing_stages"]["db_persistence"]["persisted_count"] = len(persisted)
+            batch_stats["processing_stages"]["db_persistence"]["resolved"] = db_result
+            batch_stats["processing_stages"]["db_persistence"]["rows_per_sec"] = (
+                round(rows_written / duration_seconds, 1) if duration_seconds > 0 else None
+            )
+            
+        except Exception as e:
+            batch_stats["processing_stages"]["db_persistence"]["status"] = "failed"
+            batch_stats["processing_stages"]["db_persistence"]["error"] = str(e)
+            logger.warning(f"Database persistence failed for batch {batch_id}: {e}")
+            # DB失敗も致命的でないため続行（ワーカー側でイベント単位に永続化される）
+    else:
+        batch_stats["processing_stages"]["db_persistence"]["status"] = "skipped"
     
-    # Stage 2: Redis発行（強化パイプライン）
+    # Stage 3: Redis発行（強化パイプライン）
     stage_start = datetime.now(timezone.utc)
     try:
-        redis_successful = await _enhanced_redis_publish(redis_client, validated_events, batch_id)
+        redis_successful, redis_failed_indexes = await _enhanced_redis_publish(
+            redis_client, validated_events, batch_id, persisted
+        )
         successful_events += redis_successful
-        
+        batch_stats["processing_stages"]["redis_publish"]["published_count"] = redis_successful
+        batch_stats["processing_stages"]["redis_publish"]["failed_event_ids"] = [
+            validated_events[i].eventId for i in redis_failed_indexes
+        ]
         batch_stats["processing_stages"]["redis_publish"]["status"] = "completed"
         batch_stats["processing_stages"]["redis_publish"]["duration_ms"] = int(
             (datetime.now(timezone.utc) - stage_start).total_seconds() * 1000
@@ -185,35 +272,39 @@ async def _process_events_transaction(
         batch_stats["processing_stages"]["redis_publish"]["status"] = "failed"
         batch_stats["processing_stages"]["redis_publish"]["error"] = str(e)
         logger.error(f"Redis publish failed for batch {batch_id}: {e}")
+        redis_failed_indexes = list(range(len(validated_events)))
         # Redis失敗は致命的でないため続行
     
-    # Stage 3: データベース永続化（オプション）
-    stage_start = datetime.now(timezone.utc)
-    try:
-        db_successful = await _enhanced_database_persist(db, validated_events, batch_id)
-        
-        batch_stats["processing_stages"]["db_persistence"]["status"] = "completed"
-        batch_stats["processing_stages"]["db_persistence"]["duration_ms"] = int(
-            (datetime.now(timezone.utc) - stage_start).total_seconds() * 1000
+    # 発行に失敗したイベント: 永続化済みはワーカーの遅延リトライに引き渡し、
+    # それ以外（と引き渡せなかったもの）は失敗として報告する
+    if redis_failed_indexes:
+        handed_off = await _hand_off_unpublished_events(
+            validated_events, persisted, redis_failed_indexes, batch_id
         )
-        batch_stats["processing_stages"]["db_persistence"]["persisted_count"] = db_successful
-        
-    except Exception as e:
-        batch_stats["processing_stages"]["db_persistence"]["status"] = "failed"
-        batch_stats["processing_stages"]["db_persistence"]["error"] = str(e)
-        logger.warning(f"Database persistence failed for batch {batch_id}: {e}")
-        # DB失敗も致命的でないため続行
+        batch_stats["processing_stages"]["redis_publish"]["retry_scheduled_count"] = len(handed_off)
+        undelivered = [i for i in redis_failed_indexes if i not in handed_off]
+        failed_events.extend(validated_events[i] for i in undelivered)
+        # 未永続化かつ未発行のイベントは再送を受け付ける
+        await _release_undelivered_events(validated_events, persisted, undelivered)
+    else:
+        undelivered = []
     
-    # Stage 4: リアルタイム通知
+    # Stage 4: リアルタイム通知（失敗として報告したイベントは通知しない）
     stage_start = datetime.now(timezone.utc)
     try:
-        notify_successful = await _enhanced_realtime_notify(validated_events, batch_id)
+        undelivered_indexes = set(undelivered)
+        delivered_events = [
+            event
+            for i, event in enumerate(validated_events)
+            if i not in undelivered_indexes
+        ]
+        notify_successful = await _enhanced_realtime_notify(delivered_events, batch_id)
         
         batch_stats["processing_stages"]["realtime_notify"]["status"] = "completed"
         batch_stats["processing_stages"]["realtime_notify"]["duration_ms"] = int(
             (datetime.now(timezone.utc) - stage_start).total_seconds() * 1000
         )
-        batch_stats["processing_stages"]["realtime_notify"]["notified_count"] = notify_successful
+        batch_stats["processing_stages"]["realtime_notify"]["notified_students"] = notify_successful
         
     except Exception as e:
         batch_stats["processing_stages"]["realtime_notify"]["status"] = "failed"
@@ -221,81 +312,205 @@ async def _process_events_transaction(
         logger.warning(f"Realtime notification failed for batch {batch_id}: {e}")
     
     # 最終結果
-    batch_stats["successful_events"] = len(validated_events)
+    batch_stats["successful_events"] = len(validated_events) - len(undelivered)
     batch_stats["failed_events"] = failed_events
-    batch_stats["validation_success_rate"] = len(validated_events) / len(events) * 100
+    batch_stats["validation_success_rate"] = (len(events) - validation_failures) / len(events) * 100
     
     return batch_stats
 
 
-async def _enhanced_redis_publish(redis_client, events: List[EventData], batch_id: str) -> int:
+async def _deduplicate_events(events: List[EventData]) -> Tuple[List[EventData], int]:
+    """
+    重複排除期間内に取り込み済みのeventIdを持つイベントを除外する
+
+    eventIdごとに SET NX EX を1つのパイプラインで実行する（イベントあたりO(1)）。
+    eventIdを持たないイベントは常に取り込む。
+
+    Returns:
+        (重複を除いたイベントリスト, 重複として破棄した件数)
+    """
+    keyed = [(i, event.eventId) for i, event in enumerate(events) if event.eventId]
+    if not keyed:
+        return events, 0
+
+    first_seen = await claim_event_ids(
+        [event_id for _, event_id in keyed], settings.INGEST_DEDUP_WINDOW_SECONDS
+    )
+    duplicate_indexes = {i for (i, _), is_new in zip(keyed, first_seen) if not is_new}
+    if duplicate_indexes:
+        logger.info(f"Dropped {len(duplicate_indexes)} duplicate events by eventId")
+
+    unique_events = [event for i, event in enumerate(events) if i not in duplicate_indexes]
+    return unique_events, len(duplicate_indexes)
+
+
+async def _release_undelivered_events(
+    events: List[EventData],
+    persisted: Dict[int, Dict[str, Any]],
+    undelivered_indexes: List[int],
+) -> None:
+    """
+    DBにもRedisにも届かなかったイベントの重複排除キーを解放する
+
+    永続化済みのイベントはキーを残し、再送による二重書き込みを防ぐ。
+    """
+    if settings.INGEST_DEDUP_WINDOW_SECONDS <= 0:
+        return
+    release_ids = [
+        event_id
+        for i in undelivered_indexes
+        if (event_id := events[i].eventId) and i not in persisted
+    ]
+    await release_event_ids(release_ids)
+
+
+async def _hand_off_unpublished_events(
+    events: List[EventData],
+    persisted: Dict[int, Dict[str, Any]],
+    failed_indexes: List[int],
+    batch_id: str,
+) -> Set[int]:
+    """
+    永続化済みで発行に失敗したイベントを dbPersisted 付きで遅延リトライに登録する
+
+    ワーカーはリトライ時にDB書き込みを省略し、通知・集計のみを行う。
+
+    Returns:
+        登録できたイベントのインデックス（登録に失敗した場合は空）
+    """
+    indexes = [i for i in failed_indexes if i in persisted]
+    if not indexes:
+        return set()
+
+    processed_at = datetime.now(timezone.utc).isoformat()
+    payloads = [
+        _enhanced_event_payload(
+            events[i], batch_id, processed_at, "phase3_enhanced_retry", persisted[i]
+        )
+        for i in indexes
+    ]
+    try:
+        await event_retry_queue.schedule(payloads, error="Redisへの発行に失敗しました")
+    except Exception as e:
+        logger.error(
+            f"Failed to schedule {len(indexes)} persisted but unpublished events "
+            f"of batch {batch_id} for retry: {e}"
+        )
+        return set()
+    return set(indexes)
+
+
+def _enhanced_event_payload(
+    event: EventData,
+    batch_id: str,
+    processed_at: str,
+    processing_version: str,
+    persisted_ids: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """発行するイベントにメタデータと永続化済みの解決済みIDを付与する"""
+    payload = {
+        **event.model_dump(),
+        "batch_id": batch_id,
+        "processed_at": processed_at,
+        "processing_version": processing_version,
+    }
+    if persisted_ids:
+        payload.update(persisted_ids)
+        payload["dbPersisted"] = True
+    return payload
+
+
+async def _enhanced_redis_publish(
+    redis_client,
+    events: List[EventData],
+    batch_id: str,
+    persisted: Optional[Dict[int, Dict[str, Any]]] = None,
+) -> Tuple[int, List[int]]:
     """
     Phase 3強化: 高負荷対応Redis発行（サーキットブレーカー付き）
+
+    チャンク全体を1つのパイプライン（1接続・1往復）で送信し、サーキットブレーカーは
+    チャンク単位で1回だけ更新する。
+    EVENT_INGEST_MODE=stream の場合はRedis Streamsにチャンク単位でXADDし、
+    ワーカー停止中に発行されたイベントも失われないようにする。
+    persisted に含まれるイベント（インデックス指定）は、解決済みIDと dbPersisted フラグを
+    付与して発行し、ワーカー側のPostgreSQL書き込みを省略させる。
+
+    Returns:
+        (発行成功数, 発行に失敗したイベントのインデックスリスト)
     """
     published_count = 0
+    failed_indexes: List[int] = []
+    use_stream = settings.EVENT_INGEST_MODE == "stream"
+    processing_version = "phase3_enhanced_stream" if use_stream else "phase3_enhanced_pipeline"
     
-    # チャンク毎に並列処理
     for i in range(0, len(events), MAX_REDIS_PIPELINE_SIZE):
         chunk = events[i:i + MAX_REDIS_PIPELINE_SIZE]
         
-        # 各イベントを個別に安全に送信
-        chunk_tasks = []
-        for event in chunk:
-            # Phase 3強化: メタデータ追加
-            enhanced_event = {
-                **event.model_dump(),
-                "batch_id": batch_id,
-                "processed_at": datetime.now(timezone.utc).isoformat(),
-                "processing_version": "phase3_enhanced_safe"
-            }
-            message = json.dumps(enhanced_event)
-            
-            # 新しい安全なRedis publish関数を使用
-            task = safe_redis_publish(PROGRESS_CHANNEL, message, max_retries=3)
-            chunk_tasks.append(task)
+        # Phase 3強化: メタデータ追加
+        processed_at = datetime.now(timezone.utc).isoformat()
+        messages = [
+            json.dumps(
+                _enhanced_event_payload(
+                    event,
+                    batch_id,
+                    processed_at,
+                    processing_version,
+                    persisted.get(i + offset) if persisted else None,
+                )
+            )
+            for offset, event in enumerate(chunk)
+        ]
         
-        # チャンク内のタスクを並列実行
-        results = await asyncio.gather(*chunk_tasks, return_exceptions=True)
+        if use_stream:
+            # 学生単位でシャードのストリームに振り分け（学生内の処理順序を保つ）
+            streams = [
+                progress_stream_name(student_shard(event.emailAddress)) for event in chunk
+            ]
+            results = await safe_redis_xadd_batch(
+                messages, max_retries=BATCH_RETRY_COUNT, streams=streams
+            )
+        else:
+            results = await safe_redis_publish_batch(
+                PROGRESS_CHANNEL,
+                messages,
+                max_retries=BATCH_RETRY_COUNT,
+                counter_key=PROGRESS_PUBLISHED_KEY,
+            )
         
-        # 成功数をカウント
-        for result in results:
-            if result is True:  # safe_redis_publishはboolを返す
+        # イベント単位の結果を集計
+        for offset, published in enumerate(results):
+            if published:
                 published_count += 1
-            elif isinstance(result, Exception):
-                logger.warning(f"Event publish failed in batch {batch_id}: {result}")
-        
-        # 負荷分散のための小さな待機
-        if len(events) > MAX_REDIS_PIPELINE_SIZE:
-            await asyncio.sleep(0.001)
+            else:
+                failed_indexes.append(i + offset)
     
+    if failed_indexes:
+        logger.warning(
+            f"Event publish failed in batch {batch_id}: {len(failed_indexes)} events "
+            f"(eventIds: {[events[i].eventId for i in failed_indexes[:10]]})"
+        )
     logger.debug(f"Enhanced Redis publish completed for batch {batch_id}: {published_count}/{len(events)} events")
-    return published_count
+    return published_count, failed_indexes
 
 
-async def _enhanced_database_persist(db: Session, events: List[EventData], batch_id: str) -> int:
+async def _enhanced_database_persist(
+    db: Session, events: List[EventData], batch_id: str
+) -> Dict[str, Any]:
     """
     Phase 3強化: バッチデータベース永続化
+
+    学生・ノートブック・セル・セッションをセット単位のUPSERTで解決し、
+    CellExecutionを1トランザクションで一括挿入する（crud_ingest.persist_event_batch）。
+    同期SQLAlchemyセッションを使用するため、イベントループを塞がないようDB用スレッドプールで実行する。
     """
     try:
-        # 簡単な統計テーブルへの永続化例
-        # 実際の実装では適切なテーブル構造が必要
-        
-        event_summary = {
-            "batch_id": batch_id,
-            "event_count": len(events),
-            "event_types": {},
-            "processed_at": datetime.now(timezone.utc)
-        }
-        
-        for event in events:
-            event_type = getattr(event, "eventType", "unknown")
-            event_summary["event_types"][event_type] = event_summary["event_types"].get(event_type, 0) + 1
-        
-        # 実際のDBへの永続化はここで実装
-        # 例: bulk insert, upsert など
-        
-        logger.debug(f"Database persistence completed for batch {batch_id}: {len(events)} events")
-        return len(events)
+        result = await run_db(crud_ingest.persist_event_batch, db, events)
+        logger.debug(
+            f"Database persistence completed for batch {batch_id}: "
+            f"{result['executions']} executions, {result['students']} students"
+        )
+        return result
         
     except Exception as e:
         logger.error(f"Database persistence error for batch {batch_id}: {e}")
@@ -305,43 +520,18 @@ async def _enhanced_database_persist(db: Session, events: List[EventData], batch
 async def _enhanced_realtime_notify(events: List[EventData], batch_id: str) -> int:
     """
     Phase 3強化: 統一管理システム経由リアルタイム通知
+
+    イベントごとではなくバッチ単位で学生ごとに集約した通知を1件作成し、
+    配信はバックグラウンドで行う（/events の応答時間が接続数に依存しない）。
+
+    Returns:
+        通知に含まれる学生数
     """
-    try:
-        notified_count = 0
-        
-        # 講師への通知（関連するクラスの進捗）
-        for event in events:
-            user_id = getattr(event, 'emailAddress', None) or getattr(event, 'userId', None)
-            if user_id:
-                # 学生進捗通知
-                student_notification = {
-                    "type": "student_progress_update",
-                    "batch_id": batch_id,
-                    "user_id": user_id,
-                    "event_type": getattr(event, "eventType", "unknown"),
-                    "timestamp": datetime.now(timezone.utc).isoformat()
-                }
-                
-                # 講師に通知
-                instructor_sent = await unified_manager.broadcast_to_type(
-                    ClientType.INSTRUCTOR, 
-                    student_notification
-                )
-                
-                # ダッシュボードに通知
-                dashboard_sent = await unified_manager.broadcast_to_type(
-                    ClientType.DASHBOARD,
-                    student_notification
-                )
-                
-                notified_count += instructor_sent + dashboard_sent
-        
-        logger.debug(f"Realtime notification completed for batch {batch_id}: {notified_count} notifications sent")
-        return notified_count
-        
-    except Exception as e:
-        logger.error(f"Realtime notification error for batch {batch_id}: {e}")
-        raise
+    notified_students = batch_progress_notifier.schedule(events, batch_id)
+    logger.debug(
+        f"Realtime notification scheduled for batch {batch_id}: {notified_students} students"
+    )
+    return notified_students
 
 
 # レガシー関数（後方互換性のため保持）
@@ -358,6 +548,7 @@ async def _publish_events_batch(redis_client, events: List[EventData]):
         for event in chunk:
             event_data = event.model_dump_json()
             pipe.publish(PROGRESS_CHANNEL, event_data)
+        pipe.incrby(PROGRESS_PUBLISHED_KEY, len(chunk))
         
         await pipe.execute()
         
@@ -45,6 +45,9 @@ async def health_check() -> Dict[str, Any]:
         websocket_stats = get_websocket_health()
         health_status["services"]["websocket"] = websocket_stats
         
+        # ワーカーの同時実行数制御の状態（上限・依存サービスのレイテンシ・変更理由）
+        health_status["worker_concurrency"] = await get_worker_concurrency()
+        
         # 全体的なステータス判定
         all_services_healthy = all(
             service.get("status") == "healthy" 
@@ -172,6 +175,17 @@ async def check_influxdb_health() -> Dict[str, Any]:
         }
 
 
+async def get_worker_concurrency() -> Dict[str, Any]:
+    """稼働中ワーカーごとの同時実行数制御の状態を取得"""
+    try:
+        from core.admission_control import ingest_admission_controller
+        
+        return await ingest_admission_controller.get_worker_concurrency()
+    except Exception as e:
+        logger.warning(f"Worker concurrency status unavailable: {e}")
+        return {}
+
+
 def get_websocket_health() -> Dict[str, Any]:
     """WebSocket接続の健全性統計を取得"""
     try:
@@ -261,4 +275,61 @@ async def liveness_check() -> Dict[str, str]:
         "status": "alive",
         "timestamp": datetime.utcnow().isoformat(),
         "message": "Application process is running"
-    }
\ No newline at end of file
+    }
+
+
+@router.get("/health/workers")
+async def worker_shard_status() -> Dict[str, Any]:
+    """
+    ワーカーシャードの処理遅延
+    ストリーム（シャード）ごとの未処理件数（lag + pending）を報告
+    """
+    from core.admission_control import ingest_admission_controller
+    from core.config import settings
+
+    try:
+        shard_lag = await ingest_admission_controller.get_shard_lag()
+    except Exception as e:
+        logger.error(f"Worker shard status check failed: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail={
+                "status": "unavailable",
+                "timestamp": datetime.utcnow().isoformat(),
+                "error": str(e)
+            }
+        )
+
+    return {
+        "status": "ok",
+        "timestamp": datetime.utcnow().isoformat(),
+        "shard_count": settings.WORKER_SHARD_COUNT,
+        "active_shards": len(shard_lag),
+        "shard_lag": shard_lag,
+        "max_lag": max(shard_lag.values(), default=0),
+    }
+
+
+@router.get("/health/entity-cache")
+async def entity_cache_status() -> Dict[str, Any]:
+    """
+    エンティティID解決キャッシュの統計
+    名前空間（学生・ノートブック・セル・セッション・チーム）ごとのヒット率とエントリ数、
+    連続エラー状態のヒット率（実行履歴からの再構築数）、ヘルプ状態インデックスの更新・再構築数、
+    ダッシュボードのバージョンの更新・参照数、ダッシュボードのInfluxDBクエリキャッシュのヒット率
+    """
+    from core.influx_query_cache import influx_query_cache
+    from crud.crud_dashboard_version import dashboard_version_index
+    from crud.crud_entity_cache import entity_id_cache
+    from crud.crud_error_state import consecutive_error_tracker
+    from crud.crud_help_state import help_state_index
+
+    return {
+        "status": "ok",
+        "timestamp": datetime.utcnow().isoformat(),
+        "namespaces": entity_id_cache.get_statistics(),
+        "consecutive_error_state": consecutive_error_tracker.get_statistics(),
+        "help_state": help_state_index.get_statistics(),
+        "dashboard_version": dashboard_version_index.get_statistics(),
+        "influx_query_cache": influx_query_cache.get_statistics(),
+    }
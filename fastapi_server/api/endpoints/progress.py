@@ -1,29 +1,61 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Response
 import redis.asyncio as redis
 
+from core.admission_control import ingest_admission_controller
+from core.config import settings
 from schemas.event import EventData
-from db.redis_client import get_redis_client, PROGRESS_CHANNEL
+from db.redis_client import (
+    get_redis_client,
+    progress_stream_name,
+    safe_redis_xadd_batch,
+    student_shard,
+    PROGRESS_CHANNEL,
+    PROGRESS_PUBLISHED_KEY,
+)
 
 router = APIRouter()
 
 
 @router.post("/student-progress")
 async def receive_progress(
-    event: EventData, redis_client: redis.Redis = Depends(get_redis_client)
+    event: EventData,
+    response: Response,
+    redis_client: redis.Redis = Depends(get_redis_client),
 ):
     """
-    学生の進捗状況データを受信し、Redis Pub/Subにイベントを発行する。
+    学生の進捗状況データを受信し、ワーカーにイベントを発行する。
+
+    /events と同じく、EVENT_INGEST_MODE=stream の場合は学生のシャードの進捗ストリームに
+    XADDし、それ以外はRedis Pub/Subに発行する。ワーカーが追いついていない場合は 429 を返す。
     """
+    # 流量制御: ワーカーが追いついていない場合は受け付けず、再送時期を通知する
+    admission = await ingest_admission_controller.check()
+    if not admission.admitted:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Ingest backlog {admission.backlog} exceeds limit, retry later",
+            headers=admission.headers(),
+        )
+    response.headers.update(admission.headers())
+
     # 受信したデータを出力して確認
     print(
         f"--- Received Student Progress Data ---\n{event.model_dump_json(indent=2)}\n------------------------------------"
     )
 
     # PydanticモデルをJSON文字列に変換して発行する
-    await redis_client.publish(PROGRESS_CHANNEL, event.model_dump_json())
+    if settings.EVENT_INGEST_MODE == "stream":
+        stream = progress_stream_name(student_shard(event.emailAddress))
+        results = await safe_redis_xadd_batch([event.model_dump_json()], streams=[stream])
+        if not all(results):
+            raise HTTPException(status_code=503, detail="Failed to enqueue progress event")
+    else:
+        await redis_client.publish(PROGRESS_CHANNEL, event.model_dump_json())
+        # ワーカーの処理待ち件数の算出に使用する発行数を加算
+        await redis_client.incr(PROGRESS_PUBLISHED_KEY)
 
     return {
         "status": "ok",
         "message": "Event published successfully",
-        "processed_user_id": event.userId,
+        "processed_user_id": event.emailAddress,
     }
@@ -0,0 +1,215 @@
+"""
+取り込み流量制御（アドミッションコントロール）
+
+ワーカーが報告する処理待ち件数（並列キュー深さ・ストリーム遅延・Pub/Subの未処理件数）を読み取り、
+上限を超えた場合は /api/v1/events で 429 と Retry-After を返します。
+上限の半分を超えた時点から、クライアントに送信間隔を広げるよう
+X-Ingest-Backoff-Ms ヘッダーで通知します。
+"""
+
+import json
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from core.config import settings
+from db.redis_client import WORKER_BACKLOG_KEY, get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+# クライアントへの送信間隔拡大ヒントのヘッダー名
+BACKOFF_HINT_HEADER = "X-Ingest-Backoff-Ms"
+
+# 上限に対する処理待ち件数の比率がこの値を超えたら送信間隔拡大を促す
+SOFT_LIMIT_RATIO = 0.5
+
+# 報告がこの秒数より古いワーカーは停止したものとして無視する
+STALE_REPORT_SECONDS = 10
+
+# 上限到達時の基本Retry-After（秒）
+BASE_RETRY_AFTER_SECONDS = 5
+
+
+@dataclass
+class AdmissionDecision:
+    """取り込み可否の判定結果"""
+
+    admitted: bool
+    backlog: Optional[int] = None
+    retry_after_seconds: int = 0
+    backoff_ms: int = 0
+
+    def headers(self) -> Dict[str, str]:
+        """クライアントに返す流量制御ヘッダー"""
+        headers: Dict[str, str] = {}
+        if self.backoff_ms > 0:
+            headers[BACKOFF_HINT_HEADER] = str(self.backoff_ms)
+        if not self.admitted:
+            headers["Retry-After"] = str(self.retry_after_seconds)
+        return headers
+
+
+class IngestAdmissionController:
+    """ワーカーの処理待ち件数に基づく取り込み流量制御"""
+
+    def __init__(
+        self,
+        backlog_limit: Optional[int] = None,
+        retry_after_max_seconds: Optional[int] = None,
+        cache_ttl_seconds: float = 1.0,
+    ):
+        self.backlog_limit = (
+            backlog_limit
+            if backlog_limit is not None
+            else settings.INGEST_BACKLOG_LIMIT
+        )
+        self.retry_after_max_seconds = (
+            retry_after_max_seconds or settings.INGEST_RETRY_AFTER_MAX_SECONDS
+        )
+        self.cache_ttl_seconds = cache_ttl_seconds
+
+        # リクエストごとにRedisを読まないよう、直近の値を短時間キャッシュ
+        self._cached_backlog: Optional[int] = None
+        self._cached_at = 0.0
+
+        # 統計
+        self.stats = {"admitted": 0, "rejected": 0, "backoff_hinted": 0}
+
+    @staticmethod
+    def aggregate_reports(reports: Dict[str, str], now: float) -> Optional[int]:
+        """
+        ワーカーごとの報告を処理待ち件数に集約する
+
+        並列キュー深さはワーカーごとのため合計する。ストリーム遅延はストリーム
+        （シャード）ごとのコンシューマーグループ全体の値のため、ストリーム内では最大値を、
+        ストリーム間では合計を使用する。Pub/Subは全ワーカーが全イベントを受信するため最大値を使用する。
+        有効な報告がない場合は None。
+        """
+        fresh = IngestAdmissionController._fresh_reports(reports, now)
+        if not fresh:
+            return None
+
+        queue_depth = sum(report.get("queue_depth") or 0 for report in fresh)
+        stream_backlog = sum(
+            IngestAdmissionController.aggregate_stream_lag(fresh).values()
+        )
+        pubsub_backlog = max(report.get("pubsub_backlog") or 0 for report in fresh)
+        return queue_depth + stream_backlog + pubsub_backlog
+
+    @staticmethod
+    def _fresh_reports(reports: Dict[str, str], now: float) -> List[Dict[str, Any]]:
+        """解析可能かつ STALE_REPORT_SECONDS 以内に更新された報告のみを返す"""
+        fresh = []
+        for raw in reports.values():
+            try:
+                report = json.loads(raw)
+            except (TypeError, ValueError):
+                continue
+            if now - report.get("updated_at", 0) > STALE_REPORT_SECONDS:
+                continue
+            fresh.append(report)
+        return fresh
+
+    @staticmethod
+    def aggregate_stream_lag(reports: List[Dict[str, Any]]) -> Dict[str, int]:
+        """ストリーム（シャード）ごとの未処理件数"""
+        lag: Dict[str, int] = {}
+        for report in reports:
+            backlog = report.get("stream_backlog")
+            if backlog is None:
+                continue
+            stream = report.get("stream") or "default"
+            lag[stream] = max(lag.get(stream, 0), backlog)
+        return lag
+
+    async def get_shard_lag(self) -> Dict[str, int]:
+        """稼働中ワーカーの報告からストリーム（シャード）ごとの未処理件数を取得"""
+        async with get_redis_connection() as redis_client:
+            reports = await redis_client.hgetall(WORKER_BACKLOG_KEY)
+        return self.aggregate_stream_lag(
+            self._fresh_reports(reports or {}, time.time())
+        )
+
+    async def get_worker_concurrency(self) -> Dict[str, Any]:
+        """稼働中ワーカーの報告から同時実行数制御の状態（上限・変更理由）を取得"""
+        async with get_redis_connection() as redis_client:
+            reports = await redis_client.hgetall(WORKER_BACKLOG_KEY)
+        return {
+            report.get("worker") or f"worker_{index}": report["concurrency"]
+            for index, report in enumerate(
+                self._fresh_reports(reports or {}, time.time())
+            )
+            if report.get("concurrency")
+        }
+
+    async def get_backlog(self) -> Optional[int]:
+        """現在の処理待ち件数を取得（取得できない場合は None）"""
+        now = time.time()
+        if now - self._cached_at < self.cache_ttl_seconds:
+            return self._cached_backlog
+
+        try:
+            async with get_redis_connection() as redis_client:
+                reports = await redis_client.hgetall(WORKER_BACKLOG_KEY)
+            backlog = self.aggregate_reports(reports or {}, now)
+        except Exception as e:
+            # 流量制御の失敗で取り込みを止めない（フェイルオープン）
+            logger.warning(f"Failed to read worker backlog: {e}")
+            backlog = None
+
+        self._cached_backlog = backlog
+        self._cached_at = now
+        return backlog
+
+    def evaluate(self, backlog: Optional[int]) -> AdmissionDecision:
+        """処理待ち件数から取り込み可否と送信間隔ヒントを判定"""
+        if self.backlog_limit <= 0 or backlog is None:
+            return AdmissionDecision(admitted=True, backlog=backlog)
+
+        load_ratio = backlog / self.backlog_limit
+        if load_ratio >= 1.0:
+            retry_after = min(
+                self.retry_after_max_seconds,
+                math.ceil(BASE_RETRY_AFTER_SECONDS * load_ratio),
+            )
+            return AdmissionDecision(
+                admitted=False,
+                backlog=backlog,
+                retry_after_seconds=retry_after,
+                backoff_ms=retry_after * 1000,
+            )
+
+        backoff_ms = 0
+        if load_ratio >= SOFT_LIMIT_RATIO:
+            # 上限に近づくほど大きな送信間隔拡大を促す（最大 BASE_RETRY_AFTER_SECONDS 秒）
+            backoff_ms = int(BASE_RETRY_AFTER_SECONDS * 1000 * load_ratio)
+        return AdmissionDecision(admitted=True, backlog=backlog, backoff_ms=backoff_ms)
+
+    async def check(self) -> AdmissionDecision:
+        """取り込み可否を判定し、統計を更新"""
+        decision = self.evaluate(await self.get_backlog())
+        if decision.admitted:
+            self.stats["admitted"] += 1
+            if decision.backoff_ms:
+                self.stats["backoff_hinted"] += 1
+        else:
+            self.stats["rejected"] += 1
+            logger.warning(
+                f"Ingest rejected: backlog {decision.backlog} >= limit {self.backlog_limit}, "
+                f"Retry-After {decision.retry_after_seconds}s"
+            )
+        return decision
+
+    def get_statistics(self) -> Dict[str, Optional[int]]:
+        """流量制御統計を取得"""
+        return {
+            **self.stats,
+            "backlog_limit": self.backlog_limit,
+            "last_backlog": self._cached_backlog,
+        }
+
+
+# グローバルインスタンス
+ingest_admission_controller = IngestAdmissionController()
@@ -0,0 +1,144 @@
+"""
+バッチ進捗通知システム
+取り込みバッチ単位で学生ごとに集約した進捗メッセージを1件作成し、
+HTTPリクエストの処理経路外で講師・ダッシュボードへ並行配信する
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+from core.unified_connection_manager import (
+    ClientType,
+    UnifiedConnectionManager,
+    unified_manager,
+)
+from schemas.event import EventData
+
+logger = logging.getLogger(__name__)
+
+BATCH_PROGRESS_MESSAGE_TYPE = "student_progress_batch"
+
+
+class BatchProgressNotifier:
+    """取り込みバッチの進捗通知を集約・非同期配信するクラス"""
+
+    def __init__(
+        self,
+        manager: UnifiedConnectionManager = unified_manager,
+        client_types: Sequence[ClientType] = (
+            ClientType.INSTRUCTOR,
+            ClientType.DASHBOARD,
+        ),
+    ):
+        self.manager = manager
+        self.client_types = list(client_types)
+
+        # 実行中の配信タスク（GCで破棄されないよう参照を保持）
+        self._tasks: Set[asyncio.Task] = set()
+
+        # 統計
+        self.stats = {
+            "batches_scheduled": 0,
+            "batches_delivered": 0,
+            "messages_sent": 0,
+            "delivery_errors": 0,
+        }
+
+    @staticmethod
+    def build_message(
+        events: List[EventData], batch_id: str
+    ) -> Optional[Dict[str, Any]]:
+        """
+        バッチ内のイベントを学生ごとに集約した進捗メッセージを作成
+
+        Returns:
+            通知メッセージ（通知対象の学生がいない場合は None）
+        """
+        students: Dict[str, Dict[str, Any]] = {}
+        for event in events:
+            user_id = event.emailAddress
+            if not user_id:
+                continue
+
+            summary = students.get(user_id)
+            if summary is None:
+                summary = students[user_id] = {
+                    "user_id": user_id,
+                    "event_count": 0,
+                    "error_count": 0,
+                    "event_types": {},
+                    "last_event_time": None,
+                }
+
+            event_type = event.eventType or "unknown"
+            summary["event_count"] += 1
+            summary["event_types"][event_type] = (
+                summary["event_types"].get(event_type, 0) + 1
+            )
+            if event.hasError:
+                summary["error_count"] += 1
+            if event.eventTime and (
+                summary["last_event_time"] is None
+                or event.eventTime > summary["last_event_time"]
+            ):
+                summary["last_event_time"] = event.eventTime
+
+        if not students:
+            return None
+
+        return {
+            "type": BATCH_PROGRESS_MESSAGE_TYPE,
+            "batch_id": batch_id,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "total_events": sum(s["event_count"] for s in students.values()),
+            "students": list(students.values()),
+        }
+
+    def schedule(self, events: List[EventData], batch_id: str) -> int:
+        """
+        バッチ進捗通知をバックグラウンドで配信するようスケジュール
+
+        Returns:
+            通知に含まれる学生数
+        """
+        message = self.build_message(events, batch_id)
+        if message is None:
+            return 0
+
+        task = asyncio.create_task(self._deliver(message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self.stats["batches_scheduled"] += 1
+        return len(message["students"])
+
+    async def _deliver(self, message: Dict[str, Any]) -> int:
+        """集約メッセージを対象クライアントへ並行配信"""
+        try:
+            sent = await self.manager.broadcast_to_types(self.client_types, message)
+            self.stats["batches_delivered"] += 1
+            self.stats["messages_sent"] += sent
+            logger.debug(
+                f"Batch progress notification for {message['batch_id']} sent to {sent} clients"
+            )
+            return sent
+        except Exception as e:
+            self.stats["delivery_errors"] += 1
+            logger.error(
+                f"Batch progress notification failed for {message['batch_id']}: {e}"
+            )
+            return 0
+
+    async def drain(self):
+        """実行中の配信タスクの完了を待機（シャットダウン時・テスト用）"""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """通知統計を取得"""
+        return {**self.stats, "pending_deliveries": len(self._tasks)}
+
+
+# グローバルインスタンス
+batch_progress_notifier = BatchProgressNotifier()
@@ -62,6 +62,147 @@ class Settings(BaseSettings):
     REDIS_HOST: str = "redis"
     REDIS_PORT: int = 6379
 
+    # イベント取り込みモード（"pubsub": 従来のPub/Sub, "stream": Redis Streams + コンシューマーグループ）
+    EVENT_INGEST_MODE: str = "pubsub"
+    # ACK済みエントリをXTRIM MINIDで削除する間隔
+    PROGRESS_STREAM_TRIM_INTERVAL_SECONDS: int = 30
+    # XREADGROUPで一度に読み込む件数
+    WORKER_STREAM_BATCH_SIZE: int = 50
+    # XREADGROUPのブロック時間
+    WORKER_STREAM_BLOCK_MS: int = 5000
+    # この時間ACKされないエントリをXAUTOCLAIMで回収
+    WORKER_STREAM_CLAIM_IDLE_MS: int = 60000
+    # 最大配信回数（超過したエントリはデッドレターストリームに移動）
+    WORKER_STREAM_MAX_DELIVERIES: int = 5
+    # 未指定の場合はホスト名+シャード番号を使用（再起動後も同じ名前）
+    WORKER_CONSUMER_NAME: Union[str, None] = None
+    # この時間アイドルで未ACKエントリのないコンシューマーを削除
+    WORKER_STREAM_STALE_CONSUMER_MS: int = 3600000
+
+    # 失敗イベントの遅延リトライ（ワーカースロットを待機させずにバックオフ）とデッドレター
+    # 処理の総試行回数（超過したイベントはデッドレターへ）
+    RETRY_MAX_ATTEMPTS: int = 5
+    RETRY_BASE_DELAY_SECONDS: float = 1.0
+    RETRY_MAX_DELAY_SECONDS: float = 60.0
+    RETRY_POLL_INTERVAL_MS: int = 500
+    RETRY_BATCH_SIZE: int = 100
+    # 取り出したリトライの処理期限（超過した場合はワーカー停止とみなしてリトライ待ちに戻す）
+    RETRY_LEASE_SECONDS: float = 300.0
+    DEAD_LETTER_STREAM_MAXLEN: int = 10000
+
+    # 学生単位のシャーディング（stream モード）: emailAddress のハッシュでK個のストリームに振り分け、
+    # シャードごとに1つのワーカープロセスが順番に処理する（学生内の順序を保証しつつ学生間で並列化）
+    WORKER_SHARD_COUNT: int = 1
+    # 指定した場合はそのシャードのみ処理（未指定時は全シャードのプロセスを起動）
+    WORKER_SHARD_INDEX: Union[int, None] = None
+    # 異常終了したシャードプロセスの再起動待ち（指数バックオフ、この秒数以上稼働したらリセット）
+    WORKER_SHARD_RESTART_BACKOFF_SECONDS: float = 1.0
+    WORKER_SHARD_RESTART_BACKOFF_MAX_SECONDS: float = 60.0
+    WORKER_SHARD_STABLE_SECONDS: float = 60.0
+
+    # ワーカーのマイクロバッチ処理: 最大N件 または T ミリ秒まで溜めてイベントタイプごとに一括処理する
+    WORKER_BATCH_MODE: bool = True
+    WORKER_BATCH_MAX_EVENTS: int = 100
+    WORKER_BATCH_MAX_WAIT_MS: int = 50
+
+    # /api/v1/events でPostgreSQLへの一括永続化を行う（永続化済みイベントはワーカーでDB書き込みを省略）
+    INGEST_BULK_PERSIST: bool = True
+
+    # eventIdによる重複排除期間（秒）。再送・オフラインキュー再生による重複を取り込み時に破棄する（0で無効）
+    INGEST_DEDUP_WINDOW_SECONDS: int = 600
+
+    # 取り込みの流量制御: ワーカーの処理待ち件数がこの値を超えたら 429 を返す（0で無効）
+    # 処理待ち件数は stream モードではストリームの未処理件数、pubsub モードでは発行済みで未処理の件数
+    INGEST_BACKLOG_LIMIT: int = 5000
+    # Retry-After の上限
+    INGEST_RETRY_AFTER_MAX_SECONDS: int = 60
+    # ワーカーが処理待ち件数を報告する間隔
+    WORKER_BACKLOG_REPORT_INTERVAL_SECONDS: int = 2
+
+    # エンティティID解決キャッシュ（学生・ノートブック・セル・セッション）
+    # 名前空間ごとのプロセス内LRU上限
+    ENTITY_CACHE_MAX_ENTRIES: int = 50000
+    ENTITY_CACHE_TTL_SECONDS: int = 3600
+    # Redisを第2段として複数プロセスで共有
+    ENTITY_CACHE_REDIS_ENABLED: bool = True
+
+    # 連続エラー状態（学生ごとのRedisハッシュ、なければ実行履歴から再構築）
+    ERROR_STATE_REDIS_ENABLED: bool = True
+    ERROR_STATE_TTL_SECONDS: int = 86400
+    # ワーカーのホットパスで参照する設定値（連続エラー閾値など）のプロセス内キャッシュ期間
+    SETTINGS_LOCAL_CACHE_TTL_SECONDS: int = 30
+
+    # ヘルプ要求状態インデックス（Redis）: 最新イベントが help でこの秒数以内の学生をヘルプ要求中とする
+    HELP_STATE_ACTIVE_SECONDS: int = 300
+
+    # ダッシュボードの差分取得（?since=<バージョン>）: 時間経過で表示状態が遷移した学生を確認する間隔
+    DASHBOARD_TRANSITION_SWEEP_SECONDS: float = 5.0
+    # 各バージョンで返したメトリクスの保持期間（これより古いカーソルには全メトリクスを返す）
+    DASHBOARD_METRICS_SNAPSHOT_TTL_SECONDS: int = 600
+
+    # ワーカーの同時実行数制御（AIMD）: 依存サービスのp90レイテンシが目標を超えたら減らし、
+    # 目標内で上限まで使い切っている場合は1ずつ増やす
+    CONCURRENCY_MIN_LIMIT: int = 2
+    CONCURRENCY_MAX_LIMIT: int = 32
+    CONCURRENCY_LATENCY_WINDOW_SECONDS: float = 10.0
+    CONCURRENCY_POSTGRES_TARGET_MS: float = 200.0
+    CONCURRENCY_INFLUX_TARGET_MS: float = 300.0
+    CONCURRENCY_REDIS_TARGET_MS: float = 20.0
+
+    # 同期DB・InfluxDB・Redis呼び出しを実行するスレッドプールの上限（イベントループを塞がないため）
+    # DBはSQLAlchemy接続プール（pool_size 5 + max_overflow 10）を超えない値にする
+    DB_EXECUTOR_MAX_WORKERS: int = 10
+    INFLUX_EXECUTOR_MAX_WORKERS: int = 4
+    REDIS_EXECUTOR_MAX_WORKERS: int = 4
+
+    # InfluxDBへの進捗イベント書き込み（ラインプロトコルをgzip圧縮してバッチ送信）
+    INFLUX_PROGRESS_MEASUREMENT: str = "student_progress"
+    INFLUX_WRITE_BATCH_SIZE: int = 500
+    # フラッシュ条件: 行数・バイト数（非圧縮）の目標に達したとき、または最古の行が最大滞留時間を超えたとき
+    INFLUX_WRITE_MAX_LINGER_MS: int = 500
+    INFLUX_WRITE_MAX_BATCH_BYTES: int = 1024 * 1024
+    # 同時に送信中の書き込みリクエスト数の上限
+    INFLUX_WRITE_MAX_IN_FLIGHT: int = 4
+    INFLUX_WRITE_GZIP_LEVEL: int = 5
+    # メモリ上のバッファの上限（超えた分はディスクに退避）
+    INFLUX_WRITE_BUFFER_MAX_POINTS: int = 10000
+    # 送信できない行の退避先（セグメントファイル）と再送レート
+    # 各プロセスは配下の専用サブディレクトリ（shard-<番号>-<PID>）を使用し、
+    # 終了したプロセスのサブディレクトリは次に起動したプロセスが引き継いで再送する
+    INFLUX_SPILL_DIR: str = "data/influx_spill"
+    INFLUX_SPILL_SEGMENT_MAX_BYTES: int = 8 * 1024 * 1024
+    INFLUX_SPILL_MAX_BYTES: int = 1024 * 1024 * 1024
+    INFLUX_SPILL_REPLAY_POINTS_PER_SECOND: int = 5000
+    INFLUX_SPILL_RETRY_INTERVAL_SECONDS: float = 5.0
+
+    # ダッシュボードのInfluxDBクエリ結果キャッシュ: TTLは集計ウィンドウの長さ × 係数（下限あり）
+    INFLUX_QUERY_CACHE_TTL_FRACTION: float = 0.1
+    INFLUX_QUERY_CACHE_MIN_TTL_SECONDS: float = 5.0
+    INFLUX_QUERY_CACHE_MAX_ENTRIES: int = 256
+
+    # 進捗イベントのロールアップ（1分・1時間単位）: ワーカーが定期的にダウンサンプリングし、
+    # ダッシュボードのチャート・メトリクスは集計ウィンドウに合う最も粗いロールアップを参照する
+    INFLUX_ROLLUP_ENABLED: bool = True
+    INFLUX_ROLLUP_INTERVAL_SECONDS: int = 60
+    # 遅れて届いたイベントを反映するため再集計する期間
+    INFLUX_ROLLUP_LOOKBACK_MINUTES: int = 10
+    # 起動時に過去のイベントから作成する期間
+    INFLUX_ROLLUP_BACKFILL_HOURS: int = 168
+
+    # 圧縮された取り込みペイロード（Content-Encoding: gzip / zstd）の展開後サイズ上限
+    INGEST_MAX_DECOMPRESSED_BYTES: int = 32 * 1024 * 1024
+
+    @field_validator("EVENT_INGEST_MODE", mode="before")
+    @classmethod
+    def validate_ingest_mode(cls, v):
+        """取り込みモードの検証"""
+        mode = str(v).strip().lower()
+        if mode not in ("pubsub", "stream"):
+            raise ValueError(
+                "EVENT_INGEST_MODE は 'pubsub' または 'stream' を指定してください"
+            )
+        return mode
+
     # JWT Authentication
     SECRET_KEY: str = "your-secret-key-here-change-in-production"
     ALGORITHM: str = "HS256"
@@ -0,0 +1,72 @@
+"""
+依存サービスのレイテンシ計測
+
+PostgreSQL（コミットを含むDB処理）・InfluxDB書き込み・Redis（PUBLISH・インデックス更新）の所要時間を
+依存サービスごとの直近ウィンドウで保持し、平均とp90を提供します。
+ワーカーの同時実行数制御（worker.concurrency_limiter）が目標レイテンシとの比較に使用します。
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from core.config import settings
+
+# 依存サービス名
+POSTGRES = "postgres"
+INFLUX = "influx"
+REDIS = "redis"
+
+# 依存サービスごとに保持する最大サンプル数
+MAX_SAMPLES_PER_DEPENDENCY = 500
+
+
+class DependencyLatencyTracker:
+    """
+    依存サービスごとの直近レイテンシ
+
+    DB・InfluxDB・Redis用スレッドプールのスレッドからも記録されるため、ロックで保護する。
+    """
+
+    def __init__(self, window_seconds: Optional[float] = None):
+        self.window_seconds = (
+            window_seconds or settings.CONCURRENCY_LATENCY_WINDOW_SECONDS
+        )
+        self._samples: Dict[str, Deque[Tuple[float, float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, dependency: str, latency_ms: float):
+        """所要時間（ミリ秒）を記録"""
+        with self._lock:
+            samples = self._samples.setdefault(
+                dependency, deque(maxlen=MAX_SAMPLES_PER_DEPENDENCY)
+            )
+            samples.append((time.monotonic(), latency_ms))
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """ウィンドウ内のサンプル数・平均・p90（依存サービスごと）"""
+        cutoff = time.monotonic() - self.window_seconds
+        with self._lock:
+            windows = {
+                dependency: sorted(ms for at, ms in samples if at >= cutoff)
+                for dependency, samples in self._samples.items()
+            }
+
+        result: Dict[str, Dict[str, Any]] = {}
+        for dependency, values in windows.items():
+            if not values:
+                result[dependency] = {"samples": 0, "avg_ms": None, "p90_ms": None}
+                continue
+            p90_index = min(len(values) - 1, math.ceil(len(values) * 0.9) - 1)
+            result[dependency] = {
+                "samples": len(values),
+                "avg_ms": round(sum(values) / len(values), 2),
+                "p90_ms": round(values[p90_index], 2),
+            }
+        return result
+
+
+# グローバルインスタンス
+dependency_latency = DependencyLatencyTracker()
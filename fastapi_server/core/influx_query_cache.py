@@ -0,0 +1,118 @@
+"""
+InfluxDBクエリ結果のキャッシュ（シングルフライト）
+
+ダッシュボードのクエリ結果を集計ウィンドウに揃えたキーで一定時間保持します。
+同じキーの取得が同時に行われた場合は1回のクエリを共有するため、
+閲覧者数に関係なくInfluxDBへのクエリ数は (キーの種類 × TTL) あたり1回になります。
+
+- キーには時刻をTTL単位に切り捨てた値を含め、同じ区間の要求が同じクエリになるようにする
+- TTLは集計ウィンドウの長さに比例（INFLUX_QUERY_CACHE_TTL_FRACTION、下限あり）
+- クエリの失敗はキャッシュしない（待機していた要求には同じ例外を返す）
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Coroutine, Dict, Hashable, Optional, Tuple, TypeVar
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# loader が返すクエリ結果の型
+T = TypeVar("T")
+
+
+def window_ttl(window_seconds: float) -> float:
+    """集計ウィンドウの長さに応じたTTL（秒）"""
+    return max(
+        settings.INFLUX_QUERY_CACHE_MIN_TTL_SECONDS,
+        window_seconds * settings.INFLUX_QUERY_CACHE_TTL_FRACTION,
+    )
+
+
+def aligned_now(ttl: float, now: Optional[float] = None) -> datetime:
+    """現在時刻をTTL単位に切り捨てた時刻（UTC、naive）"""
+    now = time.time() if now is None else now
+    return datetime.utcfromtimestamp(math.floor(now / ttl) * ttl)
+
+
+class InfluxQueryCache:
+    """集計ウィンドウに揃えたキーでクエリ結果を保持するシングルフライトキャッシュ"""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or settings.INFLUX_QUERY_CACHE_MAX_ENTRIES
+        # キー → (有効期限（monotonic）, 値)
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        # キー → 実行中のクエリ
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+        # 統計
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+
+    async def get_or_load(
+        self, key: Hashable, ttl: float, loader: Callable[[], Coroutine[Any, Any, T]]
+    ) -> T:
+        """
+        キャッシュされた結果を返す（ない場合は loader を実行し、同時の要求で共有する）
+
+        Args:
+            key: キャッシュキー（時刻はTTL単位に切り捨てて含める）
+            ttl: 保持する秒数
+            loader: クエリを実行して結果を返すコルーチン関数
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["misses"] += 1
+            # 最初の要求がキャンセルされても待機中の要求に結果を返せるよう独立したタスクで実行
+            task = asyncio.create_task(loader())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._on_done(key, ttl, done))
+        return await asyncio.shield(task)
+
+    def _on_done(self, key: Hashable, ttl: float, task: asyncio.Task):
+        self._in_flight.pop(key, None)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            self.stats["errors"] += 1
+            logger.warning(f"InfluxDB query for {key} failed: {error}")
+            return
+        self._entries[key] = (time.monotonic() + ttl, task.result())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """キャッシュを破棄（実行中のクエリは継続）"""
+        self._entries.clear()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """ヒット率とエントリ数"""
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "in_flight": len(self._in_flight),
+            "hit_rate": (
+                round((self.stats["hits"] + self.stats["coalesced"]) / lookups, 3)
+                if lookups
+                else 0.0
+            ),
+        }
+
+
+# グローバルインスタンス
+influx_query_cache = InfluxQueryCache()
@@ -0,0 +1,296 @@
+"""
+InfluxDB進捗イベントのロールアップ（ダウンサンプリング）
+
+ダッシュボードのアクティビティチャートとクラス全体のメトリクスが毎回生の進捗イベントを
+集計しないよう、ワーカーが定期的にダウンサンプリングのFluxスクリプトを実行し、
+学生（チーム）ごとの集計を別のメジャーメントに書き込みます。
+
+- 1分単位: 生のイベントから直近 INFLUX_ROLLUP_LOOKBACK_MINUTES 分を再集計（遅れて届いたイベントを反映）
+- 1時間単位: 1分単位のロールアップから直近の時間を再集計
+- フィールド: executions, errors, help, duration_sum, duration_count
+- タイムスタンプは各区間の開始時刻（再集計しても同じ点を上書きするため冪等）
+- ディスクに退避された行（InfluxDB停止中の書き込み、全ワーカープロセス分）は再送が完了するまで対象の区間を再集計
+アクティブユーザー数はロールアップの emailAddress タグの distinct で数えます。
+ダッシュボードは集計ウィンドウを割り切れる最も粗いロールアップを参照します。
+
+ロールアップの作成範囲（最後の作成開始時刻）と最終更新時刻はRedisのウォーターマークに記録し、
+作成前（デプロイ直後）や更新が INFLUX_ROLLUP_LOOKBACK_MINUTES より古い（ワーカー停止中）場合、
+ダッシュボードは生のイベントを集計します。
+ワーカーの起動時はウォーターマークの最終更新時刻から再集計し、過去の期間からの作成
+（INFLUX_ROLLUP_BACKFILL_HOURS）はウォーターマークがない場合のみ行います。
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple, Union
+
+from core.config import settings
+from core.influxdb_batch_writer import batch_writer
+from db.executor import run_influx
+from db.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# ロールアップのウォーターマーク（ハッシュ: covered_from, updated_at。いずれもUNIX秒）
+ROLLUP_WATERMARK_KEY = "influx_rollup:watermark"
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+@dataclass(frozen=True)
+class Rollup:
+    """ロールアップの解像度"""
+
+    name: str
+    seconds: int
+
+    @property
+    def measurement(self) -> str:
+        return f"{settings.INFLUX_PROGRESS_MEASUREMENT}_{self.name}"
+
+
+ROLLUP_1M = Rollup("1m", 60)
+ROLLUP_1H = Rollup("1h", 3600)
+# 粗い順
+ROLLUPS = (ROLLUP_1H, ROLLUP_1M)
+
+
+def choose_rollup(window_seconds: int) -> Optional[Rollup]:
+    """集計ウィンドウを割り切れる最も粗いロールアップ（無効な場合は None）"""
+    if not settings.INFLUX_ROLLUP_ENABLED:
+        return None
+    for rollup in ROLLUPS:
+        if window_seconds >= rollup.seconds and window_seconds % rollup.seconds == 0:
+            return rollup
+    return None
+
+
+@dataclass(frozen=True)
+class RollupWatermark:
+    """ロールアップの作成範囲と最終更新時刻"""
+
+    # この時刻以降のイベントがロールアップに含まれる
+    covered_from: float
+    # 最後にロールアップを更新した時刻
+    updated_at: float
+
+    def covers(self, start_time: datetime, now: float) -> bool:
+        """start_time 以降の集計にロールアップを使用できるか（作成済みかつ更新が遅れていない）"""
+        max_age = settings.INFLUX_ROLLUP_LOOKBACK_MINUTES * 60
+        return (
+            self.covered_from <= (start_time - _EPOCH).total_seconds()
+            and now - self.updated_at <= max_age
+        )
+
+
+async def read_watermark() -> Optional[RollupWatermark]:
+    """ウォーターマークを取得（ない場合・Redis障害時は None）"""
+    try:
+        client = await get_redis_client()
+        fields = await client.hgetall(ROLLUP_WATERMARK_KEY)
+    except Exception as e:
+        logger.warning(f"Failed to read InfluxDB rollup watermark: {e}")
+        return None
+    if not fields or "covered_from" not in fields or "updated_at" not in fields:
+        return None
+    return RollupWatermark(float(fields["covered_from"]), float(fields["updated_at"]))
+
+
+async def record_watermark(
+    updated_at: datetime, covered_from: Optional[datetime] = None
+):
+    """ロールアップの更新を記録（covered_from は過去のイベントから作成した場合のみ指定）"""
+    fields: Dict[Union[str, bytes], float] = {
+        "updated_at": (updated_at - _EPOCH).total_seconds()
+    }
+    if covered_from is not None:
+        fields["covered_from"] = (covered_from - _EPOCH).total_seconds()
+    client = await get_redis_client()
+    await client.hset(ROLLUP_WATERMARK_KEY, mapping=fields)
+
+
+async def choose_available_rollup(
+    window_seconds: int, start_time: datetime
+) -> Optional[Rollup]:
+    """
+    start_time 以降の集計に使用できるロールアップ（None の場合は生のイベントを集計する）
+
+    ロールアップが無効・作成前・更新が遅れている場合は None を返す。
+    """
+    rollup = choose_rollup(window_seconds)
+    if rollup is None:
+        return None
+    watermark = await read_watermark()
+    if watermark is None or not watermark.covers(start_time, time.time()):
+        return None
+    return rollup
+
+
+def floor_time(at: datetime, seconds: int) -> datetime:
+    """時刻（naive は UTC）を seconds 単位に切り捨てた naive UTC 時刻"""
+    if at.tzinfo is not None:
+        at = at.astimezone(timezone.utc).replace(tzinfo=None)
+    epoch = datetime(1970, 1, 1)
+    elapsed = int((at - epoch).total_seconds())
+    return epoch + timedelta(seconds=elapsed // seconds * seconds)
+
+
+def _format(at: datetime) -> str:
+    return at.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def build_minute_rollup_query(start_time: datetime) -> str:
+    """生のイベントから start_time 以降の1分単位のロールアップを書き込むFluxスクリプト"""
+    bucket = settings.INFLUXDB_BUCKET
+    target = ROLLUP_1M.measurement
+
+    def rollup(source: str, field: str, fn: str) -> str:
+        return f"""
+    {source}
+      |> group(columns: ["emailAddress", "teamName"])
+      |> aggregateWindow(every: 1m, fn: {fn}, createEmpty: false, timeSrc: "_start")
+      |> set(key: "_measurement", value: "{target}")
+      |> set(key: "_field", value: "{field}")
+      |> to(bucket: "{bucket}", org: "{settings.INFLUXDB_ORG}")
+"""
+
+    return f"""
+    raw = from(bucket: "{bucket}")
+      |> range(start: {_format(start_time)})
+      |> filter(fn: (r) => r._measurement == "{settings.INFLUX_PROGRESS_MEASUREMENT}")
+
+    executions = raw
+      |> filter(fn: (r) => r.event == "cell_executed" and r._field == "success")
+
+    durations = raw
+      |> filter(fn: (r) => r.event == "cell_executed" and r._field == "duration")
+      |> filter(fn: (r) => r._value > 0)
+{rollup("executions", "executions", "count")}
+{rollup('executions |> filter(fn: (r) => r._value == false)', "errors", "count")}
+{rollup('raw |> filter(fn: (r) => r.event == "help" and r._field == "cellIndex")', "help", "count")}
+{rollup("durations", "duration_sum", "sum")}
+{rollup("durations", "duration_count", "count")}
+    """
+
+
+def build_hour_rollup_query(start_time: datetime) -> str:
+    """1分単位のロールアップから start_time 以降の1時間単位のロールアップを書き込むFluxスクリプト"""
+    bucket = settings.INFLUXDB_BUCKET
+    return f"""
+    from(bucket: "{bucket}")
+      |> range(start: {_format(start_time)})
+      |> filter(fn: (r) => r._measurement == "{ROLLUP_1M.measurement}")
+      |> group(columns: ["emailAddress", "teamName", "_field"])
+      |> aggregateWindow(every: 1h, fn: sum, createEmpty: false, timeSrc: "_start")
+      |> set(key: "_measurement", value: "{ROLLUP_1H.measurement}")
+      |> to(bucket: "{bucket}", org: "{settings.INFLUXDB_ORG}")
+    """
+
+
+class InfluxRollupScheduler:
+    """ダウンサンプリングを定期的に実行するクラス（ワーカーの1プロセスで実行）"""
+
+    def __init__(self, interval_seconds: Optional[int] = None):
+        self.interval_seconds = (
+            interval_seconds or settings.INFLUX_ROLLUP_INTERVAL_SECONDS
+        )
+        self._backfilled = False
+        # 起動時に読み込んだウォーターマークの最終更新時刻（以前のプロセスの続きから再集計する）
+        self._resumed_at: Optional[datetime] = None
+        # ディスクに退避された行の再送が完了するまで再集計を続ける開始時刻
+        self._recompute_from: Optional[datetime] = None
+
+        # 統計
+        self.stats: Dict[str, Any] = {"runs": 0, "failures": 0, "last_run_at": None}
+
+    def _first_start(self, now: datetime) -> Tuple[datetime, bool]:
+        """
+        初回に再集計する開始時刻と、過去のイベントから作成し直すかどうか
+
+        以前のプロセスのウォーターマークがあればその最終更新時刻から再集計する。
+        ない場合と、停止期間が作成期間より長い場合は過去の期間から作成する。
+        """
+        lookback = timedelta(minutes=settings.INFLUX_ROLLUP_LOOKBACK_MINUTES)
+        backfill_start = now - timedelta(hours=settings.INFLUX_ROLLUP_BACKFILL_HOURS)
+        if self._resumed_at is not None:
+            resume_start = min(self._resumed_at, now) - lookback
+            if resume_start > backfill_start:
+                return resume_start, False
+        return backfill_start, True
+
+    def _starts(
+        self, now: datetime, spilled_at: Optional[float]
+    ) -> Tuple[datetime, datetime, bool]:
+        """
+        今回再集計する1分・1時間のロールアップの開始時刻（区間の境界に揃える）と、
+        過去のイベントから作成し直すかどうか
+        """
+        lookback = timedelta(minutes=settings.INFLUX_ROLLUP_LOOKBACK_MINUTES)
+        start = now - lookback
+        backfill = False
+        if not self._backfilled:
+            # 初回は以前のプロセスの続き、またはウォーターマークがなければ過去のイベントから作成
+            start, backfill = self._first_start(now)
+
+        # 退避された行は再送されるまで生のイベントに現れないため、
+        # 退避中と再送完了後の1回は最古のセグメントの作成時刻から再集計する
+        if spilled_at is not None:
+            spill_start = datetime.utcfromtimestamp(spilled_at) - lookback
+            if self._recompute_from is None or spill_start < self._recompute_from:
+                self._recompute_from = spill_start
+        if self._recompute_from is not None:
+            start = min(start, self._recompute_from)
+
+        minute_start = floor_time(start, ROLLUP_1M.seconds)
+        hour_start = floor_time(minute_start, ROLLUP_1H.seconds)
+        return minute_start, hour_start, backfill
+
+    async def run_once(self, now: Optional[datetime] = None):
+        """1分・1時間のロールアップを再集計"""
+        from db.influxdb_client import query_progress_data
+
+        now = now or datetime.utcnow()
+        if not self._backfilled and self._resumed_at is None:
+            watermark = await read_watermark()
+            if watermark is not None:
+                self._resumed_at = datetime.utcfromtimestamp(watermark.updated_at)
+        # 他のシャードのプロセスが退避した行も含める
+        spilled_at = await batch_writer.oldest_spilled_at()
+        minute_start, hour_start, backfill = self._starts(now, spilled_at)
+        await run_influx(query_progress_data, build_minute_rollup_query(minute_start))
+        await run_influx(query_progress_data, build_hour_rollup_query(hour_start))
+        # 時間単位のロールアップの最初の区間は minute_start より前を含まないため、作成範囲は次の区間以降
+        covered_from = None
+        if backfill:
+            covered_from = (
+                minute_start
+                if minute_start == hour_start
+                else hour_start + timedelta(hours=1)
+            )
+        await record_watermark(now, covered_from=covered_from)
+        self._backfilled = True
+        if spilled_at is None:
+            self._recompute_from = None
+        self.stats["runs"] += 1
+        self.stats["last_run_at"] = datetime.utcnow().isoformat()
+
+    async def run(self, is_running):
+        """
+        is_running() が True の間、定期的にロールアップを更新する
+
+        Args:
+            is_running: 継続判定関数
+        """
+        logger.info(
+            f"[WORKER] InfluxDB rollup scheduler started (every {self.interval_seconds}s)"
+        )
+        while is_running():
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.stats["failures"] += 1
+                logger.warning(f"[WORKER] InfluxDB rollup failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
@@ -0,0 +1,292 @@
+"""
+InfluxDB書き込みのディスク退避（先行書き込みログ）
+
+InfluxDBが遅延・停止している間、送信できないラインプロトコルの行を
+ローカルのセグメントファイルに追記します。セグメントは古い順に再送され、
+全行の送信が完了したら削除されます。ファイル操作はスレッドから呼び出されるため、
+呼び出し側で直列化する（1スレッドのプールで実行する）ことを前提とします。
+
+複数のワーカープロセスが同じ INFLUX_SPILL_DIR を使うため、各プロセスは専用の
+サブディレクトリ（例: shard-0-1234）にのみ追記・再送します。サブディレクトリは
+ロックファイルの flock で所有し、プロセスの終了時（異常終了を含む）にロックは解放されます。
+起動時の load で、ロックされていない他のサブディレクトリ（終了したプロセスのもの）と
+INFLUX_SPILL_DIR 直下の旧形式のセグメントを自分のサブディレクトリに移動して引き継ぎます。
+"""
+
+import fcntl
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = ".lp"
+# サブディレクトリの所有を示すロックファイル
+LOCK_FILE_NAME = ".lock"
+
+
+@dataclass
+class SpillSegment:
+    """セグメントファイル（ファイル名は作成時刻のナノ秒）"""
+
+    path: Path
+    points: int
+    bytes: int
+
+    @property
+    def created_at(self) -> float:
+        try:
+            return int(self.path.stem.split("-")[0]) / 1_000_000_000
+        except ValueError:
+            return time.time()
+
+
+class InfluxSpillStore:
+    """ラインプロトコルのセグメントファイル群"""
+
+    def __init__(
+        self,
+        directory: str,
+        segment_max_bytes: int,
+        max_bytes: int,
+        owner: Optional[str] = None,
+    ):
+        self.root = Path(directory)
+        # このプロセス専用のサブディレクトリ
+        self.directory = self.root / (owner or f"process-{os.getpid()}")
+        self._lock_fd: Optional[int] = None
+        self.segment_max_bytes = segment_max_bytes
+        self.max_bytes = max_bytes
+        # 古い順（末尾が追記中のセグメント）
+        self.segments: Deque[SpillSegment] = deque()
+        # 再送中のセグメント（追記しない）
+        self._replaying: Optional[SpillSegment] = None
+        self._sequence = 0
+        self.spilled_points = 0
+        self.dropped_points = 0
+
+    @property
+    def bytes_on_disk(self) -> int:
+        return sum(segment.bytes for segment in self.segments)
+
+    @property
+    def points_on_disk(self) -> int:
+        return sum(segment.points for segment in self.segments)
+
+    def load(self, owner: Optional[str] = None):
+        """
+        サブディレクトリを所有し、終了したプロセスのセグメントを引き継いで読み込む（起動時に呼び出す）
+
+        Args:
+            owner: サブディレクトリ名（例: shard-0-1234。None の場合は生成時の名前）
+        """
+        if owner is not None and self._lock_fd is None:
+            self.directory = self.root / owner
+        self._lock_directory()
+        self._adopt_orphans()
+
+        self.segments.clear()
+        for path in sorted(self.directory.glob(f"*{SEGMENT_SUFFIX}")):
+            data = path.read_bytes()
+            if not data:
+                path.unlink()
+                continue
+            self.segments.append(SpillSegment(path, data.count(b"\n"), len(data)))
+        if self.segments:
+            logger.info(
+                f"Loaded {len(self.segments)} spilled InfluxDB segments "
+                f"({self.points_on_disk} points, {self.bytes_on_disk} bytes)"
+            )
+
+    def _lock_directory(self):
+        """自分のサブディレクトリのロックを取得（引き継ぎで削除された場合は作り直す）"""
+        while self._lock_fd is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            lock_path = self.directory / LOCK_FILE_NAME
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                same_file = os.stat(lock_path).st_ino == os.fstat(fd).st_ino
+            except FileNotFoundError:
+                same_file = False
+            if same_file:
+                self._lock_fd = fd
+            else:
+                os.close(fd)
+
+    def _try_lock(self, directory: Path) -> Optional[int]:
+        """他のサブディレクトリのロックを取得（所有プロセスが動作中の場合は None）"""
+        try:
+            fd = os.open(directory / LOCK_FILE_NAME, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError:
+            return None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+
+    def _adopt_orphans(self):
+        """終了したプロセスのサブディレクトリと旧形式のセグメントを自分のサブディレクトリに移動"""
+        adopted = 0
+        for path in sorted(self.root.glob(f"*{SEGMENT_SUFFIX}")):
+            adopted += self._adopt_segment(path)
+
+        for directory in sorted(self.root.iterdir()):
+            if not directory.is_dir() or directory == self.directory:
+                continue
+            fd = self._try_lock(directory)
+            if fd is None:
+                continue
+            try:
+                for path in sorted(directory.glob(f"*{SEGMENT_SUFFIX}")):
+                    adopted += self._adopt_segment(path)
+                # ロックを保持したまま削除する（所有しようとしたプロセスは作り直す）
+                for leftover in directory.iterdir():
+                    leftover.unlink(missing_ok=True)
+                directory.rmdir()
+            except OSError as e:
+                logger.warning(f"Failed to adopt spill directory {directory}: {e}")
+            finally:
+                os.close(fd)
+
+        if adopted:
+            logger.info(
+                f"Adopted {adopted} spilled InfluxDB segments into {self.directory}"
+            )
+
+    def _adopt_segment(self, path: Path) -> int:
+        target = self.directory / path.name
+        if target.exists():
+            target = (
+                self.directory / f"{path.stem}-{self.directory.name}{SEGMENT_SUFFIX}"
+            )
+        try:
+            os.replace(path, target)
+        except FileNotFoundError:
+            # 他のプロセスが先に引き継いだ
+            return 0
+        return 1
+
+    def close(self):
+        """サブディレクトリのロックを解放（停止時に呼び出す）"""
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def _new_segment(self) -> SpillSegment:
+        self._sequence += 1
+        name = f"{time.time_ns()}-{self._sequence:06d}{SEGMENT_SUFFIX}"
+        segment = SpillSegment(self.directory / name, 0, 0)
+        self.segments.append(segment)
+        return segment
+
+    def append(self, lines: List[str]):
+        """行を最新のセグメントに追記（サイズ上限でローテーション）"""
+        if not lines:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        segment = self.segments[-1] if self.segments else None
+        # 再送中のセグメントには追記しない
+        if (
+            segment is None
+            or segment is self._replaying
+            or segment.bytes >= self.segment_max_bytes
+        ):
+            segment = self._new_segment()
+
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        with open(segment.path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        segment.points += len(lines)
+        segment.bytes += len(data)
+        self.spilled_points += len(lines)
+        self._enforce_limit()
+
+    def _enforce_limit(self):
+        """ディスク使用量の上限を超えた場合は最古のセグメントから削除する"""
+        while self.bytes_on_disk > self.max_bytes and len(self.segments) > 1:
+            oldest = self.segments.popleft()
+            if oldest is self._replaying:
+                self._replaying = None
+            oldest.path.unlink(missing_ok=True)
+            self.dropped_points += oldest.points
+            logger.error(
+                f"InfluxDB spill limit {self.max_bytes} bytes exceeded, "
+                f"dropped segment {oldest.path.name} ({oldest.points} points)"
+            )
+
+    def oldest(self) -> Optional[SpillSegment]:
+        """最古のセグメント"""
+        return self.segments[0] if self.segments else None
+
+    def oldest_spilled_at(self) -> Optional[float]:
+        """
+        INFLUX_SPILL_DIR 全体（他プロセスのサブディレクトリと旧形式を含む）で最古のセグメントの作成時刻
+
+        ロールアップは1プロセスで実行するため、他のシャードが退避した行も対象にする。
+        """
+        paths = [
+            *self.root.glob(f"*{SEGMENT_SUFFIX}"),
+            *self.root.glob(f"*/*{SEGMENT_SUFFIX}"),
+        ]
+        if not paths:
+            return None
+        return min(SpillSegment(path, 0, 0).created_at for path in paths)
+
+    def begin_replay(self) -> Optional[SpillSegment]:
+        """最古のセグメントを再送対象にする（以降の追記は新しいセグメントに行う）"""
+        self._replaying = self.oldest()
+        return self._replaying
+
+    def read(self, segment: SpillSegment) -> List[str]:
+        """セグメントの行を読み込む"""
+        return segment.path.read_text(encoding="utf-8").splitlines()
+
+    def truncate_front(self, segment: SpillSegment, remaining: List[str]):
+        """送信済みの行を除いた残りでセグメントを書き換える"""
+        if segment not in self.segments:
+            # 再送中にディスク上限で削除された
+            return
+        if not remaining:
+            self.remove(segment)
+            return
+        data = ("\n".join(remaining) + "\n").encode("utf-8")
+        tmp_path = segment.path.with_suffix(".tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, segment.path)
+        segment.points = len(remaining)
+        segment.bytes = len(data)
+
+    def remove(self, segment: SpillSegment):
+        """再送が完了したセグメントを削除"""
+        if segment is self._replaying:
+            self._replaying = None
+        segment.path.unlink(missing_ok=True)
+        try:
+            self.segments.remove(segment)
+        except ValueError:
+            pass
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """ディスク上の行数・バイト数と再送の遅れ"""
+        oldest = self.oldest()
+        return {
+            "directory": str(self.directory),
+            "segments": len(self.segments),
+            "bytes_on_disk": self.bytes_on_disk,
+            "points_on_disk": self.points_on_disk,
+            "max_bytes": self.max_bytes,
+            "replay_lag_seconds": (
+                round(time.time() - oldest.created_at, 1) if oldest else 0.0
+            ),
+            "spilled_points": self.spilled_points,
+            "dropped_points": self.dropped_points,
+        }
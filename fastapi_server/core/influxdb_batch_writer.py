@@ -1,225 +1,523 @@
 """
 InfluxDBバッチライター
-効率的なバッチ書き込みとメトリクス収集
+ラインプロトコルのバッファリングと非同期バッチ書き込み
+
+イベント辞書から直接ラインプロトコルを組み立ててバッファし、gzip圧縮したバッチを
+InfluxDB v2 の書き込みAPIへ非同期HTTPで送信します。
+フラッシュは専用タスクが行い、行数・バイト数の目標に達したとき、または最古の行が
+最大滞留時間を超えたときに実行します（同時に発生したフラッシュ要求は1回にまとめる）。
+送信中のリクエスト数には上限を設け、メモリ上のバッファは行数で制限します。
+送信に失敗した行とバッファの上限を超えた行はディスクのセグメントファイルに退避し、
+InfluxDBの回復後に一定のレートで再送します。
 """
 
 import asyncio
+import gzip
 import logging
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+import time
 from collections import defaultdict
-import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+import httpx
+from pydantic import BaseModel
 
-from influxdb_client import Point
 from core.config import settings
-from db.influxdb_client import influx_client, write_api
+from core.dependency_latency import INFLUX, dependency_latency
+from core.influx_spill import InfluxSpillStore
+from db.executor import BlockingIOExecutor
+from db.influx_line_protocol import (
+    PERFORMANCE_METRICS_LAYOUT,
+    SYSTEM_METRICS_LAYOUT,
+    MeasurementLayout,
+    build_line,
+    progress_layout,
+)
 
 logger = logging.getLogger(__name__)
 
+# 書き込みリクエストのタイムアウト（秒）
+WRITE_TIMEOUT_SECONDS = 10.0
+
+# フラッシュ1回あたりの行数・書き込みレイテンシのヒストグラムのバケット上限
+FLUSH_SIZE_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000)
+WRITE_LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+class FlushHistogram:
+    """フラッシュ時の値のヒストグラム（累積ではないバケット別件数）"""
+
+    def __init__(self, buckets, unit: str):
+        self.buckets = buckets
+        self.unit = unit
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        """値を記録"""
+        index = len(self.buckets)
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"<={upper}{self.unit}" for upper in self.buckets] + [
+            f">{self.buckets[-1]}{self.unit}"
+        ]
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 3) if self.count else 0.0,
+            "max": round(self.max, 3),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
 
 class InfluxDBBatchWriter:
     """InfluxDBのバッチ書き込みとメトリクス管理"""
-    
-    def __init__(self, batch_size: int = 100, flush_interval_seconds: int = 30):
-        self.batch_size = batch_size
-        self.flush_interval_seconds = flush_interval_seconds
-        self.point_buffer: List[Point] = []
+
+    def __init__(
+        self,
+        batch_size: Optional[int] = None,
+        max_linger_ms: Optional[int] = None,
+        max_batch_bytes: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+        gzip_level: Optional[int] = None,
+        layout: Optional[MeasurementLayout] = None,
+        max_buffer_points: Optional[int] = None,
+        spill_store: Optional[InfluxSpillStore] = None,
+        replay_points_per_second: Optional[int] = None,
+    ):
+        self.batch_size = batch_size or settings.INFLUX_WRITE_BATCH_SIZE
+        self.max_linger_seconds = (max_linger_ms or settings.INFLUX_WRITE_MAX_LINGER_MS) / 1000
+        self.max_batch_bytes = max_batch_bytes or settings.INFLUX_WRITE_MAX_BATCH_BYTES
+        self.max_in_flight = max_in_flight or settings.INFLUX_WRITE_MAX_IN_FLIGHT
+        self.gzip_level = settings.INFLUX_WRITE_GZIP_LEVEL if gzip_level is None else gzip_level
+        self.layout = layout or progress_layout()
+        self.max_buffer_points = max_buffer_points or settings.INFLUX_WRITE_BUFFER_MAX_POINTS
+        self.replay_points_per_second = (
+            replay_points_per_second or settings.INFLUX_SPILL_REPLAY_POINTS_PER_SECOND
+        )
+        self.spill = spill_store or InfluxSpillStore(
+            settings.INFLUX_SPILL_DIR,
+            segment_max_bytes=settings.INFLUX_SPILL_SEGMENT_MAX_BYTES,
+            max_bytes=settings.INFLUX_SPILL_MAX_BYTES,
+        )
+        # セグメントファイルの操作は1スレッドで直列に実行する
+        self._spill_executor = BlockingIOExecutor(1, "influx-spill")
+
+        self.line_buffer: List[str] = []
+        self.buffer_bytes = 0
+        # バッファ内の最古の行の追加時刻（最大滞留時間の判定に使用）
+        self._oldest_buffered_at: Optional[float] = None
+        self._flush_requested = asyncio.Event()
         self.metrics_buffer: Dict[str, Any] = defaultdict(int)
         self.last_flush_time = datetime.utcnow()
         self.flush_task: Optional[asyncio.Task] = None
+        self.replay_task: Optional[asyncio.Task] = None
         self.is_running = False
-        
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._send_slots = asyncio.Semaphore(self.max_in_flight)
+        self._slot_released = asyncio.Event()
+        self._in_flight: Set[asyncio.Task] = set()
+
         # メトリクス統計
         self.total_points_written = 0
         self.total_batches_written = 0
+        self.total_bytes_sent = 0
         self.write_errors = 0
-        
-    async def start_batch_writer(self):
-        """バッチライターを開始"""
+        self.dropped_points = 0
+        self.replayed_points = 0
+        self.flush_triggers: Dict[str, int] = defaultdict(int)
+        self.coalesced_flush_requests = 0
+        self.flush_size_histogram = FlushHistogram(FLUSH_SIZE_BUCKETS, "points")
+        self.write_latency_histogram = FlushHistogram(WRITE_LATENCY_BUCKETS_MS, "ms")
+
+    async def start_batch_writer(self, spill_owner: Optional[str] = None):
+        """
+        バッチライターを開始
+
+        Args:
+            spill_owner: ディスク退避に使うプロセス専用のサブディレクトリ名（例: shard-0-1234）
+        """
         if self.is_running:
             logger.warning("Batch writer is already running")
             return
-        
+
+        try:
+            await self._spill_executor.run(self.spill.load, spill_owner)
+        except OSError as e:
+            logger.error(f"Failed to load spilled InfluxDB segments: {e}")
+
         self.is_running = True
         self.flush_task = asyncio.create_task(self._flush_loop())
+        self.replay_task = asyncio.create_task(self._replay_loop())
         logger.info(
             f"InfluxDB batch writer started: "
+            f"measurement={self.layout.measurement}, "
             f"batch_size={self.batch_size}, "
-            f"flush_interval={self.flush_interval_seconds}s"
+            f"max_batch_bytes={self.max_batch_bytes}, "
+            f"max_linger={self.max_linger_seconds * 1000:.0f}ms, "
+            f"max_in_flight={self.max_in_flight}"
         )
-    
+
     async def stop_batch_writer(self):
-        """バッチライターを停止"""
+        """バッチライターを停止（残りのバッファと送信中のリクエストを待ってから終了）"""
         self.is_running = False
-        
-        # 最終フラッシュを実行
-        await self._flush_buffer()
-        
-        if self.flush_task:
-            self.flush_task.cancel()
-            try:
-                await self.flush_task
-            except asyncio.CancelledError:
-                pass
-        
+
+        for task in (self.flush_task, self.replay_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+        # 最終フラッシュを実行（送信できない行はディスクに退避される）
+        while self.line_buffer:
+            await self._send_slots.acquire()
+            self._start_send(self._take_batch())
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        await self._spill_executor.run(self.spill.close)
+        self._spill_executor.shutdown()
+
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
         logger.info(
             f"InfluxDB batch writer stopped. "
             f"Total points written: {self.total_points_written}, "
             f"Total batches: {self.total_batches_written}, "
-            f"Errors: {self.write_errors}"
+            f"Errors: {self.write_errors}, "
+            f"Points on disk: {self.spill.points_on_disk}"
         )
-    
-    async def add_progress_point(self, event_data: Dict[str, Any]):
-        """進捗イベントポイントをバッファに追加"""
+
+    async def add_progress_point(self, event_data: Any):
+        """
+        進捗イベントをバッファに追加
+
+        Args:
+            event_data: イベント辞書（EventData などのモデルも可）
+        """
+        if isinstance(event_data, BaseModel):
+            event_data = event_data.model_dump()
         try:
-            # 基本情報の抽出
-            email = event_data.get("emailAddress", "unknown")
-            notebook_path = event_data.get("notebookPath", "")
-            event_type = event_data.get("eventType", "unknown")
-            
-            # ノートブック情報の解析
-            notebook_name = notebook_path.split("/")[-1] if notebook_path else "unknown"
-            notebook_dir = "/".join(notebook_path.split("/")[:-1]) if "/" in notebook_path else "root"
-            
-            # ポイント作成
-            point = (
-                Point("student_progress_v2")
-                .tag("email_address", email)
-                .tag("event_type", event_type)
-                .tag("notebook_name", notebook_name)
-                .tag("notebook_dir", notebook_dir)
-                .tag("session_id", event_data.get("sessionId", "unknown"))
-                .field("notebook_path", notebook_path)
-                .field("cell_index", event_data.get("cellIndex", -1))
-                .field("cell_id", event_data.get("cellId", ""))
-                .field("execution_count", event_data.get("executionCount", -1))
-                .field("duration_ms", event_data.get("executionDurationMs", 0))
-                .field("has_error", event_data.get("hasError", False))
-                .time(datetime.utcnow())
-            )
-            
-            await self._add_point_to_buffer(point)
-            
-            # メトリクス更新
-            self.metrics_buffer[f"events_{event_type}"] += 1
-            self.metrics_buffer[f"students_{email}"] += 1
-            self.metrics_buffer["total_events"] += 1
-            
+            line = build_line(event_data, self.layout)
         except Exception as e:
-            logger.error(f"Failed to create progress point: {e}")
+            logger.error(f"Failed to build progress line: {e}")
             self.write_errors += 1
-    
+            return
+        if line is None:
+            return
+
+        self._add_line_to_buffer(line)
+
+        # メトリクス更新
+        event_type = event_data.get("eventType", "unknown")
+        self.metrics_buffer[f"events_{event_type}"] += 1
+        self.metrics_buffer["total_events"] += 1
+
     async def add_system_metrics_point(self, metrics: Dict[str, Any]):
-        """システムメトリクスポイントをバッファに追加"""
-        try:
-            point = (
-                Point("system_metrics")
-                .tag("metric_type", "system_health")
-                .field("websocket_connections", metrics.get("websocket_connections", 0))
-                .field("worker_processed_messages", metrics.get("worker_processed_messages", 0))
-                .field("worker_error_count", metrics.get("worker_error_count", 0))
-                .field("redis_memory_usage", metrics.get("redis_memory_usage", 0))
-                .field("postgres_connections", metrics.get("postgres_connections", 0))
-                .time(datetime.utcnow())
-            )
-            
-            await self._add_point_to_buffer(point)
-            
-        except Exception as e:
-            logger.error(f"Failed to create system metrics point: {e}")
-            self.write_errors += 1
-    
+        """システムメトリクスをバッファに追加"""
+        line = build_line(metrics, SYSTEM_METRICS_LAYOUT)
+        if line is not None:
+            self._add_line_to_buffer(line)
+
     async def add_performance_metrics_point(self, metrics: Dict[str, Any]):
-        """パフォーマンスメトリクスポイントをバッファに追加"""
-        try:
-            point = (
-                Point("performance_metrics")
-                .tag("metric_type", "performance")
-                .field("api_response_time_ms", metrics.get("api_response_time", 0))
-                .field("db_query_time_ms", metrics.get("db_query_time", 0))
-                .field("memory_usage_mb", metrics.get("memory_usage", 0))
-                .field("cpu_usage_percent", metrics.get("cpu_usage", 0))
-                .time(datetime.utcnow())
-            )
-            
-            await self._add_point_to_buffer(point)
-            
-        except Exception as e:
-            logger.error(f"Failed to create performance metrics point: {e}")
-            self.write_errors += 1
-    
-    async def _add_point_to_buffer(self, point: Point):
-        """ポイントをバッファに追加し、必要に応じてフラッシュ"""
-        self.point_buffer.append(point)
-        
-        # バッチサイズに達したら即座にフラッシュ
-        if len(self.point_buffer) >= self.batch_size:
-            await self._flush_buffer()
-    
+        """パフォーマンスメトリクスをバッファに追加"""
+        line = build_line(metrics, PERFORMANCE_METRICS_LAYOUT)
+        if line is not None:
+            self._add_line_to_buffer(line)
+
+    def _add_line_to_buffer(self, line: str):
+        """
+        行をバッファに追加（フラッシュは専用タスクが行い、呼び出し元では待機しない）
+
+        バッファが空だった場合は最大滞留時間のタイマーを開始するためにフラッシュタスクを起床させる。
+        """
+        was_empty = not self.line_buffer
+        if was_empty:
+            self._oldest_buffered_at = time.monotonic()
+        self.line_buffer.append(line)
+        self.buffer_bytes += len(line) + 1
+
+        if len(self.line_buffer) >= self.batch_size or self.buffer_bytes >= self.max_batch_bytes:
+            self._request_flush()
+        elif was_empty:
+            self._flush_requested.set()
+
+    def _request_flush(self):
+        """フラッシュタスクを起床させる（起床前の要求は1回にまとめる）"""
+        if self._flush_requested.is_set():
+            self.coalesced_flush_requests += 1
+        else:
+            self._flush_requested.set()
+
+    def _flush_reason(self) -> Optional[str]:
+        """フラッシュすべき理由（まだフラッシュしない場合は None）"""
+        if not self.line_buffer:
+            return None
+        if len(self.line_buffer) >= self.batch_size:
+            return "size"
+        if self.buffer_bytes >= self.max_batch_bytes:
+            return "bytes"
+        oldest = self._oldest_buffered_at
+        if oldest is not None and time.monotonic() - oldest >= self.max_linger_seconds:
+            return "linger"
+        return None
+
     async def _flush_loop(self):
-        """定期的なフラッシュループ"""
+        """フラッシュ要求または最大滞留時間を待ってバッファを送信するループ"""
         while self.is_running:
             try:
-                await asyncio.sleep(self.flush_interval_seconds)
-                
-                # 時間ベースのフラッシュ
-                time_since_flush = (datetime.utcnow() - self.last_flush_time).total_seconds()
-                if time_since_flush >= self.flush_interval_seconds and self.point_buffer:
-                    await self._flush_buffer()
-                
+                reason = self._flush_reason()
+                if reason is None:
+                    await self._wait_for_flush_request()
+                    continue
+                self.flush_triggers[reason] += 1
+                await self._flush_buffer()
+
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"Error in flush loop: {e}")
-                await asyncio.sleep(5)
-    
-    async def _flush_buffer(self):
-        """バッファをInfluxDBにフラッシュ"""
-        if not self.point_buffer:
-            return
-        
-        try:
-            # バッファのコピーを作成して並行書き込みを避ける
-            points_to_write = self.point_buffer.copy()
-            self.point_buffer.clear()
-            
-            # InfluxDBに書き込み
-            await asyncio.get_event_loop().run_in_executor(
-                None, 
-                lambda: write_api.write(
-                    bucket=settings.INFLUXDB_BUCKET,
-                    org=settings.INFLUXDB_ORG,
-                    record=points_to_write
-                )
+                await asyncio.sleep(1)
+
+    async def _wait_for_flush_request(self):
+        """フラッシュ要求を待つ（バッファに行がある場合は最古の行の滞留期限まで）"""
+        timeout = None
+        if self.line_buffer and self._oldest_buffered_at is not None:
+            timeout = max(
+                0.0, self._oldest_buffered_at + self.max_linger_seconds - time.monotonic()
             )
-            
-            # 統計更新
-            self.total_points_written += len(points_to_write)
-            self.total_batches_written += 1
-            self.last_flush_time = datetime.utcnow()
-            
-            logger.debug(
-                f"Flushed {len(points_to_write)} points to InfluxDB. "
-                f"Total: {self.total_points_written} points in {self.total_batches_written} batches"
+        try:
+            await asyncio.wait_for(self._flush_requested.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._flush_requested.clear()
+
+    async def _flush_buffer(self):
+        """
+        バッファを行数・バイト数の上限ごとのバッチに分けて送信タスクに引き渡す
+
+        送信中のリクエストが上限に達している間は空きを待ち、その間にバッファが上限行数を
+        超えた場合はディスクに退避する。
+        """
+        while self.line_buffer:
+            if self._send_slots.locked():
+                self._slot_released.clear()
+                try:
+                    await asyncio.wait_for(self._slot_released.wait(), self.max_linger_seconds)
+                except asyncio.TimeoutError:
+                    if len(self.line_buffer) >= self.max_buffer_points:
+                        await self._spill_lines(self._take_all())
+                continue
+            await self._send_slots.acquire()
+            self._start_send(self._take_batch())
+            # 残りが目標に達していなければ次の要求・滞留期限まで溜める
+            if self._flush_reason() is None:
+                return
+
+    def _take_batch(self) -> List[str]:
+        """バッファの先頭から行数・バイト数の上限までの行を取り出す"""
+        count = 0
+        size = 0
+        for line in self.line_buffer[:self.batch_size]:
+            if count and size + len(line) + 1 > self.max_batch_bytes:
+                break
+            count += 1
+            size += len(line) + 1
+        lines = self.line_buffer[:count]
+        del self.line_buffer[:count]
+        self.buffer_bytes -= size
+        if not self.line_buffer:
+            self._oldest_buffered_at = None
+        return lines
+
+    def _take_all(self) -> List[str]:
+        """バッファの全行を取り出す"""
+        lines, self.line_buffer = self.line_buffer, []
+        self.buffer_bytes = 0
+        self._oldest_buffered_at = None
+        return lines
+
+    def _start_send(self, lines: List[str]):
+        """送信タスクを開始（送信枠は取得済みであること）"""
+        self.flush_size_histogram.observe(len(lines))
+        task = asyncio.create_task(self._send_batch(lines))
+        self._in_flight.add(task)
+        task.add_done_callback(self._on_send_done)
+
+    def _on_send_done(self, task: asyncio.Task):
+        self._in_flight.discard(task)
+        self._send_slots.release()
+        self._slot_released.set()
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=settings.DYNAMIC_INFLUXDB_URL,
+                timeout=WRITE_TIMEOUT_SECONDS,
+                headers={
+                    "Authorization": f"Token {settings.INFLUXDB_TOKEN}",
+                    "Content-Type": "text/plain; charset=utf-8",
+                    "Content-Encoding": "gzip",
+                },
             )
-            
+        return self._client
+
+    async def _post(self, lines: List[str]) -> int:
+        """
+        gzip圧縮したバッチをInfluxDB v2 書き込みAPIへ送信
+
+        Returns:
+            送信したバイト数（失敗時は例外を送出）
+        """
+        body = gzip.compress("\n".join(lines).encode("utf-8"), compresslevel=self.gzip_level)
+        started = time.perf_counter()
+        response = await self._get_client().post(
+            "/api/v2/write",
+            params={
+                "org": settings.INFLUXDB_ORG,
+                "bucket": settings.INFLUXDB_BUCKET,
+                "precision": "ns",
+            },
+            content=body,
+        )
+        latency_ms = (time.perf_counter() - started) * 1000
+        dependency_latency.observe(INFLUX, latency_ms)
+        self.write_latency_histogram.observe(latency_ms)
+        response.raise_for_status()
+
+        # 統計更新
+        self.total_points_written += len(lines)
+        self.total_batches_written += 1
+        self.total_bytes_sent += len(body)
+        self.last_flush_time = datetime.utcnow()
+        return len(body)
+
+    def _is_rejected(self, error: Exception) -> bool:
+        """不正な行を含むバッチとして拒否されたか（再送しても失敗する）"""
+        status = getattr(getattr(error, "response", None), "status_code", None)
+        return status == 400
+
+    async def _send_batch(self, lines: List[str]):
+        """バッチを送信し、失敗した場合はディスクに退避する"""
+        try:
+            sent_bytes = await self._post(lines)
         except Exception as e:
-            logger.error(f"Failed to flush buffer to InfluxDB: {e}")
             self.write_errors += 1
-            # 書き込み失敗時はポイントを戻す（メモリ制限に注意）
-            if len(self.point_buffer) < self.batch_size * 2:
-                self.point_buffer.extend(points_to_write)
-    
+            if self._is_rejected(e):
+                self.dropped_points += len(lines)
+                logger.error(f"InfluxDB rejected batch of {len(lines)} lines: {e}")
+                return
+            logger.error(f"Failed to write batch to InfluxDB, spilling {len(lines)} lines: {e}")
+            await self._spill_lines(lines)
+            return
+
+        logger.debug(
+            f"Flushed {len(lines)} lines ({sent_bytes} bytes gzip) to InfluxDB. "
+            f"Total: {self.total_points_written} points in {self.total_batches_written} batches"
+        )
+
+    async def _spill_lines(self, lines: List[str]):
+        """行をディスクのセグメントファイルに退避"""
+        try:
+            await self._spill_executor.run(self.spill.append, lines)
+        except OSError as e:
+            self.dropped_points += len(lines)
+            logger.error(f"Failed to spill {len(lines)} InfluxDB lines to disk: {e}")
+
+    async def _replay_loop(self):
+        """ディスクに退避した行を一定のレートで再送するループ"""
+        while self.is_running:
+            try:
+                if not await self._replay_oldest_segment():
+                    await asyncio.sleep(settings.INFLUX_SPILL_RETRY_INTERVAL_SECONDS)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in spill replay loop: {e}")
+                await asyncio.sleep(settings.INFLUX_SPILL_RETRY_INTERVAL_SECONDS)
+
+    async def _replay_oldest_segment(self) -> bool:
+        """
+        最古のセグメントをバッチサイズごとに再送する
+
+        Returns:
+            セグメントを最後まで再送できた場合は True（退避データがない・失敗した場合は False）
+        """
+        segment = await self._spill_executor.run(self.spill.begin_replay)
+        if segment is None:
+            return False
+
+        lines = await self._spill_executor.run(self.spill.read, segment)
+        sent = 0
+        try:
+            while sent < len(lines):
+                chunk = lines[sent:sent + self.batch_size]
+                async with self._send_slots:
+                    try:
+                        await self._post(chunk)
+                    except Exception as e:
+                        self.write_errors += 1
+                        if not self._is_rejected(e):
+                            raise
+                        self.dropped_points += len(chunk)
+                        logger.error(f"InfluxDB rejected {len(chunk)} replayed lines: {e}")
+                sent += len(chunk)
+                self.replayed_points += len(chunk)
+                # 回復直後のInfluxDBに負荷をかけすぎないようにレートを制限する
+                await asyncio.sleep(len(chunk) / self.replay_points_per_second)
+        except Exception as e:
+            logger.warning(f"Spill replay paused after {sent} lines: {e}")
+            return False
+        finally:
+            await self._spill_executor.run(self.spill.truncate_front, segment, lines[sent:])
+        return True
+
+    async def oldest_spilled_at(self) -> Optional[float]:
+        """全ワーカープロセスの退避データのうち最古のセグメントの作成時刻（ない場合は None）"""
+        return await self._spill_executor.run(self.spill.oldest_spilled_at)
+
     def get_batch_writer_stats(self) -> Dict[str, Any]:
         """バッチライターの統計情報を取得"""
         return {
             "is_running": self.is_running,
-            "buffer_size": len(self.point_buffer),
+            "measurement": self.layout.measurement,
+            "buffer_size": len(self.line_buffer),
+            "in_flight_requests": len(self._in_flight),
+            "max_in_flight": self.max_in_flight,
             "total_points_written": self.total_points_written,
             "total_batches_written": self.total_batches_written,
+            "total_bytes_sent": self.total_bytes_sent,
             "write_errors": self.write_errors,
+            "dropped_points": self.dropped_points + self.spill.dropped_points,
+            "max_buffer_points": self.max_buffer_points,
+            "spill": {
+                **self.spill.get_statistics(),
+                "replayed_points": self.replayed_points,
+                "replay_points_per_second": self.replay_points_per_second,
+            },
             "batch_size": self.batch_size,
-            "flush_interval_seconds": self.flush_interval_seconds,
+            "flush": {
+                "max_linger_ms": round(self.max_linger_seconds * 1000),
+                "max_batch_bytes": self.max_batch_bytes,
+                "buffer_bytes": self.buffer_bytes,
+                "triggers": dict(self.flush_triggers),
+                "coalesced_requests": self.coalesced_flush_requests,
+                "size_histogram": self.flush_size_histogram.to_dict(),
+                "write_latency_histogram": self.write_latency_histogram.to_dict(),
+            },
             "last_flush_time": self.last_flush_time.isoformat() if self.last_flush_time else None,
             "recent_metrics": dict(self.metrics_buffer)
         }
@@ -236,4 +534,4 @@ async def start_influxdb_batch_writer():
 
 async def stop_influxdb_batch_writer():
     """InfluxDBバッチライターを停止（アプリケーション終了時に呼び出す）"""
-    await batch_writer.stop_batch_writer()
\ No newline at end of file
+    await batch_writer.stop_batch_writer()
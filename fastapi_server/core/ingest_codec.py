@@ -0,0 +1,151 @@
+"""
+イベント取り込みペイロードのデコード
+
+/api/v1/events のリクエストボディについて、Content-Encoding（gzip / zstd）の展開と
+Content-Type（JSON / MessagePack）に応じた EventData へのデコードを行います。
+JSONは中間のdictを作らずに TypeAdapter.validate_json で直接検証します。
+"""
+
+import io
+import logging
+import zlib
+from typing import Any, List
+
+from fastapi import HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
+
+from core.config import settings
+from schemas.event import EventData
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+MSGPACK_CONTENT_TYPES = ("application/msgpack", "application/x-msgpack")
+
+_event_batch_adapter = TypeAdapter(List[EventData])
+
+
+def supported_encodings() -> List[str]:
+    """この環境で展開可能な Content-Encoding の一覧"""
+    encodings = ["identity", "gzip", "deflate"]
+    if zstandard is not None:
+        encodings.append("zstd")
+    return encodings
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Decompressed payload exceeds {settings.INGEST_MAX_DECOMPRESSED_BYTES} bytes",
+    )
+
+
+def decode_content_encoding(body: bytes, content_encoding: str) -> bytes:
+    """
+    Content-Encoding に従ってボディを展開する
+
+    展開後のサイズは INGEST_MAX_DECOMPRESSED_BYTES までに制限します（圧縮爆弾対策）。
+
+    Raises:
+        HTTPException: 未対応のエンコーディング(415)、展開後サイズ超過(413)、破損データ(400)
+    """
+    encoding = (content_encoding or "identity").strip().lower()
+    limit = settings.INGEST_MAX_DECOMPRESSED_BYTES
+
+    if encoding in ("", "identity"):
+        return body
+
+    try:
+        if encoding in ("gzip", "x-gzip", "deflate"):
+            # wbits=47: gzip / zlib ヘッダーを自動判別
+            decompressor = zlib.decompressobj(wbits=47)
+            data = decompressor.decompress(body, limit + 1)
+            if len(data) > limit or decompressor.unconsumed_tail:
+                raise _too_large()
+            return data
+
+        if encoding == "zstd" and zstandard is not None:
+            reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(body))
+            data = reader.read(limit + 1)
+            if len(data) > limit:
+                raise _too_large()
+            return data
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.warning(f"Failed to decode {encoding} payload: {e}")
+        raise HTTPException(status_code=400, detail=f"Invalid {encoding} payload")
+
+    raise HTTPException(
+        status_code=415,
+        detail=f"Unsupported Content-Encoding '{encoding}'. Supported: {', '.join(supported_encodings())}",
+    )
+
+
+def decode_event_batch(body: bytes, content_type: str) -> List[EventData]:
+    """
+    展開済みボディを Content-Type に応じて EventData のリストにデコードする
+
+    Raises:
+        RequestValidationError: 検証エラー（FastAPI標準と同じ422応答）
+        HTTPException: MessagePackが利用できない(415)、または解析できない(400)場合
+    """
+    media_type = (content_type or "application/json").split(";")[0].strip().lower()
+
+    try:
+        if media_type in MSGPACK_CONTENT_TYPES:
+            if msgpack is None:
+                raise HTTPException(
+                    status_code=415, detail="MessagePack is not supported"
+                )
+            try:
+                payload: Any = msgpack.unpackb(body, raw=False)
+            except Exception as e:
+                raise HTTPException(
+                    status_code=400, detail=f"Invalid MessagePack payload: {e}"
+                )
+            return _event_batch_adapter.validate_python(payload)
+
+        return _event_batch_adapter.validate_json(body)
+
+    except ValidationError as e:
+        raise RequestValidationError(
+            [
+                {**error, "loc": ("body", *error["loc"])}
+                for error in e.errors(include_url=False)
+            ]
+        )
+
+
+async def read_event_batch(request: Request) -> List[EventData]:
+    """FastAPI依存関数: リクエストボディを展開・デコードして EventData のリストを返す"""
+    body = decode_content_encoding(
+        await request.body(), request.headers.get("content-encoding", "")
+    )
+    return decode_event_batch(body, request.headers.get("content-type", ""))
+
+
+# OpenAPIドキュメント用のリクエストボディ定義（依存関数でボディを読むため明示する）
+EVENT_BATCH_OPENAPI_EXTRA = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            media_type: {
+                "schema": {"type": "array", "items": EventData.model_json_schema()}
+            }
+            for media_type in ("application/json", MSGPACK_CONTENT_TYPES[0])
+        },
+        "description": "Content-Encoding: gzip / zstd に対応",
+    }
+}
@@ -0,0 +1,368 @@
+"""
+失敗イベントの遅延リトライとデッドレター
+
+ワーカーで処理に失敗したイベントを、次回試行時刻をスコアとするRedisソート済みセットに
+登録し、スケジューラータスクが時刻の来たものから再処理します。ワーカースロットは
+バックオフ中に待機しないため、正常なイベントの処理は失敗イベントの影響を受けません。
+最大試行回数を超えたイベントと、再試行しても成功しないイベント（検証エラー・必須フィールドの欠落）は
+デッドレターストリームに移し、管理APIから確認・再投入できます。
+
+リトライ待ちは学生のシャードごとのキーに登録し、各シャードのワーカーは自分のキーのみを
+取り出すため、リトライされたイベントも学生の他のイベントと同じワーカーで処理されます。
+取り出したイベントは処理中のキーにリース期限付きで移し、処理の完了後に削除します。
+処理中にワーカーが停止した場合は、リース期限の切れたイベントを次の取り出し時にリトライ待ちに戻します。
+"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from core.config import settings
+from db.redis_client import (
+    DEAD_LETTER_STREAM,
+    get_redis_connection,
+    retry_processing_key,
+    retry_queue_key,
+    student_shard,
+)
+
+logger = logging.getLogger(__name__)
+
+# バックオフに加えるジッター（遅延に対する割合）
+RETRY_JITTER_RATIO = 0.2
+
+# リース期限の切れた処理中のイベントをリトライ待ちに戻し、時刻の来たイベントを処理中に移す
+# KEYS[1]: リトライ待ち, KEYS[2]: 処理中
+# ARGV[1]: 現在時刻, ARGV[2]: 取り出す件数, ARGV[3]: リース期限
+_CLAIM_DUE = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, member in ipairs(expired) do
+    redis.call('ZREM', KEYS[2], member)
+    redis.call('ZADD', KEYS[1], ARGV[1], member)
+end
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, member in ipairs(due) do
+    redis.call('ZREM', KEYS[1], member)
+    redis.call('ZADD', KEYS[2], ARGV[3], member)
+end
+return due
+"""
+
+
+def _event_retry_key(event_data: Dict[str, Any]) -> str:
+    """イベントの学生のシャードに対応するリトライ待ちのキー"""
+    return retry_queue_key(student_shard(event_data.get("emailAddress")))
+
+
+def _dead_letter_fields(
+    event_data: Dict[str, Any], attempts: int, error: str, failed_at: float
+) -> Dict[str, str]:
+    return {
+        "data": json.dumps(event_data),
+        "attempts": str(attempts),
+        "error": error[:500],
+        "failed_at": str(failed_at),
+    }
+
+
+@dataclass
+class RetryEntry:
+    """リトライ対象のイベントと失敗済みの試行回数"""
+
+    event: Dict[str, Any]
+    attempt: int
+    # ソート済みセットのメンバー（処理完了時に処理中のキーから削除する）
+    member: str = ""
+
+
+class EventRetryQueue:
+    """Redisソート済みセットによる遅延リトライとデッドレターストリーム"""
+
+    def __init__(
+        self,
+        max_attempts: Optional[int] = None,
+        base_delay_seconds: Optional[float] = None,
+        max_delay_seconds: Optional[float] = None,
+    ):
+        self.max_attempts = max_attempts or settings.RETRY_MAX_ATTEMPTS
+        self.base_delay_seconds = (
+            base_delay_seconds or settings.RETRY_BASE_DELAY_SECONDS
+        )
+        self.max_delay_seconds = max_delay_seconds or settings.RETRY_MAX_DELAY_SECONDS
+
+        # 統計
+        self.stats = {"scheduled": 0, "retried": 0, "dead_lettered": 0, "replayed": 0}
+
+    def backoff_seconds(self, attempt: int) -> float:
+        """attempt 回目の失敗後、次の試行までの遅延（指数バックオフ + ジッター）"""
+        delay = min(
+            self.base_delay_seconds * (2 ** (attempt - 1)), self.max_delay_seconds
+        )
+        return delay * (1 + random.uniform(0, RETRY_JITTER_RATIO))
+
+    async def schedule(
+        self,
+        events: List[Dict[str, Any]],
+        error: str = "",
+        attempts: Optional[List[int]] = None,
+    ) -> Dict[str, int]:
+        """
+        失敗したイベントをリトライ待ちに登録する
+
+        Args:
+            events: 処理に失敗したイベント
+            error: 失敗理由（デッドレターに記録）
+            attempts: イベントごとの失敗済み試行回数（初回失敗の場合は省略）
+
+        Returns:
+            リトライ登録件数とデッドレター移動件数
+
+        Raises:
+            redis.RedisError: 登録に失敗した場合（呼び出し側でイベントを破棄しないこと）
+        """
+        if not events:
+            return {"scheduled": 0, "dead_lettered": 0}
+
+        attempts = attempts or [0] * len(events)
+        now = time.time()
+        # キー → メンバー → 次回試行時刻
+        retry_members: Dict[str, Dict[str, float]] = {}
+        dead_letters: List[Dict[str, str]] = []
+
+        for event_data, previous in zip(events, attempts):
+            attempt = previous + 1
+            if attempt >= self.max_attempts:
+                dead_letters.append(
+                    _dead_letter_fields(event_data, attempt, error, now)
+                )
+                continue
+            # 同一内容のイベントが重複しないよう一意のIDを付与
+            member = json.dumps(
+                {"id": uuid.uuid4().hex, "attempt": attempt, "event": event_data}
+            )
+            retry_members.setdefault(_event_retry_key(event_data), {})[member] = (
+                now + self.backoff_seconds(attempt)
+            )
+
+        async with get_redis_connection() as redis_client:
+            pipe = redis_client.pipeline(transaction=False)
+            for key, members in retry_members.items():
+                pipe.zadd(key, members)
+            for fields in dead_letters:
+                self._add_dead_letter(pipe, fields)
+            await pipe.execute()
+
+        scheduled = sum(len(members) for members in retry_members.values())
+        self.stats["scheduled"] += scheduled
+        self.stats["dead_lettered"] += len(dead_letters)
+        if dead_letters:
+            logger.error(
+                f"最大試行回数({self.max_attempts})に達したイベントをデッドレターに移動: "
+                f"{len(dead_letters)} 件, error={error}"
+            )
+        return {"scheduled": scheduled, "dead_lettered": len(dead_letters)}
+
+    async def dead_letter(
+        self,
+        events: List[Dict[str, Any]],
+        error: str = "",
+        attempts: Optional[List[int]] = None,
+    ) -> int:
+        """
+        再試行しても成功しないイベントをリトライせずにデッドレターに移す
+
+        Args:
+            events: 処理に失敗したイベント
+            error: 失敗理由
+            attempts: イベントごとの失敗済み試行回数（初回失敗の場合は省略）
+
+        Returns:
+            デッドレターに移した件数
+
+        Raises:
+            redis.RedisError: 登録に失敗した場合（呼び出し側でイベントを破棄しないこと）
+        """
+        if not events:
+            return 0
+
+        attempts = attempts or [0] * len(events)
+        now = time.time()
+        async with get_redis_connection() as redis_client:
+            pipe = redis_client.pipeline(transaction=False)
+            for event_data, previous in zip(events, attempts):
+                self._add_dead_letter(
+                    pipe, _dead_letter_fields(event_data, previous + 1, error, now)
+                )
+            await pipe.execute()
+
+        self.stats["dead_lettered"] += len(events)
+        logger.error(
+            f"再試行しても成功しないイベントをデッドレターに移動: {len(events)} 件, error={error}"
+        )
+        return len(events)
+
+    def _add_dead_letter(self, pipe, fields: Dict[str, str]):
+        pipe.xadd(
+            DEAD_LETTER_STREAM,
+            fields,
+            maxlen=settings.DEAD_LETTER_STREAM_MAXLEN,
+            approximate=True,
+        )
+
+    async def pop_due(
+        self, shard: int = 0, limit: Optional[int] = None
+    ) -> List[RetryEntry]:
+        """
+        シャードのリトライ待ちから次回試行時刻に達したイベントを取り出す
+
+        取り出しと処理中のキーへの移動はLuaスクリプトで不可分に行うため、
+        複数のワーカーが同時に取り出しても同じイベントは1つのワーカーのみが処理する。
+        処理が終わったら complete を呼び出すこと（呼び出さない場合はリース期限後に再び取り出される）。
+        """
+        limit = limit or settings.RETRY_BATCH_SIZE
+        now = time.time()
+        async with get_redis_connection() as redis_client:
+            claim_due = redis_client.register_script(_CLAIM_DUE)
+            members = await claim_due(
+                keys=[retry_queue_key(shard), retry_processing_key(shard)],
+                args=[now, limit, now + settings.RETRY_LEASE_SECONDS],
+            )
+
+        entries = []
+        for member in members:
+            payload = json.loads(member)
+            entries.append(
+                RetryEntry(
+                    event=payload["event"], attempt=payload["attempt"], member=member
+                )
+            )
+        self.stats["retried"] += len(entries)
+        return entries
+
+    async def complete(self, entries: List[RetryEntry], shard: int = 0):
+        """処理（失敗時の再登録を含む）を終えたイベントを処理中のキーから削除する"""
+        members = [entry.member for entry in entries if entry.member]
+        if not members:
+            return
+        async with get_redis_connection() as redis_client:
+            await redis_client.zrem(retry_processing_key(shard), *members)
+
+    async def run(
+        self,
+        is_running: Callable[[], bool],
+        process: Callable[[List[RetryEntry]], Awaitable[None]],
+        shard: Optional[int] = None,
+    ):
+        """
+        時刻の来たリトライを取り出して process に渡すスケジューラーループ
+
+        Args:
+            shard: 取り出すシャード（None の場合は全シャード。シャードに分けずに実行するワーカー用）
+        """
+        interval = settings.RETRY_POLL_INTERVAL_MS / 1000
+        shards = (
+            [shard] if shard is not None else range(max(settings.WORKER_SHARD_COUNT, 1))
+        )
+        while is_running():
+            try:
+                backlogged = False
+                for current in shards:
+                    entries = await self.pop_due(current)
+                    if entries:
+                        await process(entries)
+                        await self.complete(entries, current)
+                        backlogged = (
+                            backlogged or len(entries) >= settings.RETRY_BATCH_SIZE
+                        )
+                # 溜まっている場合は待たずに続けて取り出す
+                if backlogged:
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"リトライスケジューラーでエラーが発生しました: {e}")
+            await asyncio.sleep(interval)
+
+    async def list_dead_letters(self, count: int = 50) -> List[Dict[str, Any]]:
+        """新しい順にデッドレターを取得"""
+        async with get_redis_connection() as redis_client:
+            entries = await redis_client.xrevrange(DEAD_LETTER_STREAM, count=count)
+        return [
+            {
+                "id": entry_id,
+                "event": json.loads(fields.get("data", "null")),
+                "attempts": int(fields.get("attempts", 0)),
+                "error": fields.get("error", ""),
+                "failed_at": float(fields.get("failed_at", 0)),
+            }
+            for entry_id, fields in entries
+        ]
+
+    async def replay_dead_letters(self, entry_ids: Optional[List[str]] = None) -> int:
+        """
+        デッドレターをリトライ待ちに再投入する（試行回数はリセット）
+
+        Args:
+            entry_ids: 再投入するエントリID（省略時は全件）
+
+        Returns:
+            再投入した件数
+        """
+        async with get_redis_connection() as redis_client:
+            if entry_ids:
+                entries = []
+                for entry_id in entry_ids:
+                    entries.extend(
+                        await redis_client.xrange(
+                            DEAD_LETTER_STREAM, entry_id, entry_id
+                        )
+                    )
+            else:
+                entries = await redis_client.xrange(DEAD_LETTER_STREAM)
+            if not entries:
+                return 0
+
+            now = time.time()
+            members: Dict[str, Dict[str, float]] = {}
+            for _, fields in entries:
+                event_data = json.loads(fields["data"])
+                member = json.dumps(
+                    {"id": uuid.uuid4().hex, "attempt": 0, "event": event_data}
+                )
+                members.setdefault(_event_retry_key(event_data), {})[member] = now
+            pipe = redis_client.pipeline(transaction=True)
+            for key, key_members in members.items():
+                pipe.zadd(key, key_members)
+            pipe.xdel(DEAD_LETTER_STREAM, *[entry_id for entry_id, _ in entries])
+            await pipe.execute()
+
+        self.stats["replayed"] += len(entries)
+        logger.info(f"デッドレターを再投入しました: {len(entries)} 件")
+        return len(entries)
+
+    async def get_statistics(self) -> Dict[str, Any]:
+        """リトライ待ち件数・デッドレター件数と処理統計"""
+        async with get_redis_connection() as redis_client:
+            pipe = redis_client.pipeline(transaction=False)
+            shard_count = max(settings.WORKER_SHARD_COUNT, 1)
+            for shard in range(shard_count):
+                pipe.zcard(retry_queue_key(shard))
+            for shard in range(shard_count):
+                pipe.zcard(retry_processing_key(shard))
+            pipe.xlen(DEAD_LETTER_STREAM)
+            *counts, dead_letters = await pipe.execute()
+        return {
+            "pending_retries": sum(counts[:shard_count]),
+            "in_progress_retries": sum(counts[shard_count:]),
+            "dead_letters": dead_letters,
+            **self.stats,
+        }
+
+
+# グローバルインスタンス
+event_retry_queue = EventRetryQueue()
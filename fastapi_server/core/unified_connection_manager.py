@@ -259,8 +259,16 @@ class UnifiedConnectionManager:
             self.stats["messages_filtered"] += 1
             return False
             
+        return await self._send_serialized(client_id, json.dumps(message))
+        
+    async def _send_serialized(self, client_id: str, payload: str) -> bool:
+        """シリアライズ済みメッセージを送信（フィルタリング済みであること）"""
+        connection_info = self.connections.get(client_id)
+        if connection_info is None:
+            return False
+            
         try:
-            await connection_info.websocket.send_text(json.dumps(message))
+            await connection_info.websocket.send_text(payload)
             
             # アクティビティ更新
             connection_info.last_activity = datetime.now(timezone.utc)
@@ -273,6 +281,32 @@ class UnifiedConnectionManager:
             await self.disconnect(client_id)
             return False
             
+    async def _broadcast(self, client_ids: List[str], message: Dict[str, Any]) -> int:
+        """
+        フィルタリング後、メッセージを1回だけシリアライズして並行送信
+        
+        Returns:
+            送信成功数
+        """
+        targets = []
+        for client_id in client_ids:
+            connection_info = self.connections.get(client_id)
+            if connection_info is None:
+                continue
+            if not self.message_filter.should_send_to_client(message, connection_info):
+                self.stats["messages_filtered"] += 1
+                continue
+            targets.append(client_id)
+            
+        if not targets:
+            return 0
+            
+        payload = json.dumps(message)
+        results = await asyncio.gather(
+            *(self._send_serialized(client_id, payload) for client_id in targets)
+        )
+        return sum(1 for sent in results if sent)
+        
     async def broadcast_to_room(self, room: str, message: Dict[str, Any]) -> int:
         """
         ルーム内全クライアントにブロードキャスト
@@ -287,14 +321,7 @@ class UnifiedConnectionManager:
         if room not in self.rooms:
             return 0
             
-        success_count = 0
-        client_ids = list(self.rooms[room])  # コピーして安全に反復
-        
-        for client_id in client_ids:
-            if await self.send_to_client(client_id, message):
-                success_count += 1
-                
-        return success_count
+        return await self._broadcast(list(self.rooms[room]), message)  # コピーして安全に反復
         
     async def broadcast_to_type(self, client_type: ClientType, message: Dict[str, Any]) -> int:
         """
@@ -307,14 +334,23 @@ class UnifiedConnectionManager:
         Returns:
             送信成功数
         """
-        success_count = 0
-        client_ids = list(self.client_type_index[client_type])
+        return await self.broadcast_to_types([client_type], message)
         
-        for client_id in client_ids:
-            if await self.send_to_client(client_id, message):
-                success_count += 1
-                
-        return success_count
+    async def broadcast_to_types(self, client_types: List[ClientType], message: Dict[str, Any]) -> int:
+        """
+        複数タイプのクライアントに1回のシリアライズでブロードキャスト
+        
+        Args:
+            client_types: 対象クライアントタイプのリスト
+            message: ブロードキャストメッセージ
+            
+        Returns:
+            送信成功数
+        """
+        client_ids: List[str] = []
+        for client_type in client_types:
+            client_ids.extend(self.client_type_index[client_type])
+        return await self._broadcast(client_ids, message)
         
     async def broadcast_to_all(self, message: Dict[str, Any]) -> int:
         """
@@ -326,14 +362,7 @@ class UnifiedConnectionManager:
         Returns:
             送信成功数
         """
-        success_count = 0
-        client_ids = list(self.connections.keys())
-        
-        for client_id in client_ids:
-            if await self.send_to_client(client_id, message):
-                success_count += 1
-                
-        return success_count
+        return await self._broadcast(list(self.connections.keys()), message)
         
     def get_connection_stats(self) -> Dict[str, Any]:
         """接続統計情報を取得"""
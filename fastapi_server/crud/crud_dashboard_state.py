@@ -0,0 +1,196 @@
+"""
+学生ごとのダッシュボード集計（student_dashboard_state）
+
+ダッシュボードの概要は学生ごとに実行回数・エラー回数・最後のノートブック・
+有意な連続エラーのあるセルを必要としますが、これらを毎回 cell_executions から
+集計する代わりに、セル実行の永続化と同じトランザクションで差分を反映します。
+概要の取得は students との結合による1回のスキャンになります。
+
+- セル実行の永続化（persist_event_batch / create_cell_execution）で回数・最終実行を加算
+- セッション作成時に最新セッション開始時刻を更新
+- resolve_consecutive_errors で有意な連続エラーのセルをクリア
+- 時間経過で表示状態が遷移する学生の抽出（ダッシュボードのバージョンを進めるため）
+関数はコミットしないため、呼び出し側のトランザクション内で実行します。
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from db import models
+
+# 概要に表示する有意な連続エラーのセル数の上限
+MAX_ERROR_CELLS = 10
+
+# 最新セッション開始からこの秒数が経過すると表示状態が遷移する
+# （determine_student_status: 120秒で active → idle、300秒で error → idle）
+STATUS_TRANSITION_SECONDS = (120, 300)
+
+
+@dataclass
+class StudentStateDelta:
+    """1人の学生についてのセル実行の差分"""
+
+    cell_executions: int = 0
+    error_count: int = 0
+    last_notebook_path: Optional[str] = None
+    last_activity_at: Optional[datetime] = None
+    significant_error_cells: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    def add_execution(
+        self,
+        notebook_path: Optional[str],
+        executed_at: datetime,
+        has_error: bool,
+        cell_db_id: int,
+        consecutive_count: int,
+        is_significant: bool,
+    ):
+        """セル実行1件を加算（実行順に呼び出す）"""
+        self.cell_executions += 1
+        if has_error:
+            self.error_count += 1
+        self.last_notebook_path = notebook_path
+        self.last_activity_at = executed_at
+        if is_significant:
+            self.significant_error_cells[str(cell_db_id)] = {
+                "consecutive_count": consecutive_count,
+                "last_error_time": executed_at.isoformat(),
+            }
+
+
+def apply_state_deltas(db: Session, deltas: Dict[int, StudentStateDelta]):
+    """学生ID → 差分 を1回の INSERT ... ON CONFLICT で反映する"""
+    if not deltas:
+        return
+
+    table = models.StudentDashboardState.__table__
+    stmt = pg_insert(table).values(
+        [
+            {
+                "student_id": student_id,
+                "cell_executions": delta.cell_executions,
+                "error_count": delta.error_count,
+                "last_notebook_path": delta.last_notebook_path,
+                "last_activity_at": delta.last_activity_at,
+                "significant_error_cells": delta.significant_error_cells,
+            }
+            for student_id, delta in sorted(deltas.items())
+        ]
+    )
+    excluded = stmt.excluded
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[table.c.student_id],
+            set_={
+                "cell_executions": table.c.cell_executions + excluded.cell_executions,
+                "error_count": table.c.error_count + excluded.error_count,
+                "last_notebook_path": func.coalesce(
+                    excluded.last_notebook_path, table.c.last_notebook_path
+                ),
+                "last_activity_at": func.greatest(
+                    table.c.last_activity_at, excluded.last_activity_at
+                ),
+                # セルごとに最新の連続エラー状況で上書き
+                "significant_error_cells": table.c.significant_error_cells.op("||")(
+                    excluded.significant_error_cells
+                ),
+                "updated_at": func.now(),
+            },
+        )
+    )
+
+
+def record_session_starts(db: Session, starts: Dict[int, datetime]):
+    """学生ID → 作成したセッションの開始時刻 を最新セッション開始時刻に反映する"""
+    if not starts:
+        return
+
+    table = models.StudentDashboardState.__table__
+    stmt = pg_insert(table).values(
+        [
+            {"student_id": student_id, "latest_session_start": start_time}
+            for student_id, start_time in sorted(starts.items())
+        ]
+    )
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[table.c.student_id],
+            set_={
+                "latest_session_start": func.greatest(
+                    table.c.latest_session_start, stmt.excluded.latest_session_start
+                ),
+                "updated_at": func.now(),
+            },
+        )
+    )
+
+
+def clear_significant_errors(db: Session, student_id: int):
+    """学生の有意な連続エラーのセルをクリア（講師による解除）"""
+    db.execute(
+        update(models.StudentDashboardState)
+        .where(models.StudentDashboardState.student_id == student_id)
+        .values(significant_error_cells={}, updated_at=func.now())
+    )
+
+
+def get_status_transition_student_ids(
+    db: Session, start: datetime, end: datetime, help_expired_emails: Iterable[str] = ()
+) -> List[int]:
+    """
+    (start, end] の間に時間経過で表示状態が遷移した学生IDを取得
+
+    Args:
+        start: 前回の確認時刻
+        end: 今回の確認時刻
+        help_expired_emails: この間にヘルプ要求が有効期間を過ぎた学生のメールアドレス
+    """
+    state = models.StudentDashboardState
+    conditions = [
+        state.latest_session_start.between(
+            start - timedelta(seconds=seconds), end - timedelta(seconds=seconds)
+        )
+        for seconds in STATUS_TRANSITION_SECONDS
+    ]
+    emails = sorted(set(help_expired_emails))
+    if emails:
+        conditions.append(
+            state.student_id.in_(
+                select(models.Student.id).where(models.Student.email.in_(emails))
+            )
+        )
+    rows = db.execute(select(state.student_id).where(or_(*conditions))).all()
+    return [row.student_id for row in rows]
+
+
+def summarize_error_cells(cells: Optional[Dict[str, Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    significant_error_cells を get_student_consecutive_error_info と同じ形式に変換
+
+    Returns:
+        has_significant_error, consecutive_count（最大値）, error_cells（新しい順）
+    """
+    error_cells: List[Dict[str, Any]] = sorted(
+        (
+            {
+                "cell_id": int(cell_id),
+                "consecutive_count": info.get("consecutive_count", 0),
+                "last_error_time": info.get("last_error_time"),
+            }
+            for cell_id, info in (cells or {}).items()
+        ),
+        key=lambda cell: cell["last_error_time"] or "",
+        reverse=True,
+    )[:MAX_ERROR_CELLS]
+    return {
+        "has_significant_error": bool(error_cells),
+        "consecutive_count": max(
+            (cell["consecutive_count"] for cell in error_cells), default=0
+        ),
+        "error_cells": error_cells,
+    }
@@ -0,0 +1,216 @@
+"""
+ダッシュボード状態のバージョン
+
+ダッシュボードの表示に影響する変更（セル実行・セッション開始・ヘルプ要求・エラー解除、
+時間経過による状態の遷移）をコミットした後に、単調増加するバージョンを進め、
+変更された学生IDをそのバージョンとともにRedisのソート済みセットに記録します。
+/dashboard/overview?since=<バージョン> は、このセットから変更された学生のみを返します。
+
+- バージョンの採番と変更学生の記録は1つのLuaスクリプトで行う（読み取り側から見て常に整合）
+- バージョンキーがない（コールドスタート・Redisの再起動）場合は現在時刻（ミリ秒）から採番を再開し、
+  それより古いカーソルには全件を返す
+- 各バージョンで返したメトリクスもRedisに保存し、どのAPIプロセスでも値が変わったメトリクスのみを返す
+Redisが利用できない場合は常に全件を返します。
+"""
+
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+import redis
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Redisキー
+DASHBOARD_VERSION_KEY = "dashboard:version"
+# 採番を再開したバージョン（これより古いカーソルは差分を返せない）
+DASHBOARD_VERSION_FLOOR_KEY = "dashboard:version_floor"
+# 学生ID → 最後に変更されたバージョン
+DASHBOARD_CHANGES_KEY = "dashboard:changes"
+# バージョン → そのバージョンで返したメトリクス（JSON）
+DASHBOARD_METRICS_KEY_PREFIX = "dashboard:metrics:"
+
+# Redis障害時に再接続を試みるまでの秒数
+REDIS_RETRY_INTERVAL_SECONDS = 30
+
+# バージョンを進めて変更された学生を記録する（ARGV[1]: 採番開始値, ARGV[2..]: 学生ID）
+_BUMP = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('SET', KEYS[1], ARGV[1])
+    redis.call('SET', KEYS[2], ARGV[1])
+end
+local version = redis.call('INCR', KEYS[1])
+for i = 2, #ARGV do
+    redis.call('ZADD', KEYS[3], version, ARGV[i])
+end
+return version
+"""
+
+
+@dataclass
+class DashboardChanges:
+    """カーソル以降の変更"""
+
+    version: int
+    # 変更された学生ID（None の場合は差分を返せないため全件を返す）
+    student_ids: Optional[List[int]]
+    # カーソルのバージョンで返したメトリクス（保存されていない場合は None）
+    metrics: Optional[Dict[str, Any]] = None
+
+
+def dashboard_metrics_key(version: int) -> str:
+    """バージョンで返したメトリクスのRedisキー"""
+    return f"{DASHBOARD_METRICS_KEY_PREFIX}{version}"
+
+
+class DashboardVersionIndex:
+    """
+    ダッシュボード状態のバージョンと変更された学生のインデックス
+
+    更新はDB用スレッドプール上のコミット直後に呼ばれるため、同期Redisクライアントを使用する。
+    """
+
+    def __init__(self):
+        self._redis: Optional[redis.Redis] = None
+        self._bump_script = None
+        self._redis_disabled_until = 0.0
+
+        # 統計
+        self.stats = {"bumps": 0, "reads": 0, "full_reads": 0, "errors": 0}
+
+    def _get_redis(self) -> Optional[redis.Redis]:
+        if time.monotonic() < self._redis_disabled_until:
+            return None
+        if self._redis is None:
+            self._redis = redis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                decode_responses=True,
+                socket_timeout=0.5,
+                socket_connect_timeout=0.5,
+            )
+            self._bump_script = self._redis.register_script(_BUMP)
+        return self._redis
+
+    def _redis_failed(self, error: Exception):
+        """Redis障害時はしばらく全件応答で動作する"""
+        logger.warning(f"Dashboard version index unavailable: {error}")
+        self.stats["errors"] += 1
+        self._redis_disabled_until = time.monotonic() + REDIS_RETRY_INTERVAL_SECONDS
+
+    def _bump(self, client: redis.Redis, student_ids: List[int]) -> int:
+        return int(
+            self._bump_script(
+                keys=[
+                    DASHBOARD_VERSION_KEY,
+                    DASHBOARD_VERSION_FLOOR_KEY,
+                    DASHBOARD_CHANGES_KEY,
+                ],
+                args=[int(time.time() * 1000), *student_ids],
+            )
+        )
+
+    def bump(self, student_ids: Iterable[int]) -> Optional[int]:
+        """
+        学生の変更を記録してバージョンを進める（変更をコミットした後に呼び出す）
+
+        Returns:
+            新しいバージョン（Redisが利用できない場合は None）
+        """
+        ids = sorted(set(student_ids))
+        client = self._get_redis()
+        if client is None or not ids:
+            return None
+        try:
+            version = self._bump(client, ids)
+        except redis.RedisError as e:
+            self._redis_failed(e)
+            return None
+        self.stats["bumps"] += 1
+        return version
+
+    def get_changes(self, since: Optional[int] = None) -> Optional[DashboardChanges]:
+        """
+        現在のバージョンと、since より後に変更された学生・since で返したメトリクスを取得
+
+        Args:
+            since: クライアントが保持しているバージョン（None の場合は全件）
+
+        Returns:
+            DashboardChanges（Redisが利用できない場合は None）
+        """
+        self.stats["reads"] += 1
+        client = self._get_redis()
+        if client is None:
+            return None
+        try:
+            pipe = client.pipeline(transaction=True)
+            pipe.get(DASHBOARD_VERSION_KEY)
+            pipe.get(DASHBOARD_VERSION_FLOOR_KEY)
+            if since is not None:
+                pipe.zrangebyscore(DASHBOARD_CHANGES_KEY, f"({since}", "+inf")
+                pipe.get(dashboard_metrics_key(since))
+            results = pipe.execute()
+            if results[0] is None:
+                # まだ変更がない: 採番を開始する
+                version, floor = self._bump(client, []), None
+            else:
+                version, floor = int(results[0]), results[1]
+        except redis.RedisError as e:
+            self._redis_failed(e)
+            return None
+
+        # カーソルが採番の再開より古い・現在より新しい場合は差分を返せない
+        if (
+            since is None
+            or results[0] is None
+            or floor is None
+            or not int(floor) <= since <= version
+        ):
+            self.stats["full_reads"] += 1
+            return DashboardChanges(version, None)
+        return DashboardChanges(
+            version,
+            [int(student_id) for student_id in results[2]],
+            json.loads(results[3]) if results[3] else None,
+        )
+
+    def remember_metrics(self, version: int, metrics: Dict[str, Any]):
+        """バージョンで返したメトリクスを保存（次回の差分で値が変わったものだけを返すため）"""
+        client = self._get_redis()
+        if client is None:
+            return
+        try:
+            client.set(
+                dashboard_metrics_key(version),
+                json.dumps(metrics),
+                ex=settings.DASHBOARD_METRICS_SNAPSHOT_TTL_SECONDS,
+            )
+        except redis.RedisError as e:
+            self._redis_failed(e)
+
+    def reset(self):
+        """バージョンと変更の記録を破棄（次回の採番は現在時刻から再開される）"""
+        client = self._get_redis()
+        if client is None:
+            return
+        try:
+            client.delete(
+                DASHBOARD_VERSION_KEY,
+                DASHBOARD_VERSION_FLOOR_KEY,
+                DASHBOARD_CHANGES_KEY,
+            )
+        except redis.RedisError as e:
+            self._redis_failed(e)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """更新・参照の回数"""
+        return dict(self.stats)
+
+
+# グローバルインスタンス
+dashboard_version_index = DashboardVersionIndex()
@@ -0,0 +1,243 @@
+"""
+エンティティID解決キャッシュ
+
+学生（email）・ノートブック（path）・セル（notebook_id, cell_id）・アクティブセッション
+（student_id）のDB IDを、プロセス内LRU（TTL付き）とRedisの2段でキャッシュします。
+授業中はほとんど変わらない識別子の解決を、イベントごとのSELECT / UPSERTから外すためのものです。
+
+キャッシュへの登録はトランザクションのコミット後に行うこと（ロールバックされたIDを残さないため）。
+Redisが利用できない場合はプロセス内キャッシュのみで動作します。
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional
+
+import redis
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 名前空間
+STUDENT = "student"
+NOTEBOOK = "notebook"
+CELL = "cell"
+SESSION = "session"
+TEAM = "team"
+
+NAMESPACES = (STUDENT, NOTEBOOK, CELL, SESSION, TEAM)
+
+# Redisキーのプレフィックス
+ENTITY_CACHE_KEY_PREFIX = "entity:"
+
+# Redis障害時に再接続を試みるまでの秒数
+REDIS_RETRY_INTERVAL_SECONDS = 30
+
+
+def _redis_key(namespace: str, key: Hashable) -> str:
+    if isinstance(key, tuple):
+        key = ":".join(str(part) for part in key)
+    return f"{ENTITY_CACHE_KEY_PREFIX}{namespace}:{key}"
+
+
+class EntityIdCache:
+    """
+    エンティティID解決の2段キャッシュ（プロセス内LRU + Redis）
+
+    crud関数はDB用スレッドプールから呼ばれるため、プロセス内キャッシュはロックで保護し、
+    Redisは同期クライアントを使用する。
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        ttl_seconds: Optional[int] = None,
+        use_redis: Optional[bool] = None,
+    ):
+        self.max_entries = max_entries or settings.ENTITY_CACHE_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds or settings.ENTITY_CACHE_TTL_SECONDS
+        self.use_redis = (
+            settings.ENTITY_CACHE_REDIS_ENABLED if use_redis is None else use_redis
+        )
+
+        self._entries: Dict[str, "OrderedDict[Hashable, tuple]"] = {
+            namespace: OrderedDict() for namespace in NAMESPACES
+        }
+        self._lock = threading.Lock()
+        self._redis: Optional[redis.Redis] = None
+        self._redis_disabled_until = 0.0
+
+        # 統計（名前空間ごと）
+        self.stats: Dict[str, Dict[str, int]] = {
+            namespace: {"local_hits": 0, "redis_hits": 0, "misses": 0}
+            for namespace in NAMESPACES
+        }
+
+    # --- Redis（第2段） ---
+
+    def _get_redis(self) -> Optional[redis.Redis]:
+        if not self.use_redis or time.monotonic() < self._redis_disabled_until:
+            return None
+        if self._redis is None:
+            self._redis = redis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                decode_responses=True,
+                socket_timeout=0.5,
+                socket_connect_timeout=0.5,
+            )
+        return self._redis
+
+    def _redis_failed(self, error: Exception):
+        """Redis障害時はしばらくプロセス内キャッシュのみで動作する"""
+        logger.warning(f"Entity cache Redis tier unavailable: {error}")
+        self._redis_disabled_until = time.monotonic() + REDIS_RETRY_INTERVAL_SECONDS
+
+    # --- プロセス内LRU（第1段） ---
+
+    def _get_local(self, namespace: str, key: Hashable, now: float) -> Optional[Any]:
+        entries = self._entries[namespace]
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < now:
+            del entries[key]
+            return None
+        entries.move_to_end(key)
+        return value
+
+    def _set_local(self, namespace: str, key: Hashable, value: Any, now: float):
+        entries = self._entries[namespace]
+        entries[key] = (value, now + self.ttl_seconds)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    # --- 公開API ---
+
+    def get_many(self, namespace: str, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        """キャッシュ済みの値を一括取得（見つからないキーは結果に含めない）"""
+        now = time.monotonic()
+        found: Dict[Hashable, Any] = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                value = self._get_local(namespace, key, now)
+                if value is None:
+                    missing.append(key)
+                else:
+                    found[key] = value
+            self.stats[namespace]["local_hits"] += len(found)
+
+        client = self._get_redis() if missing else None
+        if client is not None:
+            try:
+                raw_values = client.mget(
+                    [_redis_key(namespace, key) for key in missing]
+                )
+            except redis.RedisError as e:
+                self._redis_failed(e)
+                raw_values = [None] * len(missing)
+
+            with self._lock:
+                still_missing = []
+                for key, raw in zip(missing, raw_values):
+                    if raw is None:
+                        still_missing.append(key)
+                        continue
+                    value = json.loads(raw)
+                    value = tuple(value) if isinstance(value, list) else value
+                    found[key] = value
+                    self._set_local(namespace, key, value, now)
+                    self.stats[namespace]["redis_hits"] += 1
+                missing = still_missing
+
+        with self._lock:
+            self.stats[namespace]["misses"] += len(missing)
+        return found
+
+    def get(self, namespace: str, key: Hashable) -> Optional[Any]:
+        """キャッシュ済みの値を取得"""
+        return self.get_many(namespace, [key]).get(key)
+
+    def set_many(self, namespace: str, values: Dict[Hashable, Any]):
+        """値を一括登録（コミット済みのIDのみを登録すること）"""
+        if not values:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for key, value in values.items():
+                self._set_local(namespace, key, value, now)
+
+        client = self._get_redis()
+        if client is not None:
+            try:
+                pipe = client.pipeline(transaction=False)
+                for key, value in values.items():
+                    pipe.set(
+                        _redis_key(namespace, key),
+                        json.dumps(value),
+                        ex=self.ttl_seconds,
+                    )
+                pipe.execute()
+            except redis.RedisError as e:
+                self._redis_failed(e)
+
+    def set(self, namespace: str, key: Hashable, value: Any):
+        """値を登録"""
+        self.set_many(namespace, {key: value})
+
+    def invalidate(self, namespace: str, keys: Iterable[Hashable]):
+        """指定キーを両方の段から削除"""
+        keys = list(keys)
+        if not keys:
+            return
+        with self._lock:
+            for key in keys:
+                self._entries[namespace].pop(key, None)
+
+        client = self._get_redis()
+        if client is not None:
+            try:
+                client.delete(*[_redis_key(namespace, key) for key in keys])
+            except redis.RedisError as e:
+                self._redis_failed(e)
+
+    def clear(self):
+        """両方の段のキャッシュを全て破棄"""
+        with self._lock:
+            for entries in self._entries.values():
+                entries.clear()
+
+        client = self._get_redis()
+        if client is not None:
+            try:
+                keys = list(
+                    client.scan_iter(match=f"{ENTITY_CACHE_KEY_PREFIX}*", count=500)
+                )
+                if keys:
+                    client.delete(*keys)
+            except redis.RedisError as e:
+                self._redis_failed(e)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """名前空間ごとのヒット率とエントリ数"""
+        result: Dict[str, Any] = {}
+        for namespace, counts in self.stats.items():
+            lookups = counts["local_hits"] + counts["redis_hits"] + counts["misses"]
+            hits = counts["local_hits"] + counts["redis_hits"]
+            result[namespace] = {
+                **counts,
+                "entries": len(self._entries[namespace]),
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+        return result
+
+
+# グローバルインスタンス
+entity_id_cache = EntityIdCache()
@@ -0,0 +1,259 @@
+"""
+連続エラー状態管理
+
+(学生, セル) ごとの現在の連続エラー回数を学生単位のRedisハッシュで保持し、
+セル実行のたびに実行履歴テーブルを遡らずにO(1)で更新します。
+
+- エラーで+1、成功で0にリセット（参照と更新は1つのLuaスクリプトで不可分に行う）
+- resolve_consecutive_errors で学生単位に0にリセット（解除マーカーを残し、実行履歴から再構築しない）
+- Redisに状態がない（コールドスタート・TTL切れ）場合は実行履歴から再構築
+Redisが利用できない場合は毎回実行履歴から計算します。
+"""
+
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import redis
+from redis.commands.core import Script
+from sqlalchemy.orm import Session
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Redisキーのプレフィックス（error_state:{student_id} → {cell_id: 連続エラー回数}）
+ERROR_STATE_KEY_PREFIX = "error_state:"
+
+# エラー解除後のハッシュに残すフィールド（状態のないセルを実行履歴から再構築せず0から数える）
+RESET_FIELD = "reset"
+
+# Redis障害時に再接続を試みるまでの秒数
+REDIS_RETRY_INTERVAL_SECONDS = 30
+
+
+# ペアごとに実行結果を順に適用し、各実行後の連続エラー回数をカンマ区切りで返す
+# （KEYS[i]: 学生のハッシュ, ARGV[1]: TTL, ARGV[2 + 3(i-1)..]: セルID, 実行結果（E/S）, 基準値）
+# 状態も基準値もなくエラーから始まるペアは適用せず空文字列を返す
+# 解除マーカー（RESET_FIELD）のある学生の状態のないセルは0から数える
+_ADVANCE = """
+local results = {}
+for i = 1, #KEYS do
+    local base = 2 + (i - 1) * 3
+    local field = ARGV[base]
+    local outcomes = ARGV[base + 1]
+    local count = redis.call('HGET', KEYS[i], field)
+    if not count then
+        if redis.call('HEXISTS', KEYS[i], 'reset') == 1 then
+            count = '0'
+        else
+            count = ARGV[base + 2]
+        end
+    end
+    if count == '' and string.sub(outcomes, 1, 1) == 'E' then
+        results[i] = ''
+    else
+        count = tonumber(count) or 0
+        local counts = {}
+        for j = 1, #outcomes do
+            if string.sub(outcomes, j, j) == 'E' then
+                count = count + 1
+            else
+                count = 0
+            end
+            counts[j] = count
+        end
+        redis.call('HSET', KEYS[i], field, count)
+        redis.call('EXPIRE', KEYS[i], ARGV[1])
+        results[i] = table.concat(counts, ',')
+    end
+end
+return results
+"""
+
+
+def _state_key(student_id: int) -> str:
+    return f"{ERROR_STATE_KEY_PREFIX}{student_id}"
+
+
+def _apply_outcomes(count: int, errors: List[bool]) -> List[int]:
+    """連続エラー回数 count から実行結果を順に適用した各実行後の回数"""
+    counts = []
+    for has_error in errors:
+        count = count + 1 if has_error else 0
+        counts.append(count)
+    return counts
+
+
+class ConsecutiveErrorTracker:
+    """
+    連続エラー回数のインクリメンタル状態
+
+    crud関数はDB用スレッドプールから呼ばれるため、同期Redisクライアントを使用する。
+    """
+
+    def __init__(
+        self, ttl_seconds: Optional[int] = None, use_redis: Optional[bool] = None
+    ):
+        self.ttl_seconds = ttl_seconds or settings.ERROR_STATE_TTL_SECONDS
+        self.use_redis = (
+            settings.ERROR_STATE_REDIS_ENABLED if use_redis is None else use_redis
+        )
+        self._redis: Optional[redis.Redis] = None
+        self._advance_script: Optional[Script] = None
+        self._redis_disabled_until = 0.0
+
+        # 統計
+        self.stats = {"state_hits": 0, "rebuilt": 0}
+
+    def _get_redis(self) -> Optional[redis.Redis]:
+        if not self.use_redis or time.monotonic() < self._redis_disabled_until:
+            return None
+        if self._redis is None:
+            self._redis = redis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                decode_responses=True,
+                socket_timeout=0.5,
+                socket_connect_timeout=0.5,
+            )
+            self._advance_script = self._redis.register_script(_ADVANCE)
+        return self._redis
+
+    def _redis_failed(self, error: Exception):
+        """Redis障害時はしばらく実行履歴からの計算で動作する"""
+        logger.warning(f"Consecutive error state unavailable: {error}")
+        self._redis_disabled_until = time.monotonic() + REDIS_RETRY_INTERVAL_SECONDS
+
+    def advance(
+        self, db: Session, outcomes: Dict[Tuple[int, int], List[bool]]
+    ) -> Dict[Tuple[int, int], List[int]]:
+        """
+        (学生ID, セルDB ID) ごとの実行結果（エラーなら True、実行順）を状態に適用し、
+        各実行後の連続エラー回数を返す
+
+        読み取りと更新を1つのLuaスクリプトで行うため、APIと複数のワーカーが同じペアを
+        同時に更新しても加算は失われない。状態がなくエラーから始まるペアのみ実行履歴から
+        基準値を再構築して適用する（その間に作成された状態があればそちらを優先）。
+        適用後にトランザクションが失敗した場合は discard で状態を破棄すること。
+        """
+        from crud.crud_ingest import get_consecutive_error_baselines
+
+        if not outcomes:
+            return {}
+
+        client = self._get_redis()
+        if client is not None:
+            try:
+                results = self._advance(outcomes, {})
+                missing = {pair for pair, counts in results.items() if counts is None}
+                self.stats["state_hits"] += len(results) - len(missing)
+                if missing:
+                    self.stats["rebuilt"] += len(missing)
+                    baselines = get_consecutive_error_baselines(db, missing)
+                    results.update(
+                        self._advance(
+                            {pair: outcomes[pair] for pair in missing},
+                            {pair: baselines.get(pair, 0) for pair in missing},
+                        )
+                    )
+                return {
+                    pair: counts
+                    for pair, counts in results.items()
+                    if counts is not None
+                }
+            except redis.RedisError as e:
+                # 一部のペアのみ適用された可能性があるため、可能であれば破棄して次回は履歴から再構築させる
+                self.discard(student_id for student_id, _ in outcomes)
+                self._redis_failed(e)
+
+        # Redisが利用できない場合は実行履歴から計算する（状態は更新しない）
+        error_pairs = {pair for pair, errors in outcomes.items() if any(errors)}
+        self.stats["rebuilt"] += len(error_pairs)
+        baselines = (
+            get_consecutive_error_baselines(db, error_pairs) if error_pairs else {}
+        )
+        return {
+            pair: _apply_outcomes(baselines.get(pair, 0), errors)
+            for pair, errors in outcomes.items()
+        }
+
+    def _advance(
+        self,
+        outcomes: Dict[Tuple[int, int], List[bool]],
+        baselines: Dict[Tuple[int, int], int],
+    ) -> Dict[Tuple[int, int], Optional[List[int]]]:
+        pairs = list(outcomes)
+        args: List[Any] = [self.ttl_seconds]
+        for pair in pairs:
+            args += [
+                pair[1],
+                "".join("E" if has_error else "S" for has_error in outcomes[pair]),
+                baselines.get(pair, ""),
+            ]
+        if self._advance_script is None:
+            raise redis.RedisError("Consecutive error state script is not registered")
+        raw = self._advance_script(
+            keys=[_state_key(student_id) for student_id, _ in pairs], args=args
+        )
+        return {
+            pair: [int(count) for count in counts.split(",")] if counts else None
+            for pair, counts in zip(pairs, raw)
+        }
+
+    def discard(self, student_ids: Iterable[int]):
+        """学生の連続エラー状態を破棄（適用後にトランザクションが失敗した場合）"""
+        client = self._get_redis()
+        keys = [_state_key(student_id) for student_id in set(student_ids)]
+        if client is None or not keys:
+            return
+        try:
+            client.delete(*keys)
+        except redis.RedisError:
+            pass
+
+    def clear_student(self, student_id: int):
+        """
+        学生の連続エラー状態を全セル分0にリセット（エラー解除時）
+
+        キーを削除すると次のエラーで実行履歴から再構築され、解除前のエラーが
+        再び数えられるため、全セルの回数を消して解除マーカーを残す。
+        """
+        client = self._get_redis()
+        if client is None:
+            return
+        key = _state_key(student_id)
+        try:
+            pipe = client.pipeline(transaction=True)
+            pipe.delete(key)
+            pipe.hset(key, RESET_FIELD, 1)
+            pipe.expire(key, self.ttl_seconds)
+            pipe.execute()
+        except redis.RedisError as e:
+            self._redis_failed(e)
+
+    def reset(self):
+        """全学生の連続エラー状態を破棄（次回参照時に実行履歴から再構築される）"""
+        client = self._get_redis()
+        if client is None:
+            return
+        try:
+            keys = list(client.scan_iter(match=f"{ERROR_STATE_KEY_PREFIX}*", count=500))
+            if keys:
+                client.delete(*keys)
+        except redis.RedisError as e:
+            self._redis_failed(e)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """状態ヒット数と履歴からの再構築数"""
+        lookups = self.stats["state_hits"] + self.stats["rebuilt"]
+        return {
+            **self.stats,
+            "hit_rate": (
+                round(self.stats["state_hits"] / lookups, 4) if lookups else 0.0
+            ),
+        }
+
+
+# グローバルインスタンス
+consecutive_error_tracker = ConsecutiveErrorTracker()
@@ -1,5 +1,13 @@
+from datetime import datetime, timezone
 from sqlalchemy.orm import Session
 from typing import List, Optional
+from crud.crud_dashboard_state import (
+    StudentStateDelta,
+    apply_state_deltas,
+    clear_significant_errors,
+)
+from crud.crud_dashboard_version import dashboard_version_index
+from crud.crud_error_state import consecutive_error_tracker
 from db import models
 from schemas.event import EventData
 
@@ -16,24 +24,23 @@ def create_cell_execution(
     セル実行履歴を作成してデータベースに保存する
     
     連続エラー検出機能が統合されており、同一セルでの連続エラー回数を
-    自動的に計算し、設定閾値以上の場合は is_significant_error フラグを設定します。
+    連続エラー状態から計算し、設定閾値以上の場合は is_significant_error フラグを設定します。
     """
     
     # 1. 現在のステータスを判定
     current_status = "success" if not event.hasError else "error"
     
     # 2. 連続エラー回数を計算
-    consecutive_count = 0
+    # 現在の状態に今回の結果を適用（エラーなら+1、成功なら0にリセット。状態がない場合は実行履歴から再構築）
+    pair = (student_id, cell_id)
+    consecutive_count = consecutive_error_tracker.advance(
+        db, {pair: [current_status == "error"]}
+    )[pair][0]
     is_significant = False
-    
+
     if current_status == "error":
-        # 過去の連続エラー回数を取得
-        consecutive_count = calculate_consecutive_errors(db, student_id, cell_id)
-        # 現在のエラーを含めて+1
-        consecutive_count += 1
         # 設定閾値以上かチェック
         is_significant = is_error_significant(db, consecutive_count)
-    # 成功の場合、連続エラーはリセットされるので 0
     
     # 3. セル実行履歴レコードを作成
     db_execution = models.CellExecution(
@@ -57,8 +64,27 @@ def create_cell_execution(
     )
     
     db.add(db_execution)
-    db.commit()
+
+    # 4. ダッシュボード集計に反映（同じトランザクション）
+    delta = StudentStateDelta()
+    delta.add_execution(
+        event.notebookPath,
+        datetime.now(timezone.utc),
+        current_status == "error",
+        cell_id,
+        consecutive_count,
+        is_significant,
+    )
+    apply_state_deltas(db, {student_id: delta})
+
+    try:
+        db.commit()
+    except Exception:
+        # 適用済みの連続エラー状態は永続化されなかったため破棄する
+        consecutive_error_tracker.discard([student_id])
+        raise
     db.refresh(db_execution)
+    dashboard_version_index.bump([student_id])
     return db_execution
 
 
@@ -125,9 +151,9 @@ def is_error_significant(db: Session, consecutive_count: int) -> bool:
     Returns:
         設定閾値以上の場合 True、未満の場合 False
     """
-    from crud.crud_settings import get_setting_value
+    from crud.crud_settings import get_cached_setting_value
     
-    threshold = get_setting_value(
+    threshold = get_cached_setting_value(
         db, 
         "consecutive_error_threshold", 
         default_value=3
@@ -215,16 +241,20 @@ def resolve_consecutive_errors(db: Session, student_id: int) -> bool:
     try:
         from datetime import datetime
         
-        # 該当学生の全CellExecutionでis_significant_errorフラグを持つレコードを更新
+        # 該当学生の連続エラー中のCellExecutionを0にリセット（実行履歴から再構築しても数えない）
         updated_rows = db.query(models.CellExecution).filter(
             models.CellExecution.student_id == student_id,
-            models.CellExecution.is_significant_error == True
+            models.CellExecution.status == "error",
+            models.CellExecution.consecutive_error_count > 0,
         ).update({
             "consecutive_error_count": 0,
             "is_significant_error": False
         })
+        clear_significant_errors(db, student_id)
         
         db.commit()
+        consecutive_error_tracker.clear_student(student_id)
+        dashboard_version_index.bump([student_id])
         print(f"Resolved consecutive errors for student {student_id}: {updated_rows} rows updated")
         return True
         
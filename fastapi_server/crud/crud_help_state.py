@@ -0,0 +1,268 @@
+"""
+ヘルプ要求状態インデックス
+
+学生ごとの最新のヘルプ関連イベント（help / help_stop）とその時刻をRedisハッシュで保持し、
+ダッシュボードはクラス全体のヘルプ状態を1回の呼び出しで取得します。
+
+- ワーカーの help / help_stop ハンドラーが更新（イベント時刻が新しい場合のみ上書き）
+- ヘルプ要求は HELP_STATE_ACTIVE_SECONDS を過ぎると無効（従来のInfluxDB参照と同じ判定）
+- インデックスがない（コールドスタート・Redisの再起動）場合はInfluxDBの1回のクエリから再構築
+Redisが利用できない場合はInfluxDBのクエリ結果をそのまま使用します。
+"""
+
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis
+from redis.commands.core import Script
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Redisキー（help_state → {email: "状態|イベント時刻(UNIX秒)"}）
+HELP_STATE_KEY = "help_state"
+# インデックスが構築済みであることを示すキー（なければInfluxDBから再構築）
+HELP_STATE_READY_KEY = "help_state:ready"
+
+HELP = "help"
+HELP_STOP = "help_stop"
+
+# Redis障害時に再接続を試みるまでの秒数
+REDIS_RETRY_INTERVAL_SECONDS = 30
+# 有効期間を過ぎたエントリを削除するまでの猶予（期限切れをダッシュボードのバージョンに反映するため）
+PRUNE_GRACE_SECONDS = 60
+
+# 保存済みの時刻より新しいイベントの場合のみ上書きする（順序が入れ替わったイベント対策）
+_RECORD_IF_NEWER = """
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+if current then
+    local at = tonumber(string.match(current, '|(.+)$'))
+    if at and at > tonumber(ARGV[3]) then
+        return 0
+    end
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2] .. '|' .. ARGV[3])
+return 1
+"""
+
+
+def _epoch_seconds(value: Any) -> float:
+    """ISO 8601文字列・datetimeをUNIX秒に変換（解析できない場合は現在時刻）"""
+    if isinstance(value, str) and value:
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            pass
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return time.time()
+
+
+def _parse_entry(raw: str) -> Optional[Tuple[str, float]]:
+    state, _, at = raw.partition("|")
+    try:
+        return state, float(at)
+    except ValueError:
+        return None
+
+
+class HelpStateIndex:
+    """
+    学生ごとのヘルプ状態のインデックス
+
+    ダッシュボードの集計はDB用スレッドプールから呼ばれるため、同期Redisクライアントを使用する。
+    """
+
+    def __init__(self, active_seconds: Optional[int] = None):
+        self.active_seconds = active_seconds or settings.HELP_STATE_ACTIVE_SECONDS
+        self._redis: Optional[redis.Redis] = None
+        self._record_script: Optional[Script] = None
+        self._redis_disabled_until = 0.0
+
+        # 統計
+        self.stats = {"reads": 0, "backfills": 0, "records": 0, "stale_ignored": 0}
+
+    def _get_redis(self) -> Optional[redis.Redis]:
+        if time.monotonic() < self._redis_disabled_until:
+            return None
+        if self._redis is None:
+            self._redis = redis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                decode_responses=True,
+                socket_timeout=0.5,
+                socket_connect_timeout=0.5,
+            )
+            self._record_script = self._redis.register_script(_RECORD_IF_NEWER)
+        return self._redis
+
+    def _redis_failed(self, error: Exception):
+        """Redis障害時はしばらくInfluxDBからの取得で動作する"""
+        logger.warning(f"Help state index unavailable: {error}")
+        self._redis_disabled_until = time.monotonic() + REDIS_RETRY_INTERVAL_SECONDS
+
+    def record(self, email: str, state: str, event_time: Any = None):
+        """
+        ヘルプ関連イベントを反映（ワーカーのハンドラーから呼び出す）
+
+        Args:
+            email: 学生のメールアドレス
+            state: HELP または HELP_STOP
+            event_time: イベント時刻（ISO 8601文字列・datetime、ない場合は現在時刻）
+        """
+        client = self._get_redis()
+        if client is None or self._record_script is None or not email:
+            return
+        try:
+            updated = self._record_script(
+                keys=[HELP_STATE_KEY], args=[email, state, _epoch_seconds(event_time)]
+            )
+        except redis.RedisError as e:
+            self._redis_failed(e)
+            return
+        if updated:
+            self.stats["records"] += 1
+        else:
+            self.stats["stale_ignored"] += 1
+
+    def get_help_states(self) -> Dict[str, bool]:
+        """
+        クラス全体のヘルプ要求状態を取得
+
+        Returns:
+            メールアドレス → ヘルプ要求中か（有効期間内の最新イベントが help の学生のみ True）
+        """
+        self.stats["reads"] += 1
+        now = time.time()
+        entries: Optional[Dict[str, Tuple[str, float]]] = None
+
+        client = self._get_redis()
+        if client is not None:
+            try:
+                pipe = client.pipeline(transaction=False)
+                pipe.exists(HELP_STATE_READY_KEY)
+                pipe.hgetall(HELP_STATE_KEY)
+                ready, raw_entries = pipe.execute()
+                if ready:
+                    entries = {}
+                    for email, raw in raw_entries.items():
+                        parsed = _parse_entry(raw)
+                        if parsed is not None:
+                            entries[email] = parsed
+                    self._prune(client, entries, now)
+            except redis.RedisError as e:
+                self._redis_failed(e)
+
+        if entries is None:
+            entries = self.backfill()
+
+        threshold = now - self.active_seconds
+        return {
+            email: state == HELP and at >= threshold
+            for email, (state, at) in entries.items()
+        }
+
+    def _prune(
+        self, client: redis.Redis, entries: Dict[str, Tuple[str, float]], now: float
+    ):
+        """有効期間を過ぎたエントリを削除（以降の判定に影響しない）"""
+        threshold = now - self.active_seconds - PRUNE_GRACE_SECONDS
+        stale = [email for email, (_, at) in entries.items() if at < threshold]
+        if stale:
+            client.hdel(HELP_STATE_KEY, *stale)
+
+    def get_expired_between(self, start: float, end: float) -> List[str]:
+        """
+        (start, end] の間に有効期間を過ぎたヘルプ要求の学生を取得
+
+        Args:
+            start: 前回の確認時刻（UNIX秒）
+            end: 今回の確認時刻（UNIX秒）
+        """
+        client = self._get_redis()
+        if client is None:
+            return []
+        try:
+            raw_entries = client.hgetall(HELP_STATE_KEY)
+        except redis.RedisError as e:
+            self._redis_failed(e)
+            return []
+        expired = []
+        for email, raw in raw_entries.items():
+            parsed = _parse_entry(raw)
+            if parsed is None or parsed[0] != HELP:
+                continue
+            if start < parsed[1] + self.active_seconds <= end:
+                expired.append(email)
+        return expired
+
+    def backfill(self) -> Dict[str, Tuple[str, float]]:
+        """
+        有効期間内の最新のヘルプ関連イベントをInfluxDBから取得してインデックスを再構築
+
+        Returns:
+            メールアドレス → (状態, イベント時刻)
+        """
+        from db.influxdb_client import query_progress_data
+
+        self.stats["backfills"] += 1
+        query = f"""
+        from(bucket: "{settings.INFLUXDB_BUCKET}")
+          |> range(start: -{self.active_seconds}s)
+          |> filter(fn: (r) => r._measurement == "{settings.INFLUX_PROGRESS_MEASUREMENT}")
+          |> filter(fn: (r) => r.event == "{HELP}" or r.event == "{HELP_STOP}")
+          |> filter(fn: (r) => r._field == "cellIndex")
+          |> group(columns: ["emailAddress"])
+          |> sort(columns: ["_time"])
+          |> last()
+        """
+        entries: Dict[str, Tuple[str, float]] = {}
+        try:
+            for table in query_progress_data(query):
+                for record in table:
+                    email = record.values.get("emailAddress")
+                    if email:
+                        entries[email] = (
+                            record.values.get("event"),
+                            record.get_time().timestamp(),
+                        )
+        except Exception as e:
+            logger.error(f"Failed to backfill help state from InfluxDB: {e}")
+            return entries
+
+        client = self._get_redis()
+        if client is None or self._record_script is None:
+            return entries
+        try:
+            for email, (state, at) in entries.items():
+                self._record_script(keys=[HELP_STATE_KEY], args=[email, state, at])
+            client.set(HELP_STATE_READY_KEY, 1)
+            logger.info(
+                f"Help state index rebuilt from InfluxDB: {len(entries)} students"
+            )
+        except redis.RedisError as e:
+            self._redis_failed(e)
+        return entries
+
+    def reset(self):
+        """インデックスを破棄（次回参照時にInfluxDBから再構築される）"""
+        client = self._get_redis()
+        if client is None:
+            return
+        try:
+            client.delete(HELP_STATE_KEY, HELP_STATE_READY_KEY)
+        except redis.RedisError as e:
+            self._redis_failed(e)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """参照・更新・再構築の回数"""
+        return dict(self.stats)
+
+
+# グローバルインスタンス
+help_state_index = HelpStateIndex()
@@ -0,0 +1,555 @@
+"""
+イベント取り込みバッチの一括永続化CRUD機能
+
+/api/v1/events で受信したイベントバッチ全体について、学生・ノートブック・セル・
+セッションをセット単位で解決し、CellExecution を1つのトランザクションで一括挿入します。
+イベントごとの get_or_create_* とコミットを、バッチあたり数回のSQL文に置き換えます。
+"""
+
+import os
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    cast,
+)
+
+from sqlalchemy import func, insert, select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from crud.crud_dashboard_state import (
+    StudentStateDelta,
+    apply_state_deltas,
+    record_session_starts,
+)
+from crud.crud_dashboard_version import dashboard_version_index
+from crud.crud_entity_cache import (
+    CELL,
+    NOTEBOOK,
+    SESSION,
+    STUDENT,
+    TEAM,
+    entity_id_cache,
+)
+from db import models
+from schemas.event import EventData
+
+# 連続エラー判定で遡る直近実行件数（calculate_consecutive_errors と同じ）
+CONSECUTIVE_ERROR_LOOKBACK = 10
+
+K = TypeVar("K", bound=Hashable)
+
+
+def _execution_keys(event: EventData) -> Tuple[str, str, str]:
+    """永続化対象イベントの (メールアドレス, ノートブックパス, セルID)"""
+    # is_persistable_execution で存在を確認済み
+    return (
+        cast(str, event.emailAddress),
+        cast(str, event.notebookPath),
+        cast(str, event.cellId),
+    )
+
+
+def is_persistable_execution(event: EventData) -> bool:
+    """CellExecution として永続化できるセル実行イベントかどうか"""
+    return (
+        event.eventType == "cell_executed"
+        and bool(event.emailAddress)
+        and bool(event.notebookPath)
+        and bool(event.cellId)
+    )
+
+
+def bulk_upsert_teams(db: Session, team_names: Iterable[str]) -> Dict[str, int]:
+    """チーム名 → チームID を INSERT ... ON CONFLICT ... RETURNING で一括解決する"""
+    names = sorted(set(team_names))
+    if not names:
+        return {}
+
+    stmt = pg_insert(models.Team).values(
+        [{"team_name": name, "description": f"{name}の説明"} for name in names]
+    )
+    upsert = stmt.on_conflict_do_update(
+        index_elements=[models.Team.team_name],
+        set_={"team_name": stmt.excluded.team_name},
+    ).returning(models.Team.id, models.Team.team_name)
+    return {row.team_name: row.id for row in db.execute(upsert)}
+
+
+def bulk_upsert_students(
+    db: Session, students: Dict[str, Tuple[Optional[str], Optional[int]]]
+) -> Dict[str, int]:
+    """
+    メールアドレス → 学生ID を一括解決する
+
+    Args:
+        students: email → (name, team_id)
+
+    既存学生の名前・チームは未設定の場合のみ補完します。
+    """
+    if not students:
+        return {}
+
+    stmt = pg_insert(models.Student).values(
+        [
+            {"email": email, "name": name, "team_id": team_id}
+            for email, (name, team_id) in sorted(students.items())
+        ]
+    )
+    upsert = stmt.on_conflict_do_update(
+        index_elements=[models.Student.email],
+        set_={
+            "name": func.coalesce(models.Student.name, stmt.excluded.name),
+            "team_id": func.coalesce(models.Student.team_id, stmt.excluded.team_id),
+        },
+    ).returning(models.Student.id, models.Student.email)
+    return {row.email: row.id for row in db.execute(upsert)}
+
+
+def bulk_upsert_notebooks(db: Session, paths: Iterable[str]) -> Dict[str, int]:
+    """ノートブックパス → ノートブックID を一括解決する"""
+    unique_paths = sorted(set(paths))
+    if not unique_paths:
+        return {}
+
+    stmt = pg_insert(models.Notebook).values(
+        [{"path": path, "name": os.path.basename(path)} for path in unique_paths]
+    )
+    upsert = stmt.on_conflict_do_update(
+        index_elements=[models.Notebook.path],
+        set_={"path": stmt.excluded.path},
+    ).returning(models.Notebook.id, models.Notebook.path)
+    return {row.path: row.id for row in db.execute(upsert)}
+
+
+def bulk_resolve_cells(
+    db: Session, cells: Dict[Tuple[int, str], EventData]
+) -> Dict[Tuple[int, str], int]:
+    """
+    (ノートブックID, セルID) → セルDB ID を一括解決する
+
+    (notebook_id, cell_id) の一意インデックスに対する INSERT ... ON CONFLICT ... RETURNING で
+    作成と取得を1文で行うため、同じセルを含むバッチが並行しても重複行は作成されません。
+    既存セルはイベントにコードがある場合のみ内容を更新します。
+
+    Args:
+        cells: (notebook_id, cell_id) → そのセルの最新イベント
+    """
+    if not cells:
+        return {}
+
+    stmt = pg_insert(models.Cell).values(
+        [
+            {
+                "notebook_id": notebook_id,
+                "cell_id": cell_id,
+                "cell_type": event.cellType or "code",
+                "content": event.code,
+                "position": event.cellIndex,
+            }
+            for (notebook_id, cell_id), event in sorted(cells.items())
+        ]
+    )
+    upsert = stmt.on_conflict_do_update(
+        index_elements=[models.Cell.notebook_id, models.Cell.cell_id],
+        set_={
+            "content": func.coalesce(
+                func.nullif(stmt.excluded.content, ""), models.Cell.content
+            )
+        },
+    ).returning(models.Cell.id, models.Cell.notebook_id, models.Cell.cell_id)
+    return {(row.notebook_id, row.cell_id): row.id for row in db.execute(upsert)}
+
+
+def _select_active_sessions(db: Session, student_ids: Iterable[int]) -> Dict[int, int]:
+    """学生ID → アクティブセッションID を取得する"""
+    rows = db.execute(
+        select(models.Session.student_id, models.Session.id).where(
+            models.Session.student_id.in_(list(student_ids)),
+            models.Session.end_time.is_(None),
+            models.Session.is_active.is_(True),
+        )
+    ).all()
+    return {row.student_id: row.id for row in rows}
+
+
+def bulk_resolve_active_sessions(
+    db: Session, student_ids: Iterable[int]
+) -> Dict[int, int]:
+    """
+    学生ID → アクティブセッションID を一括解決（未作成の場合は作成）する
+
+    アクティブセッションの部分一意インデックスに対して ON CONFLICT DO NOTHING で作成し、
+    並行するバッチが先に作成した学生は再度SELECTして取得します。
+    """
+    ids = sorted(set(student_ids))
+    if not ids:
+        return {}
+
+    resolved = _select_active_sessions(db, ids)
+
+    missing = [sid for sid in ids if sid not in resolved]
+    if missing:
+        stmt = (
+            pg_insert(models.Session)
+            .values(
+                [
+                    {
+                        "student_id": sid,
+                        "session_id": str(uuid.uuid4()),
+                        "is_active": True,
+                    }
+                    for sid in missing
+                ]
+            )
+            .on_conflict_do_nothing(
+                index_elements=[models.Session.student_id],
+                # 部分インデックスの条件と同じ式にする（推論に必要）
+                index_where=text("is_active = true AND end_time IS NULL"),
+            )
+            .returning(
+                models.Session.id, models.Session.student_id, models.Session.start_time
+            )
+        )
+        starts = {}
+        for row in db.execute(stmt):
+            resolved[row.student_id] = row.id
+            starts[row.student_id] = row.start_time
+        record_session_starts(db, starts)
+
+        lost = [sid for sid in missing if sid not in resolved]
+        if lost:
+            resolved.update(_select_active_sessions(db, lost))
+
+    return resolved
+
+
+def get_consecutive_error_baselines(
+    db: Session, pairs: Set[Tuple[int, int]]
+) -> Dict[Tuple[int, int], int]:
+    """
+    (学生ID, セルDB ID) ごとの現在の連続エラー回数を1回のクエリで取得する
+
+    calculate_consecutive_errors と同様に直近10件を新しい順に遡り、
+    成功に達するまでのエラー件数を数えます。
+    エラー解除（resolve_consecutive_errors）で回数を0にしたエラーは成功と同様に扱います。
+    """
+    if not pairs:
+        return {}
+
+    ce = models.CellExecution
+    ranked = (
+        select(
+            ce.student_id,
+            ce.cell_id,
+            ce.status,
+            ce.consecutive_error_count,
+            func.row_number()
+            .over(
+                partition_by=(ce.student_id, ce.cell_id),
+                order_by=ce.executed_at.desc(),
+            )
+            .label("rn"),
+        )
+        .where(tuple_(ce.student_id, ce.cell_id).in_(list(pairs)))
+        .subquery()
+    )
+    rows = db.execute(
+        select(
+            ranked.c.student_id,
+            ranked.c.cell_id,
+            ranked.c.status,
+            ranked.c.consecutive_error_count,
+        )
+        .where(ranked.c.rn <= CONSECUTIVE_ERROR_LOOKBACK)
+        .order_by(ranked.c.student_id, ranked.c.cell_id, ranked.c.rn)
+    ).all()
+
+    baselines: Dict[Tuple[int, int], int] = {pair: 0 for pair in pairs}
+    closed: Set[Tuple[int, int]] = set()
+    for row in rows:
+        key = (row.student_id, row.cell_id)
+        if key in closed:
+            continue
+        if row.status == "error" and row.consecutive_error_count:
+            baselines[key] += 1
+        else:
+            closed.add(key)
+    return baselines
+
+
+def _code_hash(code: Optional[str]) -> Optional[int]:
+    """セル内容の比較用ハッシュ（内容がない場合は None）"""
+    return zlib.crc32(code.encode("utf-8")) if code else None
+
+
+def _resolve_with_cache(
+    namespace: str,
+    keys: Iterable[K],
+    resolve: Callable[[Set[K]], Dict[K, int]],
+    cache_updates: Dict[str, Dict[Hashable, Any]],
+) -> Dict[K, int]:
+    """キャッシュにないキーのみ resolve でDBから解決する（新しい値は cache_updates に追加）"""
+    key_set = set(keys)
+    cached = entity_id_cache.get_many(namespace, key_set)
+    resolved: Dict[K, int] = {key: cached[key] for key in key_set if key in cached}
+    missing = key_set - resolved.keys()
+    if missing:
+        fetched = resolve(missing)
+        resolved.update(fetched)
+        cache_updates.setdefault(namespace, {}).update(fetched.items())
+    return resolved
+
+
+def _resolve_students(
+    db: Session,
+    students: Dict[str, Tuple[Optional[str], Optional[str]]],
+    cache_updates: Dict[str, Dict[Hashable, Any]],
+) -> Dict[str, int]:
+    """
+    メールアドレス → 学生ID をキャッシュ優先で解決する
+
+    キャッシュ値は (学生ID, 名前とチームを設定済みか)。未設定の可能性がある学生に
+    名前・チームを含むイベントが来た場合は、補完のためにUPSERTを行う。
+    """
+    cached = entity_id_cache.get_many(STUDENT, students)
+    student_ids: Dict[str, int] = {}
+    pending: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+    for email, (name, team) in students.items():
+        hit = cached.get(email)
+        if hit is not None and (hit[1] or not (name or team)):
+            student_ids[email] = hit[0]
+        else:
+            pending[email] = (name, team)
+
+    if not pending:
+        return student_ids
+
+    team_ids = _resolve_with_cache(
+        TEAM,
+        (team for _, team in pending.values() if team),
+        lambda names: bulk_upsert_teams(db, names),
+        cache_updates,
+    )
+    created = bulk_upsert_students(
+        db,
+        {
+            email: (name, team_ids.get(team) if team else None)
+            for email, (name, team) in pending.items()
+        },
+    )
+    student_ids.update(created)
+    cache_updates.setdefault(STUDENT, {}).update(
+        {
+            email: (student_id, bool(pending[email][0] and pending[email][1]))
+            for email, student_id in created.items()
+        }
+    )
+    return student_ids
+
+
+def _resolve_cells(
+    db: Session,
+    cells: Dict[Tuple[int, str], EventData],
+    cache_updates: Dict[str, Dict[Hashable, Any]],
+) -> Dict[Tuple[int, str], int]:
+    """
+    (ノートブックID, セルID) → セルDB ID をキャッシュ優先で解決する
+
+    キャッシュ値は (セルDB ID, 内容のハッシュ)。キャッシュ済みのセルでコードが
+    変わっている場合はSELECTを省略してID指定で内容を更新する。
+    """
+    cached = entity_id_cache.get_many(CELL, cells)
+    resolved: Dict[Tuple[int, str], int] = {}
+    content_updates: List[Dict[str, Any]] = []
+    cell_cache = cache_updates.setdefault(CELL, {})
+    for key in cells:
+        if key not in cached:
+            continue
+        cell_db_id, content_hash = cached[key]
+        resolved[key] = cell_db_id
+        code = cells[key].code
+        if code and _code_hash(code) != content_hash:
+            content_updates.append({"id": cell_db_id, "content": code})
+            cell_cache[key] = (cell_db_id, _code_hash(code))
+
+    missing = {key: event for key, event in cells.items() if key not in resolved}
+    if missing:
+        fetched = bulk_resolve_cells(db, missing)
+        resolved.update(fetched)
+        for key, cell_db_id in fetched.items():
+            cell_cache[key] = (cell_db_id, _code_hash(missing[key].code))
+
+    if content_updates:
+        db.execute(update(models.Cell), content_updates)
+    return resolved
+
+
+def persist_event_batch(db: Session, events: List[EventData]) -> Dict[str, Any]:
+    """
+    イベントバッチを1トランザクションで一括永続化する
+
+    1. チーム・学生・ノートブック・セル・セッションをセット単位で解決
+       （エンティティIDキャッシュにないもののみDBに問い合わせる）
+    2. 連続エラー回数を現在の状態にバッチ内の順序で適用（Redisで不可分に更新）
+    3. CellExecution を1回の executemany（insertmanyvalues）で挿入し、
+       学生ごとのダッシュボード集計に差分を反映
+    4. コミット後、新たに解決したIDを登録し、ダッシュボードのバージョンを進める
+       （失敗した場合は適用済みの連続エラー状態を破棄する）
+
+    Returns:
+        統計情報と、永続化したセル実行イベントのインデックス → 解決済みID情報
+    """
+    from crud.crud_error_state import consecutive_error_tracker
+    from crud.crud_settings import get_cached_setting_value
+
+    students: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+    for event in events:
+        if not event.emailAddress:
+            continue
+        name, team = students.get(event.emailAddress, (None, None))
+        students[event.emailAddress] = (name or event.userName, team or event.teamName)
+
+    # (インデックス, メールアドレス, ノートブックパス, セルID)
+    executions = [
+        (i, *_execution_keys(event))
+        for i, event in enumerate(events)
+        if is_persistable_execution(event)
+    ]
+
+    # コミット後にキャッシュへ登録する新しいID（名前空間 → キー → 値）
+    cache_updates: Dict[str, Dict[Hashable, Any]] = {}
+    latest_cell_events: Dict[Tuple[int, str], EventData] = {}
+    student_ids: Dict[str, int] = {}
+    outcomes: Dict[Tuple[int, int], List[bool]] = {}
+
+    try:
+        student_ids = _resolve_students(db, students, cache_updates)
+
+        notebook_ids = _resolve_with_cache(
+            NOTEBOOK,
+            (path for _, _, path, _ in executions),
+            lambda paths: bulk_upsert_notebooks(db, paths),
+            cache_updates,
+        )
+        for i, _, path, cell_id in executions:
+            latest_cell_events[(notebook_ids[path], cell_id)] = events[i]
+        cell_ids = _resolve_cells(db, latest_cell_events, cache_updates)
+        session_ids = _resolve_with_cache(
+            SESSION,
+            (student_ids[email] for _, email, _, _ in executions),
+            lambda ids: bulk_resolve_active_sessions(db, ids),
+            cache_updates,
+        )
+
+        # 連続エラー回数: (学生, セル) ごとの実行結果をバッチ内の順序で状態に適用
+        # （状態がなくエラーから始まる場合のみ実行履歴から再構築）
+        for i, email, path, cell_id in executions:
+            pair = (student_ids[email], cell_ids[(notebook_ids[path], cell_id)])
+            outcomes.setdefault(pair, []).append(bool(events[i].hasError))
+        consecutive = {
+            pair: iter(counts)
+            for pair, counts in consecutive_error_tracker.advance(db, outcomes).items()
+        }
+        threshold = (
+            get_cached_setting_value(db, "consecutive_error_threshold", default_value=3)
+            if any(events[i].hasError for i, _, _, _ in executions)
+            else 3
+        )
+
+        # executed_at はバッチ内の順序を保つようにマイクロ秒単位でずらす
+        base_time = datetime.now(timezone.utc)
+        execution_rows: List[Dict[str, Any]] = []
+        persisted: Dict[int, Dict[str, Any]] = {}
+        state_deltas: Dict[int, StudentStateDelta] = {}
+        for offset, (i, email, path, cell_id) in enumerate(executions):
+            event = events[i]
+            student_id = student_ids[email]
+            notebook_id = notebook_ids[path]
+            cell_db_id = cell_ids[(notebook_id, cell_id)]
+            pair = (student_id, cell_db_id)
+
+            consecutive_count = next(consecutive[pair])
+            is_significant = bool(event.hasError) and consecutive_count >= threshold
+
+            executed_at = base_time + timedelta(microseconds=offset)
+            state_deltas.setdefault(student_id, StudentStateDelta()).add_execution(
+                path,
+                executed_at,
+                bool(event.hasError),
+                cell_db_id,
+                consecutive_count,
+                is_significant,
+            )
+            execution_rows.append(
+                {
+                    "student_id": student_id,
+                    "notebook_id": notebook_id,
+                    "cell_id": cell_db_id,
+                    "session_id": session_ids[student_id],
+                    "executed_at": executed_at,
+                    "execution_count": event.executionCount,
+                    "status": "error" if event.hasError else "success",
+                    "duration": (
+                        event.executionDurationMs / 1000
+                        if event.executionDurationMs
+                        else None
+                    ),
+                    "error_message": event.errorMessage,
+                    "output": event.result,
+                    "code_content": event.code,
+                    "cell_index": event.cellIndex,
+                    "cell_type": event.cellType,
+                    "consecutive_error_count": consecutive_count,
+                    "is_significant_error": is_significant,
+                }
+            )
+            persisted[i] = {
+                "studentId": student_id,
+                "notebookId": notebook_id,
+                "cellId_db": cell_db_id,
+                "sessionId_db": session_ids[student_id],
+                "consecutiveErrorCount": consecutive_count,
+                "isSignificantError": is_significant,
+            }
+
+        if execution_rows:
+            db.execute(insert(models.CellExecution), execution_rows)
+            apply_state_deltas(db, state_deltas)
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        # 適用済みの連続エラー状態は永続化されなかったため破棄し、次回は実行履歴から再構築させる
+        consecutive_error_tracker.discard(student_id for student_id, _ in outcomes)
+        # 削除済みエンティティのIDがキャッシュに残っている可能性があるため、
+        # このバッチで参照したキーを破棄してリトライ時にDBから解決し直す
+        entity_id_cache.invalidate(STUDENT, students)
+        entity_id_cache.invalidate(NOTEBOOK, {path for _, _, path, _ in executions})
+        entity_id_cache.invalidate(CELL, latest_cell_events)
+        entity_id_cache.invalidate(SESSION, student_ids.values())
+        raise
+
+    for namespace, entries in cache_updates.items():
+        entity_id_cache.set_many(namespace, entries)
+    dashboard_version_index.bump(student_ids.values())
+
+    return {
+        "students": len(student_ids),
+        "notebooks": len(notebook_ids),
+        "cells": len(cell_ids),
+        "sessions": len(session_ids),
+        "executions": len(execution_rows),
+        "persisted": persisted,
+    }
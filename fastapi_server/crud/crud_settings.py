@@ -5,13 +5,18 @@
 Redis キャッシュ機能を統合した高速な設定値管理を実現します。
 """
 
-from typing import Any, Optional
+import time
+from typing import Any, Dict, Optional, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 
 from db.models import SystemSetting
+from core.config import settings
 from db.redis_client import get_redis_client_sync
 
+# プロセス内の設定値キャッシュ（設定キー → (値, 有効期限)）
+_local_settings_cache: Dict[str, Tuple[Any, float]] = {}
+
 
 def parse_setting_value(value: str, setting_type: str) -> Any:
     """
@@ -87,6 +92,35 @@ def get_setting_value(
     return default_value
 
 
+def get_cached_setting_value(
+    db: Session,
+    setting_key: str,
+    default_value: Any = None
+) -> Any:
+    """
+    設定値を取得（プロセス内キャッシュ付き）
+    
+    ワーカーのホットパス向け。SETTINGS_LOCAL_CACHE_TTL_SECONDS の間は
+    Redis・DBに問い合わせずにプロセス内の値を返します。
+    
+    Args:
+        db: SQLAlchemyセッション
+        setting_key: 設定キー
+        default_value: デフォルト値（設定が見つからない場合）
+    
+    Returns:
+        設定値（適切な型に変換済み）
+    """
+    now = time.monotonic()
+    cached = _local_settings_cache.get(setting_key)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+    
+    value = get_setting_value(db, setting_key, default_value=default_value)
+    _local_settings_cache[setting_key] = (value, now + settings.SETTINGS_LOCAL_CACHE_TTL_SECONDS)
+    return value
+
+
 def update_setting_value(
     db: Session, 
     setting_key: str, 
@@ -129,7 +163,8 @@ def update_setting_value(
     db.commit()
     db.refresh(setting)
     
-    # Redis キャッシュクリア
+    # プロセス内キャッシュ・Redis キャッシュクリア（他プロセスはTTLで反映）
+    _local_settings_cache.pop(setting_key, None)
     try:
         redis = get_redis_client_sync()
         redis.delete(f"setting:{setting_key}")
@@ -1,8 +1,11 @@
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, desc, case
-from typing import List, Optional, Dict, Any
+from sqlalchemy import desc
+from typing import List, Optional, Dict, Any, cast
 from datetime import datetime, timedelta
 
+from crud.crud_dashboard_state import record_session_starts, summarize_error_cells
+from crud.crud_dashboard_version import dashboard_version_index
+from crud.crud_help_state import help_state_index
 from db import models
 from schemas import student as student_schema
 
@@ -30,6 +33,7 @@ def create_student(
     db.add(db_student)
     db.commit()
     db.refresh(db_student)
+    dashboard_version_index.bump([cast(int, db_student.id)])
     return db_student
 
 
@@ -44,64 +48,34 @@ def get_or_create_student(
 
 def get_active_students_with_sessions(db: Session) -> List[Dict[str, Any]]:
     """Get active students with their latest session information"""
-    from datetime import datetime, timedelta
+    # Help status for the whole class in one lookup (Redis index maintained by the worker)
+    help_states = help_state_index.get_help_states()
 
-    # Check for recent help requests (within last 5 minutes)
-    help_threshold = datetime.utcnow() - timedelta(minutes=5)
-
-    # Get students with their session statistics aggregated
+    # Per-student counters are maintained by the worker (student_dashboard_state),
+    # so the overview is a single scan joined on the primary key
+    state = models.StudentDashboardState
     students_with_sessions = (
         db.query(
             models.Student.id,  # IDを追加
             models.Student.email,
             models.Student.name,
             models.Team.team_name,
-            func.max(models.Session.start_time).label("latest_session_start"),
-            func.count(models.CellExecution.id.distinct()).label(
-                "total_cell_executions"
-            ),
-            func.sum(case((models.CellExecution.status == "error", 1), else_=0)).label(
-                "total_error_count"
-            ),
+            state.latest_session_start,
+            state.cell_executions,
+            state.error_count,
+            state.last_notebook_path,
+            state.significant_error_cells,
         )
         .outerjoin(models.Team, models.Team.id == models.Student.team_id)
-        .outerjoin(models.Session, models.Session.student_id == models.Student.id)
-        .outerjoin(
-            models.CellExecution, models.CellExecution.student_id == models.Student.id
-        )
-        .group_by(
-            models.Student.id,
-            models.Student.email,
-            models.Student.name,
-            models.Team.team_name,
-        )
+        .outerjoin(state, state.student_id == models.Student.id)
         .all()
     )
 
-    # For each student, get their most recent notebook and check help status
     result = []
     help_students = []  # Track students needing help
 
     for row in students_with_sessions:
-        # Get the most recent notebook for this student
-        recent_notebook = (
-            db.query(models.Notebook.path)
-            .join(
-                models.CellExecution,
-                models.CellExecution.notebook_id == models.Notebook.id,
-            )
-            .filter(
-                models.CellExecution.student_id
-                == db.query(models.Student.id)
-                .filter(models.Student.email == row.email)
-                .scalar()
-            )
-            .order_by(models.CellExecution.executed_at.desc())
-            .first()
-        )
-
-        # Check if student has recent help events (from InfluxDB via InfluxDB client)
-        is_requesting_help = check_recent_help_status(row.email, help_threshold)
+        is_requesting_help = help_states.get(row.email, False)
 
         student_data = {
             "id": row.id,  # IDを追加
@@ -112,18 +86,17 @@ def get_active_students_with_sessions(db: Session) -> List[Dict[str, Any]]:
             "is_requesting_help": is_requesting_help,
             "latest_session": (
                 {
-                    "notebook_path": (
-                        recent_notebook.path if recent_notebook else "/unknown"
-                    ),
+                    "notebook_path": row.last_notebook_path or "/unknown",
                     "started_at": row.latest_session_start,
                     "ended_at": None,  # We don't track session end times currently
                     "updated_at": row.latest_session_start,
-                    "cell_executions": row.total_cell_executions or 0,
-                    "error_count": row.total_error_count or 0,
+                    "cell_executions": row.cell_executions or 0,
+                    "error_count": row.error_count or 0,
                 }
                 if row.latest_session_start
                 else None
             ),
+            "consecutive_error_info": summarize_error_cells(row.significant_error_cells),
         }
 
         if is_requesting_help:
@@ -135,58 +108,6 @@ def get_active_students_with_sessions(db: Session) -> List[Dict[str, Any]]:
     return help_students + result
 
 
-def check_recent_help_status(email: str, help_threshold: datetime) -> bool:
-    """Check if user has recent help events in InfluxDB"""
-    try:
-        from db.influxdb_client import query_progress_data
-        from core.config import settings
-
-        # Query InfluxDB for recent help and help_stop events from this user
-        help_events_query = f"""
-        from(bucket: "{settings.INFLUXDB_BUCKET}")
-          |> range(start: {help_threshold.strftime("%Y-%m-%dT%H:%M:%SZ")})
-          |> filter(fn: (r) => r._measurement == "student_progress")
-          |> filter(fn: (r) => r.event == "help" or r.event == "help_stop")
-          |> filter(fn: (r) => r.emailAddress == "{email}")
-          |> sort(columns: ["_time"], desc: true)
-          |> limit(n: 10)
-        """
-
-        result = query_progress_data(help_events_query)
-
-        # Debug: Print query result
-        print(f"Help status query result for email {email}:")
-
-        # Check the most recent help-related event
-        recent_events = []
-        for table in result:
-            for record in table:
-                event_type = record.values.get("event")
-                timestamp = record.get_time()
-                recent_events.append((event_type, timestamp))
-
-        # Sort by timestamp to ensure we get the most recent
-        recent_events.sort(key=lambda x: x[1], reverse=True)
-
-        if recent_events:
-            latest_event, latest_time = recent_events[0]
-            print(f"  Latest Event: {latest_event}, Time: {latest_time}")
-            if latest_event == "help":
-                print(f"  Returning True (help active) for email {email}")
-                return True  # Last event was help request
-            elif latest_event == "help_stop":
-                print(f"  Returning False (help stopped) for email {email}")
-                return False  # Last event was help stop
-        else:
-            print(f"  No help events found for email {email}")
-
-        return False
-
-    except Exception as e:
-        print(f"Error checking help status for email {email}: {e}")
-        return False
-
-
 def get_total_students_count(db: Session) -> int:
     """Get total number of students"""
     return db.query(models.Student).count()
@@ -224,8 +145,11 @@ def get_or_create_active_session(db: Session, student_id: int) -> models.Session
     # 新しいセッションを作成
     new_session = models.Session(student_id=student_id, is_active=True)
     db.add(new_session)
+    db.flush()
+    record_session_starts(db, {student_id: cast(datetime, new_session.start_time)})
     db.commit()
     db.refresh(new_session)
+    dashboard_version_index.bump([student_id])
     return new_session
 
 
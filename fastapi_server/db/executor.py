@@ -0,0 +1,126 @@
+"""
+同期I/O用の上限付きスレッドプール
+
+同期SQLAlchemyセッション・InfluxDBクライアント・同期Redisインデックスの呼び出しを専用スレッドプールで実行し、
+async ハンドラー・エンドポイントからは await で利用できるようにします。
+イベントループを塞がず、かつ同時実行数をDB接続プール・InfluxDB側の上限に合わせて制限します。
+Redisの呼び出しはDB用スレッドプールの枠とPostgreSQLのレイテンシ計測に混ざらないよう別のプールで実行します。
+"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from core.config import settings
+from core.dependency_latency import INFLUX, POSTGRES, REDIS, dependency_latency
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class BlockingIOExecutor:
+    """上限付きスレッドプールと非同期ファサード"""
+
+    def __init__(self, max_workers: int, name: str, dependency: Optional[str] = None):
+        self.max_workers = max_workers
+        self.name = name
+        # 実行時間を記録する依存サービス名（同時実行数制御に使用）
+        self.dependency = dependency
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        # 統計
+        self.in_flight = 0
+        self.stats = {
+            "completed": 0,
+            "failed": 0,
+            "max_queue_wait_ms": 0.0,
+            "total_queue_wait_ms": 0.0,
+        }
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix=f"{self.name}-io"
+            )
+        return self._executor
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """同期関数をスレッドプールで実行し、結果を返す"""
+        submitted_at = time.monotonic()
+
+        def call() -> T:
+            # プールの空き待ち時間（プールが飽和していないかの指標）
+            wait_ms = (time.monotonic() - submitted_at) * 1000
+            self.stats["total_queue_wait_ms"] += wait_ms
+            if wait_ms > self.stats["max_queue_wait_ms"]:
+                self.stats["max_queue_wait_ms"] = wait_ms
+            started_at = time.monotonic()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if self.dependency:
+                    dependency_latency.observe(
+                        self.dependency, (time.monotonic() - started_at) * 1000
+                    )
+
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        try:
+            result = await loop.run_in_executor(self._get_executor(), call)
+            self.stats["completed"] += 1
+            return result
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self, wait: bool = True):
+        """スレッドプールを停止"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """実行統計を取得"""
+        calls = self.stats["completed"] + self.stats["failed"]
+        return {
+            "max_workers": self.max_workers,
+            "in_flight": self.in_flight,
+            "completed": self.stats["completed"],
+            "failed": self.stats["failed"],
+            "avg_queue_wait_ms": (
+                round(self.stats["total_queue_wait_ms"] / calls, 3) if calls else 0.0
+            ),
+            "max_queue_wait_ms": round(self.stats["max_queue_wait_ms"], 3),
+        }
+
+
+# グローバルインスタンス
+db_executor = BlockingIOExecutor(
+    settings.DB_EXECUTOR_MAX_WORKERS, "db", dependency=POSTGRES
+)
+influx_executor = BlockingIOExecutor(
+    settings.INFLUX_EXECUTOR_MAX_WORKERS, "influx", dependency=INFLUX
+)
+redis_executor = BlockingIOExecutor(
+    settings.REDIS_EXECUTOR_MAX_WORKERS, "redis", dependency=REDIS
+)
+
+
+async def run_db(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """同期DB処理（crud関数など）をDB用スレッドプールで実行"""
+    return await db_executor.run(func, *args, **kwargs)
+
+
+async def run_influx(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """同期InfluxDB処理をInfluxDB用スレッドプールで実行"""
+    return await influx_executor.run(func, *args, **kwargs)
+
+
+async def run_redis(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """同期Redis処理（ダッシュボードのバージョン・ヘルプ状態のインデックスなど）をRedis用スレッドプールで実行"""
+    return await redis_executor.run(func, *args, **kwargs)
@@ -0,0 +1,238 @@
+"""
+InfluxDB ラインプロトコル生成
+
+イベント辞書から Point オブジェクトを経由せずにラインプロトコルの行を直接組み立てます。
+measurement 名・タグ・フィールドの対応（レイアウト）は MeasurementLayout で定義し、
+フィールドの型はレイアウトで固定します（JSON由来の整数・浮動小数の揺れで
+InfluxDB 側のフィールド型が衝突しないようにするため）。
+"""
+
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from core.config import settings
+
+# フィールドの型
+FLOAT = "float"
+INT = "int"
+BOOL = "bool"
+STR = "str"
+
+# 文字列フィールドの最大長（セル内容などが長すぎる場合は切り詰める）
+MAX_STRING_FIELD_LENGTH = 1000
+
+_MEASUREMENT_ESCAPES = str.maketrans({",": r"\,", " ": r"\ ", "\n": r"\n"})
+_KEY_ESCAPES = str.maketrans({",": r"\,", "=": r"\=", " ": r"\ ", "\n": r"\n"})
+_STRING_ESCAPES = str.maketrans({'"': r"\"", "\\": r"\\"})
+
+
+@dataclass(frozen=True)
+class FieldSpec:
+    """フィールド定義（値の取得関数と型）"""
+
+    name: str
+    getter: Callable[[Dict[str, Any]], Any]
+    type: str
+
+
+@dataclass(frozen=True)
+class MeasurementLayout:
+    """
+    measurement のレイアウト
+
+    tags: タグ名 → 値の取得関数（None・空文字のタグは出力しない）
+    fields: フィールド定義（None のフィールドは出力しない）
+    time_key: タイムスタンプ（ISO 8601）を取り出すキー（ない場合は現在時刻）
+    """
+
+    measurement: str
+    tags: Dict[str, Callable[[Dict[str, Any]], Optional[str]]]
+    fields: Tuple[FieldSpec, ...]
+    time_key: Optional[str] = None
+    # タグはキー順に並べるとInfluxDB側の処理が最も効率的
+    _sorted_tags: Tuple[Tuple[str, Callable], ...] = field(
+        init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self):
+        object.__setattr__(self, "_sorted_tags", tuple(sorted(self.tags.items())))
+
+
+def _format_field(value: Any, field_type: str) -> str:
+    if field_type == INT:
+        return f"{int(value)}i"
+    if field_type == FLOAT:
+        return repr(float(value))
+    if field_type == BOOL:
+        return "true" if value else "false"
+    text = str(value)[:MAX_STRING_FIELD_LENGTH]
+    return f'"{text.translate(_STRING_ESCAPES)}"'
+
+
+def _timestamp_ns(value: Any) -> int:
+    """ISO 8601文字列・datetime・数値（ナノ秒）をナノ秒に変換（解析できない場合は現在時刻）"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    if isinstance(value, str) and value:
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            pass
+    if isinstance(value, datetime):
+        # タイムゾーンなしの日時はUTCとして扱う（influxdb-client の Point と同じ）
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp() * 1_000_000) * 1_000
+    return time.time_ns()
+
+
+def build_line(data: Dict[str, Any], layout: MeasurementLayout) -> Optional[str]:
+    """
+    辞書からラインプロトコルの1行を組み立てる
+
+    Returns:
+        ラインプロトコルの行（出力できるフィールドが1つもない場合は None）
+    """
+    parts = [layout.measurement.translate(_MEASUREMENT_ESCAPES)]
+    for tag, getter in layout._sorted_tags:
+        value = getter(data)
+        if value is None or value == "":
+            continue
+        parts.append(
+            f"{tag.translate(_KEY_ESCAPES)}={str(value).translate(_KEY_ESCAPES)}"
+        )
+
+    fields = []
+    for spec in layout.fields:
+        value = spec.getter(data)
+        if value is None:
+            continue
+        try:
+            fields.append(
+                f"{spec.name.translate(_KEY_ESCAPES)}={_format_field(value, spec.type)}"
+            )
+        except (TypeError, ValueError):
+            continue
+    if not fields:
+        return None
+
+    timestamp = _timestamp_ns(data.get(layout.time_key) if layout.time_key else None)
+    return f"{','.join(parts)} {','.join(fields)} {timestamp}"
+
+
+# --- 進捗イベントのレイアウト（既存のダッシュボード・集計クエリが参照する形式） ---
+
+
+def _notebook_name(data: Dict[str, Any]) -> str:
+    path = data.get("notebookPath")
+    return path.split("/")[-1] if path else "unknown"
+
+
+def _notebook_dir(data: Dict[str, Any]) -> str:
+    path = data.get("notebookPath")
+    return "/".join(path.split("/")[:-1]) if path and "/" in path else "root"
+
+
+def _event_type(data: Dict[str, Any]) -> str:
+    return data.get("eventType") or "unknown"
+
+
+def _only_for(event_type: str, getter: Callable[[Dict[str, Any]], Any]):
+    """特定のイベントタイプの場合のみ値を返す取得関数"""
+    return lambda data: getter(data) if data.get("eventType") == event_type else None
+
+
+def _value_or_zero(key: str) -> Callable[[Dict[str, Any]], Any]:
+    """キーの値（ない場合は 0）を返す取得関数"""
+    return lambda data: data.get(key, 0)
+
+
+def progress_layout(measurement: Optional[str] = None) -> MeasurementLayout:
+    """学生の進捗イベントのレイアウト"""
+    return MeasurementLayout(
+        measurement=measurement or settings.INFLUX_PROGRESS_MEASUREMENT,
+        tags={
+            "emailAddress": lambda data: data.get("emailAddress"),
+            "userName": lambda data: data.get("userName"),
+            "teamName": lambda data: data.get("teamName"),
+            "event": _event_type,
+            "notebook": _notebook_name,
+            "directory": _notebook_dir,
+            "cellType": lambda data: data.get("cellType"),
+            "sessionId": lambda data: data.get("sessionId"),
+        },
+        fields=(
+            FieldSpec("notebookPath", lambda data: data.get("notebookPath"), STR),
+            FieldSpec("cellId", lambda data: data.get("cellId") or "", STR),
+            FieldSpec(
+                "cellIndex",
+                lambda data: -1 if data.get("cellIndex") is None else data["cellIndex"],
+                INT,
+            ),
+            FieldSpec("cellContent", lambda data: data.get("cellContent") or "", STR),
+            FieldSpec(
+                "executionCount",
+                lambda data: (
+                    -1 if data.get("executionCount") is None else data["executionCount"]
+                ),
+                INT,
+            ),
+            # セル実行イベント: 実行結果と実行時間
+            FieldSpec(
+                "success",
+                _only_for("cell_executed", lambda data: not data.get("hasError")),
+                BOOL,
+            ),
+            FieldSpec(
+                "duration",
+                _only_for(
+                    "cell_executed", lambda data: data.get("executionDurationMs")
+                ),
+                FLOAT,
+            ),
+            # ノートブック保存イベント: 保存されたセル数
+            FieldSpec(
+                "cell_count",
+                _only_for("notebook_save", lambda data: data.get("cellCount", 0)),
+                INT,
+            ),
+            # エラー解除イベント（ダッシュボード操作）: 解除した人
+            FieldSpec(
+                "resolvedBy",
+                _only_for("error_resolved", lambda data: data.get("resolvedBy")),
+                STR,
+            ),
+        ),
+        time_key="eventTime",
+    )
+
+
+SYSTEM_METRICS_LAYOUT = MeasurementLayout(
+    measurement="system_metrics",
+    tags={"metric_type": lambda data: "system_health"},
+    fields=tuple(
+        FieldSpec(name, _value_or_zero(name), INT)
+        for name in (
+            "websocket_connections",
+            "worker_processed_messages",
+            "worker_error_count",
+            "redis_memory_usage",
+            "postgres_connections",
+        )
+    ),
+)
+
+PERFORMANCE_METRICS_LAYOUT = MeasurementLayout(
+    measurement="performance_metrics",
+    tags={"metric_type": lambda data: "performance"},
+    fields=(
+        FieldSpec(
+            "api_response_time_ms", lambda data: data.get("api_response_time", 0), FLOAT
+        ),
+        FieldSpec("db_query_time_ms", lambda data: data.get("db_query_time", 0), FLOAT),
+        FieldSpec("memory_usage_mb", lambda data: data.get("memory_usage", 0), FLOAT),
+        FieldSpec("cpu_usage_percent", lambda data: data.get("cpu_usage", 0), FLOAT),
+    ),
+)
@@ -2,16 +2,13 @@ import logging
 import time
 from functools import wraps
 from core.config import settings
-from typing import Any, Dict, Union
+from typing import Any, Dict
 
 from influxdb_client import InfluxDBClient, Point
 from influxdb_client.client.write_api import SYNCHRONOUS
 from influxdb_client.rest import ApiException
 
 
-from schemas.progress import StudentProgress
-from schemas.event import EventData
-
 # ロガーの設定
 logger = logging.getLogger(__name__)
 
@@ -79,114 +76,6 @@ def with_influxdb_retry(func):
     return wrapper
 
 
-@with_influxdb_retry
-def write_progress_event(progress: Union[StudentProgress, EventData]):
-    """
-    学生の進捗イベントをInfluxDBに書き込む
-    詳細なタグ付けを行い、検索と集計の最適化を図る
-    """
-    # notebookPathから有益なタグを抽出
-    notebook_name = (
-        progress.notebookPath.split("/")[-1] if progress.notebookPath else "unknown"
-    )
-    notebook_dir = (
-        "/".join(progress.notebookPath.split("/")[:-1])
-        if progress.notebookPath and "/" in progress.notebookPath
-        else "root"
-    )
-
-    # イベントタイプによって追加フィールドを決定
-    event_type = progress.eventType if hasattr(progress, "eventType") else "unknown"
-    additional_fields = {}
-    if event_type == "cell_executed":
-        # セル実行イベントの場合は実行結果や実行時間を保存
-        additional_fields["success"] = (
-            not progress.hasError if hasattr(progress, "hasError") else True
-        )
-        additional_fields["duration"] = (
-            progress.executionDurationMs
-            if hasattr(progress, "executionDurationMs")
-            else 0
-        )
-    elif event_type == "notebook_save":
-        # ノートブック保存イベントの場合は保存されたセル数などを保存
-        additional_fields["cell_count"] = (
-            progress.cellCount if hasattr(progress, "cellCount") else 0
-        )
-
-    # 基本ポイント定義
-    point = (
-        Point("student_progress")
-        # 基本タグ（クエリの一般的な絞り込みに使用）
-        .tag("emailAddress", progress.emailAddress)
-        .tag("userName", progress.userName or "")
-        .tag("teamName", progress.teamName or "")
-        .tag(
-            "event",
-            event_type,
-        )
-        .tag("notebook", notebook_name)
-        .tag("directory", notebook_dir)
-        # セルタイプがある場合はタグとして追加（コード/マークダウン等）
-        .tag(
-            "cellType",
-            progress.cellType if hasattr(progress, "cellType") else "unknown",
-        )
-        # セッションIDがある場合はタグとして追加
-        .tag(
-            "sessionId",
-            progress.sessionId if hasattr(progress, "sessionId") else "unknown",
-        )
-        # 以下はフィールドとして保存（数値や文字列データ）
-        .field("notebookPath", progress.notebookPath)
-        .field("cellId", progress.cellId or "")
-        .field(
-            "cellIndex", progress.cellIndex if progress.cellIndex is not None else -1
-        )
-        # セルコンテンツは長すぎる場合は切り詰める
-        .field(
-            "cellContent",
-            (
-                (progress.cellContent or "")[:1000]
-                if hasattr(progress, "cellContent")
-                else ""
-            ),
-        )
-        .field(
-            "executionCount",
-            progress.executionCount if progress.executionCount is not None else -1,
-        )
-        .time(
-            progress.eventTime
-            if hasattr(progress, "eventTime") and progress.eventTime
-            else None
-        )
-    )
-
-    # 追加フィールドがあれば追加
-    for key, value in additional_fields.items():
-        if isinstance(value, bool):
-            point = point.field(key, value)
-        elif isinstance(value, (int, float)):
-            point = point.field(key, value)
-        else:
-            point = point.field(key, str(value))
-
-    try:
-        write_api.write(
-            bucket=settings.INFLUXDB_BUCKET, org=settings.INFLUXDB_ORG, record=point
-        )
-        logger.info(
-            f"InfluxDBへのイベント書き込み成功: メールアドレス={progress.emailAddress}, イベント={event_type}"
-        )
-        return True
-    except Exception as e:
-        # 例外はデコレータでキャッチされリトライされるが、ここには到達しないはず
-        # （最後のリトライ失敗時は例外が上がる）
-        logger.error(f"InfluxDBへの書き込みエラー: {e}")
-        raise
-
-
 def write_event_batch(events: list, measurement: str = "student_progress"):
     """
     複数のイベントをバッチで書き込む
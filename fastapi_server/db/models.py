@@ -9,7 +9,9 @@ from sqlalchemy import (
     Float,
     Enum,
     Index,
+    text,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 import enum
@@ -86,6 +88,16 @@ class Session(Base):
     student = relationship("Student", back_populates="sessions")
     cell_executions = relationship("CellExecution", back_populates="session")
 
+    # 学生ごとのアクティブセッションは1つ（一括取り込みの ON CONFLICT の対象）
+    __table_args__ = (
+        Index(
+            "uq_sessions_active_student_id",
+            "student_id",
+            unique=True,
+            postgresql_where=text("is_active = true AND end_time IS NULL"),
+        ),
+    )
+
 
 class Notebook(Base):
     """Jupyterノートブック"""
@@ -125,6 +137,10 @@ class Cell(Base):
     notebook = relationship("Notebook", back_populates="cells")
     executions = relationship("CellExecution", back_populates="cell")
 
+    __table_args__ = (
+        Index("uq_cells_notebook_id_cell_id", "notebook_id", "cell_id", unique=True),
+    )
+
 
 class CellExecution(Base):
     """セル実行履歴"""
@@ -160,6 +176,22 @@ class CellExecution(Base):
     session = relationship("Session", back_populates="cell_executions")
 
 
+class StudentDashboardState(Base):
+    """学生ごとのダッシュボード集計（イベントの永続化と同じトランザクションで差分更新）"""
+
+    __tablename__ = "student_dashboard_state"
+
+    student_id = Column(Integer, ForeignKey("students.id"), primary_key=True)
+    cell_executions = Column(Integer, nullable=False, default=0, server_default="0")
+    error_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_notebook_path = Column(String, nullable=True)  # 最後に実行したノートブック
+    last_activity_at = Column(DateTime(timezone=True), nullable=True)  # 最後のセル実行時刻
+    latest_session_start = Column(DateTime(timezone=True), nullable=True)
+    # 有意な連続エラーのあるセル {セルDB ID: {"consecutive_count", "last_error_time"}}
+    significant_error_cells = Column(JSONB, nullable=False, server_default="{}")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
 class Class(Base):
     """授業/クラス"""
 
@@ -1,8 +1,10 @@
 import redis.asyncio as redis
-from typing import Optional
+from typing import List, Optional
 from core.config import settings
+from core.dependency_latency import REDIS as REDIS_DEPENDENCY, dependency_latency
 import logging
 import asyncio
+import zlib
 from contextlib import asynccontextmanager
 
 logger = logging.getLogger(__name__)
@@ -61,15 +63,69 @@ def get_redis_client_sync() -> redis.Redis:
 # 進捗イベントを発行するPub/Subチャンネル名
 PROGRESS_CHANNEL = "progress_events"
 
+# PROGRESS_CHANNEL に発行した進捗イベントの累計数（Pub/Subモードの処理待ち件数の算出に使用）
+PROGRESS_PUBLISHED_KEY = "progress_events:published"
+
 # 処理完了をWebSocketクライアントに通知するためのチャンネル名
 NOTIFICATION_CHANNEL = "notifications"
 
 # エラーログを発行するPub/Subチャンネル名
 ERROR_CHANNEL = "error_logs"
 
+# 進捗イベントを永続的に蓄積するRedis Stream名（EVENT_INGEST_MODE=stream時に使用）
+PROGRESS_STREAM = "progress_events_stream"
+
+# 進捗ストリームを読み込むワーカーのコンシューマーグループ名
+PROGRESS_CONSUMER_GROUP = "progress_workers"
+
+
+def student_shard(email_address: Optional[str], shard_count: Optional[int] = None) -> int:
+    """
+    学生（emailAddress）を安定ハッシュ（CRC32）でシャード番号に割り当てる
+
+    同じ学生のイベントは常に同じシャードに入るため、シャード内で処理順序が保たれる。
+    """
+    count = shard_count or settings.WORKER_SHARD_COUNT
+    if count <= 1:
+        return 0
+    return zlib.crc32((email_address or "").encode("utf-8")) % count
+
+
+def progress_stream_name(shard: int = 0) -> str:
+    """シャード番号に対応する進捗ストリーム名（シャード数1の場合は PROGRESS_STREAM）"""
+    if settings.WORKER_SHARD_COUNT <= 1:
+        return PROGRESS_STREAM
+    return f"{PROGRESS_STREAM}:{shard}"
+
+
+# 取り込み済みeventIdの重複排除キーのプレフィックス（SET NX EX で重複排除期間を管理）
+EVENT_DEDUP_KEY_PREFIX = "ingest:dedup:"
+
+# ワーカーが処理待ち件数（キュー深さ・ストリーム遅延）を報告するハッシュ名（フィールド: ワーカー名）
+WORKER_BACKLOG_KEY = "worker:backlog"
+
+# 処理に失敗したイベントのリトライ待ち（ソート済みセット、スコアは次回試行時刻）
+RETRY_QUEUE_KEY = "progress_events_retry"
+
+
+def retry_queue_key(shard: int = 0) -> str:
+    """シャード番号に対応するリトライ待ちのキー（シャード数1の場合は RETRY_QUEUE_KEY）"""
+    if settings.WORKER_SHARD_COUNT <= 1:
+        return RETRY_QUEUE_KEY
+    return f"{RETRY_QUEUE_KEY}:{shard}"
+
+
+def retry_processing_key(shard: int = 0) -> str:
+    """シャードのリトライ待ちから取り出し、処理中のイベントのキー（スコアはリース期限）"""
+    return f"{retry_queue_key(shard)}:processing"
+
+
+# 最大試行回数を超えたイベントを保管するデッドレターストリーム
+DEAD_LETTER_STREAM = "progress_events_dead_letter"
+
 
 import time
-from typing import Any, Dict
+from typing import Any, Callable, Dict
 
 
 def _update_circuit_breaker(success: bool) -> None:
@@ -183,3 +239,194 @@ async def get_redis_info() -> Dict[str, Any]:
             "error": str(e),
             "circuit_breaker": _circuit_breaker_state.copy()
         }
+
+
+async def ensure_progress_consumer_group(
+    redis_client: redis.Redis, stream: str = PROGRESS_STREAM
+) -> None:
+    """
+    進捗ストリームのコンシューマーグループを作成（存在する場合は何もしない）
+
+    ストリームが未作成でもMKSTREAMで同時に作成します。
+    """
+    try:
+        await redis_client.xgroup_create(
+            stream, PROGRESS_CONSUMER_GROUP, id="0", mkstream=True
+        )
+        logger.info(
+            f"Consumer group '{PROGRESS_CONSUMER_GROUP}' created on stream '{stream}'"
+        )
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+async def _execute_pipeline_batch(
+    queue_commands: Callable[[Any], None],
+    size: int,
+    label: str,
+    max_retries: int,
+) -> Optional[List[Any]]:
+    """
+    1つのパイプライン（1接続・1往復）でコマンド群を実行し、コマンドごとの結果を返す
+
+    サーキットブレーカーの更新はコマンド単位ではなくバッチ単位で1回のみ行う。
+    パイプライン全体が接続エラーで失敗した場合のみ指数バックオフでリトライする。
+    個々のコマンドのエラーは例外オブジェクトとして結果に含まれる。
+
+    Returns:
+        コマンドごとの結果（パイプライン全体が失敗した場合は None）
+    """
+    if size == 0:
+        return []
+
+    for attempt in range(max_retries):
+        try:
+            async with get_redis_connection() as redis_client:
+                pipe = redis_client.pipeline(transaction=False)
+                queue_commands(pipe)
+                return await pipe.execute(raise_on_error=False)
+
+        except redis.ConnectionError as e:
+            if "Circuit Breaker is open" in str(e):
+                break
+            wait_time = min(2 ** attempt, 10)  # 指数バックオフ（最大10秒）
+            logger.warning(
+                f"Redis {label} pipeline connection error, retrying in {wait_time}s "
+                f"(attempt {attempt + 1}/{max_retries}): {e}"
+            )
+            if attempt < max_retries - 1:
+                await asyncio.sleep(wait_time)
+
+        except Exception as e:
+            logger.error(f"Redis {label} pipeline failed (attempt {attempt + 1}/{max_retries}): {e}")
+            if attempt < max_retries - 1:
+                await asyncio.sleep(0.5)  # 短い待機
+
+    logger.error(f"Redis {label} pipeline failed after {max_retries} attempts ({size} commands)")
+    return None
+
+
+async def _safe_pipeline_batch(
+    queue_commands: Callable[[Any], None],
+    size: int,
+    label: str,
+    max_retries: int,
+) -> List[bool]:
+    """
+    パイプラインでコマンド群を実行し、コマンドごとの成否を返す
+    """
+    started_at = time.monotonic()
+    results = await _execute_pipeline_batch(queue_commands, size, label, max_retries)
+    dependency_latency.observe(REDIS_DEPENDENCY, (time.monotonic() - started_at) * 1000)
+    if results is None:
+        return [False] * size
+
+    outcomes = [not isinstance(result, Exception) for result in results]
+    failed = outcomes.count(False)
+    if failed:
+        logger.warning(f"Redis {label} pipeline: {failed}/{size} commands failed")
+    else:
+        logger.debug(f"Redis {label} pipeline successful: {size} commands")
+    return outcomes
+
+
+async def safe_redis_publish_batch(
+    channel: str,
+    messages: List[str],
+    max_retries: int = 3,
+    counter_key: Optional[str] = None,
+) -> List[bool]:
+    """
+    複数メッセージを1つのパイプラインでPUBLISHする
+
+    Args:
+        channel: Pub/Subチャンネル名
+        messages: 送信メッセージのリスト
+        max_retries: パイプライン全体の最大リトライ回数
+        counter_key: 発行したメッセージ数を同じパイプラインで加算するキー
+
+    Returns:
+        List[bool]: メッセージごとの送信成功フラグ（messagesと同じ順序）
+    """
+
+    def queue_commands(pipe):
+        for message in messages:
+            pipe.publish(channel, message)
+        if counter_key and messages:
+            pipe.incrby(counter_key, len(messages))
+
+    outcomes = await _safe_pipeline_batch(queue_commands, len(messages), "publish", max_retries)
+    return outcomes[: len(messages)]
+
+
+async def safe_redis_xadd_batch(
+    messages: List[str],
+    max_retries: int = 3,
+    streams: Optional[List[str]] = None,
+) -> List[bool]:
+    """
+    複数メッセージを1つのパイプラインで進捗ストリームにXADDする
+
+    MAXLEN によるトリムは未配信・未ACKのエントリも削除するため行わない。
+    ストリームの長さは取り込みのアドミッション制御で抑え、ACK済みのエントリは
+    ワーカーが ProgressStreamConsumer.trim_acked で削除する。
+
+    Args:
+        messages: JSONシリアライズ済みのイベントメッセージ
+        max_retries: パイプライン全体の最大リトライ回数
+        streams: メッセージごとの追加先ストリーム（シャーディング時。None の場合は PROGRESS_STREAM）
+
+    Returns:
+        List[bool]: メッセージごとの追加成功フラグ（messagesと同じ順序）
+    """
+    targets = streams or [PROGRESS_STREAM] * len(messages)
+
+    def queue_commands(pipe):
+        for stream, message in zip(targets, messages):
+            pipe.xadd(stream, {"data": message})
+
+    return await _safe_pipeline_batch(queue_commands, len(messages), "xadd", max_retries)
+
+
+async def claim_event_ids(
+    event_ids: List[str], ttl_seconds: int, max_retries: int = 2
+) -> List[bool]:
+    """
+    eventIdを重複排除期間中の取り込み済みとして登録する（SET NX EX を1つのパイプラインで実行）
+
+    Redisが利用できない場合は取り込みを止めないよう、全イベントを初回扱いにする（フェイルオープン）。
+
+    Args:
+        event_ids: 登録するeventIdのリスト（同一バッチ内の重複を含んでもよい）
+        ttl_seconds: 重複排除期間（秒）
+        max_retries: パイプライン全体の最大リトライ回数
+
+    Returns:
+        List[bool]: eventIdごとの初回フラグ（False は期間内の再送）
+    """
+
+    def queue_commands(pipe):
+        for event_id in event_ids:
+            pipe.set(f"{EVENT_DEDUP_KEY_PREFIX}{event_id}", 1, nx=True, ex=ttl_seconds)
+
+    results = await _execute_pipeline_batch(
+        queue_commands, len(event_ids), "dedup", max_retries
+    )
+    if results is None:
+        return [True] * len(event_ids)
+    # SET NX は登録時 True、既存キーの場合 None を返す
+    return [isinstance(result, Exception) or bool(result) for result in results]
+
+
+async def release_event_ids(event_ids: List[str]) -> None:
+    """配信に失敗したイベントの重複排除キーを削除し、クライアントの再送を受け付ける"""
+    if not event_ids:
+        return
+    try:
+        async with get_redis_connection() as redis_client:
+            await redis_client.delete(
+                *(f"{EVENT_DEDUP_KEY_PREFIX}{event_id}" for event_id in event_ids)
+            )
+    except Exception as e:
+        logger.warning(f"Failed to release {len(event_ids)} dedup keys: {e}")
@@ -1,4 +1,5 @@
 import asyncio
+import os
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
@@ -68,6 +69,15 @@ async def lifespan(app: FastAPI):
     await initialize_realtime_notifier()
     print("Realtime notifier service started")
 
+    # InfluxDBバッチライターの開始（ダッシュボード操作のイベントを書き込む）
+    from core.influxdb_batch_writer import batch_writer
+    try:
+        await batch_writer.start_batch_writer(spill_owner=f"api-{os.getpid()}")
+        print("InfluxDB batch writer started")
+    except Exception as e:
+        # バッチライターは必須ではないため、エラーでも続行
+        print(f"Failed to start InfluxDB batch writer: {e}")
+
     # アプリケーションの実行中はここでyield
     yield
 
@@ -78,6 +88,20 @@ async def lifespan(app: FastAPI):
     from core.realtime_notifier import shutdown_realtime_notifier
     await shutdown_realtime_notifier()
     print("Realtime notifier service stopped")
+
+    # 配信中のバッチ進捗通知の完了を待機
+    from core.batch_progress_notifier import batch_progress_notifier
+    await batch_progress_notifier.drain()
+
+    # InfluxDBバッチライターの停止（残りの行を送信し、送信できない行はディスクに退避）
+    await batch_writer.stop_batch_writer()
+    print("InfluxDB batch writer stopped")
+
+    # 同期DB・InfluxDB・Redis呼び出し用スレッドプールの停止
+    from db.executor import db_executor, influx_executor, redis_executor
+    db_executor.shutdown()
+    influx_executor.shutdown()
+    redis_executor.shutdown()
     
     # WebSocketクリーンアップサービスの停止
     from core.websocket_cleanup import stop_websocket_cleanup
@@ -112,14 +136,14 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        # 流量制御ヘッダーをブラウザ拡張機能から参照できるようにする
+        expose_headers=["Retry-After", "X-Ingest-Backoff-Ms"],
     )
 
 # APIルーターの追加
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
 # 静的ファイルディレクトリのマウント
-import os
-
 static_dir = os.path.join(os.path.dirname(__file__), "static")
 if not os.path.exists(static_dir):
     os.makedirs(static_dir)
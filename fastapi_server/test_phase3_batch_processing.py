@@ -143,8 +143,8 @@ async def test_phase3_enhanced_batch_processing():
                     extra_info = ""
                     if 'persisted_count' in stage_data:
                         extra_info = f", {stage_data['persisted_count']}件永続化"
-                    if 'notified_count' in stage_data:
-                        extra_info = f", {stage_data['notified_count']}件通知"
+                    if 'notified_students' in stage_data:
+                        extra_info = f", {stage_data['notified_students']}名分通知"
                     print(f"     - {stage_name}: {status} ({duration}ms{extra_info})")
         else:
             print(f"   ❌ 中規模バッチ処理失敗: {result.stderr}")
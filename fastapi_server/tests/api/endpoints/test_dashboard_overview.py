@@ -0,0 +1,280 @@
+"""
+ダッシュボード概要の差分取得のテスト
+
+/dashboard/overview?since=<バージョン> の差分応答・304応答と、
+差分を返せない場合の全件応答、アクティビティチャートのクエリの統合と共有、
+生のイベントを集計する場合の measurement の設定をテストします。
+"""
+
+import asyncio
+import time
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.endpoints import dashboard
+from core.influx_rollup import RollupWatermark
+from crud.crud_dashboard_version import DashboardChanges
+from db.session import get_db
+
+
+def _student(email, status, executions=0):
+    return {"emailAddress": email, "status": status, "cellExecutions": executions}
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(dashboard.router, prefix="/dashboard")
+    app.dependency_overrides[get_db] = lambda: MagicMock()
+    return TestClient(app)
+
+
+class TestDashboardOverviewDelta:
+    """概要の差分取得のテストケース"""
+
+    @patch("api.endpoints.dashboard._activity_chart_slot", return_value=1700000000)
+    @patch("api.endpoints.dashboard.get_activity_chart", new_callable=AsyncMock)
+    @patch("api.endpoints.dashboard._collect_overview_students")
+    @patch("api.endpoints.dashboard.dashboard_version_index")
+    def test_full_response_carries_version(
+        self, mock_index, mock_collect, mock_chart, mock_slot, client
+    ):
+        """since がない場合は全件とバージョン（ETag）を返すかテスト"""
+        mock_index.get_changes.return_value = DashboardChanges(10, None)
+        mock_collect.return_value = ([_student("a@example.com", "active", 2)], [])
+        mock_chart.return_value = [{"helpCount": 1}]
+
+        response = client.get("/dashboard/overview")
+
+        assert response.status_code == 200
+        assert response.headers["ETag"] == 'W/"10-1h-1700000000"'
+        body = response.json()
+        assert body["full"] is True
+        assert body["version"] == 10
+        assert body["metrics"]["totalExecutions"] == 2
+        assert body["metrics"]["helpCount"] == 1
+        mock_index.remember_metrics.assert_called_once_with(10, body["metrics"])
+
+    @patch("api.endpoints.dashboard.get_activity_chart", new_callable=AsyncMock)
+    @patch("api.endpoints.dashboard._collect_overview_students")
+    @patch("api.endpoints.dashboard.dashboard_version_index")
+    def test_delta_returns_changed_students_and_metrics(
+        self, mock_index, mock_collect, mock_chart, client
+    ):
+        """変更された学生と、カーソルのバージョンから値が変わったメトリクスのみを返すかテスト"""
+        a, b = _student("a@example.com", "active", 2), _student("b@example.com", "idle")
+        mock_chart.return_value = []
+        mock_index.get_changes.return_value = DashboardChanges(10, None)
+        mock_collect.return_value = ([a, b], [])
+        client.get("/dashboard/overview")
+        # 別のAPIプロセスが応答した場合もRedisに保存したメトリクスと比較する
+        served = mock_index.remember_metrics.call_args.args[1]
+
+        changed_b = _student("b@example.com", "active", 1)
+        mock_index.get_changes.return_value = DashboardChanges(12, [2], served)
+        mock_collect.return_value = ([a, changed_b], [changed_b])
+
+        response = client.get("/dashboard/overview", params={"since": 10})
+
+        assert response.status_code == 200
+        assert response.headers["ETag"] == 'W/"12"'
+        body = response.json()
+        assert body["full"] is False
+        assert body["students"] == [changed_b]
+        assert body["metrics"] == {"totalActive": 2, "totalExecutions": 3}
+        mock_chart.assert_called_once()
+        assert mock_index.remember_metrics.call_args.args == (
+            12,
+            {**served, "totalActive": 2, "totalExecutions": 3},
+        )
+
+    @patch("api.endpoints.dashboard._collect_overview_students")
+    @patch("api.endpoints.dashboard.dashboard_version_index")
+    def test_delta_returns_all_metrics_without_snapshot(
+        self, mock_index, mock_collect, client
+    ):
+        """カーソルのバージョンのメトリクスが保存されていない場合は全メトリクスを返すかテスト"""
+        changed = _student("a@example.com", "active", 2)
+        mock_index.get_changes.return_value = DashboardChanges(12, [1])
+        mock_collect.return_value = ([changed], [changed])
+
+        body = client.get("/dashboard/overview", params={"since": 10}).json()
+
+        assert body["full"] is False
+        assert body["metrics"] == {
+            "totalStudents": 1,
+            "totalActive": 1,
+            "errorCount": 0,
+            "significantErrorCount": 0,
+            "totalExecutions": 2,
+        }
+
+    @patch("api.endpoints.dashboard._collect_overview_students")
+    @patch("api.endpoints.dashboard.dashboard_version_index")
+    def test_not_modified_when_nothing_changed(self, mock_index, mock_collect, client):
+        """カーソル以降に変更がない場合は集計せずに304を返すかテスト"""
+        mock_index.get_changes.return_value = DashboardChanges(10, [])
+
+        response = client.get("/dashboard/overview", params={"since": 10})
+
+        assert response.status_code == 304
+        assert response.headers["ETag"] == 'W/"10"'
+        mock_collect.assert_not_called()
+
+    @patch("api.endpoints.dashboard._activity_chart_slot", return_value=1700000000)
+    @patch("api.endpoints.dashboard.get_activity_chart", new_callable=AsyncMock)
+    @patch("api.endpoints.dashboard._collect_overview_students")
+    @patch("api.endpoints.dashboard.dashboard_version_index")
+    def test_full_mode_not_modified_when_etag_matches(
+        self, mock_index, mock_collect, mock_chart, mock_slot, client
+    ):
+        """since がなくても If-None-Match が現在のETagと一致すれば集計せずに304を返すかテスト"""
+        mock_index.get_changes.return_value = DashboardChanges(10, None)
+
+        response = client.get(
+            "/dashboard/overview",
+            headers={"If-None-Match": 'W/"9-1h-1700000000", W/"10-1h-1700000000"'},
+        )
+
+        assert response.status_code == 304
+        assert response.headers["ETag"] == 'W/"10-1h-1700000000"'
+        mock_collect.assert_not_called()
+        mock_chart.assert_not_called()
+
+        mock_collect.return_value = ([], [])
+        mock_chart.return_value = []
+        assert (
+            client.get(
+                "/dashboard/overview", headers={"If-None-Match": 'W/"9-1h-1700000000"'}
+            ).status_code
+            == 200
+        )
+
+    @patch("api.endpoints.dashboard._activity_chart_slot")
+    @patch("api.endpoints.dashboard.get_activity_chart", new_callable=AsyncMock)
+    @patch("api.endpoints.dashboard._collect_overview_students")
+    @patch("api.endpoints.dashboard.dashboard_version_index")
+    def test_full_mode_etag_changes_with_chart_slot_and_time_range(
+        self, mock_index, mock_collect, mock_chart, mock_slot, client
+    ):
+        """バージョンが同じでも、チャートの集計区間や time_range が変われば全件を返すかテスト"""
+        mock_index.get_changes.return_value = DashboardChanges(10, None)
+        mock_collect.return_value = ([], [])
+        mock_chart.return_value = []
+        headers = {"If-None-Match": 'W/"10-1h-1700000000"'}
+
+        mock_slot.return_value = 1700000300
+        response = client.get("/dashboard/overview", headers=headers)
+        assert response.status_code == 200
+        assert response.headers["ETag"] == 'W/"10-1h-1700000300"'
+
+        mock_slot.return_value = 1700000000
+        response = client.get(
+            "/dashboard/overview", params={"time_range": "24h"}, headers=headers
+        )
+        assert response.status_code == 200
+        assert response.headers["ETag"] == 'W/"10-24h-1700000000"'
+        mock_slot.assert_called_with("24h")
+
+
+def _record(result, at, value):
+    record = MagicMock()
+    record.values = {"result": result}
+    record.get_time.return_value = at
+    record.get_value.return_value = value
+    return record
+
+
+class TestActivityChart:
+    """アクティビティチャートのテストケース"""
+
+    @pytest.mark.asyncio
+    @patch("core.influx_rollup.read_watermark", new_callable=AsyncMock)
+    @patch("api.endpoints.dashboard.run_influx", new_callable=AsyncMock)
+    async def test_chart_uses_one_script_and_splits_by_yield(
+        self, mock_run_influx, mock_watermark
+    ):
+        """実行・エラー・ヘルプの件数をロールアップから1つのスクリプトで取得し、yield名で振り分けるかテスト"""
+        mock_watermark.return_value = RollupWatermark(0.0, time.time())
+        at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        mock_run_influx.return_value = [
+            [_record("executions", at, 4)],
+            [_record("errors", at, 1)],
+            [_record("help", at, None)],
+        ]
+
+        chart = await dashboard._query_activity_chart(datetime(2024, 1, 1), "5m", 300)
+
+        assert mock_run_influx.call_count == 1
+        assert (
+            'r._measurement == "student_progress_1m"'
+            in mock_run_influx.call_args.args[1]
+        )
+        assert chart == [
+            {
+                "time": at.isoformat(),
+                "executionCount": 4,
+                "errorCount": 1,
+                "helpCount": 0,
+            }
+        ]
+
+    @pytest.mark.asyncio
+    @patch("core.influx_rollup.read_watermark", new_callable=AsyncMock)
+    @patch("api.endpoints.dashboard.run_influx", new_callable=AsyncMock)
+    async def test_chart_reads_raw_events_until_rollup_is_ready(
+        self, mock_run_influx, mock_watermark
+    ):
+        """ロールアップの作成前・更新が遅れている場合は生のイベントを集計するかテスト"""
+        mock_run_influx.return_value = []
+        start = datetime(2024, 1, 1)
+        stale = RollupWatermark(0.0, time.time() - 3600)
+        not_backfilled = RollupWatermark(time.time(), time.time())
+
+        for watermark in (None, stale, not_backfilled):
+            mock_watermark.return_value = watermark
+            await dashboard._query_activity_chart(start, "5m", 300)
+            query = mock_run_influx.call_args.args[1]
+            assert 'r._measurement == "student_progress"' in query
+            assert "student_progress_1m" not in query
+
+    @pytest.mark.asyncio
+    @patch("core.influx_rollup.read_watermark", new_callable=AsyncMock)
+    @patch("api.endpoints.dashboard.run_influx", new_callable=AsyncMock)
+    async def test_raw_queries_use_configured_measurement(
+        self, mock_run_influx, mock_watermark
+    ):
+        """生のイベントの集計はロールアップと同じ設定の measurement を参照するかテスト"""
+        mock_run_influx.return_value = []
+        mock_watermark.return_value = None
+        start = datetime(2024, 1, 1)
+
+        with patch("core.config.settings.INFLUX_PROGRESS_MEASUREMENT", "progress_v2"):
+            await dashboard._query_activity_chart(start, "5m", 300)
+            chart_query = mock_run_influx.call_args.args[1]
+            await dashboard._query_influxdb_metrics(start, datetime(2024, 1, 2), 300)
+            metrics_query = mock_run_influx.call_args.args[1]
+
+        for query in (chart_query, metrics_query):
+            assert 'r._measurement == "progress_v2"' in query
+            assert "student_progress" not in query
+
+    @pytest.mark.asyncio
+    @patch("api.endpoints.dashboard._query_activity_chart", new_callable=AsyncMock)
+    async def test_viewers_share_cached_chart(self, mock_query):
+        """同じ集計区間の要求はInfluxDBへのクエリを共有するかテスト"""
+        dashboard.influx_query_cache.clear()
+        mock_query.return_value = [
+            {"time": "t", "executionCount": 1, "errorCount": 0, "helpCount": 0}
+        ]
+
+        charts = await asyncio.gather(
+            *(dashboard.get_activity_chart("1h") for _ in range(5))
+        )
+
+        assert mock_query.call_count == 1
+        assert all(chart == mock_query.return_value for chart in charts)
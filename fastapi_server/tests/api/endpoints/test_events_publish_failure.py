@@ -0,0 +1,144 @@
+"""
+イベントバッチの発行失敗時の扱いテスト
+
+DBに永続化済みでRedisへの発行に失敗したイベントが dbPersisted 付きで遅延リトライに
+引き渡され、引き渡せなかったイベントは失敗として報告されることと、
+有効なイベントが1件もないバッチがクライアントエラー（422）で拒否されることをテストします。
+"""
+
+import pytest
+from fastapi import HTTPException, Response
+from unittest.mock import AsyncMock, patch
+
+from api.endpoints import events as events_endpoint
+from core.admission_control import AdmissionDecision
+from schemas.event import EventData
+
+
+def _batch_stats():
+    stages = (
+        "validation",
+        "deduplication",
+        "redis_publish",
+        "db_persistence",
+        "realtime_notify",
+    )
+    return {
+        "event_types": {},
+        "processing_stages": {
+            stage: {"status": "pending", "duration_ms": 0} for stage in stages
+        },
+    }
+
+
+def _events():
+    return [
+        EventData(
+            eventId=f"e{i}",
+            eventType="cell_executed",
+            emailAddress="student@example.com",
+            notebookPath="/lesson/01.ipynb",
+            cellId=f"cell-{i}",
+        )
+        for i in range(3)
+    ]
+
+
+class TestUnpublishedPersistedEvents:
+    """永続化済み・未発行イベントのテストケース"""
+
+    @pytest.fixture(autouse=True)
+    def patch_stages(self):
+        """DB永続化（先頭2件のみ成功）・発行（後ろ2件が失敗）・通知をモック"""
+        persisted = {0: {"studentId": 1}, 1: {"studentId": 1, "cellId_db": 5}}
+        with patch.object(
+            events_endpoint.settings, "INGEST_DEDUP_WINDOW_SECONDS", 60
+        ), patch.object(
+            events_endpoint.settings, "INGEST_BULK_PERSIST", True
+        ), patch.object(
+            events_endpoint,
+            "_enhanced_database_persist",
+            AsyncMock(return_value={"persisted": persisted, "executions": 2}),
+        ), patch.object(
+            events_endpoint,
+            "_deduplicate_events",
+            AsyncMock(side_effect=lambda e: (e, 0)),
+        ), patch.object(
+            events_endpoint,
+            "_enhanced_redis_publish",
+            AsyncMock(return_value=(1, [1, 2])),
+        ), patch.object(
+            events_endpoint, "_enhanced_realtime_notify", AsyncMock(return_value=1)
+        ) as mock_notify, patch.object(
+            events_endpoint, "release_event_ids", AsyncMock()
+        ) as mock_release, patch.object(
+            events_endpoint, "event_retry_queue"
+        ) as mock_retry_queue:
+            mock_retry_queue.schedule = AsyncMock(
+                return_value={"scheduled": 1, "dead_lettered": 0}
+            )
+            self.mock_notify = mock_notify
+            self.mock_release = mock_release
+            self.mock_retry_queue = mock_retry_queue
+            yield
+
+    @pytest.mark.asyncio
+    async def test_persisted_events_are_handed_to_retry_queue(self):
+        """永続化済みの未発行イベントはリトライに登録し、未永続化のものは失敗として報告するかテスト"""
+        stats = await events_endpoint._process_events_transaction(
+            _events(), None, None, "batch1", _batch_stats()
+        )
+
+        scheduled = self.mock_retry_queue.schedule.call_args.args[0]
+        assert [payload["eventId"] for payload in scheduled] == ["e1"]
+        assert scheduled[0]["dbPersisted"] is True
+        assert scheduled[0]["cellId_db"] == 5
+        assert stats["successful_events"] == 2
+        assert [event.eventId for event in stats["failed_events"]] == ["e2"]
+        self.mock_release.assert_called_once_with(["e2"])
+
+    @pytest.mark.asyncio
+    async def test_failed_events_are_not_notified(self):
+        """失敗として報告したイベントはリアルタイム通知に含めないかテスト"""
+        await events_endpoint._process_events_transaction(
+            _events(), None, None, "batch1", _batch_stats()
+        )
+
+        notified = self.mock_notify.call_args.args[0]
+        assert [event.eventId for event in notified] == ["e0", "e1"]
+
+    @pytest.mark.asyncio
+    async def test_reports_failed_when_retry_scheduling_fails(self):
+        """リトライへの登録にも失敗した場合は失敗として報告し、永続化済みの重複排除キーは残すかテスト"""
+        self.mock_retry_queue.schedule = AsyncMock(
+            side_effect=ConnectionError("redis down")
+        )
+
+        stats = await events_endpoint._process_events_transaction(
+            _events(), None, None, "batch1", _batch_stats()
+        )
+
+        assert stats["successful_events"] == 1
+        assert [event.eventId for event in stats["failed_events"]] == ["e1", "e2"]
+        self.mock_release.assert_called_once_with(["e2"])
+
+
+class TestAllInvalidBatch:
+    """有効なイベントが1件もないバッチのテストケース"""
+
+    @pytest.mark.asyncio
+    async def test_rejects_with_client_error(self):
+        """全イベントの emailAddress が欠けている場合は 422 を返すかテスト"""
+        events = [
+            EventData(eventId=f"e{i}", eventType="cell_executed") for i in range(2)
+        ]
+
+        with patch.object(
+            events_endpoint.ingest_admission_controller,
+            "check",
+            AsyncMock(return_value=AdmissionDecision(admitted=True)),
+        ), pytest.raises(HTTPException) as excinfo:
+            await events_endpoint.receive_events(Response(), events, None, None)
+
+        assert excinfo.value.status_code == 422
+        assert excinfo.value.detail == "No valid events to process"
@@ -1,10 +1,14 @@
 import pytest
 import json
-from unittest.mock import AsyncMock
+from unittest.mock import AsyncMock, patch
+from fastapi import HTTPException, Response
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 
+from api.endpoints import progress as progress_endpoint
+from core.admission_control import AdmissionDecision
 from db.redis_client import get_redis_client
+from schemas.event import EventData
 
 
 @pytest.fixture
@@ -23,6 +27,7 @@ def test_receive_progress_new_user(client: TestClient, db_session: Session, mock
 
     payload = {
         "userId": user_id,
+        "emailAddress": user_id,
         "notebookPath": "/path/to/notebook.ipynb",
         "event": "cell_executed",
         "timestamp": "2024-01-01T12:00:00Z",
@@ -44,7 +49,7 @@ def test_receive_progress_new_user(client: TestClient, db_session: Session, mock
     import json
 
     published_data = json.loads(call_args[0][1])
-    assert published_data["userId"] == user_id
+    assert published_data["emailAddress"] == user_id
 
     # クリーンアップ: 依存性オーバーライドをリセット
     client.app.dependency_overrides.clear()
@@ -60,6 +65,7 @@ def test_receive_progress_existing_user(
 
     payload = {
         "userId": user_id,
+        "emailAddress": user_id,
         "notebookPath": "/path/to/another_notebook.ipynb",
         "event": "notebook_saved",
         "timestamp": "2024-01-01T13:00:00Z",
@@ -80,7 +86,82 @@ def test_receive_progress_existing_user(
     import json
 
     published_data = json.loads(call_args[0][1])
-    assert published_data["userId"] == user_id
+    assert published_data["emailAddress"] == user_id
 
     # クリーンアップ: 依存性オーバーライドをリセット
     client.app.dependency_overrides.clear()
+
+
+class TestReceiveProgressIngestMode:
+    """EVENT_INGEST_MODE に応じた発行先と流量制御のテストケース"""
+
+    @pytest.fixture(autouse=True)
+    def admitted(self):
+        with patch.object(
+            progress_endpoint.ingest_admission_controller,
+            "check",
+            AsyncMock(return_value=AdmissionDecision(admitted=True)),
+        ) as mock_check:
+            self.mock_check = mock_check
+            yield
+
+    def _event(self):
+        return EventData(
+            eventId="e1",
+            eventType="cell_executed",
+            emailAddress="student@example.com",
+        )
+
+    @pytest.mark.asyncio
+    async def test_stream_mode_adds_to_student_shard_stream(self, mock_redis):
+        """stream モードでは学生のシャードの進捗ストリームにXADDし、Pub/Subには発行しないかテスト"""
+        with patch.object(
+            progress_endpoint.settings, "EVENT_INGEST_MODE", "stream"
+        ), patch.object(
+            progress_endpoint.settings, "WORKER_SHARD_COUNT", 4
+        ), patch.object(
+            progress_endpoint, "safe_redis_xadd_batch", AsyncMock(return_value=[True])
+        ) as mock_xadd:
+            await progress_endpoint.receive_progress(
+                self._event(), Response(), mock_redis
+            )
+            shard = progress_endpoint.student_shard("student@example.com")
+            expected_stream = progress_endpoint.progress_stream_name(shard)
+
+        messages = mock_xadd.call_args.args[0]
+        assert json.loads(messages[0])["eventId"] == "e1"
+        assert expected_stream != progress_endpoint.progress_stream_name(0)
+        assert mock_xadd.call_args.kwargs["streams"] == [expected_stream]
+        mock_redis.publish.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_stream_mode_reports_failed_xadd(self, mock_redis):
+        """ストリームへの追加に失敗した場合は 503 を返すかテスト"""
+        with patch.object(
+            progress_endpoint.settings, "EVENT_INGEST_MODE", "stream"
+        ), patch.object(
+            progress_endpoint, "safe_redis_xadd_batch", AsyncMock(return_value=[False])
+        ), pytest.raises(
+            HTTPException
+        ) as excinfo:
+            await progress_endpoint.receive_progress(
+                self._event(), Response(), mock_redis
+            )
+
+        assert excinfo.value.status_code == 503
+
+    @pytest.mark.asyncio
+    async def test_rejects_when_backlog_exceeds_limit(self, mock_redis):
+        """ワーカーの処理待ちが上限を超えた場合は発行せずに 429 を返すかテスト"""
+        self.mock_check.return_value = AdmissionDecision(
+            admitted=False, backlog=500, retry_after_seconds=3
+        )
+
+        with pytest.raises(HTTPException) as excinfo:
+            await progress_endpoint.receive_progress(
+                self._event(), Response(), mock_redis
+            )
+
+        assert excinfo.value.status_code == 429
+        assert excinfo.value.headers["Retry-After"] == "3"
+        mock_redis.publish.assert_not_called()
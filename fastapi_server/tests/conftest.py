@@ -70,6 +70,26 @@ async def setup_services(setup_db):
     yield
 
 
+@pytest.fixture(autouse=True)
+def reset_ingest_state():
+    """
+    テスト間でロールバックされたIDや連続エラー状態が残らないよう、
+    エンティティIDキャッシュ・連続エラー状態・ヘルプ状態・設定値のプロセス内キャッシュを破棄する
+    """
+    from crud import crud_settings
+    from crud.crud_dashboard_version import dashboard_version_index
+    from crud.crud_entity_cache import entity_id_cache
+    from crud.crud_error_state import consecutive_error_tracker
+    from crud.crud_help_state import help_state_index
+
+    entity_id_cache.clear()
+    consecutive_error_tracker.reset()
+    help_state_index.reset()
+    dashboard_version_index.reset()
+    crud_settings._local_settings_cache.clear()
+    yield
+
+
 @pytest.fixture(scope="function")
 def db_session() -> Generator:
     """各テスト関数にDBセッションを提供し、テスト後にロールバックする"""
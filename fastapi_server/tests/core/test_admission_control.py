@@ -0,0 +1,120 @@
+"""
+取り込み流量制御テスト
+
+ワーカー報告の集約、上限超過時の 429 判定と Retry-After、
+上限接近時の送信間隔拡大ヒントをテストします。
+"""
+
+import json
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+import core.admission_control as admission_module
+from core.admission_control import (
+    BACKOFF_HINT_HEADER,
+    STALE_REPORT_SECONDS,
+    IngestAdmissionController,
+)
+
+
+def _report(
+    queue_depth,
+    stream_backlog=None,
+    updated_at=1000.0,
+    stream=None,
+    pubsub_backlog=None,
+):
+    return json.dumps(
+        {
+            "queue_depth": queue_depth,
+            "stream_backlog": stream_backlog,
+            "stream": stream,
+            "pubsub_backlog": pubsub_backlog,
+            "updated_at": updated_at,
+        }
+    )
+
+
+class TestIngestAdmissionController:
+    """IngestAdmissionControllerクラスのテストケース"""
+
+    def setup_method(self):
+        """各テストメソッド実行前のセットアップ"""
+        self.controller = IngestAdmissionController(
+            backlog_limit=1000, retry_after_max_seconds=30, cache_ttl_seconds=0
+        )
+
+    def test_aggregate_sums_queues_and_takes_max_stream_backlog(self):
+        """キュー深さは合計、ストリーム遅延は最大値で集約されるかテスト"""
+        reports = {
+            "w1": _report(10, 300),
+            "w2": _report(20, 250),
+            "stale": _report(999, 999, updated_at=1000.0 - STALE_REPORT_SECONDS - 1),
+        }
+
+        assert IngestAdmissionController.aggregate_reports(reports, now=1000.0) == 330
+
+    def test_aggregate_sums_backlog_across_shards(self):
+        """シャード（ストリーム）ごとの遅延は合計され、シャード別の遅延も取得できるかテスト"""
+        reports = {
+            "shard0": _report(0, 100, stream="progress_events_stream:0"),
+            "shard1": _report(0, 40, stream="progress_events_stream:1"),
+        }
+
+        assert IngestAdmissionController.aggregate_reports(reports, now=1000.0) == 140
+        fresh = IngestAdmissionController._fresh_reports(reports, now=1000.0)
+        assert IngestAdmissionController.aggregate_stream_lag(fresh) == {
+            "progress_events_stream:0": 100,
+            "progress_events_stream:1": 40,
+        }
+
+    def test_aggregate_takes_max_pubsub_backlog(self):
+        """Pub/Subの未処理件数は全ワーカーが全イベントを受信するため最大値で集約されるかテスト"""
+        reports = {
+            "w1": _report(5, pubsub_backlog=700),
+            "w2": _report(0, pubsub_backlog=650),
+        }
+
+        assert IngestAdmissionController.aggregate_reports(reports, now=1000.0) == 705
+
+    def test_aggregate_without_fresh_reports(self):
+        """有効な報告がない場合は None を返すかテスト"""
+        assert IngestAdmissionController.aggregate_reports({}, now=1000.0) is None
+
+    def test_evaluate_rejects_over_limit(self):
+        """上限超過時に 429 用の Retry-After が設定されるかテスト"""
+        decision = self.controller.evaluate(2000)
+
+        assert not decision.admitted
+        assert decision.retry_after_seconds == 10
+        assert decision.headers()["Retry-After"] == "10"
+
+    def test_evaluate_caps_retry_after(self):
+        """Retry-After が上限値で打ち切られるかテスト"""
+        assert self.controller.evaluate(100000).retry_after_seconds == 30
+
+    def test_evaluate_hints_backoff_near_limit(self):
+        """上限に近づくと送信間隔拡大ヒントが返るかテスト"""
+        decision = self.controller.evaluate(600)
+
+        assert decision.admitted
+        assert decision.headers() == {BACKOFF_HINT_HEADER: "3000"}
+        assert self.controller.evaluate(100).headers() == {}
+
+    def test_evaluate_admits_without_reports(self):
+        """処理待ち件数が不明な場合は受け付けるかテスト（フェイルオープン）"""
+        assert self.controller.evaluate(None).admitted
+
+    @pytest.mark.asyncio
+    async def test_check_fails_open_on_redis_error(self):
+        """Redis障害時も取り込みを止めないかテスト"""
+        with patch.object(
+            admission_module,
+            "get_redis_connection",
+            MagicMock(side_effect=Exception("down")),
+        ):
+            decision = await self.controller.check()
+
+        assert decision.admitted
+        assert self.controller.stats["admitted"] == 1
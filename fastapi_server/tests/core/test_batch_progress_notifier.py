@@ -0,0 +1,106 @@
+"""
+バッチ進捗通知テスト
+
+学生ごとの集約メッセージ作成、バックグラウンド配信、
+1回のシリアライズによる並行ブロードキャストをテストします。
+"""
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from core.batch_progress_notifier import (
+    BATCH_PROGRESS_MESSAGE_TYPE,
+    BatchProgressNotifier,
+)
+from core.unified_connection_manager import ClientType, UnifiedConnectionManager
+from schemas.event import EventData
+
+
+def _event(email, event_type="cell_executed", has_error=False, event_time=None):
+    return EventData(
+        emailAddress=email,
+        eventType=event_type,
+        hasError=has_error,
+        eventTime=event_time,
+    )
+
+
+class TestBatchProgressNotifier:
+    """BatchProgressNotifierクラスのテストケース"""
+
+    def test_build_message_groups_by_student(self):
+        """バッチ内のイベントが学生ごとに集約されるかテスト"""
+        events = [
+            _event("a@example.com", event_time="2024-01-01T00:00:01Z"),
+            _event("a@example.com", has_error=True, event_time="2024-01-01T00:00:02Z"),
+            _event("b@example.com", event_type="notebook_opened"),
+            _event(None),
+        ]
+
+        message = BatchProgressNotifier.build_message(events, "batch01")
+
+        assert message["type"] == BATCH_PROGRESS_MESSAGE_TYPE
+        assert message["total_events"] == 3
+        students = {s["user_id"]: s for s in message["students"]}
+        assert students["a@example.com"]["event_count"] == 2
+        assert students["a@example.com"]["error_count"] == 1
+        assert students["a@example.com"]["last_event_time"] == "2024-01-01T00:00:02Z"
+        assert students["b@example.com"]["event_types"] == {"notebook_opened": 1}
+
+    @pytest.mark.asyncio
+    async def test_schedule_delivers_once_in_background(self):
+        """バッチごとに1回だけバックグラウンド配信されるかテスト"""
+        manager = MagicMock()
+        manager.broadcast_to_types = AsyncMock(return_value=5)
+        notifier = BatchProgressNotifier(manager=manager)
+
+        students = notifier.schedule(
+            [_event("a@example.com"), _event("b@example.com")], "b1"
+        )
+        await notifier.drain()
+
+        assert students == 2
+        manager.broadcast_to_types.assert_called_once()
+        assert notifier.stats["messages_sent"] == 5
+        assert notifier.get_statistics()["pending_deliveries"] == 0
+
+    @pytest.mark.asyncio
+    async def test_schedule_without_students_skips_delivery(self):
+        """通知対象の学生がいない場合は配信しないかテスト"""
+        manager = MagicMock()
+        manager.broadcast_to_types = AsyncMock()
+        notifier = BatchProgressNotifier(manager=manager)
+
+        assert notifier.schedule([_event(None)], "b1") == 0
+        manager.broadcast_to_types.assert_not_called()
+
+
+class TestBroadcastSerializeOnce:
+    """UnifiedConnectionManagerのブロードキャストのテストケース"""
+
+    @pytest.mark.asyncio
+    async def test_broadcast_to_types_serializes_once(self):
+        """複数クライアントへの配信でもシリアライズが1回だけかテスト"""
+        manager = UnifiedConnectionManager()
+        websockets = []
+        for i in range(3):
+            websocket = MagicMock()
+            websocket.send_text = AsyncMock()
+            websockets.append(websocket)
+            manager.connections[f"instructor-{i}"] = MagicMock(
+                client_type=ClientType.INSTRUCTOR, websocket=websocket, metadata={}
+            )
+            manager.client_type_index[ClientType.INSTRUCTOR].add(f"instructor-{i}")
+
+        with patch(
+            "core.unified_connection_manager.json.dumps", return_value="{}"
+        ) as dumps:
+            sent = await manager.broadcast_to_types(
+                [ClientType.INSTRUCTOR, ClientType.DASHBOARD],
+                {"type": BATCH_PROGRESS_MESSAGE_TYPE},
+            )
+
+        assert sent == 3
+        dumps.assert_called_once()
+        for websocket in websockets:
+            websocket.send_text.assert_called_once_with("{}")
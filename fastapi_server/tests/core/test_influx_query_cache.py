@@ -0,0 +1,82 @@
+"""
+InfluxDBクエリ結果キャッシュのテスト
+
+同時の要求による1回のクエリの共有（シングルフライト）、TTL内の再利用、
+失敗をキャッシュしないことと、集計ウィンドウに揃えた時刻・TTLをテストします。
+"""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from core.influx_query_cache import InfluxQueryCache, aligned_now, window_ttl
+
+
+class TestInfluxQueryCache:
+    """InfluxQueryCacheクラスのテストケース"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_one_query(self):
+        """同じキーの同時の要求が1回のクエリを共有し、以降はキャッシュを返すかテスト"""
+        cache = InfluxQueryCache(max_entries=8)
+        calls = 0
+        release = asyncio.Event()
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return {"value": 1}
+
+        waiters = [
+            asyncio.create_task(cache.get_or_load("chart", 60, loader))
+            for _ in range(10)
+        ]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters)
+
+        assert calls == 1
+        assert all(result == {"value": 1} for result in results)
+        assert await cache.get_or_load("chart", 60, loader) == {"value": 1}
+        stats = cache.get_statistics()
+        assert stats["misses"] == 1
+        assert stats["coalesced"] == 9
+        assert stats["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_failures_are_not_cached(self):
+        """クエリの失敗は待機中の要求にも返し、次の要求で再実行するかテスト"""
+        cache = InfluxQueryCache(max_entries=8)
+        attempts = []
+
+        async def loader():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RuntimeError("influx down")
+            return 5
+
+        with pytest.raises(RuntimeError):
+            await cache.get_or_load("metrics", 60, loader)
+        assert await cache.get_or_load("metrics", 60, loader) == 5
+        assert cache.get_statistics()["errors"] == 1
+
+    @pytest.mark.asyncio
+    async def test_expired_entries_are_reloaded(self):
+        """TTLを過ぎたエントリは再度クエリするかテスト"""
+        cache = InfluxQueryCache(max_entries=8)
+        values = iter([1, 2])
+
+        async def loader():
+            return next(values)
+
+        assert await cache.get_or_load("chart", 0, loader) == 1
+        assert await cache.get_or_load("chart", 0, loader) == 2
+
+    def test_window_alignment(self):
+        """TTLは集計ウィンドウに比例し、時刻はTTL単位に切り捨てるかテスト"""
+        assert window_ttl(300) == 30
+        assert window_ttl(10) == 5
+        assert aligned_now(30, now=1704067215.5) == datetime(2024, 1, 1, 0, 0, 0)
+        assert aligned_now(30, now=1704067231.0) == datetime(2024, 1, 1, 0, 0, 30)
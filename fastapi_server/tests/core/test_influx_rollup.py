@@ -0,0 +1,186 @@
+"""
+InfluxDB進捗イベントのロールアップのテスト
+
+集計ウィンドウに応じたロールアップの選択、区間の境界への切り捨て、
+ダウンサンプリングの再集計範囲（初回の作成・ディスク退避中の延長）、
+ウォーターマークによる生のイベントへのフォールバックをテストします。
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from core.influx_rollup import (
+    ROLLUP_1H,
+    ROLLUP_1M,
+    InfluxRollupScheduler,
+    RollupWatermark,
+    build_minute_rollup_query,
+    choose_available_rollup,
+    choose_rollup,
+    floor_time,
+)
+
+
+class TestInfluxRollup:
+    """ロールアップのテストケース"""
+
+    def test_choose_coarsest_rollup_for_window(self):
+        """集計ウィンドウを割り切れる最も粗いロールアップを選ぶかテスト"""
+        assert choose_rollup(300) is ROLLUP_1M
+        assert choose_rollup(3600) is ROLLUP_1H
+        assert choose_rollup(4 * 3600) is ROLLUP_1H
+        assert choose_rollup(30) is None
+
+        with patch("core.influx_rollup.settings.INFLUX_ROLLUP_ENABLED", False):
+            assert choose_rollup(3600) is None
+
+    def test_floor_time(self):
+        """naive・タイムゾーン付きの時刻を区間の境界に切り捨てるかテスト"""
+        assert floor_time(datetime(2024, 1, 1, 10, 7, 33), 3600) == datetime(
+            2024, 1, 1, 10
+        )
+        assert floor_time(
+            datetime(2024, 1, 1, 19, 7, 33, tzinfo=timezone(timedelta(hours=9))), 60
+        ) == datetime(2024, 1, 1, 10, 7)
+
+    def test_minute_rollup_writes_each_field(self):
+        """1分単位のロールアップが各フィールドを区間の開始時刻で書き込むかテスト"""
+        query = build_minute_rollup_query(datetime(2024, 1, 1))
+
+        for field in ("executions", "errors", "help", "duration_sum", "duration_count"):
+            assert f'set(key: "_field", value: "{field}")' in query
+        assert query.count('timeSrc: "_start"') == 5
+        assert query.count(f'value: "{ROLLUP_1M.measurement}"') == 5
+
+    def test_watermark_covers_only_backfilled_and_fresh_range(self):
+        """作成範囲内かつ更新が遅れていない場合のみロールアップを使用できるかテスト"""
+        start = datetime(2024, 1, 8, 10)
+        start_ts = (start - datetime(1970, 1, 1)).total_seconds()
+        watermark = RollupWatermark(covered_from=start_ts - 60, updated_at=start_ts)
+
+        assert watermark.covers(start, start_ts + 60)
+        # 作成範囲より前から集計する場合
+        assert not watermark.covers(start - timedelta(minutes=5), start_ts + 60)
+        # ワーカー停止で更新が遅れている場合
+        assert not watermark.covers(start, start_ts + 3600)
+
+    @pytest.mark.asyncio
+    @patch("core.influx_rollup.read_watermark", new_callable=AsyncMock)
+    async def test_falls_back_to_raw_without_watermark(self, mock_read_watermark):
+        """ウォーターマークがない（作成前・Redis障害時）場合は None を返すかテスト"""
+        start = datetime(2024, 1, 8, 10)
+        mock_read_watermark.return_value = None
+        assert await choose_available_rollup(300, start) is None
+
+        mock_read_watermark.return_value = RollupWatermark(0.0, time.time())
+        assert await choose_available_rollup(300, start) is ROLLUP_1M
+        assert await choose_available_rollup(30, start) is None
+
+    @pytest.mark.asyncio
+    @patch("core.influx_rollup.read_watermark", new_callable=AsyncMock)
+    @patch("core.influx_rollup.record_watermark", new_callable=AsyncMock)
+    @patch("core.influx_rollup.run_influx", new_callable=AsyncMock)
+    @patch("core.influx_rollup.batch_writer")
+    async def test_backfills_then_recomputes_lookback(
+        self, mock_writer, mock_run_influx, mock_record_watermark, mock_read_watermark
+    ):
+        """初回は過去の期間から作成し、以降は直近の期間のみ再集計するかテスト"""
+        mock_read_watermark.return_value = None
+        mock_writer.oldest_spilled_at = AsyncMock(return_value=None)
+        scheduler = InfluxRollupScheduler(interval_seconds=60)
+        now = datetime(2024, 1, 8, 10, 30, 15)
+
+        await scheduler.run_once(now)
+        assert (
+            "range(start: 2024-01-01T10:30:00Z)"
+            in mock_run_influx.call_args_list[0].args[1]
+        )
+        assert (
+            "range(start: 2024-01-01T10:00:00Z)"
+            in mock_run_influx.call_args_list[1].args[1]
+        )
+        # 1時間単位の最初の区間は10:30より前を含まないため、作成範囲は次の区間から
+        mock_record_watermark.assert_called_once_with(
+            now, covered_from=datetime(2024, 1, 1, 11)
+        )
+
+        await scheduler.run_once(now)
+        assert (
+            "range(start: 2024-01-08T10:20:00Z)"
+            in mock_run_influx.call_args_list[2].args[1]
+        )
+        assert (
+            "range(start: 2024-01-08T10:00:00Z)"
+            in mock_run_influx.call_args_list[3].args[1]
+        )
+        assert mock_record_watermark.call_args.kwargs["covered_from"] is None
+
+    @pytest.mark.asyncio
+    @patch("core.influx_rollup.read_watermark", new_callable=AsyncMock)
+    @patch("core.influx_rollup.record_watermark", new_callable=AsyncMock)
+    @patch("core.influx_rollup.run_influx", new_callable=AsyncMock)
+    @patch("core.influx_rollup.batch_writer")
+    async def test_resumes_from_watermark_on_restart(
+        self, mock_writer, mock_run_influx, mock_record_watermark, mock_read_watermark
+    ):
+        """再起動時はウォーターマークの最終更新時刻から再集計し、過去の期間から作成しないかテスト"""
+        epoch = datetime(1970, 1, 1)
+        mock_writer.oldest_spilled_at = AsyncMock(return_value=None)
+        now = datetime(2024, 1, 8, 10, 30, 15)
+        updated_at = (datetime(2024, 1, 8, 9, 45) - epoch).total_seconds()
+        mock_read_watermark.return_value = RollupWatermark(0.0, updated_at)
+        scheduler = InfluxRollupScheduler(interval_seconds=60)
+
+        await scheduler.run_once(now)
+
+        assert (
+            "range(start: 2024-01-08T09:35:00Z)"
+            in mock_run_influx.call_args_list[0].args[1]
+        )
+        assert (
+            "range(start: 2024-01-08T09:00:00Z)"
+            in mock_run_influx.call_args_list[1].args[1]
+        )
+        mock_record_watermark.assert_called_once_with(now, covered_from=None)
+
+        # 停止期間が作成期間より長い場合は過去の期間から作成し直す
+        updated_at = (datetime(2023, 12, 1) - epoch).total_seconds()
+        mock_read_watermark.return_value = RollupWatermark(0.0, updated_at)
+        scheduler = InfluxRollupScheduler(interval_seconds=60)
+
+        await scheduler.run_once(now)
+
+        assert (
+            "range(start: 2024-01-01T10:30:00Z)"
+            in mock_run_influx.call_args_list[2].args[1]
+        )
+        assert mock_record_watermark.call_args.kwargs["covered_from"] == datetime(
+            2024, 1, 1, 11
+        )
+
+    @pytest.mark.asyncio
+    @patch("core.influx_rollup.record_watermark", new_callable=AsyncMock)
+    @patch("core.influx_rollup.run_influx", new_callable=AsyncMock)
+    @patch("core.influx_rollup.batch_writer")
+    async def test_recomputes_from_spill_until_replayed(
+        self, mock_writer, mock_run_influx, mock_record_watermark
+    ):
+        """ディスク退避中と再送完了後の1回は退避開始時刻から再集計するかテスト"""
+        now = datetime(2024, 1, 8, 10, 30)
+        spilled_at = (datetime(2024, 1, 8, 8, 0) - datetime(1970, 1, 1)).total_seconds()
+        scheduler = InfluxRollupScheduler(interval_seconds=60)
+        scheduler._backfilled = True
+
+        mock_writer.oldest_spilled_at = AsyncMock(return_value=spilled_at)
+        await scheduler.run_once(now)
+        mock_writer.oldest_spilled_at.return_value = None
+        await scheduler.run_once(now)
+        await scheduler.run_once(now)
+
+        minute_queries = [call.args[1] for call in mock_run_influx.call_args_list[::2]]
+        assert "range(start: 2024-01-08T07:50:00Z)" in minute_queries[0]
+        assert "range(start: 2024-01-08T07:50:00Z)" in minute_queries[1]
+        assert "range(start: 2024-01-08T10:20:00Z)" in minute_queries[2]
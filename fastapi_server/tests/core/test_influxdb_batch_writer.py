@@ -0,0 +1,322 @@
+"""
+InfluxDBバッチライターテスト
+
+イベント辞書からのラインプロトコル生成（エスケープ・型・タイムスタンプ）と、
+フラッシュ条件（行数・バイト数・最大滞留時間）と要求の集約、gzip圧縮したバッチの送信、
+送信中リクエスト数の上限・失敗時のディスク退避と再送をテストします。
+"""
+
+import asyncio
+import gzip
+
+import httpx
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from core.influx_spill import InfluxSpillStore
+from core.influxdb_batch_writer import InfluxDBBatchWriter
+from db.influx_line_protocol import build_line, progress_layout
+
+
+def _event(**overrides):
+    event = {
+        "eventType": "cell_executed",
+        "eventTime": "2024-01-01T00:00:00Z",
+        "emailAddress": "student@example.com",
+        "userName": "Student One",
+        "notebookPath": "course/week1.ipynb",
+        "cellId": "cell-1",
+        "cellIndex": 2,
+        "executionCount": 3,
+        "hasError": False,
+        "executionDurationMs": 12,
+        "sessionId": "",
+    }
+    event.update(overrides)
+    return event
+
+
+def _no_content():
+    return httpx.Response(
+        204, request=httpx.Request("POST", "http://influxdb/api/v2/write")
+    )
+
+
+def _writer(spill_dir, **kwargs):
+    writer = InfluxDBBatchWriter(
+        batch_size=kwargs.pop("batch_size", 2),
+        max_linger_ms=kwargs.pop("max_linger_ms", 20),
+        max_batch_bytes=kwargs.pop("max_batch_bytes", 1024 * 1024),
+        max_in_flight=kwargs.pop("max_in_flight", 2),
+        gzip_level=1,
+        layout=progress_layout("student_progress"),
+        max_buffer_points=kwargs.pop("max_buffer_points", 100),
+        spill_store=InfluxSpillStore(
+            str(spill_dir), segment_max_bytes=1024, max_bytes=1024 * 1024
+        ),
+        replay_points_per_second=1_000_000,
+    )
+    client = MagicMock()
+    client.post = kwargs.pop("post", AsyncMock(return_value=_no_content()))
+    client.aclose = AsyncMock()
+    writer._client = client
+    return writer, client
+
+
+async def _wait_until(condition, timeout=1.0):
+    """条件が満たされるまで待機"""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition not met"
+        await asyncio.sleep(0.005)
+
+
+class TestBuildLine:
+    """ラインプロトコル生成のテストケース"""
+
+    def test_progress_line_layout(self):
+        """既存の student_progress と同じタグ・フィールド・型で出力されるかテスト"""
+        line = build_line(_event(), progress_layout("student_progress"))
+
+        series = (
+            "student_progress,directory=course,emailAddress=student@example.com,"
+            "event=cell_executed,notebook=week1.ipynb,userName=Student\\ One "
+        )
+        assert line.startswith(series)
+        fields, timestamp = line.removeprefix(series).rsplit(" ", 1)
+        assert "cellIndex=2i" in fields
+        assert "executionCount=3i" in fields
+        assert "success=true" in fields
+        assert "duration=12.0" in fields
+        assert "cell_count" not in fields
+        assert timestamp == "1704067200000000000"
+
+    def test_escapes_string_fields(self):
+        """文字列フィールドの引用符とバックスラッシュがエスケープされるかテスト"""
+        line = build_line(_event(cellContent='print("a\\b")'), progress_layout("p"))
+
+        assert 'cellContent="print(\\"a\\\\b\\")"' in line
+
+    def test_notebook_save_fields(self):
+        """ノートブック保存イベントではセル数が出力され、実行結果は出力されないかテスト"""
+        line = build_line(
+            _event(eventType="notebook_save", cellCount=7), progress_layout("p")
+        )
+
+        assert "cell_count=7i" in line
+        assert "success=" not in line
+
+    def test_error_resolved_fields(self):
+        """エラー解除イベントでは解除した人が出力され、他のイベントでは出力されないかテスト"""
+        resolved = build_line(
+            _event(eventType="error_resolved", resolvedBy="instructor"),
+            progress_layout("p"),
+        )
+        executed = build_line(_event(resolvedBy="instructor"), progress_layout("p"))
+
+        assert "event=error_resolved" in resolved
+        assert 'resolvedBy="instructor"' in resolved
+        assert "resolvedBy" not in executed
+
+
+class TestInfluxDBBatchWriter:
+    """InfluxDBBatchWriterクラスのテストケース"""
+
+    @pytest.mark.asyncio
+    async def test_flushes_gzip_batch_when_size_reached(self, tmp_path):
+        """バッチサイズに達すると滞留時間を待たずにgzip圧縮したラインプロトコルが送信されるかテスト"""
+        writer, client = _writer(tmp_path, max_linger_ms=60000)
+        await writer.start_batch_writer()
+        try:
+            await writer.add_progress_point(_event(cellId="a"))
+            await writer.add_progress_point(_event(cellId="b"))
+            await _wait_until(lambda: writer.total_points_written == 2)
+        finally:
+            await writer.stop_batch_writer()
+
+        client.post.assert_awaited_once()
+        kwargs = client.post.call_args.kwargs
+        assert kwargs["params"]["precision"] == "ns"
+        lines = gzip.decompress(kwargs["content"]).decode().split("\n")
+        assert len(lines) == 2
+        assert writer.flush_triggers == {"size": 1}
+        assert writer.flush_size_histogram.count == 1
+        assert writer.write_latency_histogram.count == 1
+
+    @pytest.mark.asyncio
+    async def test_flushes_after_max_linger(self, tmp_path):
+        """バッチサイズに満たない行も最大滞留時間を過ぎると送信されるかテスト"""
+        writer, client = _writer(tmp_path, batch_size=100, max_linger_ms=20)
+        await writer.start_batch_writer()
+        try:
+            await writer.add_progress_point(_event(cellId="a"))
+            assert client.post.await_count == 0
+            await _wait_until(lambda: writer.total_points_written == 1)
+        finally:
+            await writer.stop_batch_writer()
+
+        assert writer.flush_triggers == {"linger": 1}
+
+    @pytest.mark.asyncio
+    async def test_add_does_not_flush_inline_and_requests_coalesce(self, tmp_path):
+        """追加は呼び出し元でフラッシュせず、起床前の複数のフラッシュ要求が1回にまとめられるかテスト"""
+        writer, client = _writer(tmp_path, batch_size=1)
+
+        for cell_id in "abc":
+            await writer.add_progress_point(_event(cellId=cell_id))
+
+        client.post.assert_not_called()
+        assert writer.coalesced_flush_requests == 2
+        assert len(writer.line_buffer) == 3
+
+    def test_take_batch_respects_byte_limit(self, tmp_path):
+        """1回のバッチが最大バイト数を超えないように分割されるかテスト"""
+        writer, _ = _writer(tmp_path, batch_size=100, max_batch_bytes=30)
+        for i in range(5):
+            writer._add_line_to_buffer(f"m f={i}i {i:08d}")
+
+        batch = writer._take_batch()
+
+        assert len(batch) == 1
+        assert len(writer.line_buffer) == 4
+        assert writer.buffer_bytes == sum(len(line) + 1 for line in writer.line_buffer)
+
+    @pytest.mark.asyncio
+    async def test_buffer_spills_to_disk_while_max_in_flight_reached(self, tmp_path):
+        """送信中のリクエストが上限の間にバッファが上限行数を超えるとディスクに退避するかテスト"""
+        release = asyncio.Event()
+
+        async def slow_post(*args, **kwargs):
+            await release.wait()
+            return _no_content()
+
+        writer, client = _writer(
+            tmp_path,
+            batch_size=1,
+            max_in_flight=1,
+            max_buffer_points=3,
+            post=AsyncMock(side_effect=slow_post),
+        )
+        await writer.start_batch_writer()
+        try:
+            await writer.add_progress_point(_event(cellId="a"))
+            await _wait_until(lambda: client.post.await_count == 1)
+            for cell_id in "bcd":
+                await writer.add_progress_point(_event(cellId=cell_id))
+            await _wait_until(lambda: writer.spill.points_on_disk == 3)
+            assert writer.line_buffer == []
+        finally:
+            release.set()
+            await writer.stop_batch_writer()
+
+        assert writer.total_points_written == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_batch_is_spilled_and_replayed(self, tmp_path):
+        """送信に失敗したバッチがディスクに退避され、回復後に再送・削除されるかテスト"""
+        writer, client = _writer(
+            tmp_path, post=AsyncMock(side_effect=httpx.ConnectError("down"))
+        )
+
+        await writer.add_progress_point(_event(cellId="a"))
+        await writer.add_progress_point(_event(cellId="b"))
+        await writer._flush_buffer()
+        await asyncio.gather(*writer._in_flight)
+
+        assert writer.line_buffer == []
+        assert writer.write_errors == 1
+        stats = writer.get_batch_writer_stats()["spill"]
+        assert stats["points_on_disk"] == 2
+        assert stats["bytes_on_disk"] > 0
+
+        client.post = AsyncMock(return_value=_no_content())
+        assert await writer._replay_oldest_segment() is True
+
+        assert writer.total_points_written == 2
+        assert writer.replayed_points == 2
+        assert writer.spill.points_on_disk == 0
+        assert list(writer.spill.directory.iterdir()) == []
+
+
+class TestInfluxSpillStore:
+    """InfluxSpillStoreクラスのテストケース"""
+
+    def test_rotates_segments_and_reloads(self, tmp_path):
+        """サイズ上限でセグメントがローテーションされ、再起動後に読み込めるかテスト"""
+        store = InfluxSpillStore(str(tmp_path), segment_max_bytes=10, max_bytes=1024)
+        store.append(["m f=1i 1", "m f=2i 2"])
+        store.append(["m f=3i 3"])
+
+        reloaded = InfluxSpillStore(str(tmp_path), segment_max_bytes=10, max_bytes=1024)
+        reloaded.load()
+
+        assert len(reloaded.segments) == 2
+        assert reloaded.points_on_disk == 3
+        assert reloaded.read(reloaded.oldest()) == ["m f=1i 1", "m f=2i 2"]
+
+    def test_replaying_segment_is_not_appended(self, tmp_path):
+        """再送中のセグメントには追記せず、残りの行だけに書き換えられるかテスト"""
+        store = InfluxSpillStore(str(tmp_path), segment_max_bytes=1024, max_bytes=1024)
+        store.append(["m f=1i 1", "m f=2i 2"])
+        segment = store.begin_replay()
+        store.append(["m f=3i 3"])
+
+        store.truncate_front(segment, ["m f=2i 2"])
+
+        assert len(store.segments) == 2
+        assert store.read(segment) == ["m f=2i 2"]
+        assert store.points_on_disk == 2
+
+    def test_drops_oldest_segment_over_disk_limit(self, tmp_path):
+        """ディスク使用量の上限を超えた場合は最古のセグメントを削除して件数を記録するかテスト"""
+        store = InfluxSpillStore(str(tmp_path), segment_max_bytes=1, max_bytes=20)
+        store.append(["m f=1i 1"])
+        store.append(["m f=2i 2"])
+        store.append(["m f=3i 3"])
+
+        assert store.dropped_points == 1
+        assert store.bytes_on_disk <= 20
+
+    def test_adopts_segments_of_exited_processes(self, tmp_path):
+        """ロックされていない他のプロセスのサブディレクトリと旧形式のセグメントを引き継ぐかテスト"""
+        running = InfluxSpillStore(
+            str(tmp_path), segment_max_bytes=1024, max_bytes=1024
+        )
+        running.load("shard-1-200")
+        running.append(["m f=1i 1"])
+        exited = InfluxSpillStore(str(tmp_path), segment_max_bytes=1024, max_bytes=1024)
+        exited.load("shard-0-100")
+        exited.append(["m f=2i 2"])
+        exited.close()
+        (tmp_path / "1-000001.lp").write_bytes(b"m f=3i 3\n")
+
+        store = InfluxSpillStore(str(tmp_path), segment_max_bytes=1024, max_bytes=1024)
+        store.load("shard-0-300")
+
+        assert store.points_on_disk == 2
+        assert store.read(store.oldest()) == ["m f=3i 3"]
+        assert not (tmp_path / "shard-0-100").exists()
+        # 動作中のプロセスのセグメントは引き継がない
+        assert running.points_on_disk == 1
+        assert sorted(path.name for path in tmp_path.iterdir()) == [
+            "shard-0-300",
+            "shard-1-200",
+        ]
+        running.close()
+        store.close()
+
+    def test_oldest_spilled_at_spans_other_processes(self, tmp_path):
+        """他のプロセスのサブディレクトリと旧形式を含めた最古のセグメント時刻を返すかテスト"""
+        store = InfluxSpillStore(str(tmp_path), segment_max_bytes=1024, max_bytes=1024)
+        store.load("shard-0-100")
+        assert store.oldest_spilled_at() is None
+
+        store.append(["m f=1i 1"])
+        other = tmp_path / "shard-1-200"
+        other.mkdir()
+        (other / "2000000000-000001.lp").write_bytes(b"m f=2i 2\n")
+        assert store.oldest_spilled_at() == 2.0
+
+        (tmp_path / "1000000000-000001.lp").write_bytes(b"m f=3i 3\n")
+        assert store.oldest_spilled_at() == 1.0
+        store.close()
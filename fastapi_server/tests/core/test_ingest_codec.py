@@ -0,0 +1,102 @@
+"""
+取り込みペイロードデコードテスト
+
+gzip / zstd の展開、MessagePackボディのデコード、検証エラー時の422応答、
+展開後サイズの上限をテストします。
+"""
+
+import gzip
+import json
+
+import msgpack
+import pytest
+import zstandard
+from fastapi import FastAPI, Depends
+from fastapi.testclient import TestClient
+from typing import List
+
+from core.config import settings
+from core.ingest_codec import read_event_batch
+from schemas.event import EventData
+
+app = FastAPI()
+
+
+@app.post("/events")
+async def echo_events(events: List[EventData] = Depends(read_event_batch)):
+    return {"count": len(events), "first": events[0].eventId if events else None}
+
+
+client = TestClient(app)
+
+EVENTS = [
+    {"eventId": "e1", "eventType": "cell_executed", "code": "print('x')\n" * 50},
+    {"eventId": "e2", "eventType": "cell_executed"},
+]
+
+
+class TestIngestCodec:
+    """read_event_batch のテストケース"""
+
+    def test_plain_json(self):
+        """非圧縮JSONがそのままデコードされるかテスト"""
+        response = client.post("/events", json=EVENTS)
+
+        assert response.status_code == 200
+        assert response.json() == {"count": 2, "first": "e1"}
+
+    @pytest.mark.parametrize(
+        "encoding,compress",
+        [
+            ("gzip", gzip.compress),
+            ("zstd", lambda data: zstandard.ZstdCompressor().compress(data)),
+        ],
+    )
+    def test_compressed_json(self, encoding, compress):
+        """Content-Encoding付きJSONが展開されるかテスト"""
+        response = client.post(
+            "/events",
+            content=compress(json.dumps(EVENTS).encode()),
+            headers={"Content-Type": "application/json", "Content-Encoding": encoding},
+        )
+
+        assert response.status_code == 200
+        assert response.json()["count"] == 2
+
+    def test_gzip_msgpack(self):
+        """gzip圧縮されたMessagePackボディがデコードされるかテスト"""
+        response = client.post(
+            "/events",
+            content=gzip.compress(msgpack.packb(EVENTS)),
+            headers={"Content-Type": "application/msgpack", "Content-Encoding": "gzip"},
+        )
+
+        assert response.status_code == 200
+        assert response.json() == {"count": 2, "first": "e1"}
+
+    def test_invalid_body_returns_422(self):
+        """配列でないボディは検証エラー（422）になるかテスト"""
+        response = client.post("/events", json={"eventId": "e1"})
+
+        assert response.status_code == 422
+        assert response.json()["detail"][0]["loc"][0] == "body"
+
+    def test_unsupported_encoding_returns_415(self):
+        """未対応のContent-Encodingは415になるかテスト"""
+        response = client.post(
+            "/events", content=b"[]", headers={"Content-Encoding": "br"}
+        )
+
+        assert response.status_code == 415
+
+    def test_decompressed_size_limit(self, monkeypatch):
+        """展開後サイズが上限を超えると413になるかテスト"""
+        monkeypatch.setattr(settings, "INGEST_MAX_DECOMPRESSED_BYTES", 100)
+
+        response = client.post(
+            "/events",
+            content=gzip.compress(json.dumps(EVENTS).encode()),
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+        )
+
+        assert response.status_code == 413
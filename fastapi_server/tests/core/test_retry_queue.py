@@ -0,0 +1,196 @@
+"""
+遅延リトライキューテスト
+
+失敗イベントのソート済みセットへの登録とバックオフ、最大試行回数超過時の
+デッドレター移動、シャードごとのキー、時刻の来たリトライのリース付き取り出しと完了、
+デッドレター再投入をテストします。
+"""
+
+import json
+from contextlib import asynccontextmanager
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import core.retry_queue as retry_module
+from core.retry_queue import EventRetryQueue
+from db.redis_client import DEAD_LETTER_STREAM, RETRY_QUEUE_KEY, student_shard
+
+
+def _redis_mock(execute_result=None):
+    """パイプラインを持つ非同期Redisクライアントのモック"""
+    client = MagicMock()
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(return_value=execute_result or [])
+    client.pipeline.return_value = pipe
+
+    @asynccontextmanager
+    async def connection():
+        yield client
+
+    return client, pipe, connection
+
+
+class TestEventRetryQueue:
+    """EventRetryQueueクラスのテストケース"""
+
+    def setup_method(self):
+        """各テストメソッド実行前のセットアップ"""
+        self.queue = EventRetryQueue(
+            max_attempts=3, base_delay_seconds=1.0, max_delay_seconds=10.0
+        )
+
+    def test_backoff_grows_exponentially_with_cap(self):
+        """遅延が試行回数に応じて指数的に増え、上限で頭打ちになるかテスト"""
+        with patch.object(retry_module.random, "uniform", return_value=0.0):
+            delays = [self.queue.backoff_seconds(attempt) for attempt in (1, 2, 3, 10)]
+
+        assert delays == [1.0, 2.0, 4.0, 10.0]
+
+    @pytest.mark.asyncio
+    async def test_schedule_adds_to_sorted_set_with_due_time(self):
+        """失敗イベントが次回試行時刻をスコアとして登録されるかテスト"""
+        _, pipe, connection = _redis_mock()
+
+        with patch.object(
+            retry_module, "get_redis_connection", connection
+        ), patch.object(retry_module.time, "time", return_value=1000.0), patch.object(
+            retry_module.random, "uniform", return_value=0.0
+        ):
+            result = await self.queue.schedule(
+                [{"eventType": "cell_executed"}], error="boom"
+            )
+
+        assert result == {"scheduled": 1, "dead_lettered": 0}
+        key, members = pipe.zadd.call_args.args
+        assert key == RETRY_QUEUE_KEY
+        member, due = next(iter(members.items()))
+        assert json.loads(member)["attempt"] == 1
+        assert due == 1001.0
+        pipe.xadd.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_schedule_moves_exhausted_events_to_dead_letter(self):
+        """最大試行回数に達したイベントはデッドレターストリームに移動するかテスト"""
+        _, pipe, connection = _redis_mock()
+
+        with patch.object(retry_module, "get_redis_connection", connection):
+            result = await self.queue.schedule(
+                [{"eventType": "a"}, {"eventType": "b"}], error="boom", attempts=[2, 1]
+            )
+
+        assert result == {"scheduled": 1, "dead_lettered": 1}
+        stream, fields = pipe.xadd.call_args.args
+        assert stream == DEAD_LETTER_STREAM
+        assert json.loads(fields["data"]) == {"eventType": "a"}
+        assert fields["attempts"] == "3"
+
+    @pytest.mark.asyncio
+    async def test_dead_letter_skips_retries(self):
+        """再試行しても成功しないイベントはリトライ待ちに登録せずデッドレターに移すかテスト"""
+        _, pipe, connection = _redis_mock()
+
+        with patch.object(retry_module, "get_redis_connection", connection):
+            moved = await self.queue.dead_letter([{"eventType": "a"}], error="invalid")
+
+        assert moved == 1
+        pipe.zadd.assert_not_called()
+        stream, fields = pipe.xadd.call_args.args
+        assert stream == DEAD_LETTER_STREAM
+        assert fields["attempts"] == "1"
+        assert fields["error"] == "invalid"
+
+    @pytest.mark.asyncio
+    async def test_sharded_retries_use_the_student_shard_key(self):
+        """シャード時はリトライを学生のシャードのキーに登録し、シャードのキーから取り出すかテスト"""
+        client, pipe, connection = _redis_mock()
+        claim_due = AsyncMock(return_value=[])
+        client.register_script.return_value = claim_due
+        event = {"eventType": "cell_executed", "emailAddress": "a@example.com"}
+
+        with patch.object(retry_module, "get_redis_connection", connection), patch(
+            "db.redis_client.settings.WORKER_SHARD_COUNT", 4
+        ):
+            shard = student_shard("a@example.com")
+            await self.queue.schedule([event], error="boom")
+            await self.queue.pop_due(shard)
+
+        assert pipe.zadd.call_args.args[0] == f"{RETRY_QUEUE_KEY}:{shard}"
+        assert claim_due.call_args.kwargs["keys"] == [
+            f"{RETRY_QUEUE_KEY}:{shard}",
+            f"{RETRY_QUEUE_KEY}:{shard}:processing",
+        ]
+
+    @pytest.mark.asyncio
+    async def test_pop_due_leases_entries_until_completed(self):
+        """取り出したエントリをリース期限付きで処理中に移し、完了時に処理中から削除するかテスト"""
+        members = [
+            json.dumps({"id": "1", "attempt": 1, "event": {"eventType": "a"}}),
+            json.dumps({"id": "2", "attempt": 2, "event": {"eventType": "b"}}),
+        ]
+        client, _, connection = _redis_mock()
+        claim_due = AsyncMock(return_value=members)
+        client.register_script.return_value = claim_due
+        client.zrem = AsyncMock(return_value=2)
+
+        with patch.object(
+            retry_module, "get_redis_connection", connection
+        ), patch.object(retry_module.time, "time", return_value=1000.0), patch.object(
+            retry_module.settings, "RETRY_LEASE_SECONDS", 30
+        ):
+            entries = await self.queue.pop_due(limit=10)
+            await self.queue.complete(entries)
+
+        assert [(entry.event, entry.attempt) for entry in entries] == [
+            ({"eventType": "a"}, 1),
+            ({"eventType": "b"}, 2),
+        ]
+        assert claim_due.call_args.kwargs == {
+            "keys": [RETRY_QUEUE_KEY, f"{RETRY_QUEUE_KEY}:processing"],
+            "args": [1000.0, 10, 1030.0],
+        }
+        client.zrem.assert_called_once_with(f"{RETRY_QUEUE_KEY}:processing", *members)
+
+    @pytest.mark.asyncio
+    async def test_run_keeps_lease_when_processing_fails(self):
+        """処理が例外で終わった場合は完了扱いにせず、リース期限後の再取り出しに任せるかテスト"""
+        entry = retry_module.RetryEntry(event={"eventType": "a"}, attempt=1, member="m")
+        calls = []
+
+        def is_running():
+            calls.append(1)
+            return len(calls) == 1
+
+        with patch.object(
+            self.queue, "pop_due", AsyncMock(return_value=[entry])
+        ), patch.object(
+            self.queue, "complete", AsyncMock()
+        ) as mock_complete, patch.object(
+            retry_module.asyncio, "sleep", AsyncMock()
+        ):
+            await self.queue.run(
+                is_running, AsyncMock(side_effect=RuntimeError("crash")), shard=0
+            )
+            mock_complete.assert_not_called()
+
+            calls.clear()
+            await self.queue.run(is_running, AsyncMock(), shard=0)
+            mock_complete.assert_called_once_with([entry], 0)
+
+    @pytest.mark.asyncio
+    async def test_replay_dead_letters_resets_attempts(self):
+        """デッドレターが試行回数0でリトライ待ちに戻され、ストリームから削除されるかテスト"""
+        client, pipe, connection = _redis_mock()
+        client.xrange = AsyncMock(
+            return_value=[
+                ("1-0", {"data": json.dumps({"eventType": "a"}), "attempts": "3"})
+            ]
+        )
+
+        with patch.object(retry_module, "get_redis_connection", connection):
+            replayed = await self.queue.replay_dead_letters(["1-0"])
+
+        assert replayed == 1
+        _, members = pipe.zadd.call_args.args
+        assert json.loads(next(iter(members)))["attempt"] == 0
+        pipe.xdel.assert_called_once_with(DEAD_LETTER_STREAM, "1-0")
@@ -0,0 +1,142 @@
+"""
+イベント取り込みバッチ一括永続化のCRUDテスト
+
+連続エラー回数のベースライン計算（エラー解除済みのエラーの扱いを含む）、永続化対象イベントの判定と、
+セル・アクティブセッションの一意インデックスに対する一括解決をテストします。
+"""
+
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from sqlalchemy.dialects import postgresql
+
+from crud.crud_ingest import (
+    bulk_resolve_active_sessions,
+    bulk_resolve_cells,
+    get_consecutive_error_baselines,
+    is_persistable_execution,
+)
+from schemas.event import EventData
+
+
+def _row(student_id, cell_id, status, consecutive_error_count=None):
+    if consecutive_error_count is None:
+        consecutive_error_count = 1 if status == "error" else 0
+    return SimpleNamespace(
+        student_id=student_id,
+        cell_id=cell_id,
+        status=status,
+        consecutive_error_count=consecutive_error_count,
+    )
+
+
+class TestConsecutiveErrorBaselines:
+    """get_consecutive_error_baselines のテストケース"""
+
+    def test_counts_errors_until_first_success(self):
+        """新しい順に成功に達するまでのエラー件数を数えるかテスト"""
+        db = MagicMock()
+        db.execute.return_value.all.return_value = [
+            _row(1, 10, "error"),
+            _row(1, 10, "error"),
+            _row(1, 10, "success"),
+            _row(1, 10, "error"),
+            _row(2, 20, "success"),
+            _row(2, 20, "error"),
+        ]
+
+        baselines = get_consecutive_error_baselines(db, {(1, 10), (2, 20), (3, 30)})
+
+        assert baselines == {(1, 10): 2, (2, 20): 0, (3, 30): 0}
+        db.execute.assert_called_once()
+
+    def test_resolved_errors_end_the_count(self):
+        """エラー解除で回数を0にしたエラーは成功と同様に数えるのを止めるかテスト"""
+        db = MagicMock()
+        db.execute.return_value.all.return_value = [
+            _row(1, 10, "error"),
+            _row(1, 10, "error", consecutive_error_count=0),
+            _row(1, 10, "error"),
+        ]
+
+        assert get_consecutive_error_baselines(db, {(1, 10)}) == {(1, 10): 1}
+
+    def test_empty_pairs_skip_query(self):
+        """対象がない場合はクエリを発行しないかテスト"""
+        db = MagicMock()
+
+        assert get_consecutive_error_baselines(db, set()) == {}
+        db.execute.assert_not_called()
+
+
+class TestIsPersistableExecution:
+    """is_persistable_execution のテストケース"""
+
+    def test_requires_cell_execution_fields(self):
+        """セル実行イベントかつ必須フィールドが揃っている場合のみ対象になるかテスト"""
+        base = dict(
+            eventType="cell_executed",
+            emailAddress="student@example.com",
+            notebookPath="/lesson/01.ipynb",
+            cellId="cell-1",
+        )
+
+        assert is_persistable_execution(EventData(**base))
+        assert not is_persistable_execution(EventData(**{**base, "cellId": None}))
+        assert not is_persistable_execution(
+            EventData(**{**base, "eventType": "notebook_opened"})
+        )
+
+
+def _sql(statement):
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+
+class TestBulkResolveCells:
+    """bulk_resolve_cells のテストケース"""
+
+    def test_upserts_on_unique_cell_index(self):
+        """SELECTせずに (notebook_id, cell_id) の ON CONFLICT で作成・取得するかテスト"""
+        db = MagicMock()
+        db.execute.return_value = [
+            SimpleNamespace(id=7, notebook_id=1, cell_id="a"),
+            SimpleNamespace(id=8, notebook_id=1, cell_id="b"),
+        ]
+        cells = {
+            (1, "b"): EventData(eventType="cell_executed", cellId="b", code="x = 1"),
+            (1, "a"): EventData(eventType="cell_executed", cellId="a"),
+        }
+
+        assert bulk_resolve_cells(db, cells) == {(1, "a"): 7, (1, "b"): 8}
+        db.execute.assert_called_once()
+        sql = _sql(db.execute.call_args.args[0])
+        assert "ON CONFLICT (notebook_id, cell_id) DO UPDATE" in sql
+        assert "RETURNING cells.id, cells.notebook_id, cells.cell_id" in sql
+
+
+class TestBulkResolveActiveSessions:
+    """bulk_resolve_active_sessions のテストケース"""
+
+    @patch("crud.crud_ingest.record_session_starts")
+    def test_reselects_sessions_created_concurrently(self, mock_record_starts):
+        """ON CONFLICT DO NOTHING で作成できなかった学生は再SELECTで解決するかテスト"""
+        started = object()
+        db = MagicMock()
+        db.execute.side_effect = [
+            MagicMock(
+                all=MagicMock(return_value=[SimpleNamespace(student_id=1, id=10)])
+            ),
+            [SimpleNamespace(id=20, student_id=2, start_time=started)],
+            MagicMock(
+                all=MagicMock(return_value=[SimpleNamespace(student_id=3, id=30)])
+            ),
+        ]
+
+        assert bulk_resolve_active_sessions(db, [3, 1, 2]) == {1: 10, 2: 20, 3: 30}
+        insert_sql = _sql(db.execute.call_args_list[1].args[0])
+        assert (
+            "ON CONFLICT (student_id) WHERE is_active = true AND end_time IS NULL"
+            in insert_sql
+        )
+        assert "DO NOTHING" in insert_sql
+        mock_record_starts.assert_called_once_with(db, {2: started})
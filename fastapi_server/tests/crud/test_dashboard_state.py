@@ -0,0 +1,90 @@
+"""
+学生ごとのダッシュボード集計のテスト
+
+セル実行の差分の集計、差分を反映するUPSERT文、
+有意な連続エラーのセルの概要形式への変換をテストします。
+"""
+
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+from sqlalchemy.dialects import postgresql
+
+from crud.crud_dashboard_state import (
+    MAX_ERROR_CELLS,
+    StudentStateDelta,
+    apply_state_deltas,
+    summarize_error_cells,
+)
+
+
+class TestStudentDashboardState:
+    """ダッシュボード集計のテストケース"""
+
+    def test_delta_accumulates_executions_in_order(self):
+        """実行回数・エラー回数・最後のノートブックと有意なエラーのセルを集計するかテスト"""
+        at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        delta = StudentStateDelta()
+
+        delta.add_execution("/a.ipynb", at, True, 7, 3, True)
+        delta.add_execution("/b.ipynb", at + timedelta(seconds=1), False, 8, 0, False)
+
+        assert delta.cell_executions == 2
+        assert delta.error_count == 1
+        assert delta.last_notebook_path == "/b.ipynb"
+        assert delta.last_activity_at == at + timedelta(seconds=1)
+        assert delta.significant_error_cells == {
+            "7": {"consecutive_count": 3, "last_error_time": at.isoformat()}
+        }
+
+    def test_apply_state_deltas_issues_single_upsert(self):
+        """複数学生の差分を加算・セルのマージを行う1回のUPSERTで反映するかテスト"""
+        db = MagicMock()
+        at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        first, second = StudentStateDelta(), StudentStateDelta()
+        first.add_execution("/a.ipynb", at, True, 7, 3, True)
+        second.add_execution("/b.ipynb", at, False, 8, 0, False)
+
+        apply_state_deltas(db, {2: second, 1: first})
+
+        db.execute.assert_called_once()
+        sql = str(db.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+        assert "ON CONFLICT (student_id) DO UPDATE" in sql
+        assert (
+            "student_dashboard_state.cell_executions + excluded.cell_executions" in sql
+        )
+        assert (
+            "student_dashboard_state.significant_error_cells || excluded.significant_error_cells"
+            in sql
+        )
+
+    def test_apply_state_deltas_skips_empty(self):
+        """差分がない場合はSQLを実行しないかテスト"""
+        db = MagicMock()
+
+        apply_state_deltas(db, {})
+
+        db.execute.assert_not_called()
+
+    def test_summarize_error_cells(self):
+        """有意なエラーのセルを新しい順・上限件数で従来の連続エラー情報の形式に変換するかテスト"""
+        base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        cells = {
+            str(cell_id): {
+                "consecutive_count": cell_id,
+                "last_error_time": (base + timedelta(minutes=cell_id)).isoformat(),
+            }
+            for cell_id in range(3, 3 + MAX_ERROR_CELLS + 2)
+        }
+
+        info = summarize_error_cells(cells)
+
+        assert info["has_significant_error"] is True
+        assert len(info["error_cells"]) == MAX_ERROR_CELLS
+        assert info["error_cells"][0]["cell_id"] == 3 + MAX_ERROR_CELLS + 1
+        assert info["consecutive_count"] == 3 + MAX_ERROR_CELLS + 1
+        assert summarize_error_cells({}) == {
+            "has_significant_error": False,
+            "consecutive_count": 0,
+            "error_cells": [],
+        }
@@ -0,0 +1,102 @@
+"""
+ダッシュボード状態のバージョンのテスト
+
+DashboardVersionIndex のカーソル以降の変更の取得（差分を返せない場合の判定）、
+バージョンの採番、各バージョンで返したメトリクスの保存をテストします。
+"""
+
+import json
+from unittest.mock import MagicMock
+
+import redis
+
+from crud.crud_dashboard_version import (
+    DASHBOARD_CHANGES_KEY,
+    DASHBOARD_VERSION_FLOOR_KEY,
+    DASHBOARD_VERSION_KEY,
+    DashboardVersionIndex,
+    dashboard_metrics_key,
+)
+
+
+def _index(results, bump_version=1):
+    """パイプラインの実行結果として results を返すRedisモック付きのインデックス"""
+    index = DashboardVersionIndex()
+    client = MagicMock()
+    client.pipeline.return_value.execute.return_value = results
+    index._redis = client
+    index._bump_script = MagicMock(return_value=bump_version)
+    return index, client
+
+
+class TestDashboardVersionIndex:
+    """DashboardVersionIndexクラスのテストケース"""
+
+    def test_returns_students_changed_after_cursor(self):
+        """カーソルより後に変更された学生IDを返すかテスト"""
+        index, client = _index(["120", "100", ["3", "7"], None])
+
+        changes = index.get_changes(110)
+
+        assert changes.version == 120
+        assert changes.student_ids == [3, 7]
+        assert changes.metrics is None
+        client.pipeline.return_value.zrangebyscore.assert_called_once_with(
+            DASHBOARD_CHANGES_KEY, "(110", "+inf"
+        )
+
+    def test_requires_full_response_for_unknown_cursor(self):
+        """カーソルがない・採番の再開より古い・現在より新しい場合は全件とするかテスト"""
+        index, _ = _index(["120", "100"])
+        assert index.get_changes(None).student_ids is None
+
+        for since in (50, 130):
+            index, _ = _index(["120", "100", [], None])
+            changes = index.get_changes(since)
+            assert changes.version == 120
+            assert changes.student_ids is None
+
+    def test_seeds_version_on_cold_start(self):
+        """バージョンがない場合は採番を開始して全件とするかテスト"""
+        index, _ = _index([None, None, [], None], bump_version=1700000000001)
+
+        changes = index.get_changes(5)
+
+        assert changes.version == 1700000000001
+        assert changes.student_ids is None
+        assert index._bump_script.call_args.kwargs["keys"] == [
+            DASHBOARD_VERSION_KEY,
+            DASHBOARD_VERSION_FLOOR_KEY,
+            DASHBOARD_CHANGES_KEY,
+        ]
+
+    def test_metrics_snapshot_is_shared_through_redis(self):
+        """バージョンで返したメトリクスを保存し、カーソルの差分取得時に返すかテスト"""
+        index, client = _index([])
+        index.remember_metrics(110, {"totalActive": 3})
+
+        key, value = client.set.call_args.args
+        assert key == dashboard_metrics_key(110)
+        assert json.loads(value) == {"totalActive": 3}
+        assert client.set.call_args.kwargs["ex"] > 0
+
+        client.pipeline.return_value.execute.return_value = ["120", "100", ["3"], value]
+        assert index.get_changes(110).metrics == {"totalActive": 3}
+        client.pipeline.return_value.get.assert_called_with(dashboard_metrics_key(110))
+
+    def test_bump_records_unique_students(self):
+        """変更された学生IDを重複なく記録してバージョンを返すかテスト"""
+        index, _ = _index([], bump_version=42)
+
+        assert index.bump([5, 3, 5]) == 42
+        assert index._bump_script.call_args.kwargs["args"][1:] == [3, 5]
+        assert index.bump([]) is None
+        assert index.get_statistics()["bumps"] == 1
+
+    def test_unavailable_when_redis_fails(self):
+        """Redis障害時は None を返し、以降しばらくRedisを使わないかテスト"""
+        index, client = _index([])
+        client.pipeline.return_value.execute.side_effect = redis.ConnectionError("down")
+
+        assert index.get_changes(10) is None
+        assert index._get_redis() is None
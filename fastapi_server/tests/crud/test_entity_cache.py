@@ -0,0 +1,128 @@
+"""
+エンティティID解決キャッシュのテスト
+
+EntityIdCache のLRU上限・TTL・明示的な無効化・ヒット率統計と、
+キャッシュ済みセルの内容変更検出をテストします。
+"""
+
+from unittest.mock import MagicMock, patch
+
+import crud.crud_entity_cache as cache_module
+from crud.crud_entity_cache import CELL, NOTEBOOK, STUDENT, EntityIdCache
+from crud.crud_ingest import _code_hash, _resolve_cells
+from schemas.event import EventData
+
+
+class TestEntityIdCache:
+    """EntityIdCacheクラスのテストケース"""
+
+    def setup_method(self):
+        """各テストメソッド実行前のセットアップ"""
+        self.cache = EntityIdCache(max_entries=2, ttl_seconds=60, use_redis=False)
+
+    def test_get_many_returns_only_hits(self):
+        """登録済みのキーのみが返されるかテスト"""
+        self.cache.set_many(NOTEBOOK, {"/a.ipynb": 1, "/b.ipynb": 2})
+
+        found = self.cache.get_many(NOTEBOOK, ["/a.ipynb", "/c.ipynb"])
+
+        assert found == {"/a.ipynb": 1}
+
+    def test_lru_eviction(self):
+        """上限を超えると最も長く参照されていないキーが破棄されるかテスト"""
+        self.cache.set(NOTEBOOK, "/a.ipynb", 1)
+        self.cache.set(NOTEBOOK, "/b.ipynb", 2)
+        self.cache.get(NOTEBOOK, "/a.ipynb")
+        self.cache.set(NOTEBOOK, "/c.ipynb", 3)
+
+        assert self.cache.get(NOTEBOOK, "/a.ipynb") == 1
+        assert self.cache.get(NOTEBOOK, "/b.ipynb") is None
+        assert self.cache.get(NOTEBOOK, "/c.ipynb") == 3
+
+    def test_ttl_expiry(self):
+        """TTLを過ぎたエントリはヒットしないかテスト"""
+        with patch.object(cache_module.time, "monotonic", return_value=100.0):
+            self.cache.set(STUDENT, "student@example.com", (1, True))
+        with patch.object(cache_module.time, "monotonic", return_value=161.0):
+            assert self.cache.get(STUDENT, "student@example.com") is None
+
+    def test_invalidate(self):
+        """明示的に無効化したキーがヒットしなくなるかテスト"""
+        self.cache.set(CELL, (1, "cell-1"), (10, None))
+
+        self.cache.invalidate(CELL, [(1, "cell-1")])
+
+        assert self.cache.get(CELL, (1, "cell-1")) is None
+
+    def test_hit_rate_statistics(self):
+        """名前空間ごとにヒット・ミス数とヒット率が記録されるかテスト"""
+        self.cache.set(NOTEBOOK, "/a.ipynb", 1)
+        self.cache.get_many(NOTEBOOK, ["/a.ipynb", "/b.ipynb"])
+        self.cache.get(NOTEBOOK, "/a.ipynb")
+
+        stats = self.cache.get_statistics()[NOTEBOOK]
+
+        assert stats["local_hits"] == 2
+        assert stats["misses"] == 1
+        assert stats["entries"] == 1
+        assert stats["hit_rate"] == round(2 / 3, 4)
+
+    def test_redis_tier_fills_local_cache(self):
+        """Redisでヒットした値がタプルに復元され、プロセス内キャッシュに登録されるかテスト"""
+        cache = EntityIdCache(max_entries=10, ttl_seconds=60, use_redis=True)
+        client = MagicMock()
+        client.mget.return_value = ["[7, true]"]
+        cache._redis = client
+
+        assert cache.get(STUDENT, "student@example.com") == (7, True)
+        assert cache.get(STUDENT, "student@example.com") == (7, True)
+
+        client.mget.assert_called_once()
+        stats = cache.get_statistics()[STUDENT]
+        assert stats["redis_hits"] == 1
+        assert stats["local_hits"] == 1
+
+
+class TestResolveCells:
+    """_resolve_cells のテストケース"""
+
+    def _event(self, code):
+        return EventData(
+            eventType="cell_executed",
+            emailAddress="student@example.com",
+            notebookPath="/a.ipynb",
+            cellId="cell-1",
+            code=code,
+        )
+
+    @patch("crud.crud_ingest.bulk_resolve_cells")
+    def test_cached_cell_updates_changed_content(self, mock_resolve):
+        """キャッシュ済みセルのコードが変わった場合はID指定で内容のみ更新するかテスト"""
+        cache = EntityIdCache(max_entries=10, ttl_seconds=60, use_redis=False)
+        cache.set(CELL, (1, "cell-1"), (10, _code_hash("print(1)")))
+        db = MagicMock()
+        updates = {}
+
+        with patch("crud.crud_ingest.entity_id_cache", cache):
+            resolved = _resolve_cells(
+                db, {(1, "cell-1"): self._event("print(2)")}, updates
+            )
+
+        assert resolved == {(1, "cell-1"): 10}
+        mock_resolve.assert_not_called()
+        db.execute.assert_called_once()
+        assert updates[CELL] == {(1, "cell-1"): (10, _code_hash("print(2)"))}
+
+    @patch("crud.crud_ingest.bulk_resolve_cells")
+    def test_unchanged_cached_cell_skips_db(self, mock_resolve):
+        """キャッシュ済みセルの内容が同じ場合はDBに問い合わせないかテスト"""
+        cache = EntityIdCache(max_entries=10, ttl_seconds=60, use_redis=False)
+        cache.set(CELL, (1, "cell-1"), (10, _code_hash("print(1)")))
+        db = MagicMock()
+
+        with patch("crud.crud_ingest.entity_id_cache", cache):
+            resolved = _resolve_cells(db, {(1, "cell-1"): self._event("print(1)")}, {})
+
+        assert resolved == {(1, "cell-1"): 10}
+        mock_resolve.assert_not_called()
+        db.execute.assert_not_called()
@@ -0,0 +1,109 @@
+"""
+連続エラー状態管理のテスト
+
+ConsecutiveErrorTracker の実行結果の適用・実行履歴からの再構築・Redis障害時の動作と、
+設定値のプロセス内キャッシュをテストします。
+"""
+
+from unittest.mock import MagicMock, patch
+
+import redis
+
+from crud import crud_settings
+from crud.crud_error_state import ConsecutiveErrorTracker
+
+
+def _tracker(*script_results):
+    """連続エラー状態を適用するLuaスクリプトの実行結果として script_results を順に返すトラッカー"""
+    tracker = ConsecutiveErrorTracker(ttl_seconds=60, use_redis=True)
+    client = MagicMock()
+    tracker._redis = client
+    tracker._advance_script = MagicMock(side_effect=list(script_results))
+    return tracker, client
+
+
+class TestConsecutiveErrorTracker:
+    """ConsecutiveErrorTrackerクラスのテストケース"""
+
+    @patch("crud.crud_ingest.get_consecutive_error_baselines")
+    def test_applies_outcomes_in_one_script(self, mock_baselines):
+        """実行結果を1回のスクリプトで順に適用し、実行履歴を参照しないかテスト"""
+        tracker, _ = _tracker(["3,0,1", "1"])
+
+        counts = tracker.advance(
+            MagicMock(), {(1, 10): [True, False, True], (2, 20): [True]}
+        )
+
+        assert counts == {(1, 10): [3, 0, 1], (2, 20): [1]}
+        mock_baselines.assert_not_called()
+        call = tracker._advance_script.call_args
+        assert call.kwargs["keys"] == ["error_state:1", "error_state:2"]
+        assert call.kwargs["args"] == [60, 10, "ESE", "", 20, "E", ""]
+        assert tracker.get_statistics()["state_hits"] == 2
+
+    @patch("crud.crud_ingest.get_consecutive_error_baselines")
+    def test_rebuilds_missing_state_from_history(self, mock_baselines):
+        """状態がなくエラーから始まるペアのみ実行履歴の基準値で再適用するかテスト"""
+        mock_baselines.return_value = {(2, 20): 1}
+        tracker, _ = _tracker(["0", ""], ["2,3"])
+        db = MagicMock()
+
+        counts = tracker.advance(db, {(1, 10): [False], (2, 20): [True, True]})
+
+        assert counts == {(1, 10): [0], (2, 20): [2, 3]}
+        mock_baselines.assert_called_once_with(db, {(2, 20)})
+        retry = tracker._advance_script.call_args
+        assert retry.kwargs["keys"] == ["error_state:2"]
+        assert retry.kwargs["args"] == [60, 20, "EE", 1]
+        assert tracker.get_statistics()["rebuilt"] == 1
+
+    @patch("crud.crud_ingest.get_consecutive_error_baselines")
+    def test_falls_back_to_history_when_redis_fails(self, mock_baselines):
+        """Redis障害時は状態を破棄して実行履歴から計算し、以降しばらくRedisを使わないかテスト"""
+        mock_baselines.return_value = {(1, 10): 3}
+        tracker, client = _tracker(redis.ConnectionError("down"))
+
+        counts = tracker.advance(
+            MagicMock(), {(1, 10): [True, False], (1, 11): [False]}
+        )
+
+        assert counts == {(1, 10): [4, 0], (1, 11): [0]}
+        client.delete.assert_called_once_with("error_state:1")
+        assert tracker._get_redis() is None
+
+    def test_clear_student(self):
+        """エラー解除時に学生の全セルの回数を消して解除マーカーを残すかテスト"""
+        tracker, client = _tracker([])
+        pipe = client.pipeline.return_value
+
+        tracker.clear_student(1)
+
+        pipe.delete.assert_called_once_with("error_state:1")
+        pipe.hset.assert_called_once_with("error_state:1", "reset", 1)
+        pipe.expire.assert_called_once_with("error_state:1", 60)
+        pipe.execute.assert_called_once()
+        client.delete.assert_not_called()
+
+
+class TestCachedSettingValue:
+    """get_cached_setting_value のテストケース"""
+
+    def setup_method(self):
+        """各テストメソッド実行前のセットアップ"""
+        crud_settings._local_settings_cache.clear()
+
+    @patch("crud.crud_settings.get_setting_value")
+    def test_caches_value_in_process(self, mock_get):
+        """有効期間内はRedis・DBに問い合わせないかテスト"""
+        mock_get.return_value = 5
+        db = MagicMock()
+
+        first = crud_settings.get_cached_setting_value(
+            db, "consecutive_error_threshold", 3
+        )
+        second = crud_settings.get_cached_setting_value(
+            db, "consecutive_error_threshold", 3
+        )
+
+        assert first == second == 5
+        mock_get.assert_called_once()
@@ -0,0 +1,101 @@
+"""
+ヘルプ要求状態インデックスのテスト
+
+HelpStateIndex のクラス全体のヘルプ状態の取得（有効期間の判定）と、
+インデックスがない場合・Redis障害時のInfluxDBからの再構築をテストします。
+"""
+
+import time
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import redis
+
+from crud.crud_help_state import HELP, HELP_STOP, HELP_STATE_KEY, HelpStateIndex
+
+
+def _index(ready, entries):
+    """パイプラインの実行結果として (ready, entries) を返すRedisモック付きのインデックス"""
+    index = HelpStateIndex(active_seconds=300)
+    client = MagicMock()
+    client.pipeline.return_value.execute.return_value = [ready, entries]
+    index._redis = client
+    index._record_script = MagicMock(return_value=1)
+    return index, client
+
+
+def _influx_record(email, event, at):
+    record = MagicMock()
+    record.values = {"emailAddress": email, "event": event}
+    record.get_time.return_value = at
+    return record
+
+
+class TestHelpStateIndex:
+    """HelpStateIndexクラスのテストケース"""
+
+    @patch("db.influxdb_client.query_progress_data")
+    def test_reads_whole_class_from_index(self, mock_query):
+        """インデックスから全学生のヘルプ状態を1回で取得し、期限切れのヘルプは無効とするかテスト"""
+        now = time.time()
+        index, client = _index(
+            1,
+            {
+                "a@example.com": f"{HELP}|{now - 10}",
+                "b@example.com": f"{HELP_STOP}|{now - 5}",
+                "c@example.com": f"{HELP}|{now - 600}",
+            },
+        )
+
+        states = index.get_help_states()
+
+        assert states == {
+            "a@example.com": True,
+            "b@example.com": False,
+            "c@example.com": False,
+        }
+        mock_query.assert_not_called()
+        client.hdel.assert_called_once_with(HELP_STATE_KEY, "c@example.com")
+
+    @patch("db.influxdb_client.query_progress_data")
+    def test_backfills_from_influx_on_cold_start(self, mock_query):
+        """インデックスが未構築の場合はInfluxDBの1回のクエリから再構築するかテスト"""
+        recent = datetime.now(timezone.utc)
+        mock_query.return_value = [
+            [
+                _influx_record("a@example.com", HELP, recent),
+                _influx_record("b@example.com", HELP_STOP, recent),
+            ]
+        ]
+        index, client = _index(0, {})
+
+        states = index.get_help_states()
+
+        assert states == {"a@example.com": True, "b@example.com": False}
+        mock_query.assert_called_once()
+        assert index._record_script.call_count == 2
+        client.set.assert_called_once()
+        assert index.get_statistics()["backfills"] == 1
+
+    @patch("db.influxdb_client.query_progress_data")
+    def test_falls_back_to_influx_when_redis_fails(self, mock_query):
+        """Redis障害時はInfluxDBの結果を使い、以降しばらくRedisを使わないかテスト"""
+        mock_query.return_value = [
+            [_influx_record("a@example.com", HELP, datetime.now(timezone.utc))]
+        ]
+        index, client = _index(1, {})
+        client.pipeline.return_value.execute.side_effect = redis.ConnectionError("down")
+
+        assert index.get_help_states() == {"a@example.com": True}
+        assert index._get_redis() is None
+
+    def test_record_passes_event_time(self):
+        """イベント時刻がUNIX秒として記録スクリプトに渡されるかテスト"""
+        index, _ = _index(1, {})
+
+        index.record("a@example.com", HELP, "2024-01-01T00:00:00Z")
+
+        index._record_script.assert_called_once_with(
+            keys=[HELP_STATE_KEY], args=["a@example.com", HELP, 1704067200.0]
+        )
+        assert index.get_statistics()["records"] == 1
@@ -0,0 +1,60 @@
+"""
+eventId重複排除テスト
+
+SET NX EX による取り込み済みeventIdの判定と、Redis障害時のフェイルオープンをテストします。
+"""
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import db.redis_client as redis_client_module
+from db.redis_client import EVENT_DEDUP_KEY_PREFIX, claim_event_ids
+
+
+def _make_client(execute_result=None, execute_side_effect=None):
+    """パイプラインを返すモックRedisクライアントを作成"""
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(
+        return_value=execute_result, side_effect=execute_side_effect
+    )
+    client = MagicMock()
+    client.pipeline.return_value = pipe
+    return client, pipe
+
+
+class TestClaimEventIds:
+    """claim_event_ids のテストケース"""
+
+    def setup_method(self):
+        """サーキットブレーカー状態をリセット"""
+        redis_client_module._circuit_breaker_state.update(
+            {"failure_count": 0, "last_failure_time": 0, "is_open": False}
+        )
+
+    @pytest.mark.asyncio
+    async def test_existing_keys_are_reported_as_duplicates(self):
+        """SET NX が None を返したeventIdが重複と判定されるかテスト"""
+        client, pipe = _make_client(execute_result=[True, None, True])
+
+        with patch.object(
+            redis_client_module, "get_redis_client", AsyncMock(return_value=client)
+        ):
+            results = await claim_event_ids(["e1", "e2", "e3"], ttl_seconds=600)
+
+        assert results == [True, False, True]
+        pipe.set.assert_any_call(f"{EVENT_DEDUP_KEY_PREFIX}e1", 1, nx=True, ex=600)
+        assert pipe.set.call_count == 3
+
+    @pytest.mark.asyncio
+    async def test_redis_failure_fails_open(self):
+        """Redis障害時は全イベントを初回扱いにするかテスト"""
+        client, _ = _make_client(execute_side_effect=Exception("down"))
+
+        with patch.object(
+            redis_client_module, "get_redis_client", AsyncMock(return_value=client)
+        ):
+            results = await claim_event_ids(
+                ["e1", "e2"], ttl_seconds=600, max_retries=1
+            )
+
+        assert results == [True, True]
@@ -0,0 +1,114 @@
+"""
+同期I/O用スレッドプールテスト
+
+BlockingIOExecutor がイベントループ外のスレッドで同期関数を実行し、
+同時実行数の上限と実行統計を管理すること、同期Redis処理がDB用とは別のプールで
+実行されることをテストします。
+"""
+
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from core.dependency_latency import POSTGRES, REDIS
+from db.executor import BlockingIOExecutor, db_executor, redis_executor, run_redis
+
+
+class TestBlockingIOExecutor:
+    """BlockingIOExecutorクラスのテストケース"""
+
+    def setup_method(self):
+        """各テストメソッド実行前のセットアップ"""
+        self.executor = BlockingIOExecutor(max_workers=2, name="test")
+
+    def teardown_method(self):
+        """各テストメソッド実行後のクリーンアップ"""
+        self.executor.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_runs_in_worker_thread(self):
+        """同期関数が専用スレッドで実行され、引数と戻り値が受け渡されるかテスト"""
+        result = await self.executor.run(
+            lambda a, b=0: (threading.current_thread().name, a + b), 1, b=2
+        )
+
+        thread_name, value = result
+        assert thread_name.startswith("test-io")
+        assert value == 3
+
+    @pytest.mark.asyncio
+    async def test_does_not_block_event_loop(self):
+        """同期処理の実行中もイベントループが他のコルーチンを実行できるかテスト"""
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        ticker_task = asyncio.create_task(ticker())
+        await self.executor.run(time.sleep, 0.1)
+        ticker_task.cancel()
+
+        assert ticks >= 5
+
+    @pytest.mark.asyncio
+    async def test_bounds_concurrency(self):
+        """同時実行数が max_workers を超えないかテスト"""
+        running = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def work():
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.02)
+            with lock:
+                running -= 1
+
+        await asyncio.gather(*(self.executor.run(work) for _ in range(6)))
+
+        assert peak == 2
+        assert self.executor.get_statistics()["completed"] == 6
+
+    @pytest.mark.asyncio
+    async def test_propagates_exceptions(self):
+        """例外が呼び出し側に伝播し、失敗数が記録されるかテスト"""
+
+        def fail():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            await self.executor.run(fail)
+
+        stats = self.executor.get_statistics()
+        assert stats["failed"] == 1
+        assert stats["in_flight"] == 0
+
+
+class TestRedisExecutor:
+    """同期Redis処理用スレッドプールのテストケース"""
+
+    def teardown_method(self):
+        """各テストメソッド実行後のクリーンアップ"""
+        redis_executor.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_runs_outside_db_pool(self):
+        """DB用スレッドプールの枠とPostgreSQLのレイテンシを使わずに実行されるかテスト"""
+        db_completed = db_executor.stats["completed"]
+
+        with patch("db.executor.dependency_latency") as mock_latency:
+            thread_name = await run_redis(lambda: threading.current_thread().name)
+
+        assert thread_name.startswith("redis-io")
+        assert db_executor.stats["completed"] == db_completed
+        dependencies = [call.args[0] for call in mock_latency.observe.call_args_list]
+        assert dependencies == [REDIS]
+        assert POSTGRES not in dependencies
@@ -0,0 +1,104 @@
+"""
+Redisパイプライン一括発行テスト
+
+チャンク全体が1つのパイプラインで送信され、イベント単位の結果が返り、
+サーキットブレーカーがバッチ単位で1回だけ更新されることをテストします。
+"""
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import db.redis_client as redis_client_module
+from db.redis_client import (
+    PROGRESS_CHANNEL,
+    PROGRESS_PUBLISHED_KEY,
+    safe_redis_publish_batch,
+    safe_redis_xadd_batch,
+)
+
+
+def _make_client(execute_result=None, execute_side_effect=None):
+    """パイプラインを返すモックRedisクライアントを作成"""
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(
+        return_value=execute_result, side_effect=execute_side_effect
+    )
+    client = MagicMock()
+    client.pipeline.return_value = pipe
+    return client, pipe
+
+
+class TestRedisBatchPublish:
+    """safe_redis_publish_batch / safe_redis_xadd_batch のテストケース"""
+
+    def setup_method(self):
+        """サーキットブレーカー状態をリセット"""
+        redis_client_module._circuit_breaker_state.update(
+            {"failure_count": 0, "last_failure_time": 0, "is_open": False}
+        )
+
+    @pytest.mark.asyncio
+    async def test_publish_batch_uses_single_pipeline(self):
+        """全メッセージが1つのパイプラインで送信されるかテスト"""
+        client, pipe = _make_client(execute_result=[1, 1, 1])
+
+        with patch.object(
+            redis_client_module, "get_redis_client", AsyncMock(return_value=client)
+        ):
+            results = await safe_redis_publish_batch(PROGRESS_CHANNEL, ["a", "b", "c"])
+
+        assert results == [True, True, True]
+        client.pipeline.assert_called_once_with(transaction=False)
+        assert pipe.publish.call_count == 3
+        pipe.execute.assert_awaited_once_with(raise_on_error=False)
+
+    @pytest.mark.asyncio
+    async def test_publish_batch_counts_published_messages(self):
+        """発行数のカウンターを同じパイプラインで加算し、結果にはメッセージ分のみを返すかテスト"""
+        client, pipe = _make_client(execute_result=[1, 1, 2])
+
+        with patch.object(
+            redis_client_module, "get_redis_client", AsyncMock(return_value=client)
+        ):
+            results = await safe_redis_publish_batch(
+                PROGRESS_CHANNEL, ["a", "b"], counter_key=PROGRESS_PUBLISHED_KEY
+            )
+
+        assert results == [True, True]
+        pipe.incrby.assert_called_once_with(PROGRESS_PUBLISHED_KEY, 2)
+
+    @pytest.mark.asyncio
+    async def test_publish_batch_reports_per_event_results(self):
+        """コマンド単位のエラーがイベント単位の結果に反映されるかテスト"""
+        client, _ = _make_client(execute_result=[1, Exception("boom"), 0])
+
+        with patch.object(
+            redis_client_module, "get_redis_client", AsyncMock(return_value=client)
+        ):
+            results = await safe_redis_publish_batch(PROGRESS_CHANNEL, ["a", "b", "c"])
+
+        assert results == [True, False, True]
+        assert redis_client_module._circuit_breaker_state["failure_count"] == 0
+
+    @pytest.mark.asyncio
+    async def test_publish_batch_connection_failure_counts_once(self):
+        """パイプライン全体の失敗はバッチ単位で1回だけブレーカーに記録されるかテスト"""
+        client, _ = _make_client(execute_side_effect=Exception("down"))
+
+        with patch.object(
+            redis_client_module, "get_redis_client", AsyncMock(return_value=client)
+        ):
+            results = await safe_redis_publish_batch(
+                PROGRESS_CHANNEL, ["a", "b", "c"], max_retries=1
+            )
+
+        assert results == [False, False, False]
+        assert redis_client_module._circuit_breaker_state["failure_count"] == 1
+
+    @pytest.mark.asyncio
+    async def test_xadd_batch_empty(self):
+        """空リストの場合はRedisに接続しないかテスト"""
+        mock_get_client = AsyncMock()
+        with patch.object(redis_client_module, "get_redis_client", mock_get_client):
+            assert await safe_redis_xadd_batch([]) == []
+        mock_get_client.assert_not_called()
@@ -13,7 +13,7 @@ from sqlalchemy.orm import Session
 from fastapi.testclient import TestClient
 
 from db import redis_client
-from worker.event_router import event_router
+from worker.event_router import EventResult, event_router
 from schemas.progress import StudentProgress
 from main import app
 
@@ -61,7 +61,7 @@ class TestEventProcessingIntegration:
     @patch("worker.event_router.crud_notebook.get_or_create_cell")
     @patch("worker.event_router.crud_notebook.get_or_create_notebook")
     @patch("worker.event_router.crud_student.get_or_create_student")
-    @patch("worker.event_router.write_progress_event", new_callable=AsyncMock)
+    @patch("worker.event_router.batch_writer.add_progress_point", new_callable=AsyncMock)
     async def test_cell_execution_event_full_flow(
         self,
         mock_write_progress,
@@ -94,7 +94,7 @@ class TestEventProcessingIntegration:
         result = await event_router.route_event(event_data, mock_db_session)
 
         # 検証
-        assert result is True
+        assert result is EventResult.OK
         mock_get_student.assert_called_once_with(mock_db_session, user_id="test_user")
         mock_write_progress.assert_called_once()
 
@@ -106,7 +106,7 @@ class TestEventProcessingIntegration:
         assert progress_data.cellId == "cell123"
 
     @pytest.mark.asyncio
-    @patch("worker.event_router.write_progress_event")
+    @patch("worker.event_router.batch_writer.add_progress_point", new_callable=AsyncMock)
     async def test_api_to_redis_integration(
         self, mock_write_progress, test_client, mock_redis
     ):
@@ -166,7 +166,7 @@ class TestErrorHandlingIntegration:
 
     @pytest.mark.asyncio
     @patch("worker.event_router.crud_student.get_or_create_student")
-    @patch("worker.event_router.write_progress_event")
+    @patch("worker.event_router.batch_writer.add_progress_point", new_callable=AsyncMock)
     @patch("db.redis_client.get_redis_client")
     async def test_error_logging_and_reporting(
         self, mock_get_redis, mock_write_progress, mock_get_student, mock_db_session
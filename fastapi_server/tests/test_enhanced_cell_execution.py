@@ -12,7 +12,7 @@ from datetime import datetime
 from db.session import SessionLocal
 from db.models import CellExecution, Student, Notebook, Cell, Session as DBSession, SystemSetting
 from schemas.event import EventData
-from crud.crud_execution import create_cell_execution
+from crud.crud_execution import create_cell_execution, resolve_consecutive_errors
 
 
 class TestEnhancedCellExecution:
@@ -219,6 +219,46 @@ class TestEnhancedCellExecution:
         assert new_error_execution.consecutive_error_count == 1
         assert new_error_execution.is_significant_error is False
 
+    def test_error_after_resolve_starts_new_count(self, db: Session):
+        """エラー解除後の最初のエラーは解除前のエラーを数えず、有意にならないことをテスト"""
+        # Given: テストデータ
+        student = Student(email=f"test_{uuid.uuid4().hex[:8]}@example.com", name="Test Student")
+        unique_id = uuid.uuid4().hex[:8]
+        notebook = Notebook(path=f"/test/notebook_{unique_id}.ipynb", name=f"notebook_{unique_id}")
+        cell = Cell(notebook_id=1, cell_id="cell-1", cell_type="code")
+        session = DBSession(student_id=1)
+        
+        db.add_all([student, notebook, cell, session])
+        db.commit()
+        
+        error_event = EventData(
+            eventType="cell_execution",
+            emailAddress="test@example.com",
+            notebookPath="/test/notebook.ipynb",
+            cellId="cell-1",
+            hasError=True,
+            errorMessage="Test error",
+            code="raise Exception('test')",
+            executionCount=1
+        )
+        
+        # When: 3回連続エラーで有意になった後にエラーを解除し、再度エラー
+        for _ in range(3):
+            execution = create_cell_execution(
+                db, error_event, student.id, notebook.id, cell.id, session.id
+            )
+        assert execution.is_significant_error is True
+        
+        assert resolve_consecutive_errors(db, student.id) is True
+        
+        new_error_execution = create_cell_execution(
+            db, error_event, student.id, notebook.id, cell.id, session.id
+        )
+        
+        # Then: 解除後のエラーは1からカウントされ、有意ではない
+        assert new_error_execution.consecutive_error_count == 1
+        assert new_error_execution.is_significant_error is False
+
 
 # Pytest fixtures
 @pytest.fixture
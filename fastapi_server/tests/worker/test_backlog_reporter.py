@@ -0,0 +1,78 @@
+"""
+ワーカー処理待ち件数レポーターテスト
+
+既定の Pub/Sub モードで、購読開始以降に発行され処理を終えていないイベント数が
+処理待ち件数として報告され、取り込みの流量制御に反映されることをテストします。
+"""
+
+import json
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from core.admission_control import IngestAdmissionController
+from db.redis_client import PROGRESS_PUBLISHED_KEY, WORKER_BACKLOG_KEY
+from worker.backlog_reporter import BacklogReporter, PubSubBacklog
+
+
+def _redis(published):
+    """発行数カウンターの値を順に返すRedisモック"""
+    client = MagicMock()
+    client.get = AsyncMock(side_effect=[str(value) for value in published])
+    client.hset = AsyncMock()
+    client.expire = AsyncMock()
+    return client
+
+
+class TestPubSubBacklog:
+    """PubSubBacklogクラスのテストケース"""
+
+    @pytest.mark.asyncio
+    async def test_counts_published_but_unfinished_events(self):
+        """購読開始後の発行数から処理を終えた件数を引いた値を返すかテスト"""
+        client = _redis([1000, 1600, 1600])
+        backlog = PubSubBacklog(client)
+
+        assert await backlog.backlog() is None
+        await backlog.start()
+        backlog.mark_finished(100)
+
+        assert await backlog.backlog() == 500
+        client.get.assert_called_with(PROGRESS_PUBLISHED_KEY)
+        backlog.mark_finished(600)
+        assert await backlog.backlog() == 0
+
+    @pytest.mark.asyncio
+    async def test_restarts_count_when_counter_is_reset(self):
+        """カウンターが購読開始時より小さくなった場合は現在値から数え直すかテスト"""
+        backlog = PubSubBacklog(_redis([1000, 20, 50]))
+        await backlog.start()
+        backlog.mark_finished(10)
+
+        assert await backlog.backlog() == 0
+        assert await backlog.backlog() == 30
+
+
+class TestBacklogReporter:
+    """BacklogReporterクラスのテストケース"""
+
+    @pytest.mark.asyncio
+    async def test_default_pubsub_mode_reports_backlog_for_admission(self):
+        """Pub/Subモード（ストリームなし）の処理待ち件数が流量制御の上限判定に使われるかテスト"""
+        client = _redis([0, 6000])
+        backlog = PubSubBacklog(client)
+        await backlog.start()
+        reporter = BacklogReporter(client, pubsub_backlog=backlog)
+
+        report = await reporter.report_once()
+
+        assert report["pubsub_backlog"] == 6000
+        assert report["stream_backlog"] is None
+        key, worker, raw = client.hset.call_args.args
+        assert key == WORKER_BACKLOG_KEY
+        controller = IngestAdmissionController(backlog_limit=5000)
+        total = controller.aggregate_reports(
+            {worker: raw}, now=json.loads(raw)["updated_at"]
+        )
+        assert total == 6000
+        assert not controller.evaluate(total).admitted
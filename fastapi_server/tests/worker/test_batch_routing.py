@@ -0,0 +1,256 @@
+"""
+ワーカーのマイクロバッチ処理テスト
+
+EventRouter.route_batch のイベントタイプ別グループ化・フォールバックと、
+セル実行イベントのバッチハンドラー（一括永続化・後処理）をテストします。
+"""
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from worker.event_router import (
+    EventResult,
+    EventRouter,
+    handle_cell_execution,
+    handle_cell_execution_batch,
+)
+
+
+def _cell_event(email="student@example.com", cell_id="cell-1", **extra):
+    return {
+        "eventType": "cell_executed",
+        "emailAddress": email,
+        "notebookPath": "/lesson1.ipynb",
+        "cellId": cell_id,
+        **extra,
+    }
+
+
+class TestRouteBatch:
+    """EventRouter.route_batch のテストケース"""
+
+    def setup_method(self):
+        """各テストメソッド実行前のセットアップ"""
+        self.event_router = EventRouter()
+        self.mock_db = MagicMock()
+
+    @pytest.mark.asyncio
+    async def test_groups_events_by_type(self):
+        """バッチ対応タイプはまとめて、それ以外は1件ずつ処理され、結果が入力順に並ぶ（真偽値は処理結果に変換）"""
+        batch_handler = AsyncMock(return_value=[True, False])
+        single_handler = AsyncMock(return_value=True)
+        self.event_router.register_batch_handler("cell_executed", batch_handler)
+        self.event_router.register_handler("help", single_handler)
+
+        events = [
+            _cell_event(cell_id="a"),
+            {"eventType": "help", "emailAddress": "other@example.com"},
+            _cell_event(cell_id="b"),
+        ]
+        results = await self.event_router.route_batch(events, self.mock_db)
+
+        assert results == [EventResult.OK, EventResult.OK, EventResult.RETRY]
+        batch_handler.assert_awaited_once_with([events[0], events[2]], self.mock_db)
+        single_handler.assert_awaited_once_with(events[1], self.mock_db)
+
+    @pytest.mark.asyncio
+    async def test_preserves_order_within_student(self):
+        """同じ学生のイベントタイプが切り替わる場合は、それまでのグループを先に処理する"""
+        calls = []
+
+        async def batch_handler(group, db):
+            calls.append([event["cellId"] for event in group])
+            return [True] * len(group)
+
+        async def help_handler(event_data, db):
+            calls.append(event_data["eventType"])
+            return True
+
+        self.event_router.register_batch_handler("cell_executed", batch_handler)
+        self.event_router.register_handler("help", help_handler)
+
+        events = [
+            _cell_event(cell_id="a"),
+            _cell_event(email="other@example.com", cell_id="x"),
+            {"eventType": "help", "emailAddress": "student@example.com"},
+            _cell_event(cell_id="b"),
+            _cell_event(email="other@example.com", cell_id="y"),
+        ]
+        results = await self.event_router.route_batch(events, self.mock_db)
+
+        assert results == [EventResult.OK] * 5
+        assert calls == [["a", "x"], "help", ["b", "y"]]
+
+    @pytest.mark.asyncio
+    async def test_falls_back_to_single_events_on_batch_error(self):
+        """バッチハンドラーが失敗した場合はロールバックして1件ずつ処理し直す"""
+        batch_handler = AsyncMock(side_effect=RuntimeError("db error"))
+        single_handler = AsyncMock(side_effect=[True, False])
+        self.event_router.register_batch_handler("cell_executed", batch_handler)
+        self.event_router.register_handler("cell_executed", single_handler)
+
+        events = [_cell_event(cell_id="a"), _cell_event(cell_id="b")]
+        results = await self.event_router.route_batch(events, self.mock_db)
+
+        assert results == [EventResult.OK, EventResult.RETRY]
+        self.mock_db.rollback.assert_called_once()
+        assert single_handler.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_missing_event_type_fails(self):
+        """eventType のないイベントは再試行しても成功しない失敗として扱う"""
+        results = await self.event_router.route_batch(
+            [{"emailAddress": "x"}], self.mock_db
+        )
+
+        assert results == [EventResult.PERMANENT]
+
+
+class TestCellExecutionBatchHandler:
+    """handle_cell_execution_batch のテストケース"""
+
+    @pytest.mark.asyncio
+    @patch(
+        "worker.event_router._handle_persisted_cell_execution", new_callable=AsyncMock
+    )
+    @patch("worker.event_router.crud_ingest.persist_event_batch")
+    async def test_persists_pending_events_in_one_call(self, mock_persist, mock_after):
+        """未永続化イベントは1回の一括永続化にまとめ、永続化済みイベントはDBを省略する"""
+        mock_persist.return_value = {
+            "students": 1,
+            "notebooks": 1,
+            "cells": 2,
+            "sessions": 1,
+            "executions": 2,
+            "persisted": {
+                0: {"studentId": 1, "notebookId": 2, "cellId_db": 3},
+                1: {"studentId": 1, "notebookId": 2, "cellId_db": 4},
+            },
+        }
+        mock_after.return_value = EventResult.OK
+        db = MagicMock()
+
+        events = [
+            _cell_event(cell_id="a"),
+            _cell_event(
+                cell_id="b", dbPersisted=True, studentId=1, notebookId=2, cellId_db=5
+            ),
+            _cell_event(cell_id="c"),
+        ]
+        results = await handle_cell_execution_batch(events, db)
+
+        assert results == [EventResult.OK] * 3
+        mock_persist.assert_called_once()
+        persisted_events = mock_persist.call_args.args[1]
+        assert [event.cellId for event in persisted_events] == ["a", "c"]
+
+        # 永続化で解決したIDが後処理に渡される
+        after_data = [call.args[1] for call in mock_after.await_args_list]
+        assert after_data[0]["cellId_db"] == 3
+        assert after_data[1]["cellId_db"] == 5
+        assert after_data[2]["cellId_db"] == 4
+
+    @pytest.mark.asyncio
+    @patch(
+        "worker.event_router._handle_persisted_cell_execution", new_callable=AsyncMock
+    )
+    @patch("worker.event_router.crud_ingest.persist_event_batch")
+    async def test_invalid_events_are_marked_failed(self, mock_persist, mock_after):
+        """必須フィールドが不足したイベントは永続化せず、再試行しても成功しない失敗とする"""
+        mock_persist.return_value = {
+            "students": 1,
+            "notebooks": 1,
+            "cells": 1,
+            "sessions": 1,
+            "executions": 1,
+            "persisted": {0: {"studentId": 1, "notebookId": 2, "cellId_db": 3}},
+        }
+        mock_after.return_value = EventResult.OK
+
+        events = [_cell_event(cell_id=None), _cell_event(cell_id="b")]
+        results = await handle_cell_execution_batch(events, MagicMock())
+
+        assert results == [EventResult.PERMANENT, EventResult.OK]
+        assert len(mock_persist.call_args.args[1]) == 1
+
+    @pytest.mark.asyncio
+    @patch(
+        "worker.event_router._handle_persisted_cell_execution", new_callable=AsyncMock
+    )
+    @patch("worker.event_router.crud_ingest.persist_event_batch")
+    async def test_failed_post_processing_marks_event_persisted(
+        self, mock_persist, mock_after
+    ):
+        """コミット後の後処理に失敗したイベントは永続化済みとしてリトライに回る"""
+        mock_persist.return_value = {
+            "students": 1,
+            "notebooks": 1,
+            "cells": 1,
+            "sessions": 1,
+            "executions": 1,
+            "persisted": {0: {"studentId": 1, "notebookId": 2, "cellId_db": 3}},
+        }
+        mock_after.side_effect = RuntimeError("influx down")
+
+        events = [_cell_event(cell_id="a")]
+        results = await handle_cell_execution_batch(events, MagicMock())
+
+        assert results == [EventResult.RETRY]
+        assert events[0]["dbPersisted"] is True
+        assert events[0]["cellId_db"] == 3
+
+        # リトライでは永続化を繰り返さない
+        mock_after.side_effect = None
+        mock_after.return_value = EventResult.OK
+        results = await handle_cell_execution_batch(events, MagicMock())
+
+        assert results == [EventResult.OK]
+        mock_persist.assert_called_once()
+
+
+class TestCellExecutionHandler:
+    """handle_cell_execution のテストケース"""
+
+    @pytest.mark.asyncio
+    @patch(
+        "worker.event_router._handle_persisted_cell_execution", new_callable=AsyncMock
+    )
+    @patch("worker.event_router.crud_ingest.persist_event_batch")
+    async def test_post_processing_failure_does_not_persist_again(
+        self, mock_persist, mock_after
+    ):
+        """コミット後の後処理の失敗では即時リトライせず、永続化済みとしてマークする"""
+        mock_persist.return_value = {
+            "students": 1,
+            "notebooks": 1,
+            "cells": 1,
+            "sessions": 1,
+            "executions": 1,
+            "persisted": {0: {"studentId": 1, "notebookId": 2, "cellId_db": 3}},
+        }
+        mock_after.side_effect = RuntimeError("influx down")
+
+        event_data = _cell_event(cell_id="a")
+        with pytest.raises(RuntimeError):
+            await handle_cell_execution(event_data, MagicMock())
+
+        mock_persist.assert_called_once()
+        assert event_data["dbPersisted"] is True
+        assert event_data["studentId"] == 1
+
+    @pytest.mark.asyncio
+    @patch("worker.event_router.crud_ingest.persist_event_batch")
+    async def test_unpersisted_event_fails(self, mock_persist):
+        """実行履歴を保存できなかったイベントは遅延リトライ対象の失敗を返す"""
+        mock_persist.return_value = {
+            "students": 0,
+            "notebooks": 0,
+            "cells": 0,
+            "sessions": 0,
+            "executions": 0,
+            "persisted": {},
+        }
+
+        result = await handle_cell_execution(_cell_event(), MagicMock())
+
+        assert result is EventResult.RETRY
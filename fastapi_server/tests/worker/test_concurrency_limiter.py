@@ -0,0 +1,167 @@
+"""
+同時実行数制御テスト
+
+DependencyLatencyTracker のp90計算と、AIMDConcurrencyLimiter の
+目標超過時の乗算的減少・飽和時の加算的増加・実行枠の待機と、
+バッチ処理モードのワーカーがイベント数分の実行枠を取得して処理することをテストします。
+"""
+
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from core.dependency_latency import INFLUX, POSTGRES, DependencyLatencyTracker
+from worker.concurrency_limiter import AIMDConcurrencyLimiter
+from worker.event_router import EventResult
+
+
+def _limiter(tracker, initial_limit=8):
+    return AIMDConcurrencyLimiter(
+        min_limit=2,
+        max_limit=16,
+        initial_limit=initial_limit,
+        targets={POSTGRES: 100.0, INFLUX: 200.0},
+        tracker=tracker,
+    )
+
+
+class TestDependencyLatencyTracker:
+    """DependencyLatencyTrackerクラスのテストケース"""
+
+    def test_snapshot_reports_p90(self):
+        """ウィンドウ内のサンプルから平均とp90が計算されるかテスト"""
+        tracker = DependencyLatencyTracker(window_seconds=60)
+        for latency in range(1, 11):
+            tracker.observe(POSTGRES, latency * 10.0)
+
+        snapshot = tracker.snapshot()[POSTGRES]
+
+        assert snapshot["samples"] == 10
+        assert snapshot["avg_ms"] == 55.0
+        assert snapshot["p90_ms"] == 90.0
+
+
+class TestAIMDConcurrencyLimiter:
+    """AIMDConcurrencyLimiterクラスのテストケース"""
+
+    def setup_method(self):
+        """各テストメソッド実行前のセットアップ"""
+        self.tracker = DependencyLatencyTracker(window_seconds=60)
+
+    @pytest.mark.asyncio
+    async def test_decreases_when_dependency_exceeds_target(self):
+        """目標レイテンシを超えた依存サービスがあると上限を乗算的に減らし、理由を記録するかテスト"""
+        limiter = _limiter(self.tracker)
+        for _ in range(10):
+            self.tracker.observe(POSTGRES, 400.0)
+
+        change = await limiter.adjust()
+
+        assert change["from"] == 8
+        assert change["to"] == 6
+        assert "postgres" in change["reason"]
+        assert limiter.get_statistics()["recent_changes"] == [change]
+
+    @pytest.mark.asyncio
+    async def test_does_not_decrease_again_within_window(self):
+        """減少の効果が計測ウィンドウに反映されるまで続けて減らさないかテスト"""
+        limiter = _limiter(self.tracker)
+        for _ in range(10):
+            self.tracker.observe(INFLUX, 1000.0)
+
+        await limiter.adjust()
+        assert await limiter.adjust() is None
+        assert limiter.current_limit == 6
+
+    @pytest.mark.asyncio
+    async def test_increases_when_saturated_within_target(self):
+        """レイテンシが目標内で上限まで使い切っている場合は1増やすかテスト"""
+        limiter = _limiter(self.tracker, initial_limit=2)
+        for _ in range(10):
+            self.tracker.observe(POSTGRES, 10.0)
+        await limiter.acquire()
+        await limiter.acquire()
+
+        change = await limiter.adjust()
+
+        assert change["to"] == 3
+        assert "saturated" in change["reason"]
+
+    @pytest.mark.asyncio
+    async def test_unchanged_when_not_saturated(self):
+        """上限まで使っていない場合は変更しないかテスト"""
+        limiter = _limiter(self.tracker)
+
+        assert await limiter.adjust() is None
+        assert limiter.current_limit == 8
+
+    @pytest.mark.asyncio
+    async def test_acquire_waits_for_free_slot(self):
+        """上限に達している場合は実行枠が返却されるまで待機するかテスト"""
+        limiter = _limiter(self.tracker, initial_limit=2)
+        await limiter.acquire()
+        await limiter.acquire()
+
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        await limiter.release()
+        await asyncio.wait_for(waiter, timeout=0.1)
+        assert limiter.in_flight == 2
+
+    @pytest.mark.asyncio
+    async def test_batch_acquires_one_slot_per_event(self):
+        """バッチはイベント数分（上限まで）の枠を取得し、上限を超える分は待機するかテスト"""
+        limiter = _limiter(self.tracker, initial_limit=4)
+        units = await limiter.acquire(3)
+        assert units == 3
+
+        waiter = asyncio.create_task(limiter.acquire(2))
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        await limiter.release(units)
+        assert await asyncio.wait_for(waiter, timeout=0.1) == 2
+        # 上限より大きいバッチは他の処理がなければ単独で実行できる
+        await limiter.release(2)
+        assert await asyncio.wait_for(limiter.acquire(100), timeout=0.1) == 4
+
+
+class TestBatchModeConcurrency:
+    """バッチ処理モードのワーカーの同時実行数制御のテストケース"""
+
+    @pytest.mark.asyncio
+    async def test_batch_processing_is_bounded_by_limiter(self):
+        """読み込みループとリトライの再処理が同時に呼び出しても上限を超えて処理しないかテスト"""
+        from worker import main as worker_main
+
+        limiter = _limiter(DependencyLatencyTracker(window_seconds=60), initial_limit=2)
+        running = 0
+        peak = 0
+        observed_in_flight = []
+
+        async def process_batch(events):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            observed_in_flight.append(limiter.in_flight)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return [EventResult.OK] * len(events)
+
+        with patch.object(
+            worker_main.parallel_processor, "limiter", limiter
+        ), patch.object(worker_main.settings, "WORKER_BATCH_MODE", True), patch.object(
+            worker_main, "_process_event_batch", side_effect=process_batch
+        ):
+            results = await asyncio.gather(
+                worker_main._process_events([{"eventType": "cell_executed"}] * 2),
+                worker_main._process_events([{"eventType": "cell_executed"}] * 2),
+            )
+
+        assert results == [[EventResult.OK] * 2, [EventResult.OK] * 2]
+        assert peak == 1
+        assert observed_in_flight == [2, 2]
+        assert limiter.in_flight == 0
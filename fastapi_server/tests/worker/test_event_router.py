@@ -8,7 +8,7 @@
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 
-from worker.event_router import EventRouter
+from worker.event_router import EventResult, EventRouter
 
 
 class TestEventRouter:
@@ -34,7 +34,7 @@ class TestEventRouter:
         result = await self.event_router.route_event(event_data, self.mock_db)
 
         # 検証
-        assert result is True
+        assert result is EventResult.OK
         mock_handler.assert_called_once_with(event_data, self.mock_db)
 
     @pytest.mark.asyncio
@@ -46,14 +46,14 @@ class TestEventRouter:
         # イベントをルーティング
         result = await self.event_router.route_event(event_data, self.mock_db)
 
-        # 検証（イベントタイプがない場合はFalseを返す）
-        assert result is False
+        # 検証（イベントタイプがない場合は再試行しても成功しない失敗を返す）
+        assert result is EventResult.PERMANENT
 
     @pytest.mark.asyncio
     async def test_unknown_event_type_uses_default_handler(self):
         """未知のイベントタイプの場合にデフォルトハンドラーが使われるかテスト"""
         # デフォルトハンドラーをモック
-        self.event_router._default_handler = AsyncMock(return_value=True)
+        self.event_router._default_handler = AsyncMock(return_value=EventResult.OK)
 
         # 未知のイベントタイプのデータ
         event_data = {
@@ -66,7 +66,7 @@ class TestEventRouter:
         result = await self.event_router.route_event(event_data, self.mock_db)
 
         # 検証（デフォルトハンドラーが呼ばれ、その結果が返される）
-        assert result is True
+        assert result is EventResult.OK
         self.event_router._default_handler.assert_called_once_with(
             event_data, self.mock_db
         )
@@ -89,8 +89,8 @@ class TestEventRouter:
         # イベントをルーティング
         result = await self.event_router.route_event(event_data, self.mock_db)
 
-        # 検証（エラーが発生した場合はFalseを返す）
-        assert result is False
+        # 検証（エラーが発生した場合は遅延リトライ対象の失敗を返す）
+        assert result is EventResult.RETRY
         mock_handler.assert_called_once_with(event_data, self.mock_db)
         mock_handle_error.assert_called_once_with(
             error=test_exception,
@@ -109,7 +109,9 @@ class TestEventHandlers:
 
     @pytest.mark.asyncio
     @patch("worker.event_router.crud_student.get_or_create_student")
-    @patch("worker.event_router.write_progress_event")
+    @patch(
+        "worker.event_router.batch_writer.add_progress_point", new_callable=AsyncMock
+    )
     async def test_handle_cell_execution(self, mock_write_progress, mock_get_student):
         """セル実行イベントハンドラーのテスト"""
         # モックのセットアップ
@@ -139,7 +141,9 @@ class TestEventHandlers:
 
     @pytest.mark.asyncio
     @patch("worker.event_router.crud_student.get_or_create_student")
-    @patch("worker.event_router.write_progress_event")
+    @patch(
+        "worker.event_router.batch_writer.add_progress_point", new_callable=AsyncMock
+    )
     async def test_handle_notebook_save(self, mock_write_progress, mock_get_student):
         """ノートブック保存イベントハンドラーのテスト"""
         # モックのセットアップ
@@ -167,13 +171,83 @@ class TestEventHandlers:
         mock_write_progress.assert_called_once()
 
 
+class TestInstructorEventResults:
+    """講師イベントハンドラーの処理結果（再試行・恒久的な失敗）のテストケース"""
+
+    def setup_method(self):
+        """各テストメソッド実行前のセットアップ"""
+        self.mock_db = MagicMock()
+
+    @pytest.mark.asyncio
+    async def test_session_start_without_instructor_id_is_permanent(self):
+        """instructor_id がない場合は恒久的な失敗を返すかテスト"""
+        from worker.event_router import handle_student_session_start
+
+        result = await handle_student_session_start({"student_id": "s1"}, self.mock_db)
+
+        assert result is EventResult.PERMANENT
+
+    @pytest.mark.asyncio
+    @patch("worker.event_router.run_db", new_callable=AsyncMock, return_value=None)
+    async def test_session_start_with_unknown_instructor_is_permanent(
+        self, mock_run_db
+    ):
+        """存在しない講師の場合は恒久的な失敗を返すかテスト"""
+        from worker.event_router import handle_student_session_start
+
+        result = await handle_student_session_start(
+            {"student_id": "s1", "instructor_id": 99999}, self.mock_db
+        )
+
+        assert result is EventResult.PERMANENT
+
+    @pytest.mark.asyncio
+    @patch(
+        "worker.event_router.run_db",
+        new_callable=AsyncMock,
+        side_effect=ConnectionError("db down"),
+    )
+    async def test_session_start_db_failure_is_retried(self, mock_run_db):
+        """DBエラーの場合は再試行対象の失敗を返すかテスト"""
+        from worker.event_router import handle_student_session_start
+
+        result = await handle_student_session_start(
+            {"student_id": "s1", "instructor_id": 1}, self.mock_db
+        )
+
+        assert result is EventResult.RETRY
+
+    @pytest.mark.asyncio
+    async def test_assignment_without_student_id_is_permanent(self):
+        """student_id がない場合は恒久的な失敗を返すかテスト"""
+        from worker.event_router import handle_instructor_assignment
+
+        result = await handle_instructor_assignment({"class_id": "c1"}, self.mock_db)
+
+        assert result is EventResult.PERMANENT
+
+    @pytest.mark.asyncio
+    @patch("worker.event_router.run_db", new_callable=AsyncMock, return_value=[])
+    async def test_assignment_without_available_instructor_is_retried(
+        self, mock_run_db
+    ):
+        """利用可能な講師がいない場合は再試行対象の失敗を返すかテスト"""
+        from worker.event_router import handle_instructor_assignment
+
+        result = await handle_instructor_assignment({"student_id": "s1"}, self.mock_db)
+
+        assert result is EventResult.RETRY
+
+
 @pytest.mark.asyncio
 class TestRetryMechanism:
     """リトライメカニズムのテストケース"""
 
     @pytest.mark.asyncio
     @patch("worker.event_router.crud_student.get_or_create_student")
-    @patch("worker.event_router.write_progress_event")
+    @patch(
+        "worker.event_router.batch_writer.add_progress_point", new_callable=AsyncMock
+    )
     @patch("worker.event_router.handle_event_error")
     @patch("asyncio.sleep", new_callable=AsyncMock)
     async def test_default_handler_with_retry(
@@ -211,7 +285,8 @@ class TestRetryMechanism:
             result = await event_router._default_handler(event_data, mock_db)
 
             # 検証
-            assert result is False  # エラー発生時はFalseを返す
+            # エラー発生時は遅延リトライ対象の失敗を返す
+            assert result is EventResult.RETRY
             assert mock_write_progress.call_count == 1  # 1回目で失敗
             assert (
                 mock_sleep.call_count == 0
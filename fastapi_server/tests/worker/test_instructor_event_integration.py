@@ -14,6 +14,7 @@ from unittest.mock import AsyncMock, patch
 from sqlalchemy.orm import Session
 
 from worker.event_router import (
+    EventResult,
     event_router,
     handle_student_session_start,
     handle_instructor_assignment,
@@ -57,7 +58,7 @@ class TestInstructorEventIntegration:
         result = await handle_student_session_start(event_data, db_session)
 
         # 処理が成功したことを確認
-        assert result is True
+        assert result is EventResult.OK
 
         # 講師ステータスが自動更新されたことを確認
         updated_instructor = get_instructor(db_session, instructor.id)
@@ -100,7 +101,7 @@ class TestInstructorEventIntegration:
         result = await handle_instructor_assignment(event_data, db_session)
 
         # 処理が成功したことを確認
-        assert result is True
+        assert result is EventResult.OK
 
         # 講師が割り当てられたことを確認
         updated_instructor = get_instructor(db_session, instructor.id)
@@ -138,7 +139,7 @@ class TestInstructorEventIntegration:
         result = await event_router.route_event(session_event, db_session)
 
         # 処理が成功したことを確認
-        assert result is True
+        assert result is EventResult.OK
 
         # 講師ステータスが更新されたことを確認
         updated_instructor = get_instructor(db_session, instructor.id)
@@ -194,7 +195,7 @@ class TestInstructorEventIntegration:
             result = await handle_instructor_assignment(assignment_event, db_session)
 
         # 処理が成功したことを確認
-        assert result is True
+        assert result is EventResult.OK
 
         # WebSocket通知が送信されたことを確認
         assert mock_websocket.send_text.call_count >= 2  # 接続成功 + 割り当て通知
@@ -243,7 +244,7 @@ class TestInstructorEventIntegration:
 
         # イベント処理を実行
         result = await handle_student_session_start(session_start_event, db_session)
-        assert result is True
+        assert result is EventResult.OK
 
         # ステータス履歴が追加されたことを確認
         updated_history = get_instructor_status_history(db_session, instructor.id)
@@ -267,5 +268,5 @@ class TestInstructorEventIntegration:
         # エラーハンドリングが適切に動作することを確認
         result = await handle_student_session_start(invalid_event, db_session)
 
-        # エラーが適切に処理され、Falseが返されることを確認
-        assert result is False
+        # 再試行しても成功しないため、恒久的な失敗として返されることを確認
+        assert result is EventResult.PERMANENT
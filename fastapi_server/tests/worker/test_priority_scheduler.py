@@ -0,0 +1,116 @@
+"""
+優先度スケジューラーテスト
+
+PriorityTaskScheduler の即時起床・エージングによる飢餓回避・待ち時間ヒストグラムと、
+ParallelEventProcessor のスケールダウンをテストします。
+"""
+
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from unittest.mock import patch
+
+import worker.parallel_processor as processor_module
+from worker.parallel_processor import (
+    EventPriority,
+    ParallelEventProcessor,
+    PriorityTaskScheduler,
+    ProcessingTask,
+    WorkerStatus,
+)
+
+
+def _task(task_id, priority):
+    return ProcessingTask(
+        task_id=task_id,
+        event_data={"eventType": "test"},
+        priority=priority,
+        created_at=datetime.now(timezone.utc),
+    )
+
+
+class TestPriorityTaskScheduler:
+    """PriorityTaskSchedulerクラスのテストケース"""
+
+    @pytest.mark.asyncio
+    async def test_waiting_getter_wakes_on_put(self):
+        """待機中の取り出しは投入と同時に起床するかテスト"""
+        scheduler = PriorityTaskScheduler()
+        getter = asyncio.create_task(scheduler.get())
+        await asyncio.sleep(0)
+
+        await scheduler.put(_task("t1", EventPriority.LOW))
+        task = await asyncio.wait_for(getter, timeout=0.05)
+
+        assert task.task_id == "t1"
+
+    @pytest.mark.asyncio
+    async def test_higher_priority_first(self):
+        """同時刻に投入されたタスクは高優先度から取り出されるかテスト"""
+        scheduler = PriorityTaskScheduler(aging_step_seconds=60)
+        await scheduler.put(_task("low", EventPriority.LOW))
+        await scheduler.put(_task("medium", EventPriority.MEDIUM))
+        await scheduler.put(_task("high", EventPriority.HIGH))
+
+        order = [(await scheduler.get()).task_id for _ in range(3)]
+
+        assert order == ["high", "medium", "low"]
+
+    @pytest.mark.asyncio
+    async def test_aging_prevents_starvation(self):
+        """十分待った低優先度タスクは後続の高優先度タスクより先に取り出されるかテスト"""
+        scheduler = PriorityTaskScheduler(aging_step_seconds=1.0)
+        with patch.object(processor_module.time, "monotonic", return_value=100.0):
+            await scheduler.put(_task("low", EventPriority.LOW))
+        with patch.object(processor_module.time, "monotonic", return_value=103.0):
+            await scheduler.put(_task("high", EventPriority.HIGH))
+
+        assert (await scheduler.get()).task_id == "low"
+
+    @pytest.mark.asyncio
+    async def test_close_returns_none_after_drain(self):
+        """close() 後は残りのタスクを返し、空になったら None を返すかテスト"""
+        scheduler = PriorityTaskScheduler()
+        await scheduler.put(_task("t1", EventPriority.HIGH))
+        await scheduler.close()
+
+        assert (await scheduler.get()).task_id == "t1"
+        assert await scheduler.get() is None
+
+    @pytest.mark.asyncio
+    async def test_wait_histogram_per_priority(self):
+        """優先度ごとに待ち時間ヒストグラムが記録されるかテスト"""
+        scheduler = PriorityTaskScheduler()
+        await scheduler.put(_task("t1", EventPriority.MEDIUM))
+        await scheduler.get()
+
+        histograms = scheduler.get_wait_histograms()
+
+        assert histograms["MEDIUM"]["count"] == 1
+        assert sum(histograms["MEDIUM"]["buckets"].values()) == 1
+        assert histograms["HIGH"]["count"] == 0
+
+
+class TestParallelEventProcessorScaling:
+    """ParallelEventProcessorのスケーリングのテストケース"""
+
+    @pytest.mark.asyncio
+    async def test_scale_down_retires_idle_worker(self):
+        """キューが空の状態が続くとアイドルワーカーが停止されるかテスト"""
+        processor = ParallelEventProcessor(max_workers=8, auto_scale=False)
+        processor.is_running = True
+        for i in range(3):
+            await processor._create_worker(f"worker_{i}")
+        await asyncio.sleep(0)
+        processor.processing_stats["active_workers"] = 3
+
+        for _ in range(processor_module.SCALE_DOWN_IDLE_CYCLES):
+            await processor._auto_scale_workers()
+
+        assert len(processor.workers) == 2
+        assert len(processor.worker_tasks) == 2
+        assert all(m.status == WorkerStatus.IDLE for m in processor.workers.values())
+
+        await processor.scheduler.close()
+        await processor._wait_for_completion()
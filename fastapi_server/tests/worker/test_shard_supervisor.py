@@ -0,0 +1,84 @@
+"""
+シャードプロセス監視テスト
+
+異常終了したシャードプロセスが同じシャード番号のまま指数バックオフ付きで再起動され、
+停止要求後は再起動しないことをテストします。
+"""
+
+from worker.main import ShardSupervisor
+
+
+class FakeProcess:
+    """is_alive・exitcode・terminate を持つプロセスの代替"""
+
+    def __init__(self, shard):
+        self.shard = shard
+        self.name = f"worker-shard-{shard}"
+        self.alive = True
+        self.exitcode = None
+
+    def is_alive(self):
+        return self.alive
+
+    def crash(self, exitcode=1):
+        self.alive = False
+        self.exitcode = exitcode
+
+    def terminate(self):
+        self.crash(-15)
+
+    def join(self):
+        pass
+
+
+class TestShardSupervisor:
+    """ShardSupervisorクラスのテストケース"""
+
+    def setup_method(self):
+        """各テストメソッド実行前のセットアップ"""
+        self.now = 0.0
+        self.started = []
+
+        def start_process(shard):
+            process = FakeProcess(shard)
+            self.started.append(process)
+            return process
+
+        self.supervisor = ShardSupervisor(
+            2, start_process=start_process, clock=lambda: self.now
+        )
+        self.supervisor.start()
+
+    def test_restarts_crashed_shard_with_backoff(self):
+        """異常終了したシャードをバックオフ後に同じシャード番号で再起動するかテスト"""
+        self.supervisor.processes[1].crash()
+
+        self.now = 0.5
+        self.supervisor.check()
+        self.supervisor.check()
+        assert len(self.started) == 2
+
+        self.now = 1.5
+        self.supervisor.check()
+        assert [process.shard for process in self.started] == [0, 1, 1]
+        assert self.supervisor.processes[1] is self.started[-1]
+        assert self.supervisor.restarts == 1
+
+        # 起動直後に再度終了した場合はバックオフを倍にする
+        self.started[-1].crash()
+        self.supervisor.check()
+        self.now = 3.0
+        self.supervisor.check()
+        assert len(self.started) == 3
+        self.now = 3.6
+        self.supervisor.check()
+        assert len(self.started) == 4
+
+    def test_does_not_restart_after_stop(self):
+        """停止要求後に終了したシャードは再起動しないかテスト"""
+        self.supervisor.stop()
+        self.now = 100.0
+        self.supervisor.check()
+
+        assert len(self.started) == 2
+        assert all(not process.is_alive() for process in self.started)
@@ -0,0 +1,254 @@
+"""
+Redis Streams コンシューマーテスト
+
+XREADGROUPによるバッチ読み込み、自コンシューマーの未ACKエントリの再読み込み、XACK、
+XAUTOCLAIMによる未ACKエントリの回収と最大配信回数を超えたエントリのデッドレター移動、
+アイドルコンシューマーの削除をテストします。
+"""
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from db.redis_client import (
+    PROGRESS_CONSUMER_GROUP,
+    PROGRESS_STREAM,
+    progress_stream_name,
+    student_shard,
+)
+from worker.stream_consumer import ProgressStreamConsumer, default_consumer_name
+
+
+class TestProgressStreamConsumer:
+    """ProgressStreamConsumerクラスのテストケース"""
+
+    def setup_method(self):
+        """各テストメソッド実行前のセットアップ"""
+        self.mock_redis = MagicMock()
+        self.consumer = ProgressStreamConsumer(
+            self.mock_redis,
+            consumer_name="test-consumer",
+            batch_size=10,
+            block_ms=100,
+            claim_idle_ms=1000,
+            max_deliveries=3,
+        )
+
+    @pytest.mark.asyncio
+    async def test_read_batch_flattens_entries(self):
+        """XREADGROUPの結果がエントリのリストに展開されるかテスト"""
+        self.mock_redis.xreadgroup = AsyncMock(
+            return_value=[
+                [
+                    PROGRESS_STREAM,
+                    [("1-0", {"data": "{}"}), ("2-0", {"data": "{}"})],
+                ]
+            ]
+        )
+
+        entries = await self.consumer.read_batch()
+
+        assert [entry_id for entry_id, _ in entries] == ["1-0", "2-0"]
+        self.mock_redis.xreadgroup.assert_called_once_with(
+            groupname=PROGRESS_CONSUMER_GROUP,
+            consumername="test-consumer",
+            streams={PROGRESS_STREAM: ">"},
+            count=10,
+            block=100,
+        )
+        assert self.consumer.stats["read_entries"] == 2
+
+    @pytest.mark.asyncio
+    async def test_read_batch_timeout_returns_empty(self):
+        """ブロックタイムアウト時は空リストを返すかテスト"""
+        self.mock_redis.xreadgroup = AsyncMock(return_value=None)
+
+        assert await self.consumer.read_batch() == []
+
+    @pytest.mark.asyncio
+    async def test_ack_skips_empty_list(self):
+        """ACK対象がない場合はRedisを呼ばないかテスト"""
+        self.mock_redis.xack = AsyncMock()
+
+        assert await self.consumer.ack([]) == 0
+        self.mock_redis.xack.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch("worker.stream_consumer.event_retry_queue")
+    async def test_claim_stale_dead_letters_poison_entries(self, mock_retry_queue):
+        """最大配信回数を超えたエントリがデッドレターに移されてACKされるかテスト"""
+        self.mock_redis.xautoclaim = AsyncMock(
+            return_value=[
+                "0-0",
+                [("9-0", {"data": "{}"}), ("10-0", {"data": "{}"}), ("11-0", None)],
+                [],
+            ]
+        )
+        pipe = self.mock_redis.pipeline.return_value
+        pipe.execute = AsyncMock(
+            return_value=[
+                [{"message_id": "9-0", "times_delivered": 2}],
+                [{"message_id": "10-0", "times_delivered": 4}],
+            ]
+        )
+        self.mock_redis.xack = AsyncMock(return_value=1)
+        mock_retry_queue.dead_letter = AsyncMock(return_value=1)
+
+        entries = await self.consumer.claim_stale()
+
+        assert [entry_id for entry_id, _ in entries] == ["9-0"]
+        mock_retry_queue.dead_letter.assert_called_once()
+        assert mock_retry_queue.dead_letter.call_args.args[0] == [{}]
+        assert mock_retry_queue.dead_letter.call_args.kwargs["attempts"] == [3]
+        self.mock_redis.xack.assert_called_once_with(
+            PROGRESS_STREAM, PROGRESS_CONSUMER_GROUP, "10-0"
+        )
+        # 範囲の件数上限で欠けないよう、配信回数はIDごとに取得する
+        ranges = [
+            (call.kwargs["min"], call.kwargs["max"], call.kwargs["count"])
+            for call in pipe.xpending_range.call_args_list
+        ]
+        assert ranges == [("9-0", "9-0", 1), ("10-0", "10-0", 1)]
+        assert self.consumer.stats["dropped_entries"] == 1
+        assert self.consumer.stats["claimed_entries"] == 1
+
+    @pytest.mark.asyncio
+    @patch("worker.stream_consumer.event_retry_queue")
+    async def test_claim_stale_keeps_entries_when_dead_letter_fails(
+        self, mock_retry_queue
+    ):
+        """デッドレターへの登録に失敗した場合はACKせずペンディングに残すかテスト"""
+        self.mock_redis.xautoclaim = AsyncMock(
+            return_value=["0-0", [("10-0", {"data": "{}"})], []]
+        )
+        pipe = self.mock_redis.pipeline.return_value
+        pipe.execute = AsyncMock(
+            return_value=[[{"message_id": "10-0", "times_delivered": 4}]]
+        )
+        self.mock_redis.xack = AsyncMock(return_value=1)
+        mock_retry_queue.dead_letter = AsyncMock(
+            side_effect=ConnectionError("redis down")
+        )
+
+        assert await self.consumer.claim_stale() == []
+        self.mock_redis.xack.assert_not_called()
+        assert self.consumer.stats["dropped_entries"] == 0
+
+    @pytest.mark.asyncio
+    async def test_read_pending_advances_cursor_and_acks_deleted_entries(self):
+        """未ACKエントリをID 0から読み、カーソルを進め、本文が消えたエントリはACKするかテスト"""
+        self.mock_redis.xreadgroup = AsyncMock(
+            side_effect=[
+                [[PROGRESS_STREAM, [("3-0", None)]]],
+                [[PROGRESS_STREAM, [("5-0", {"data": "{}"}), ("7-0", {"data": "{}"})]]],
+                [[PROGRESS_STREAM, []]],
+            ]
+        )
+        self.mock_redis.xack = AsyncMock(return_value=1)
+
+        entries = await self.consumer.read_pending()
+        assert [entry_id for entry_id, _ in entries] == ["5-0", "7-0"]
+        assert await self.consumer.read_pending() == []
+
+        cursors = [
+            call.kwargs["streams"][PROGRESS_STREAM]
+            for call in self.mock_redis.xreadgroup.call_args_list
+        ]
+        assert cursors == ["0", "3-0", "7-0"]
+        assert all(
+            "block" not in call.kwargs
+            for call in self.mock_redis.xreadgroup.call_args_list
+        )
+        self.mock_redis.xack.assert_called_once_with(
+            PROGRESS_STREAM, PROGRESS_CONSUMER_GROUP, "3-0"
+        )
+
+    @pytest.mark.asyncio
+    async def test_remove_stale_consumers_keeps_pending_and_self(self):
+        """未ACKエントリを持たない長時間アイドルの他コンシューマーのみ削除するかテスト"""
+        self.consumer.stale_consumer_ms = 1000
+        self.mock_redis.xinfo_consumers = AsyncMock(
+            return_value=[
+                {"name": "test-consumer", "pending": 0, "idle": 5000},
+                {"name": "old-1234", "pending": 0, "idle": 5000},
+                {"name": "old-5678", "pending": 2, "idle": 5000},
+                {"name": "busy", "pending": 0, "idle": 10},
+            ]
+        )
+        self.mock_redis.xgroup_delconsumer = AsyncMock(return_value=0)
+
+        assert await self.consumer.remove_stale_consumers() == 1
+        self.mock_redis.xgroup_delconsumer.assert_called_once_with(
+            PROGRESS_STREAM, PROGRESS_CONSUMER_GROUP, "old-1234"
+        )
+        assert self.consumer.stats["removed_consumers"] == 1
+
+    @pytest.mark.asyncio
+    async def test_trim_keeps_pending_and_undelivered_entries(self):
+        """最古のペンディングIDと最後に配信したIDの小さい方より前のみトリムするかテスト"""
+        self.mock_redis.xinfo_groups = AsyncMock(
+            return_value=[
+                {"name": PROGRESS_CONSUMER_GROUP, "last-delivered-id": "120-0"}
+            ]
+        )
+        self.mock_redis.xpending = AsyncMock(
+            return_value={"pending": 2, "min": "95-3", "max": "110-0", "consumers": []}
+        )
+        self.mock_redis.xtrim = AsyncMock(return_value=40)
+
+        assert await self.consumer.trim_acked() == 40
+        self.mock_redis.xtrim.assert_called_once_with(
+            PROGRESS_STREAM, minid="95-3", approximate=True
+        )
+
+        # ペンディングがない場合は最後に配信したIDまで、未配信のグループはトリムしない
+        self.mock_redis.xpending = AsyncMock(return_value={"pending": 0, "min": None})
+        await self.consumer.trim_acked()
+        assert self.mock_redis.xtrim.call_args.kwargs["minid"] == "120-0"
+
+        self.mock_redis.xinfo_groups = AsyncMock(
+            return_value=[{"name": PROGRESS_CONSUMER_GROUP, "last-delivered-id": "0-0"}]
+        )
+        assert await self.consumer.trim_acked() == 0
+        assert self.mock_redis.xtrim.call_count == 2
+
+
+class TestStudentSharding:
+    """学生単位のシャード割り当てのテストケース"""
+
+    def test_same_student_maps_to_same_shard(self):
+        """同じ学生は常に同じシャードに、全学生はシャード範囲内に割り当てられるかテスト"""
+        shards = {student_shard(f"student{i}@example.com", 4) for i in range(100)}
+
+        assert student_shard("a@example.com", 4) == student_shard("a@example.com", 4)
+        assert shards == {0, 1, 2, 3}
+
+    def test_single_shard_uses_default_stream(self):
+        """シャード数1の場合は従来のストリーム名を使用するかテスト"""
+        with patch("db.redis_client.settings") as mock_settings:
+            mock_settings.WORKER_SHARD_COUNT = 1
+            assert student_shard("a@example.com") == 0
+            assert progress_stream_name(0) == PROGRESS_STREAM
+
+            mock_settings.WORKER_SHARD_COUNT = 4
+            assert progress_stream_name(3) == f"{PROGRESS_STREAM}:3"
+
+    def test_default_consumer_name_is_stable_per_shard(self):
+        """コンシューマー名がPIDに依存せずホスト名とシャード番号で決まるかテスト"""
+        with patch("worker.stream_consumer.socket.gethostname", return_value="host-a"):
+            assert default_consumer_name(2) == "host-a-shard-2"
+            assert default_consumer_name() == "host-a-shard-0"
+
+    @pytest.mark.asyncio
+    async def test_consumer_reads_its_shard_stream(self):
+        """シャードのストリームを指定したコンシューマーはそのストリームから読み込むかテスト"""
+        mock_redis = MagicMock()
+        mock_redis.xreadgroup = AsyncMock(return_value=[])
+        consumer = ProgressStreamConsumer(
+            mock_redis, consumer_name="shard-consumer", stream=f"{PROGRESS_STREAM}:2"
+        )
+
+        await consumer.read_batch()
+
+        assert mock_redis.xreadgroup.call_args.kwargs["streams"] == {
+            f"{PROGRESS_STREAM}:2": ">"
+        }
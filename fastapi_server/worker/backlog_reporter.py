@@ -0,0 +1,139 @@
+"""
+ワーカー処理待ち件数レポーター
+
+並列処理キューの深さと、Streamsモードではコンシューマーグループの未処理件数（lag + pending）、
+Pub/Subモードでは購読開始後に発行された進捗イベントのうち処理を終えていない件数を
+定期的にRedisへ書き込みます。API側はこの値を読み取り、取り込みの流量制御（429応答）に使用します。
+同時実行数制御の状態（上限と変更理由）も併せて報告し、/health で参照できるようにします。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from typing import Any, Dict, Optional
+
+import redis.asyncio as redis
+
+from core.config import settings
+from db.redis_client import PROGRESS_PUBLISHED_KEY, WORKER_BACKLOG_KEY
+from worker.parallel_processor import parallel_processor
+from worker.stream_consumer import ProgressStreamConsumer
+
+logger = logging.getLogger(__name__)
+
+
+class PubSubBacklog:
+    """
+    Pub/Subモードの処理待ち件数
+
+    Pub/Subはサーバー側に未処理件数を持たないため、API が PROGRESS_PUBLISHED_KEY に加算する
+    発行数から、購読開始時点の発行数と処理を終えた件数を引いて求める
+    （受信済み・ソケットのバッファ内・処理中のイベントを含む）。
+    """
+
+    def __init__(self, redis_client: redis.Redis):
+        self.redis_client = redis_client
+        self._baseline: Optional[int] = None
+        self.finished = 0
+
+    async def _published(self) -> int:
+        return int(await self.redis_client.get(PROGRESS_PUBLISHED_KEY) or 0)
+
+    async def start(self):
+        """購読開始時点の発行数を記録（SUBSCRIBE の直後に呼び出す）"""
+        self._baseline = await self._published()
+        self.finished = 0
+
+    def mark_finished(self, count: int = 1):
+        """受信したメッセージの処理（失敗・リトライ登録を含む）を終えた"""
+        self.finished += count
+
+    async def backlog(self) -> Optional[int]:
+        """処理待ち件数（購読開始前は None）"""
+        if self._baseline is None:
+            return None
+        published = await self._published()
+        if published < self._baseline:
+            # カウンターが消えた（Redisの再起動など）場合は現在値から数え直す
+            self._baseline, self.finished = published, 0
+        return max(0, published - self._baseline - self.finished)
+
+
+class BacklogReporter:
+    """ワーカーの処理待ち件数をRedisに報告するクラス"""
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        stream_consumer: Optional[ProgressStreamConsumer] = None,
+        interval_seconds: Optional[int] = None,
+        pubsub_backlog: Optional[PubSubBacklog] = None,
+    ):
+        self.redis_client = redis_client
+        self.stream_consumer = stream_consumer
+        self.pubsub_backlog = pubsub_backlog
+        self.interval_seconds = (
+            interval_seconds or settings.WORKER_BACKLOG_REPORT_INTERVAL_SECONDS
+        )
+        # Pub/Subモードは同一ホストの複数プロセスを区別するためPIDを含める
+        self.worker_name = (
+            stream_consumer.consumer_name
+            if stream_consumer
+            else f"{socket.gethostname()}-{os.getpid()}"
+        )
+
+    async def collect(self) -> Dict[str, Any]:
+        """現在の処理待ち件数を収集"""
+        report: Dict[str, Any] = {
+            "worker": self.worker_name,
+            "queue_depth": parallel_processor.get_queue_depth(),
+            "concurrency": parallel_processor.limiter.get_statistics(),
+            "stream_backlog": None,
+            "stream": None,
+            "pubsub_backlog": None,
+            "updated_at": time.time(),
+        }
+        if self.pubsub_backlog is not None:
+            report["pubsub_backlog"] = await self.pubsub_backlog.backlog()
+        if self.stream_consumer is not None:
+            report["stream"] = self.stream_consumer.stream
+            lag = await self.stream_consumer.get_lag()
+            report["stream_backlog"] = (lag.get("lag") or 0) + (lag.get("pending") or 0)
+        return report
+
+    async def report_once(self) -> Dict[str, Any]:
+        """処理待ち件数を1回報告"""
+        report = await self.collect()
+        await self.redis_client.hset(
+            WORKER_BACKLOG_KEY, self.worker_name, json.dumps(report)
+        )
+        # 全ワーカー停止時に古い値が残り続けないようTTLを設定
+        await self.redis_client.expire(WORKER_BACKLOG_KEY, self.interval_seconds * 15)
+        return report
+
+    async def run(self, is_running):
+        """
+        is_running() が True の間、定期的に報告を続ける
+
+        Args:
+            is_running: 継続判定関数
+        """
+        logger.info(
+            f"[WORKER] Backlog reporter started ({self.worker_name}, every {self.interval_seconds}s)"
+        )
+        while is_running():
+            try:
+                await self.report_once()
+            except Exception as e:
+                logger.warning(f"[WORKER] Backlog report failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def clear(self):
+        """停止時に自ワーカーの報告を削除"""
+        try:
+            await self.redis_client.hdel(WORKER_BACKLOG_KEY, self.worker_name)
+        except Exception as e:
+            logger.warning(f"[WORKER] Failed to clear backlog report: {e}")
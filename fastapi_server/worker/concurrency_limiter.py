@@ -0,0 +1,187 @@
+"""
+依存サービスのレイテンシに基づくワーカーの同時実行数制御（AIMD）
+
+PostgreSQL・InfluxDB・Redis のp90レイテンシが目標を超えたら同時実行数を乗算的に減らし、
+全て目標内で上限まで使い切っている場合は1ずつ増やします。
+同じ長いセルを多数の学生が同時に実行した場合などに、DBへ過負荷をかけ続けないためのものです。
+同時実行数は処理中のイベント数で数え、バッチはイベント数分（上限まで）の枠を取得します。
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional
+
+from core.config import settings
+from core.dependency_latency import (
+    INFLUX,
+    POSTGRES,
+    REDIS,
+    DependencyLatencyTracker,
+    dependency_latency,
+)
+
+logger = logging.getLogger(__name__)
+
+# 目標超過時に同時実行数に掛ける係数（乗算的減少）
+DECREASE_FACTOR = 0.75
+
+# 判定に必要なウィンドウ内の最小サンプル数
+MIN_SAMPLES = 5
+
+# 保持する同時実行数の変更履歴の件数
+CHANGE_HISTORY_SIZE = 20
+
+
+def default_latency_targets() -> Dict[str, float]:
+    """依存サービスごとの目標p90レイテンシ（ミリ秒）"""
+    return {
+        POSTGRES: settings.CONCURRENCY_POSTGRES_TARGET_MS,
+        INFLUX: settings.CONCURRENCY_INFLUX_TARGET_MS,
+        REDIS: settings.CONCURRENCY_REDIS_TARGET_MS,
+    }
+
+
+class AIMDConcurrencyLimiter:
+    """依存サービスのレイテンシに基づく同時実行数リミッター"""
+
+    def __init__(
+        self,
+        min_limit: Optional[int] = None,
+        max_limit: Optional[int] = None,
+        initial_limit: Optional[int] = None,
+        targets: Optional[Dict[str, float]] = None,
+        tracker: Optional[DependencyLatencyTracker] = None,
+    ):
+        self.min_limit = min_limit or settings.CONCURRENCY_MIN_LIMIT
+        self.max_limit = max_limit or settings.CONCURRENCY_MAX_LIMIT
+        self.limit = float(min(self.max_limit, initial_limit or self.max_limit))
+        self.targets = targets or default_latency_targets()
+        self.tracker = tracker or dependency_latency
+
+        self.in_flight = 0
+        # 前回の調整以降の最大同時実行数（上限まで使い切っているかの判定に使用）
+        self.peak_in_flight = 0
+        self._condition = asyncio.Condition()
+        self._last_decrease_at = 0.0
+        self.changes: Deque[Dict[str, Any]] = deque(maxlen=CHANGE_HISTORY_SIZE)
+
+    @property
+    def current_limit(self) -> int:
+        """現在の同時実行数の上限（整数）"""
+        return max(self.min_limit, math.floor(self.limit))
+
+    def _units(self, weight: int) -> int:
+        # 上限より大きいバッチも単独であれば実行できるよう、取得する枠は上限までとする
+        return max(1, min(weight, self.current_limit))
+
+    async def acquire(self, weight: int = 1) -> int:
+        """
+        実行枠を取得（上限に達している場合は空くまで待機）
+
+        Args:
+            weight: 処理するイベント数
+
+        Returns:
+            取得した枠の数（release に渡す）
+        """
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: self.in_flight + self._units(weight) <= self.current_limit
+            )
+            units = self._units(weight)
+            self.in_flight += units
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return units
+
+    async def release(self, units: int = 1):
+        """実行枠を返却"""
+        async with self._condition:
+            self.in_flight -= units
+            self._condition.notify_all()
+
+    @asynccontextmanager
+    async def slot(self, weight: int = 1):
+        """weight 件のイベント分の実行枠を取得して処理を行うコンテキストマネージャー"""
+        units = await self.acquire(weight)
+        try:
+            yield
+        finally:
+            await self.release(units)
+
+    def _overloaded(self, latencies: Dict[str, Dict[str, Any]]) -> List[str]:
+        """目標レイテンシを超えている依存サービスの説明"""
+        reasons = []
+        for dependency, target_ms in self.targets.items():
+            latency = latencies.get(dependency)
+            if not latency or latency["samples"] < MIN_SAMPLES:
+                continue
+            if latency["p90_ms"] > target_ms:
+                reasons.append(
+                    f"{dependency} p90 {latency['p90_ms']:.0f}ms > target {target_ms:.0f}ms"
+                )
+        return reasons
+
+    async def adjust(self) -> Optional[Dict[str, Any]]:
+        """
+        直近のレイテンシから同時実行数を調整する（定期的に呼び出す）
+
+        Returns:
+            変更した場合はその内容（from, to, reason）、変更しない場合は None
+        """
+        now = time.monotonic()
+        previous = self.current_limit
+        overloaded = self._overloaded(self.tracker.snapshot())
+
+        reason = None
+        if overloaded:
+            # 減少の効果が計測ウィンドウに反映されるまでは続けて減らさない
+            if now - self._last_decrease_at >= self.tracker.window_seconds:
+                self.limit = max(float(self.min_limit), self.limit * DECREASE_FACTOR)
+                self._last_decrease_at = now
+                reason = "; ".join(overloaded)
+        elif self.peak_in_flight >= previous and self.limit < self.max_limit:
+            self.limit = min(float(self.max_limit), self.limit + 1)
+            reason = (
+                f"saturated at {previous} in-flight with all dependencies within target"
+            )
+
+        self.peak_in_flight = self.in_flight
+        if self.current_limit == previous:
+            return None
+
+        change = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "from": previous,
+            "to": self.current_limit,
+            "reason": reason,
+        }
+        self.changes.append(change)
+        logger.info(f"Concurrency limit {previous} -> {self.current_limit}: {reason}")
+
+        if self.current_limit > previous:
+            async with self._condition:
+                self._condition.notify_all()
+        return change
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """現在の上限・実行中件数・依存サービスのレイテンシと変更履歴"""
+        latencies = self.tracker.snapshot()
+        return {
+            "limit": self.current_limit,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "dependencies": {
+                dependency: {
+                    **latencies.get(dependency, {"samples": 0}),
+                    "target_ms": target_ms,
+                }
+                for dependency, target_ms in self.targets.items()
+            },
+            "recent_changes": list(self.changes),
+        }
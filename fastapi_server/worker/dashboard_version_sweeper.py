@@ -0,0 +1,76 @@
+"""
+ダッシュボード状態の時間経過による遷移の検出
+
+学生の表示状態（active / error / idle、ヘルプ要求の有効期間）はイベントがなくても
+時間経過で変わるため、定期的に遷移した学生を抽出してダッシュボードのバージョンを進めます。
+これにより /dashboard/overview?since=<バージョン> の差分に遷移した学生が含まれます。
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from core.config import settings
+from crud.crud_dashboard_state import get_status_transition_student_ids
+from crud.crud_dashboard_version import dashboard_version_index
+from crud.crud_help_state import help_state_index
+from db.executor import run_db, run_redis
+from db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class DashboardVersionSweeper:
+    """時間経過で表示状態が遷移した学生のバージョンを進めるクラス"""
+
+    def __init__(self, interval_seconds: Optional[float] = None):
+        self.interval_seconds = (
+            interval_seconds or settings.DASHBOARD_TRANSITION_SWEEP_SECONDS
+        )
+        self._last_sweep: Optional[float] = None
+
+    def _find_transitions(self, start: float, end: float) -> List[int]:
+        expired_emails = help_state_index.get_expired_between(start, end)
+        db = SessionLocal()
+        try:
+            return get_status_transition_student_ids(
+                db,
+                datetime.fromtimestamp(start, timezone.utc),
+                datetime.fromtimestamp(end, timezone.utc),
+                expired_emails,
+            )
+        finally:
+            db.close()
+
+    async def sweep_once(self) -> List[int]:
+        """前回の確認以降に遷移した学生のバージョンを進める"""
+        now = time.time()
+        start = (
+            self._last_sweep
+            if self._last_sweep is not None
+            else now - self.interval_seconds
+        )
+        student_ids = await run_db(self._find_transitions, start, now)
+        if student_ids:
+            await run_redis(dashboard_version_index.bump, student_ids)
+        self._last_sweep = now
+        return student_ids
+
+    async def run(self, is_running):
+        """
+        is_running() が True の間、定期的に確認を続ける
+
+        Args:
+            is_running: 継続判定関数
+        """
+        logger.info(
+            f"[WORKER] Dashboard version sweeper started (every {self.interval_seconds}s)"
+        )
+        while is_running():
+            try:
+                await self.sweep_once()
+            except Exception as e:
+                logger.warning(f"[WORKER] Dashboard version sweep failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
@@ -6,13 +6,18 @@
 """
 
 import logging
-from typing import Any, Callable, Dict
+from enum import Enum
+from typing import Any, Callable, Dict, List, Union
 from functools import wraps
 
+from pydantic import ValidationError
+
 from schemas.event import EventData
-from schemas.progress import StudentProgress
-from db.influxdb_client import write_progress_event
-from crud import crud_student, crud_notebook, crud_execution
+from core.influxdb_batch_writer import batch_writer
+from db.executor import run_db, run_redis
+from crud import crud_student, crud_ingest
+from crud.crud_dashboard_version import dashboard_version_index
+from crud.crud_help_state import HELP, HELP_STOP, help_state_index
 from sqlalchemy.orm import Session
 from worker.error_handler import handle_event_error
 
@@ -20,41 +25,50 @@ from worker.error_handler import handle_event_error
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# エラー発生時のリトライ回数とバックオフの設定
-MAX_RETRIES = 3
-BACKOFF_FACTOR = 2  # 指数バックオフ用の係数
+# 一時的な競合（キャッシュ済みIDの失効など）に備えた即時リトライ回数
+# バックオフを伴う再試行はワーカーが遅延リトライキュー（core.retry_queue）で行う
+IMMEDIATE_RETRIES = 1
+
+
+class EventResult(Enum):
+    """イベントの処理結果"""
+
+    # 処理に成功した
+    OK = "ok"
+    # 失敗した（ワーカーが遅延リトライキューに登録する）
+    RETRY = "retry"
+    # 再試行しても成功しない失敗（検証エラー・必須フィールドの欠落）。デッドレターに移す
+    PERMANENT = "permanent"
+
+
+def _as_result(result: Union[EventResult, bool, None]) -> EventResult:
+    """ハンドラーの戻り値を処理結果に変換（真偽値を返すハンドラーは成功・リトライに対応させる）"""
+    if isinstance(result, EventResult):
+        return result
+    return EventResult.OK if result else EventResult.RETRY
 
 
 def with_retry(func):
     """
-    関数の実行に失敗した場合に指数バックオフでリトライするデコレータ
+    関数の実行に失敗した場合に待機せずに即時リトライするデコレータ
+
+    ワーカースロットをバックオフ中に占有しないため、ここでは待機しない。
+    最終的に失敗したイベントはワーカーが遅延リトライキューに登録する。
+    検証エラーは再試行しても成功しないためリトライしない。
     """
 
     @wraps(func)
     async def wrapper(*args, **kwargs):
-        retries = 0
-        last_exception = None
-
-        while retries < MAX_RETRIES:
+        for attempt in range(IMMEDIATE_RETRIES + 1):
             try:
                 return await func(*args, **kwargs)
+            except ValidationError:
+                raise
             except Exception as e:
-                last_exception = e
-                wait_time = BACKOFF_FACTOR**retries
-                logger.warning(
-                    f"処理に失敗しました。{wait_time}秒後にリトライします。エラー: {e}"
-                )
-                import asyncio
-
-                await asyncio.sleep(wait_time)
-                retries += 1
-
-        # 最大リトライ回数を超えた場合
-        logger.error(
-            f"最大リトライ回数({MAX_RETRIES})を超えました。処理を中止します。最終エラー: {last_exception}"
-        )
-        # エラーログチャネルにエラーを報告する処理をここに追加予定
-        raise last_exception
+                if attempt >= IMMEDIATE_RETRIES:
+                    logger.error(f"即時リトライ後も処理に失敗しました。遅延リトライに回します。エラー: {e}")
+                    raise
+                logger.warning(f"処理に失敗しました。即時リトライします。エラー: {e}")
 
     return wrapper
 
@@ -68,6 +82,8 @@ class EventRouter:
     def __init__(self):
         # イベントタイプとハンドラー関数のマッピング
         self.handlers = {}
+        # イベントタイプとバッチ対応ハンドラー関数（イベントのリストを受け取る）のマッピング
+        self.batch_handlers = {}
 
     def register_handler(self, event_type: str, handler_func: Callable):
         """
@@ -80,7 +96,79 @@ class EventRouter:
         self.handlers[event_type] = handler_func
         logger.info(f"ハンドラー登録: {event_type} -> {handler_func.__name__}")
 
-    async def route_event(self, event_data: Dict[str, Any], db: Session) -> bool:
+    def register_batch_handler(self, event_type: str, handler_func: Callable):
+        """
+        イベントタイプに対応するバッチ対応ハンドラー関数を登録
+
+        Args:
+            event_type: イベントの種類を表す文字列
+            handler_func: イベントデータのリストとDBセッションを受け取り、
+                イベントごとの処理結果（List[EventResult]）を返すコールバック関数
+        """
+        self.batch_handlers[event_type] = handler_func
+        logger.info(f"バッチハンドラー登録: {event_type} -> {handler_func.__name__}")
+
+    async def route_batch(self, events: List[Dict[str, Any]], db: Session) -> List[EventResult]:
+        """
+        イベントデータのリストをイベントタイプごとにまとめてルーティングする
+
+        バッチ対応ハンドラーが登録されたタイプはリスト単位で処理し（コミットは1回）、
+        それ以外のタイプは従来のハンドラーで1件ずつ処理する。
+        同じ学生のイベントの処理順序を保つため、学生のイベントタイプが切り替わる時点で
+        それまでのグループを先に処理する（異なる学生のイベントは同じグループにまとめる）。
+        バッチ処理に失敗した場合は、問題のあるイベントを切り分けるため1件ずつ処理し直す。
+
+        Args:
+            events: イベントデータを含む辞書のリスト
+            db: SQLAlchemy DBセッション
+
+        Returns:
+            List[EventResult]: イベントごとの処理結果（eventsと同じ順序）
+        """
+        results = [EventResult.RETRY] * len(events)
+
+        groups: Dict[str, List[int]] = {}
+        student_types: Dict[Any, str] = {}
+        for index, event_data in enumerate(events):
+            event_type = event_data.get("eventType") or ""
+            student = event_data.get("emailAddress")
+            if student_types.get(student, event_type) != event_type:
+                await self._route_groups(events, groups, db, results)
+                groups, student_types = {}, {}
+            groups.setdefault(event_type, []).append(index)
+            student_types[student] = event_type
+
+        await self._route_groups(events, groups, db, results)
+        return results
+
+    async def _route_groups(
+        self,
+        events: List[Dict[str, Any]],
+        groups: Dict[str, List[int]],
+        db: Session,
+        results: List[EventResult],
+    ):
+        """イベントタイプごとのグループを処理し、結果を results に書き込む"""
+        for event_type, indexes in groups.items():
+            batch_handler = self.batch_handlers.get(event_type)
+            if batch_handler is not None:
+                group = [events[i] for i in indexes]
+                try:
+                    logger.info(f"イベント '{event_type}' を {len(group)} 件まとめて処理中...")
+                    for index, result in zip(indexes, await batch_handler(group, db)):
+                        results[index] = _as_result(result)
+                    continue
+                except Exception as e:
+                    logger.error(
+                        f"バッチ処理中にエラーが発生しました（{event_type}, {len(group)}件）。"
+                        f"1件ずつ処理します: {e}"
+                    )
+                    await run_db(db.rollback)
+
+            for index in indexes:
+                results[index] = await self.route_event(events[index], db)
+
+    async def route_event(self, event_data: Dict[str, Any], db: Session) -> EventResult:
         """
         イベントデータを受け取り、適切なハンドラー関数にルーティングする
 
@@ -89,14 +177,14 @@ class EventRouter:
             db: SQLAlchemy DBセッション
 
         Returns:
-            bool: 処理が成功したかどうか
+            EventResult: 処理結果（検証エラー・必須フィールドの欠落は PERMANENT）
         """
         try:
             # イベントタイプを抽出（eventTypeフィールドを使用）
             event_type = event_data.get("eventType")
             if not event_type:
                 logger.error("イベントデータにeventTypeフィールドがありません")
-                return False
+                return EventResult.PERMANENT
 
             # 対応するハンドラーを探す
             handler = self.handlers.get(event_type)
@@ -105,22 +193,25 @@ class EventRouter:
                     f"イベントタイプ '{event_type}' に対応するハンドラーが見つかりません"
                 )
                 # デフォルトハンドラーで処理
-                return await self._default_handler(event_data, db)
+                return _as_result(await self._default_handler(event_data, db))
 
             # ハンドラー関数を実行
             logger.info(f"イベント '{event_type}' を処理中...")
-            return await handler(event_data, db)
+            return _as_result(await handler(event_data, db))
 
+        except ValidationError as e:
+            logger.error(f"イベントデータの検証に失敗しました: {e}")
+            return EventResult.PERMANENT
         except Exception as e:
             logger.error(f"イベント処理中にエラーが発生しました: {e}")
             # エラーハンドラーを呼び出し
             await handle_event_error(
                 error=e, event_data=event_data, context={"method": "route_event"}
             )
-            return False
+            return EventResult.RETRY
 
     @with_retry
-    async def _default_handler(self, event_data: Dict[str, Any], db: Session) -> bool:
+    async def _default_handler(self, event_data: Dict[str, Any], db: Session) -> EventResult:
         """
         どのハンドラーにも一致しないイベントのデフォルト処理
         基本的な進捗イベントとして処理する
@@ -130,7 +221,7 @@ class EventRouter:
             db: SQLAlchemy DBセッション
 
         Returns:
-            bool: 処理が成功したかどうか
+            EventResult: 処理結果
         """
         logger.info("デフォルトハンドラーでイベントを処理します")
 
@@ -141,10 +232,11 @@ class EventRouter:
                 logger.error(
                     "emailAddressがありません。デフォルトハンドラーをスキップします。"
                 )
-                return False
+                return EventResult.PERMANENT
 
             # ユーザー情報をPostgreSQLに保存/取得
-            student = crud_student.get_or_create_student(
+            student = await run_db(
+                crud_student.get_or_create_student,
                 db,
                 email=event.emailAddress,
                 name=event.userName,
@@ -155,24 +247,26 @@ class EventRouter:
             )
 
             # 時系列データをInfluxDBに書き込み
-            write_progress_event(event)
+            await batch_writer.add_progress_point(event)
             logger.info(
-                f"InfluxDB書き込み完了: {event.emailAddress}, {event.eventType}"
+                f"InfluxDB書き込みバッファに追加: {event.emailAddress}, {event.eventType}"
             )
 
-            return True
+            return EventResult.OK
+        except ValidationError as e:
+            logger.error(f"イベントデータの検証に失敗しました: {e}")
+            return EventResult.PERMANENT
         except Exception as e:
             logger.error(f"デフォルト処理中にエラー: {e}")
             # エラーハンドラーを呼び出し
             await handle_event_error(
                 error=e, event_data=event_data, context={"method": "_default_handler"}
             )
-            return False
+            return EventResult.RETRY
 
 
 # セル実行イベントのハンドラー
-@with_retry
-async def handle_cell_execution(event_data: Dict[str, Any], db: Session):
+async def handle_cell_execution(event_data: Dict[str, Any], db: Session) -> EventResult:
     """
     セル実行イベントを処理し、LMS関連テーブルにデータを永続化する
     
@@ -180,6 +274,10 @@ async def handle_cell_execution(event_data: Dict[str, Any], db: Session):
     同一セルで連続エラーが設定閾値（デフォルト3回）以上発生した場合のみ
     有意なエラーとして記録し、ダッシュボードに通知します。
 
+    即時リトライは永続化（_persist_cell_execution_batch）のみに適用する。
+    コミット後の後処理が失敗した場合、イベントは永続化済みとしてマークされるため、
+    遅延リトライではInfluxDB書き込みと通知のみが再実行される。
+
     Args:
         event_data: イベントデータを含む辞書
         db: SQLAlchemy DBセッション
@@ -193,65 +291,130 @@ async def handle_cell_execution(event_data: Dict[str, Any], db: Session):
         logger.error(
             "必須フィールド (emailAddress, notebookPath, cellId) が不足しています。"
         )
-        return
-
-    # 2. 関連エンティティの取得または作成
-    if not event.emailAddress or not event.notebookPath:
-        logger.error("emailAddress または notebookPath が None です")
-        return
-    student = crud_student.get_or_create_student(
-        db, email=event.emailAddress, name=event.userName, team_name=event.teamName
-    )
-    notebook = crud_notebook.get_or_create_notebook(db, path=event.notebookPath)
-    cell = crud_notebook.get_or_create_cell(db, notebook_id=notebook.id, event=event)
-
-    # セッションの作成または取得（学生の最新アクティブセッション）
-    session = crud_student.get_or_create_active_session(db, student_id=student.id)
-
-    # 3. セル実行履歴を作成（連続エラー検出機能統合済み）
-    execution = crud_execution.create_cell_execution(
-        db=db,
-        event=event,
-        student_id=student.id,
-        notebook_id=notebook.id,
-        cell_id=cell.id,
-        session_id=session.id,
-    )
+        return EventResult.PERMANENT
+
+    # ingest側（/api/v1/events）でPostgreSQLへ一括永続化済みの場合はDB書き込みを省略
+    if event_data.get("dbPersisted"):
+        return await _handle_persisted_cell_execution(event, event_data)
+
+    # 2. エンティティIDの解決と実行履歴の保存（バッチ経路と同じく一括永続化を使用し、
+    #    エンティティIDキャッシュにより解決済みの学生・ノートブック・セルはDB問い合わせを省略）
+    stats = await _persist_cell_execution_batch([event], db)
+    persisted_info = stats["persisted"].get(0)
+    if persisted_info is None:
+        logger.error(f"セル実行履歴を保存できませんでした: {event.emailAddress}, {event.cellId}")
+        return EventResult.RETRY
     logger.info(
-        f"PostgreSQLへの実行履歴保存完了: student_id={student.id}, notebook_id={notebook.id}, cell_id={cell.id}, "
-        f"consecutive_errors={execution.consecutive_error_count}, significant={execution.is_significant_error}"
+        f"PostgreSQLへの実行履歴保存完了: student_id={persisted_info['studentId']}, "
+        f"notebook_id={persisted_info['notebookId']}, cell_id={persisted_info['cellId_db']}"
     )
+    _mark_persisted(event_data, persisted_info)
 
-    # 4. InfluxDBに書き込むためのイベントデータを作成
-    #    Pydantic V2の推奨に従い、`model_validate` を使用してバリデーションとモデル作成を行う
-    progress_data_dict = event.model_dump()
-    progress_data_dict.update(
-        {
-            "studentId": student.id,
-            "notebookId": notebook.id,
-            "cellId_db": cell.id,  # `cellId`はJupyterのID, `cellId_db`はDBのID
-        }
-    )
-    progress_event = StudentProgress.model_validate(progress_data_dict)
+    # 3. InfluxDB書き込みとダッシュボード通知（有意なエラーの場合は特別な通知）
+    return await _handle_persisted_cell_execution(event, event_data)
+
+
+def _mark_persisted(event_data: Dict[str, Any], persisted_info: Dict[str, Any]):
+    """
+    コミット済みのイベントに解決済みIDと dbPersisted フラグを付与する
+
+    遅延リトライキューには同じ辞書が登録されるため、後処理が失敗しても
+    再試行時に実行履歴の保存・ダッシュボード集計・連続エラー数の更新は繰り返されない。
+    """
+    event_data.update(persisted_info)
+    event_data["dbPersisted"] = True
 
-    # 5. 時系列データをInfluxDBに書き込み
-    write_progress_event(progress_event)
-    logger.info(f"InfluxDBへの書き込み完了: {event.emailAddress}, {event.eventType}")
 
-    # 6. WebSocket経由でダッシュボードにリアルタイム更新を送信
-    # 🎯 重要: 有意なエラーの場合のみダッシュボードに通知
-    if execution.is_significant_error:
+async def _handle_persisted_cell_execution(
+    event: EventData, event_data: Dict[str, Any]
+) -> EventResult:
+    """
+    ingest側で永続化済みのセル実行イベントを処理する
+
+    解決済みのID・連続エラー情報はイベントに付与されているため、
+    InfluxDB書き込みとダッシュボード通知のみを行う。
+    """
+    await batch_writer.add_progress_point(event)
+    logger.info(f"InfluxDB書き込みバッファに追加（永続化済みイベント）: {event.emailAddress}, {event.eventType}")
+
+    is_significant_error = bool(event_data.get("isSignificantError"))
+    if is_significant_error:
         logger.warning(
             f"🚨 有意なエラー検出: student={event.emailAddress}, cell={event.cellId}, "
-            f"consecutive_count={execution.consecutive_error_count}"
+            f"consecutive_count={event_data.get('consecutiveErrorCount')}"
+        )
+    await notify_dashboard_update(event, None, is_significant_error=is_significant_error)
+
+    return EventResult.OK
+
+
+async def handle_cell_execution_batch(events_data: List[Dict[str, Any]], db: Session) -> List[EventResult]:
+    """
+    セル実行イベントのバッチを処理する
+
+    ingest側で永続化済みでないイベントは crud_ingest.persist_event_batch により
+    セット単位でエンティティを解決し、1トランザクションでまとめて永続化する。
+    その後、イベントごとにInfluxDB書き込みとダッシュボード通知を行う。
+
+    Args:
+        events_data: イベントデータを含む辞書のリスト
+        db: SQLAlchemy DBセッション
+
+    Returns:
+        List[EventResult]: イベントごとの処理結果（検証エラー・必須フィールドの欠落は PERMANENT）
+    """
+    results = [EventResult.RETRY] * len(events_data)
+    events: List[EventData] = []
+    indexes: List[int] = []
+    pending: List[int] = []
+
+    for index, event_data in enumerate(events_data):
+        try:
+            event = EventData.model_validate(event_data)
+        except ValidationError as e:
+            logger.error(f"セル実行イベントの検証に失敗しました: {e}")
+            results[index] = EventResult.PERMANENT
+            continue
+        if not all([event.emailAddress, event.notebookPath, event.cellId]):
+            logger.error(
+                "必須フィールド (emailAddress, notebookPath, cellId) が不足しています。"
+            )
+            results[index] = EventResult.PERMANENT
+            continue
+        events.append(event)
+        indexes.append(index)
+        if not event_data.get("dbPersisted"):
+            pending.append(len(events) - 1)
+
+    # 1. 未永続化のイベントを1トランザクションで一括永続化
+    persisted: Dict[int, Dict[str, Any]] = {}
+    if pending:
+        stats = await _persist_cell_execution_batch([events[i] for i in pending], db)
+        persisted = {pending[i]: info for i, info in stats["persisted"].items()}
+        logger.info(
+            f"PostgreSQLへの実行履歴一括保存完了: executions={stats['executions']}, "
+            f"students={stats['students']}, cells={stats['cells']}"
         )
-        # 有意なエラーの場合は特別な通知を送信
-        await notify_dashboard_update(event, student, is_significant_error=True)
-    else:
-        # 通常の更新通知
-        await notify_dashboard_update(event, student)
 
-    return True
+    # 2. InfluxDB書き込みとダッシュボード通知（永続化済みイベントと同じ経路）
+    for position, (event, index) in enumerate(zip(events, indexes)):
+        event_data = events_data[index]
+        if not event_data.get("dbPersisted"):
+            if position not in persisted:
+                continue
+            _mark_persisted(event_data, persisted[position])
+        try:
+            results[index] = await _handle_persisted_cell_execution(event, event_data)
+        except Exception as e:
+            logger.error(f"セル実行イベントの後処理に失敗しました: {event.emailAddress}, {e}")
+
+    return results
+
+
+@with_retry
+async def _persist_cell_execution_batch(events: List[EventData], db: Session) -> Dict[str, Any]:
+    """セル実行イベントを一括永続化する（失敗時はロールバック済みのためリトライ可能）"""
+    return await run_db(crud_ingest.persist_event_batch, db, events)
 
 
 async def notify_dashboard_update(event: EventData, student, is_significant_error: bool = False):
@@ -262,6 +425,8 @@ async def notify_dashboard_update(event: EventData, student, is_significant_erro
         event: イベントデータ
         student: 学生情報
         is_significant_error: 有意なエラーの場合 True
+
+    student が None の場合はイベントのユーザー名を使用する。
     """
     try:
         from db.redis_client import get_redis_client
@@ -271,7 +436,7 @@ async def notify_dashboard_update(event: EventData, student, is_significant_erro
         dashboard_update = {
             "type": "student_progress_update",
             "emailAddress": event.emailAddress,
-            "userName": student.name or event.userName or event.emailAddress,
+            "userName": (student.name if student else None) or event.userName or event.emailAddress,
             "teamName": event.teamName,
             "currentNotebook": event.notebookPath or "/unknown",
             "lastActivity": "今",
@@ -305,7 +470,7 @@ async def notify_dashboard_update(event: EventData, student, is_significant_erro
 
 # ノートブック保存イベントのハンドラー
 @with_retry
-async def handle_notebook_save(event_data: Dict[str, Any], db: Session):
+async def handle_notebook_save(event_data: Dict[str, Any], db: Session) -> EventResult:
     """
     ノートブック保存イベントの処理
 
@@ -324,18 +489,19 @@ async def handle_notebook_save(event_data: Dict[str, Any], db: Session):
             logger.error(
                 "emailAddressがありません。ノートブック保存ハンドラーをスキップします。"
             )
-            return
+            return EventResult.PERMANENT
 
         # ユーザー情報をPostgreSQLに保存/取得
-        student = crud_student.get_or_create_student(
+        student = await run_db(
+            crud_student.get_or_create_student,
             db, email=event.emailAddress, name=event.userName, team_name=event.teamName
         )
         logger.info(f"PostgreSQL処理完了: メールアドレス {student.email}")
 
         # 時系列データをInfluxDBに書き込み
-        write_progress_event(event)
-        logger.info(f"InfluxDB書き込み完了: ノートブックパス {event.notebookPath}")
-        return True
+        await batch_writer.add_progress_point(event)
+        logger.info(f"InfluxDB書き込みバッファに追加: ノートブックパス {event.notebookPath}")
+        return EventResult.OK
     except Exception as e:
         logger.error(f"ノートブック保存処理中にエラー: {e}")
         await handle_event_error(
@@ -346,7 +512,7 @@ async def handle_notebook_save(event_data: Dict[str, Any], db: Session):
 
 # 進捗更新イベントのハンドラー
 @with_retry
-async def handle_progress_update(event_data: Dict[str, Any], db: Session):
+async def handle_progress_update(event_data: Dict[str, Any], db: Session) -> EventResult:
     """
     進捗更新イベントの処理
 
@@ -361,18 +527,19 @@ async def handle_progress_update(event_data: Dict[str, Any], db: Session):
 
         if not event.emailAddress:
             logger.error("emailAddressがありません。進捗更新ハンドラーをスキップします。")
-            return False
+            return EventResult.PERMANENT
 
         # ユーザー情報をPostgreSQLに保存/取得
-        student = crud_student.get_or_create_student(
+        student = await run_db(
+            crud_student.get_or_create_student,
             db, email=event.emailAddress, name=event.userName, team_name=event.teamName
         )
         logger.info(f"PostgreSQL処理完了: メールアドレス {student.email}")
 
         # 時系列データをInfluxDBに書き込み
-        write_progress_event(event)
-        logger.info(f"InfluxDB書き込み完了: 進捗更新 {event.emailAddress}")
-        return True
+        await batch_writer.add_progress_point(event)
+        logger.info(f"InfluxDB書き込みバッファに追加: 進捗更新 {event.emailAddress}")
+        return EventResult.OK
     except Exception as e:
         logger.error(f"進捗更新処理中にエラー: {e}")
         await handle_event_error(
@@ -383,7 +550,7 @@ async def handle_progress_update(event_data: Dict[str, Any], db: Session):
 
 # エラー発生イベントのハンドラー
 @with_retry
-async def handle_error_occurred(event_data: Dict[str, Any], db: Session):
+async def handle_error_occurred(event_data: Dict[str, Any], db: Session) -> EventResult:
     """
     エラー発生イベントの処理
 
@@ -398,22 +565,23 @@ async def handle_error_occurred(event_data: Dict[str, Any], db: Session):
 
         if not event.emailAddress:
             logger.error("emailAddressがありません。エラー発生ハンドラーをスキップします。")
-            return False
+            return EventResult.PERMANENT
 
         # ユーザー情報をPostgreSQLに保存/取得
-        student = crud_student.get_or_create_student(
+        student = await run_db(
+            crud_student.get_or_create_student,
             db, email=event.emailAddress, name=event.userName, team_name=event.teamName
         )
         logger.info(f"PostgreSQL処理完了: メールアドレス {student.email}")
 
         # 時系列データをInfluxDBに書き込み（エラーフラグ付き）
-        write_progress_event(event)
-        logger.info(f"InfluxDB書き込み完了: エラーイベント {event.emailAddress}")
+        await batch_writer.add_progress_point(event)
+        logger.info(f"InfluxDB書き込みバッファに追加: エラーイベント {event.emailAddress}")
 
         # エラー専用の処理（アラート送信など）
         await _handle_error_alert(event, student)
         
-        return True
+        return EventResult.OK
     except Exception as e:
         logger.error(f"エラー発生処理中にエラー: {e}")
         await handle_event_error(
@@ -453,7 +621,7 @@ async def _handle_error_alert(event: EventData, student):
 
 # ノートブック開始イベントのハンドラー
 @with_retry
-async def handle_notebook_opened(event_data: Dict[str, Any], db: Session):
+async def handle_notebook_opened(event_data: Dict[str, Any], db: Session) -> EventResult:
     """
     ノートブック開始イベントの処理
 
@@ -468,22 +636,23 @@ async def handle_notebook_opened(event_data: Dict[str, Any], db: Session):
 
         if not event.emailAddress:
             logger.error("emailAddressがありません。ノートブック開始ハンドラーをスキップします。")
-            return False
+            return EventResult.PERMANENT
 
         # ユーザー情報をPostgreSQLに保存/取得
-        student = crud_student.get_or_create_student(
+        student = await run_db(
+            crud_student.get_or_create_student,
             db, email=event.emailAddress, name=event.userName, team_name=event.teamName
         )
         logger.info(f"PostgreSQL処理完了: メールアドレス {student.email}")
 
         # セッション開始処理（アクティブセッション作成）
-        session = crud_student.get_or_create_active_session(db, student_id=student.id)
+        session = await run_db(crud_student.get_or_create_active_session, db, student_id=student.id)
         logger.info(f"アクティブセッション作成: session_id={session.id}")
 
         # 時系列データをInfluxDBに書き込み
-        write_progress_event(event)
-        logger.info(f"InfluxDB書き込み完了: ノートブック開始 {event.notebookPath}")
-        return True
+        await batch_writer.add_progress_point(event)
+        logger.info(f"InfluxDB書き込みバッファに追加: ノートブック開始 {event.notebookPath}")
+        return EventResult.OK
     except Exception as e:
         logger.error(f"ノートブック開始処理中にエラー: {e}")
         await handle_event_error(
@@ -494,7 +663,7 @@ async def handle_notebook_opened(event_data: Dict[str, Any], db: Session):
 
 # ヘルプ要求イベントのハンドラー
 @with_retry
-async def handle_help_request(event_data: Dict[str, Any], db: Session):
+async def handle_help_request(event_data: Dict[str, Any], db: Session) -> EventResult:
     """
     ヘルプ要求イベントの処理
 
@@ -509,26 +678,29 @@ async def handle_help_request(event_data: Dict[str, Any], db: Session):
 
         if not event.emailAddress:
             logger.error("emailAddressがありません。ヘルプ要求ハンドラーをスキップします。")
-            return False
+            return EventResult.PERMANENT
 
         # ユーザー情報をPostgreSQLに保存/取得
-        student = crud_student.get_or_create_student(
+        student = await run_db(
+            crud_student.get_or_create_student,
             db, email=event.emailAddress, name=event.userName, team_name=event.teamName
         )
         logger.info(f"PostgreSQL処理完了: メールアドレス {student.email}")
 
         # ヘルプ要求フラグ設定
-        crud_student.set_help_request_status(db, student_id=student.id, is_requesting=True)
+        await run_db(crud_student.set_help_request_status, db, student_id=student.id, is_requesting=True)
+        await run_redis(help_state_index.record, event.emailAddress, HELP, event.eventTime)
+        await run_redis(dashboard_version_index.bump, [student.id])
         logger.info(f"ヘルプ要求フラグ設定: {event.emailAddress}")
 
         # 時系列データをInfluxDBに書き込み
-        write_progress_event(event)
-        logger.info(f"InfluxDB書き込み完了: ヘルプ要求 {event.emailAddress}")
+        await batch_writer.add_progress_point(event)
+        logger.info(f"InfluxDB書き込みバッファに追加: ヘルプ要求 {event.emailAddress}")
 
         # 緊急通知を送信
         await _handle_help_alert(event, student)
         
-        return True
+        return EventResult.OK
     except Exception as e:
         logger.error(f"ヘルプ要求処理中にエラー: {e}")
         await handle_event_error(
@@ -539,7 +711,7 @@ async def handle_help_request(event_data: Dict[str, Any], db: Session):
 
 # ヘルプ停止イベントのハンドラー
 @with_retry
-async def handle_help_stop(event_data: Dict[str, Any], db: Session):
+async def handle_help_stop(event_data: Dict[str, Any], db: Session) -> EventResult:
     """
     ヘルプ停止イベントの処理
 
@@ -554,23 +726,26 @@ async def handle_help_stop(event_data: Dict[str, Any], db: Session):
 
         if not event.emailAddress:
             logger.error("emailAddressがありません。ヘルプ停止ハンドラーをスキップします。")
-            return False
+            return EventResult.PERMANENT
 
         # ユーザー情報をPostgreSQLに保存/取得
-        student = crud_student.get_or_create_student(
+        student = await run_db(
+            crud_student.get_or_create_student,
             db, email=event.emailAddress, name=event.userName, team_name=event.teamName
         )
         logger.info(f"PostgreSQL処理完了: メールアドレス {student.email}")
 
         # ヘルプ要求フラグ解除
-        crud_student.set_help_request_status(db, student_id=student.id, is_requesting=False)
+        await run_db(crud_student.set_help_request_status, db, student_id=student.id, is_requesting=False)
+        await run_redis(help_state_index.record, event.emailAddress, HELP_STOP, event.eventTime)
+        await run_redis(dashboard_version_index.bump, [student.id])
         logger.info(f"ヘルプ要求フラグ解除: {event.emailAddress}")
 
         # 時系列データをInfluxDBに書き込み
-        write_progress_event(event)
-        logger.info(f"InfluxDB書き込み完了: ヘルプ停止 {event.emailAddress}")
+        await batch_writer.add_progress_point(event)
+        logger.info(f"InfluxDB書き込みバッファに追加: ヘルプ停止 {event.emailAddress}")
         
-        return True
+        return EventResult.OK
     except Exception as e:
         logger.error(f"ヘルプ停止処理中にエラー: {e}")
         await handle_event_error(
@@ -608,7 +783,7 @@ async def _handle_help_alert(event: EventData, student):
 
 
 # 講師セッション開始イベントのハンドラー
-async def handle_student_session_start(event_data: Dict[str, Any], db: Session) -> bool:
+async def handle_student_session_start(event_data: Dict[str, Any], db: Session) -> EventResult:
     """
     学生セッション開始時の講師ステータス自動更新
 
@@ -617,25 +792,26 @@ async def handle_student_session_start(event_data: Dict[str, Any], db: Session)
         db: SQLAlchemy DBセッション
 
     Returns:
-        bool: 処理が成功したかどうか
+        EventResult: 処理結果
     """
     try:
         instructor_id = event_data.get("instructor_id")
         student_id = event_data.get("student_id")
 
+        # instructor_id の欠落・存在しない講師は再試行しても成功しない
         if not instructor_id:
             logger.warning("instructor_idが指定されていません")
-            return False
+            return EventResult.PERMANENT
 
         # 講師ステータスをIN_SESSIONに更新
         from crud.crud_instructor import get_instructor, update_instructor_status
         from schemas.instructor import InstructorStatusUpdate
         from db.models import InstructorStatus
 
-        instructor = get_instructor(db, instructor_id)
+        instructor = await run_db(get_instructor, db, instructor_id)
         if not instructor:
             logger.error(f"講師が見つかりません: {instructor_id}")
-            return False
+            return EventResult.PERMANENT
 
         # セッション情報は別途管理し、current_session_idはNullに設定
         # （外部キー制約を回避するため）
@@ -643,7 +819,9 @@ async def handle_student_session_start(event_data: Dict[str, Any], db: Session)
             status=InstructorStatus.IN_SESSION, current_session_id=None
         )
 
-        updated_instructor = update_instructor_status(db, instructor_id, status_update)
+        updated_instructor = await run_db(
+            update_instructor_status, db, instructor_id, status_update
+        )
         if updated_instructor:
             logger.info(f"講師ステータスを更新しました: {instructor_id} -> IN_SESSION")
 
@@ -653,18 +831,18 @@ async def handle_student_session_start(event_data: Dict[str, Any], db: Session)
                 instructor_id, "in_session", session_info
             )
 
-            return True
+            return EventResult.OK
         else:
             logger.error(f"講師ステータス更新に失敗しました: {instructor_id}")
-            return False
+            return EventResult.RETRY
 
     except Exception as e:
         logger.error(f"学生セッション開始処理でエラーが発生しました: {e}")
-        return False
+        return EventResult.RETRY
 
 
 # 講師割り当てイベントのハンドラー
-async def handle_instructor_assignment(event_data: Dict[str, Any], db: Session) -> bool:
+async def handle_instructor_assignment(event_data: Dict[str, Any], db: Session) -> EventResult:
     """
     講師-学生マッチング機能
 
@@ -673,7 +851,7 @@ async def handle_instructor_assignment(event_data: Dict[str, Any], db: Session)
         db: SQLAlchemy DBセッション
 
     Returns:
-        bool: 処理が成功したかどうか
+        EventResult: 処理結果
     """
     try:
         student_id = event_data.get("student_id")
@@ -681,11 +859,17 @@ async def handle_instructor_assignment(event_data: Dict[str, Any], db: Session)
         subject = event_data.get("subject", "")
         priority = event_data.get("priority", "normal")
 
+        if not student_id:
+            logger.warning("student_idが指定されていません")
+            return EventResult.PERMANENT
+
         # 利用可能な講師を検索
         from crud.crud_instructor import get_instructors
         from db.models import InstructorStatus
 
-        available_instructors = get_instructors(db, skip=0, limit=10, is_active=True)
+        available_instructors = await run_db(
+            get_instructors, db, skip=0, limit=10, is_active=True
+        )
 
         # AVAILABLE状態の講師を優先的に選択
         selected_instructor = None
@@ -694,9 +878,10 @@ async def handle_instructor_assignment(event_data: Dict[str, Any], db: Session)
                 selected_instructor = instructor
                 break
 
+        # 講師が空くまで再試行する
         if not selected_instructor:
             logger.warning(f"利用可能な講師が見つかりません: student_id={student_id}")
-            return False
+            return EventResult.RETRY
 
         # 講師をIN_SESSIONに更新
         from crud.crud_instructor import update_instructor_status
@@ -708,8 +893,8 @@ async def handle_instructor_assignment(event_data: Dict[str, Any], db: Session)
             status=InstructorStatus.IN_SESSION, current_session_id=None
         )
 
-        updated_instructor = update_instructor_status(
-            db, selected_instructor.id, status_update
+        updated_instructor = await run_db(
+            update_instructor_status, db, selected_instructor.id, status_update
         )
         if updated_instructor:
             logger.info(
@@ -721,14 +906,14 @@ async def handle_instructor_assignment(event_data: Dict[str, Any], db: Session)
                 selected_instructor.id, student_id, class_id
             )
 
-            return True
+            return EventResult.OK
         else:
             logger.error(f"講師割り当てに失敗しました: {selected_instructor.id}")
-            return False
+            return EventResult.RETRY
 
     except Exception as e:
         logger.error(f"講師割り当て処理でエラーが発生しました: {e}")
-        return False
+        return EventResult.RETRY
 
 
 # WebSocket通知ヘルパー関数
@@ -791,6 +976,7 @@ event_router = EventRouter()
 event_router.register_handler(
     "cell_executed", handle_cell_execution
 )  # フロントエンドのイベント名に合わせる
+event_router.register_batch_handler("cell_executed", handle_cell_execution_batch)
 event_router.register_handler("notebook_save", handle_notebook_save)
 event_router.register_handler("notebook_saved", handle_notebook_save)  # エイリアス
 
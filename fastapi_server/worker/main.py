@@ -4,6 +4,9 @@ import logging
 import os
 import sys
 import signal
+import multiprocessing
+import time
+from typing import Callable, Dict, List, Optional
 
 # プロジェクトのルートディレクトリをsys.pathに追加
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -15,11 +18,18 @@ from db.redis_client import (  # noqa: E402
     ERROR_CHANNEL,
     NOTIFICATION_CHANNEL,
     PROGRESS_CHANNEL,
+    PROGRESS_CONSUMER_GROUP,
     get_redis_client,
+    progress_stream_name,
+    safe_redis_publish_batch,
 )
 from db.session import SessionLocal  # noqa: E402
-from worker.event_router import event_router  # noqa: E402
+from db.executor import db_executor, influx_executor, redis_executor  # noqa: E402
+from worker.event_router import EventResult, event_router  # noqa: E402
 from worker.health_monitor import health_monitor  # noqa: E402
+from worker.stream_consumer import ProgressStreamConsumer, default_consumer_name  # noqa: E402
+from worker.backlog_reporter import BacklogReporter, PubSubBacklog  # noqa: E402
+from worker.dashboard_version_sweeper import DashboardVersionSweeper  # noqa: E402
 from worker.parallel_processor import (  # noqa: E402
     parallel_processor,
     initialize_parallel_processing,
@@ -27,7 +37,9 @@ from worker.parallel_processor import (  # noqa: E402
     process_event_parallel
 )
 from core.realtime_notifier import realtime_notifier  # noqa: E402
+from core.retry_queue import RetryEntry, event_retry_queue  # noqa: E402
 from core.influxdb_batch_writer import batch_writer  # noqa: E402
+from core.influx_rollup import InfluxRollupScheduler  # noqa: E402
 
 # ロガーの設定
 logging.basicConfig(
@@ -52,8 +64,307 @@ def get_db():
         db.close()
 
 
-async def listen_to_redis():
-    """RedisのPub/Subをリッスンし、イベントルーターを使用してイベントを処理する"""
+async def _route_event_directly(event_data: dict) -> EventResult:
+    """イベントルーター経由で同期的に処理（ハンドラー内でコミットまで完了）"""
+    db = SessionLocal()
+    try:
+        return await event_router.route_event(event_data, db)
+    finally:
+        db.close()
+
+
+async def _process_event_batch(events: List[dict]) -> List[EventResult]:
+    """イベントタイプごとにまとめて処理する（バッチ対応ハンドラーはコミット1回）"""
+    db = SessionLocal()
+    try:
+        return await event_router.route_batch(events, db)
+    finally:
+        db.close()
+
+
+async def _process_events(events: List[dict]) -> List[EventResult]:
+    """
+    WORKER_BATCH_MODE の場合はまとめて、それ以外は1件ずつ直接処理する
+
+    Pub/Sub・Streams の読み込みループと遅延リトライの再処理が同時に呼び出すため、
+    イベント数分の実行枠を同時実行数リミッター（AIMD）から取得してから処理する。
+    """
+    async with parallel_processor.limiter.slot(len(events)):
+        return await _route_events(events)
+
+
+async def _route_events(events: List[dict]) -> List[EventResult]:
+    if settings.WORKER_BATCH_MODE:
+        try:
+            return await _process_event_batch(events)
+        except Exception as e:
+            logger.error(f"バッチ処理中にエラー（{len(events)}件）: {e}")
+            return [EventResult.RETRY] * len(events)
+
+    results = []
+    for event_data in events:
+        try:
+            results.append(await _route_event_directly(event_data))
+        except Exception as e:
+            logger.error(f"イベント処理中にエラー（{event_data.get('eventType', 'unknown')}）: {e}")
+            results.append(EventResult.RETRY)
+    return results
+
+
+async def _schedule_retries(
+    events: List[dict], results: List[EventResult], attempts: Optional[List[int]] = None
+) -> bool:
+    """
+    処理に失敗したイベントを遅延リトライキューに登録する
+
+    再試行しても成功しない失敗（EventResult.PERMANENT）はリトライせずにデッドレターに移す。
+
+    Args:
+        events: 処理したイベント
+        results: イベントごとの処理結果
+        attempts: イベントごとの失敗済み試行回数（リトライからの再処理の場合）
+
+    Returns:
+        bool: 失敗イベントを全て登録できた（手放してよい）かどうか
+    """
+    attempts = attempts or [0] * len(events)
+    failed = [(event_data, attempt) for event_data, attempt, result
+              in zip(events, attempts, results) if result is EventResult.RETRY]
+    permanent = [(event_data, attempt) for event_data, attempt, result
+                 in zip(events, attempts, results) if result is EventResult.PERMANENT]
+    if not failed and not permanent:
+        return True
+    try:
+        if permanent:
+            await event_retry_queue.dead_letter(
+                [event_data for event_data, _ in permanent],
+                error="イベントの検証に失敗しました（必須フィールドの欠落を含む）",
+                attempts=[attempt for _, attempt in permanent],
+            )
+        if failed:
+            await event_retry_queue.schedule(
+                [event_data for event_data, _ in failed],
+                error="イベント処理に失敗しました",
+                attempts=[attempt for _, attempt in failed],
+            )
+        return True
+    except Exception as e:
+        logger.error(
+            f"遅延リトライ・デッドレターへの登録に失敗しました（{len(failed) + len(permanent)}件）: {e}"
+        )
+        return False
+
+
+async def _process_retry_entries(entries: List[RetryEntry]):
+    """次回試行時刻に達したイベントを再処理し、再度失敗したものは試行回数を進めて再登録する"""
+    events = [entry.event for entry in entries]
+    results = await _process_events(events)
+    await _publish_batch_results(events, results)
+    if not await _schedule_retries(events, results, [entry.attempt for entry in entries]):
+        failed_count = len(events) - results.count(EventResult.OK)
+        logger.critical(f"リトライ対象のイベントを再登録できず破棄しました: {failed_count} 件")
+    logger.info(
+        f"[WORKER] Retry batch processed: {results.count(EventResult.OK)}/{len(events)} succeeded"
+    )
+
+
+async def _send_realtime_updates(event_data: dict):
+    """処理済みイベントのリアルタイム通知（InfluxDBへの書き込みは各イベントハンドラーで行う）"""
+    # リアルタイムWebSocket通知を送信
+    try:
+        event_type = event_data.get("eventType", "unknown")
+        if event_type in ["execute_request", "cell_execution"]:
+            await realtime_notifier.send_progress_notification(event_data)
+        elif event_type in ["help_request", "error_occurred"]:
+            await realtime_notifier.send_help_request_notification(event_data)
+    except Exception as notify_error:
+        logger.warning(f"リアルタイム通知送信に失敗: {notify_error}")
+
+
+async def _publish_batch_results(events: List[dict], results: List[EventResult]):
+    """
+    バッチの処理結果に応じて完了通知・リアルタイム通知・エラーログを発行する
+
+    完了通知とエラーログはそれぞれ1つのパイプラインでまとめてPUBLISHする。
+    """
+    notifications = []
+    error_logs = []
+    processed_at = None
+
+    for event_data, result in zip(events, results):
+        # ヘルス監視: 処理済みメッセージ数を更新
+        health_monitor.increment_processed_messages()
+
+        if result is EventResult.OK:
+            if processed_at is None:
+                processed_at = json.dumps(health_monitor.get_health_status())
+            notifications.append(json.dumps({
+                "emailAddress": event_data.get("emailAddress"),
+                "notebookPath": event_data.get("notebookPath"),
+                "event": event_data.get("event"),
+                "status": "processed",
+                "processedAt": processed_at,
+            }))
+            await _send_realtime_updates(event_data)
+        else:
+            # ヘルス監視: エラー数を更新
+            health_monitor.increment_error_count()
+
+            # 処理に失敗した場合はエラーログを送信
+            error_log = {
+                "timestamp": event_data.get("timestamp", "unknown"),
+                "emailAddress": event_data.get("emailAddress", "unknown"),
+                "event": event_data.get("event", "unknown"),
+                "error": "イベント処理に失敗しました",
+                "status": "failed",
+            }
+            error_logs.append(json.dumps(error_log))
+            logger.error(f"処理失敗: {error_log}")
+
+    if notifications:
+        await safe_redis_publish_batch(NOTIFICATION_CHANNEL, notifications)
+        logger.info(f"処理完了通知を送信: {len(notifications)} 件")
+    if error_logs:
+        await safe_redis_publish_batch(ERROR_CHANNEL, error_logs)
+
+
+async def _publish_processing_result(event_data: dict, result: EventResult):
+    """処理結果に応じて完了通知・リアルタイム通知・エラーログを発行する"""
+    await _publish_batch_results([event_data], [result])
+
+
+async def _process_stream_entries(stream_consumer: ProgressStreamConsumer, entries) -> int:
+    """
+    ストリームエントリを処理し、コミット済みのエントリと遅延リトライに登録できたエントリをACKする
+
+    WORKER_BATCH_MODE の場合は読み込んだエントリをまとめて処理する。
+    処理に失敗したエントリは遅延リトライキューに登録し、登録できなかった場合のみ
+    ACKせずにペンディングのまま残してXAUTOCLAIMで再配信させる。
+    """
+    ack_ids = []
+    entry_ids = []
+    events = []
+    for entry_id, fields in entries:
+        try:
+            event_data = json.loads(fields.get("data", ""))
+        except (json.JSONDecodeError, TypeError) as e:
+            # 再配信しても解析できないためACKして破棄
+            logger.error(f"JSON解析エラー（stream entry {entry_id}）: {e}")
+            health_monitor.increment_error_count()
+            ack_ids.append(entry_id)
+            continue
+        entry_ids.append(entry_id)
+        events.append(event_data)
+
+    # ACKはコミット後に行うため、並列キューを経由せず直接処理する
+    results = await _process_events(events) if events else []
+
+    await _publish_batch_results(events, results)
+    retry_scheduled = await _schedule_retries(events, results)
+    ack_ids.extend(
+        entry_id
+        for entry_id, result in zip(entry_ids, results)
+        if result is EventResult.OK or retry_scheduled
+    )
+
+    await stream_consumer.ack(ack_ids)
+    return len(ack_ids)
+
+
+async def _drain_pubsub_batch(pubsub) -> List[dict]:
+    """
+    Pub/Subから最大 WORKER_BATCH_MAX_EVENTS 件のメッセージを取り出す
+
+    最初のメッセージは最大10秒待ち、以降は WORKER_BATCH_MAX_WAIT_MS まで追加で待つ。
+    """
+    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=10.0)
+    if not message:
+        return []
+
+    messages = [message]
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + settings.WORKER_BATCH_MAX_WAIT_MS / 1000
+    while len(messages) < settings.WORKER_BATCH_MAX_EVENTS:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+        if message:
+            messages.append(message)
+    return messages
+
+
+def _parse_messages(messages: List[dict]) -> List[dict]:
+    """Pub/SubメッセージをJSONとして解析する（解析できないメッセージは破棄）"""
+    events = []
+    for message in messages:
+        try:
+            events.append(json.loads(message["data"]))
+        except (json.JSONDecodeError, TypeError) as e:
+            logger.error(f"JSON解析エラー: {e}")
+            health_monitor.increment_error_count()
+    return events
+
+
+async def listen_to_stream(stream_consumer: ProgressStreamConsumer):
+    """Redis Streamsのコンシューマーグループからブロック単位でイベントを読み込み処理する"""
+    claim_interval = stream_consumer.claim_idle_ms / 2000  # 秒
+    last_claim_time = 0.0
+    last_trim_time = 0.0
+    loop = asyncio.get_event_loop()
+
+    # 同じコンシューマー名の前回のプロセスが残した未ACKエントリを新着より先に処理
+    # （失敗した場合は claim_stale の回収に任せる）
+    try:
+        while health_monitor.is_running:
+            pending = await stream_consumer.read_pending()
+            if not pending:
+                break
+            acked = await _process_stream_entries(stream_consumer, pending)
+            logger.info(f"[WORKER] Pending stream entries reprocessed: {acked}/{len(pending)} acked")
+    except Exception as e:
+        logger.error(f"未ACKエントリの再処理中にエラーが発生しました: {e}")
+        health_monitor.increment_error_count()
+
+    while health_monitor.is_running:
+        try:
+            # 停止したコンシューマーに残った未ACKエントリを定期的に回収し、空になったコンシューマーを削除
+            if loop.time() - last_claim_time >= claim_interval:
+                last_claim_time = loop.time()
+                claimed = await stream_consumer.claim_stale()
+                if claimed:
+                    await _process_stream_entries(stream_consumer, claimed)
+                await stream_consumer.remove_stale_consumers()
+
+            # ACK済みのエントリのみをトリム（未配信・未ACKのエントリは残す）
+            if loop.time() - last_trim_time >= settings.PROGRESS_STREAM_TRIM_INTERVAL_SECONDS:
+                last_trim_time = loop.time()
+                await stream_consumer.trim_acked()
+
+            entries = await stream_consumer.read_batch()
+            if not entries:
+                continue
+
+            acked = await _process_stream_entries(stream_consumer, entries)
+            logger.info(f"[WORKER] Stream batch processed: {acked}/{len(entries)} acked")
+
+        except Exception as e:
+            logger.error(f"ストリーム読み込み中に予期しないエラーが発生しました: {e}")
+            health_monitor.increment_error_count()
+            # エラーが発生しても処理を継続するために少し待つ
+            await asyncio.sleep(5)
+
+
+async def listen_to_redis(shard: Optional[int] = None):
+    """
+    Redisから進捗イベントを受信し、イベントルーターを使用してイベントを処理する
+
+    EVENT_INGEST_MODE=pubsub の場合はPub/Subを、stream の場合はRedis Streamsの
+    コンシューマーグループを使用する。
+
+    Args:
+        shard: 処理するシャード番号（stream モードで WORKER_SHARD_COUNT > 1 の場合）
+    """
     print("[WORKER] Starting worker process...")
     logger.info("[WORKER] Starting worker process...")
 
@@ -77,7 +388,7 @@ async def listen_to_redis():
     
     # InfluxDBバッチライター初期化
     try:
-        await batch_writer.start_batch_writer()
+        await batch_writer.start_batch_writer(spill_owner=f"shard-{shard or 0}-{os.getpid()}")
         print("[WORKER] InfluxDB batch writer initialized")
     except Exception as e:
         print(f"[WORKER] Failed to initialize InfluxDB batch writer: {e}")
@@ -112,10 +423,27 @@ async def listen_to_redis():
         print("[WORKER] Redis connection successful")
         logger.info("[WORKER] Redis connection successful")
 
-        pubsub = redis_client.pubsub()
-        await pubsub.subscribe(PROGRESS_CHANNEL)
-        print(f"[WORKER] Subscribed to channel: '{PROGRESS_CHANNEL}'")
-        logger.info(f"[WORKER] Subscribed to channel: '{PROGRESS_CHANNEL}'")
+        pubsub = None
+        pubsub_backlog = None
+        stream_consumer = None
+        if settings.EVENT_INGEST_MODE == "stream":
+            # Streamsモード: コンシューマーグループ経由で読み込む
+            stream_consumer = ProgressStreamConsumer(
+                redis_client,
+                consumer_name=settings.WORKER_CONSUMER_NAME or default_consumer_name(shard or 0),
+                stream=progress_stream_name(shard or 0),
+            )
+            await stream_consumer.initialize()
+            print(f"[WORKER] Joined consumer group '{PROGRESS_CONSUMER_GROUP}' on '{stream_consumer.stream}' as '{stream_consumer.consumer_name}'")
+            logger.info(f"[WORKER] Joined consumer group '{PROGRESS_CONSUMER_GROUP}' on '{stream_consumer.stream}'")
+        else:
+            pubsub = redis_client.pubsub()
+            await pubsub.subscribe(PROGRESS_CHANNEL)
+            # 購読開始以降に発行されたイベントのうち未処理の件数を流量制御に報告する
+            pubsub_backlog = PubSubBacklog(redis_client)
+            await pubsub_backlog.start()
+            print(f"[WORKER] Subscribed to channel: '{PROGRESS_CHANNEL}'")
+            logger.info(f"[WORKER] Subscribed to channel: '{PROGRESS_CHANNEL}'")
 
     except Exception as e:
         print(f"[WORKER] Failed to initialize Redis connection: {e}")
@@ -124,6 +452,33 @@ async def listen_to_redis():
         heartbeat_task.cancel()
         raise
 
+    # 処理待ち件数の報告を開始（API側の流量制御に使用）
+    backlog_reporter = BacklogReporter(
+        redis_client, stream_consumer, pubsub_backlog=pubsub_backlog
+    )
+    backlog_task = asyncio.create_task(
+        backlog_reporter.run(lambda: health_monitor.is_running)
+    )
+
+    # 遅延リトライのスケジューラーを開始（シャード指定時は自シャードの学生のリトライのみ取り出し、
+    # 学生内の順序を保つ）
+    retry_task = asyncio.create_task(
+        event_retry_queue.run(lambda: health_monitor.is_running, _process_retry_entries, shard)
+    )
+
+    # 時間経過による表示状態の遷移をダッシュボードのバージョンに反映し、
+    # 進捗イベントのロールアップを更新する（複数シャードでは1プロセスのみ）
+    sweeper_task = None
+    rollup_task = None
+    if not shard:
+        sweeper_task = asyncio.create_task(
+            DashboardVersionSweeper().run(lambda: health_monitor.is_running)
+        )
+        if settings.INFLUX_ROLLUP_ENABLED:
+            rollup_task = asyncio.create_task(
+                InfluxRollupScheduler().run(lambda: health_monitor.is_running)
+            )
+
     print("[WORKER] Starting message listening loop...")
     logger.info("[WORKER] Starting message listening loop...")
 
@@ -131,19 +486,52 @@ async def listen_to_redis():
     last_activity_log = 0
 
     try:
-        while health_monitor.is_running:
+        if stream_consumer is not None:
+            await listen_to_stream(stream_consumer)
+
+        # Pub/Subモードでは pubsub と pubsub_backlog の両方が初期化済み
+        while (
+            pubsub is not None
+            and pubsub_backlog is not None
+            and health_monitor.is_running
+        ):
             try:
                 # 100メッセージ毎に活動ログを出力
                 if message_count - last_activity_log >= 100:
                     print(f"[WORKER] Processed {message_count} messages total")
                     last_activity_log = message_count
 
+                if settings.WORKER_BATCH_MODE:
+                    # マイクロバッチ: N件 または T ミリ秒まで溜めてまとめて処理
+                    messages = await _drain_pubsub_batch(pubsub)
+                    if not messages:
+                        if message_count % 60 == 0:  # 10分毎にログ出力 (10秒*60回)
+                            print(f"[WORKER] Waiting... (Processed {health_monitor.processed_messages} messages so far)")
+                        continue
+
+                    message_count += len(messages)
+                    try:
+                        events = _parse_messages(messages)
+                        if events:
+                            results = await _process_events(events)
+                            await _publish_batch_results(events, results)
+                            await _schedule_retries(events, results)
+                            logger.info(
+                                f"[WORKER] Batch processed: "
+                                f"{results.count(EventResult.OK)}/{len(events)} succeeded"
+                            )
+                    finally:
+                        pubsub_backlog.mark_finished(len(messages))
+                    continue
+
                 message = await pubsub.get_message(
                     ignore_subscribe_messages=True, timeout=10.0  # 10秒タイムアウト
                 )
                 
                 if message:
                     message_count += 1
+                    # 以降は並列処理キューの深さとして報告される
+                    pubsub_backlog.mark_finished(1)
                     print(f"[WORKER] Received message #{message_count}: {message['data'][:100]}...")
                     logger.info(f"[WORKER] Received message #{message_count}")
 
@@ -157,72 +545,16 @@ async def listen_to_redis():
                     try:
                         task_id = await process_event_parallel(event_data)
                         logger.debug(f"[WORKER] Event queued for parallel processing: {task_id}")
-                        success = True  # 並列キューイング成功
+                        result = EventResult.OK  # 並列キューイング成功
                     except Exception as parallel_error:
                         logger.warning(f"[WORKER] Parallel processing failed, falling back to direct processing: {parallel_error}")
                         
                         # フォールバック: 従来の直接処理
-                        db = SessionLocal()
-                        try:
-                            success = await event_router.route_event(event_data, db)
-                        finally:
-                            db.close()
+                        result = await _route_event_directly(event_data)
                     
-                    # ヘルス監視: 処理済みメッセージ数を更新
-                    health_monitor.increment_processed_messages()
-
-                    if success:
-                            # 処理が成功したら通知を送信
-                            notification = {
-                                "emailAddress": event_data.get("emailAddress"),
-                                "notebookPath": event_data.get("notebookPath"),
-                                "event": event_data.get("event"),
-                                "status": "processed",
-                                "processedAt": json.dumps(health_monitor.get_health_status())
-                            }
-                            # Publisher用のクライアントを別途取得してpublishする
-                            publisher_redis = await get_redis_client()
-                            await publisher_redis.publish(
-                                NOTIFICATION_CHANNEL, json.dumps(notification)
-                            )
-                            
-                            # リアルタイムWebSocket通知を送信
-                            try:
-                                event_type = event_data.get("eventType", "unknown")
-                                if event_type in ["execute_request", "cell_execution"]:
-                                    await realtime_notifier.send_progress_notification(event_data)
-                                elif event_type in ["help_request", "error_occurred"]:
-                                    await realtime_notifier.send_help_request_notification(event_data)
-                            except Exception as notify_error:
-                                logger.warning(f"リアルタイム通知送信に失敗: {notify_error}")
-                            
-                            # InfluxDBバッチライターに追加
-                            try:
-                                await batch_writer.add_progress_point(event_data)
-                            except Exception as batch_error:
-                                logger.warning(f"InfluxDBバッチ書き込み追加に失敗: {batch_error}")
-                            
-                            logger.info(
-                                f"処理完了通知を送信: {event_data.get('event')} イベント"
-                            )
-                    else:
-                        # ヘルス監視: エラー数を更新
-                        health_monitor.increment_error_count()
-                        
-                        # 処理に失敗した場合はエラーログを送信
-                        error_log = {
-                            "timestamp": event_data.get("timestamp", "unknown"),
-                            "emailAddress": event_data.get("emailAddress", "unknown"),
-                            "event": event_data.get("event", "unknown"),
-                            "error": "イベント処理に失敗しました",
-                            "status": "failed",
-                        }
-                        publisher_redis = await get_redis_client()
-                        await publisher_redis.publish(
-                            ERROR_CHANNEL, json.dumps(error_log)
-                        )
-                        logger.error(f"処理失敗: {error_log}")
-                        
+                    await _publish_processing_result(event_data, result)
+                    await _schedule_retries([event_data], [result])
+
                 else:
                     # メッセージがない場合（タイムアウト）
                     if message_count % 60 == 0:  # 10分毎にログ出力 (10秒*60回)
@@ -265,6 +597,30 @@ async def listen_to_redis():
             await heartbeat_task
         except asyncio.CancelledError:
             pass
+
+        # 処理待ち件数の報告を停止
+        backlog_task.cancel()
+        try:
+            await backlog_task
+        except asyncio.CancelledError:
+            pass
+        await backlog_reporter.clear()
+
+        # 遅延リトライのスケジューラーを停止（未処理のリトライはキューに残る）
+        retry_task.cancel()
+        try:
+            await retry_task
+        except asyncio.CancelledError:
+            pass
+
+        for task in (sweeper_task, rollup_task):
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
         
         # Phase 3: 並列処理システム終了
         try:
@@ -280,12 +636,18 @@ async def listen_to_redis():
         except Exception as e:
             logger.error(f"InfluxDB batch writer shutdown error: {e}")
         
+        # 同期DB・InfluxDB・Redis呼び出し用スレッドプールの停止
+        db_executor.shutdown()
+        influx_executor.shutdown()
+        redis_executor.shutdown()
+
         # ヘルス監視システム終了
         await health_monitor.shutdown()
         
         # Redis接続を閉じる
         try:
-            await pubsub.close()
+            if pubsub is not None:
+                await pubsub.close()
             # Redis接続は共有プールのため明示的にcloseしない
         except Exception as e:
             logger.error(f"Redis cleanup error: {e}")
@@ -298,13 +660,14 @@ def signal_handler(signum, frame):
     health_monitor.is_running = False
 
 
-if __name__ == "__main__":
+def run_worker(shard: Optional[int] = None):
+    """ワーカープロセスを実行（シャード指定時はそのシャードのストリームのみ処理）"""
     # シグナルハンドラーを設定
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
-    
+
     try:
-        asyncio.run(listen_to_redis())
+        asyncio.run(listen_to_redis(shard))
     except KeyboardInterrupt:
         print("[WORKER] Received keyboard interrupt, shutting down...")
         logger.info("[WORKER] Received keyboard interrupt, shutting down...")
@@ -312,3 +675,117 @@ if __name__ == "__main__":
         print(f"[WORKER] Unexpected error: {e}")
         logger.error(f"[WORKER] Unexpected error: {e}")
         raise
+
+
+class ShardSupervisor:
+    """
+    シャードごとのワーカープロセスを起動・監視するクラス
+
+    停止したシャードのストリームは他のプロセスが処理しないため、停止要求前に終了した
+    シャードプロセスは指数バックオフ付きで同じシャード番号のまま再起動する。
+    """
+
+    def __init__(
+        self,
+        shard_count: int,
+        start_process: Optional[Callable[[int], multiprocessing.process.BaseProcess]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.shard_count = shard_count
+        self._start_process = start_process or self._spawn
+        self._clock = clock
+        self._context = multiprocessing.get_context("spawn")
+        self.processes: Dict[int, multiprocessing.process.BaseProcess] = {}
+        self._started_at: Dict[int, float] = {}
+        self._restart_at: Dict[int, float] = {}
+        self._backoff: Dict[int, float] = {}
+        self.stopping = False
+        self.restarts = 0
+
+    def _spawn(self, shard: int) -> multiprocessing.process.BaseProcess:
+        process = self._context.Process(
+            target=run_worker, args=(shard,), name=f"worker-shard-{shard}"
+        )
+        process.start()
+        return process
+
+    def _start(self, shard: int):
+        self.processes[shard] = self._start_process(shard)
+        self._started_at[shard] = self._clock()
+
+    def start(self):
+        """全シャードのプロセスを起動"""
+        for shard in range(self.shard_count):
+            self._start(shard)
+        logger.info(f"[WORKER] Started {self.shard_count} shard worker processes")
+
+    def stop(self):
+        """停止要求: 再起動をやめ、各シャードプロセスにシグナルを転送"""
+        self.stopping = True
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+
+    def check(self):
+        """終了したシャードプロセスを検出し、再起動時刻に達したものを再起動する"""
+        now = self._clock()
+        for shard, process in list(self.processes.items()):
+            if process.is_alive() or self.stopping:
+                continue
+            if shard not in self._restart_at:
+                # 十分に稼働していた場合はバックオフを初期値に戻す
+                if now - self._started_at[shard] >= settings.WORKER_SHARD_STABLE_SECONDS:
+                    self._backoff.pop(shard, None)
+                backoff = self._backoff.get(shard, settings.WORKER_SHARD_RESTART_BACKOFF_SECONDS)
+                self._backoff[shard] = min(
+                    backoff * 2, settings.WORKER_SHARD_RESTART_BACKOFF_MAX_SECONDS
+                )
+                self._restart_at[shard] = now + backoff
+                logger.error(
+                    f"[WORKER] {process.name} exited with code {process.exitcode}, "
+                    f"restarting in {backoff:.1f}s"
+                )
+            elif now >= self._restart_at[shard]:
+                del self._restart_at[shard]
+                self._start(shard)
+                self.restarts += 1
+                logger.info(f"[WORKER] Restarted worker-shard-{shard}")
+
+    def run(self, poll_interval: float = 1.0):
+        """停止要求があり全プロセスが終了するまで監視を続ける"""
+        while not self.stopping or any(p.is_alive() for p in self.processes.values()):
+            self.check()
+            time.sleep(poll_interval)
+        for process in self.processes.values():
+            process.join()
+
+
+def run_sharded_workers(shard_count: int):
+    """
+    シャードごとにワーカープロセスを起動し、停止要求まで監視する
+
+    各シャードは1プロセスのみが処理するため、学生内のイベント順序が保たれる。
+    異常終了したシャードはバックオフ付きで再起動する。
+    """
+    supervisor = ShardSupervisor(shard_count)
+    supervisor.start()
+
+    def terminate_shards(signum, frame):
+        """親プロセスへのシグナルを各シャードプロセスに転送"""
+        supervisor.stop()
+
+    signal.signal(signal.SIGTERM, terminate_shards)
+    signal.signal(signal.SIGINT, terminate_shards)
+
+    supervisor.run()
+
+
+if __name__ == "__main__":
+    if (
+        settings.EVENT_INGEST_MODE == "stream"
+        and settings.WORKER_SHARD_COUNT > 1
+        and settings.WORKER_SHARD_INDEX is None
+    ):
+        run_sharded_workers(settings.WORKER_SHARD_COUNT)
+    else:
+        run_worker(settings.WORKER_SHARD_INDEX)
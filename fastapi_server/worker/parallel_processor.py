@@ -5,23 +5,27 @@ Phase 3.2: 並列イベント処理システム
 特徴:
 - 複数ワーカープロセス並列実行
 - 動的負荷分散
-- イベントタイプ別処理優先度
+- イベントタイプ別処理優先度（エージング付き優先度スケジューラー）
 - 障害回復機能
 - パフォーマンス監視
 """
 
 import asyncio
+import heapq
+import itertools
 import json
 import logging
 import time
 import uuid
 from datetime import datetime, timezone
-from typing import Dict, List, Any, Optional, Callable
+from typing import Dict, List, Any, Optional, Callable, TypedDict
 from dataclasses import dataclass, field
 from enum import Enum
 import concurrent.futures
 from collections import defaultdict
 
+from worker.concurrency_limiter import AIMDConcurrencyLimiter
+
 logger = logging.getLogger(__name__)
 
 
@@ -62,6 +66,16 @@ class ProcessingTask:
         }
 
 
+class ProcessingStats(TypedDict):
+    """プロセッサー全体の処理統計"""
+    total_tasks_processed: int
+    total_tasks_failed: int
+    avg_processing_time: float
+    queue_sizes: Dict[str, int]
+    active_workers: int
+    last_reset: datetime
+
+
 @dataclass
 class WorkerMetrics:
     """ワーカーメトリクス"""
@@ -82,6 +96,141 @@ class WorkerMetrics:
             self.processing_time_avg = (self.processing_time_avg * 0.8) + (duration * 0.2)
 
 
+# エージング: 優先度が1段階低いタスクは、この秒数だけ後に投入された高優先度タスクと同等に扱う
+# （高優先度タスクが流れ続けても低優先度タスクが無期限に待たされない）
+AGING_STEP_SECONDS = 2.0
+
+# 優先度ごとの最大キュー長
+QUEUE_CAPACITY = {
+    EventPriority.HIGH: 100,
+    EventPriority.MEDIUM: 200,
+    EventPriority.LOW: 500,
+}
+
+# キュー待ち時間ヒストグラムのバケット上限（ミリ秒）
+WAIT_HISTOGRAM_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+# スケールダウン: キューが空の監視周期がこの回数続いたらアイドルワーカーを1つ停止
+SCALE_DOWN_IDLE_CYCLES = 3
+MIN_WORKERS = 2
+
+
+class QueueWaitHistogram:
+    """キュー待ち時間のヒストグラム（累積ではないバケット別件数）"""
+
+    def __init__(self, buckets_ms=WAIT_HISTOGRAM_BUCKETS_MS):
+        self.buckets_ms = buckets_ms
+        self.counts = [0] * (len(buckets_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, wait_ms: float):
+        """待ち時間を記録"""
+        index = len(self.buckets_ms)
+        for i, upper in enumerate(self.buckets_ms):
+            if wait_ms <= upper:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ms += wait_ms
+        self.max_ms = max(self.max_ms, wait_ms)
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"<={upper}ms" for upper in self.buckets_ms] + [f">{self.buckets_ms[-1]}ms"]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class PriorityTaskScheduler:
+    """
+    エージング付き優先度スケジューラー
+
+    全優先度のタスクを1つのヒープで管理し、asyncio.Condition で待機中のワーカーを
+    投入と同時に起床させる（ポーリングなし）。ヒープのキーは
+    「投入時刻 + 優先度段階 × AGING_STEP_SECONDS」のため、低優先度タスクも
+    一定時間後には後続の高優先度タスクより先に取り出される。
+    """
+
+    def __init__(
+        self,
+        aging_step_seconds: float = AGING_STEP_SECONDS,
+        capacity: Optional[Dict[EventPriority, int]] = None,
+    ):
+        self.aging_step_seconds = aging_step_seconds
+        self.capacity = dict(capacity or QUEUE_CAPACITY)
+        self._heap: List[tuple] = []
+        self._sequence = itertools.count()
+        self._sizes: Dict[EventPriority, int] = {priority: 0 for priority in EventPriority}
+        self._condition = asyncio.Condition()
+        self._closed = False
+        self.wait_histograms: Dict[EventPriority, QueueWaitHistogram] = {
+            priority: QueueWaitHistogram() for priority in EventPriority
+        }
+
+    def _is_full(self, priority: EventPriority) -> bool:
+        return self._sizes[priority] >= self.capacity.get(priority, 0)
+
+    def _push(self, task: ProcessingTask):
+        enqueued_at = time.monotonic()
+        key = enqueued_at + (task.priority.value - 1) * self.aging_step_seconds
+        heapq.heappush(self._heap, (key, next(self._sequence), enqueued_at, task))
+        self._sizes[task.priority] += 1
+        # 取り出し待ちのワーカーを起床
+        self._condition.notify_all()
+
+    async def put(self, task: ProcessingTask):
+        """タスクを投入（該当優先度のキューが満杯の場合は空きを待つ）"""
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._is_full(task.priority))
+            self._push(task)
+
+    async def get(self) -> Optional[ProcessingTask]:
+        """
+        次のタスクを取り出す（タスクがない場合は投入まで待機）
+
+        Returns:
+            タスク（close() 後にキューが空になった場合は None）
+        """
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._heap or self._closed)
+            if not self._heap:
+                return None
+            _key, _seq, enqueued_at, task = heapq.heappop(self._heap)
+            self._sizes[task.priority] -= 1
+            self.wait_histograms[task.priority].observe((time.monotonic() - enqueued_at) * 1000)
+            # 容量待ちの投入側を起床
+            self._condition.notify_all()
+            return task
+
+    async def close(self):
+        """待機中のワーカーを終了させる（残りのタスクは取り出し可能）"""
+        async with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def qsize(self, priority: Optional[EventPriority] = None) -> int:
+        """処理待ちタスク数（優先度指定時はその優先度のみ）"""
+        if priority is not None:
+            return self._sizes[priority]
+        return len(self._heap)
+
+    def empty(self) -> bool:
+        return not self._heap
+
+    def get_wait_histograms(self) -> Dict[str, Dict[str, Any]]:
+        """優先度ごとのキュー待ち時間ヒストグラム"""
+        return {
+            priority.name: histogram.to_dict()
+            for priority, histogram in self.wait_histograms.items()
+        }
+
+
 class ParallelEventProcessor:
     """
     並列イベント処理システム
@@ -90,7 +239,7 @@ class ParallelEventProcessor:
     - 複数ワーカー並列実行
     - 動的負荷分散
     - 優先度ベースキューイング
-    - 自動スケーリング
+    - 依存サービスのレイテンシに基づく同時実行数制御（AIMD）
     - 障害回復
     """
     
@@ -99,15 +248,16 @@ class ParallelEventProcessor:
         self.auto_scale = auto_scale
         self.workers: Dict[str, WorkerMetrics] = {}
         
-        # 優先度別キュー
-        self.task_queues: Dict[EventPriority, asyncio.Queue] = {
-            EventPriority.HIGH: asyncio.Queue(maxsize=100),
-            EventPriority.MEDIUM: asyncio.Queue(maxsize=200),
-            EventPriority.LOW: asyncio.Queue(maxsize=500)
-        }
+        # 優先度スケジューラー（全優先度共通のヒープ）
+        self.scheduler = PriorityTaskScheduler()
+        
+        # 同時実行数リミッター（ワーカー数はこの上限に追従する）
+        self.limiter = AIMDConcurrencyLimiter(
+            max_limit=max_workers, initial_limit=min(4, max_workers)
+        )
         
         # 処理統計
-        self.processing_stats = {
+        self.processing_stats: ProcessingStats = {
             "total_tasks_processed": 0,
             "total_tasks_failed": 0,
             "avg_processing_time": 0.0,
@@ -125,8 +275,10 @@ class ParallelEventProcessor:
         self.shutdown_event = asyncio.Event()
         
         # ワーカータスク
-        self.worker_tasks: List[asyncio.Task] = []
+        self.worker_tasks: Dict[str, asyncio.Task] = {}
         self.monitor_task: Optional[asyncio.Task] = None
+        self._worker_sequence = itertools.count()
+        self._idle_cycles = 0
         
     async def initialize(self):
         """並列処理システム初期化"""
@@ -134,8 +286,8 @@ class ParallelEventProcessor:
         
         # 初期ワーカー作成
         initial_workers = min(4, self.max_workers)  # 最初は4つのワーカー
-        for i in range(initial_workers):
-            await self._create_worker(f"worker_{i}")
+        for _ in range(initial_workers):
+            await self._create_worker(f"worker_{next(self._worker_sequence)}")
         
         # 監視タスク開始
         self.monitor_task = asyncio.create_task(self._monitor_system())
@@ -150,20 +302,23 @@ class ParallelEventProcessor:
         self.is_running = False
         self.shutdown_event.set()
         
-        # 全ワーカータスクの停止
-        for task in self.worker_tasks:
-            task.cancel()
-        
         # 監視タスクの停止
         if self.monitor_task:
             self.monitor_task.cancel()
         
+        # 新規の待機を終了し、ワーカーは残りのタスクを処理してから停止
+        await self.scheduler.close()
+        
         # 未処理タスクの待機（最大10秒）
         try:
             await asyncio.wait_for(self._wait_for_completion(), timeout=10.0)
         except asyncio.TimeoutError:
             logger.warning("Shutdown timeout - some tasks may be incomplete")
         
+        # 残ったワーカータスクの停止
+        for task in self.worker_tasks.values():
+            task.cancel()
+        
         logger.info("Parallel processor shutdown completed")
         
     async def add_event_handler(self, event_type: str, handler: Callable):
@@ -197,14 +352,10 @@ class ParallelEventProcessor:
             created_at=datetime.now(timezone.utc)
         )
         
-        # 優先度キューに追加
-        try:
-            await self.task_queues[priority].put(task)
-            logger.debug(f"Task {task_id} queued with priority {priority.name}")
-            return task_id
-        except asyncio.QueueFull:
-            logger.error(f"Queue full for priority {priority.name}")
-            raise Exception(f"Processing queue full for priority {priority.name}")
+        # スケジューラーに追加（満杯の場合は空きを待つ）
+        await self.scheduler.put(task)
+        logger.debug(f"Task {task_id} queued with priority {priority.name}")
+        return task_id
     
     async def process_batch(self, events: List[Dict[str, Any]]) -> List[str]:
         """
@@ -239,12 +390,8 @@ class ParallelEventProcessor:
                 task_ids.append(task_id)
             
             # バッチキューイング
-            queue = self.task_queues[priority]
             for task in batch_tasks:
-                try:
-                    await queue.put(task)
-                except asyncio.QueueFull:
-                    logger.warning(f"Queue full for priority {priority.name}, dropping task {task.task_id}")
+                await self.scheduler.put(task)
         
         logger.info(f"Batch queued: {len(task_ids)} tasks across priorities")
         return task_ids
@@ -272,7 +419,7 @@ class ParallelEventProcessor:
         
         # ワーカータスク開始
         worker_task = asyncio.create_task(self._worker_loop(worker_id))
-        self.worker_tasks.append(worker_task)
+        self.worker_tasks[worker_id] = worker_task
         
         logger.info(f"Created worker: {worker_id}")
         
@@ -281,27 +428,26 @@ class ParallelEventProcessor:
         metrics = self.workers[worker_id]
         
         try:
-            while self.is_running and not self.shutdown_event.is_set():
+            while True:
                 task = None
                 
                 try:
-                    # 優先度順にタスク取得
-                    task = await self._get_next_task()
+                    # 優先度順にタスク取得（投入されるまで待機）
+                    task = await self.scheduler.get()
                     
                     if task is None:
-                        # タスクがない場合は短時間待機
-                        await asyncio.sleep(0.1)
-                        continue
+                        # シャットダウン後にキューが空になった
+                        break
                     
                     # タスク処理
                     metrics.status = WorkerStatus.PROCESSING
                     metrics.current_task = task.task_id
                     metrics.last_activity = datetime.now(timezone.utc)
                     
-                    start_time = time.time()
-                    
-                    # 実際の処理実行
-                    await self._process_task(task)
+                    # 実際の処理実行（同時実行数の上限に達している場合は枠が空くまで待機）
+                    async with self.limiter.slot():
+                        start_time = time.time()
+                        await self._process_task(task)
                     
                     # 処理時間記録
                     processing_time = time.time() - start_time
@@ -319,9 +465,6 @@ class ParallelEventProcessor:
                         await self._handle_task_error(task, e)
                     
                     logger.error(f"Worker {worker_id} error processing task: {e}")
-                    
-                    # エラー後の短時間待機
-                    await asyncio.sleep(1.0)
                 
                 finally:
                     # ワーカー状態リセット
@@ -336,22 +479,6 @@ class ParallelEventProcessor:
             metrics.status = WorkerStatus.SHUTDOWN
             logger.info(f"Worker {worker_id} stopped")
     
-    async def _get_next_task(self) -> Optional[ProcessingTask]:
-        """次のタスクを優先度順に取得"""
-        # 高優先度から順に確認
-        for priority in [EventPriority.HIGH, EventPriority.MEDIUM, EventPriority.LOW]:
-            queue = self.task_queues[priority]
-            
-            try:
-                # ノンブロッキングで取得
-                task = queue.get_nowait()
-                queue.task_done()
-                return task
-            except asyncio.QueueEmpty:
-                continue
-        
-        return None
-    
     async def _process_task(self, task: ProcessingTask):
         """個別タスク処理"""
         event_data = task.event_data
@@ -385,43 +512,50 @@ class ParallelEventProcessor:
         logger.debug(f"Default processing: {event_type} from {user_id}")
         
         # event_routerにフォールバック（実際のデータベース保存処理）
+        from worker.event_router import EventResult, event_router
+
         try:
-            from worker.event_router import event_router
             from db.session import SessionLocal
             
             db = SessionLocal()
             try:
-                success = await event_router.route_event(event_data, db)
-                if success:
-                    logger.debug(f"Event {event_type} processed successfully via event_router fallback")
-                else:
-                    logger.warning(f"Event {event_type} processing failed via event_router fallback")
+                result = await event_router.route_event(event_data, db)
             finally:
                 db.close()
         except Exception as e:
             logger.error(f"Default event handler fallback error: {e}")
+            result = EventResult.RETRY
         
         # 統計更新
         self.processing_stats["total_tasks_processed"] += 1
+
+        if result is EventResult.PERMANENT:
+            # 再試行しても成功しない（検証エラー・必須フィールドの欠落）ためデッドレターに移す
+            from core.retry_queue import event_retry_queue
+
+            await event_retry_queue.dead_letter([event_data], error=f"Event {event_type} is invalid")
+            self.processing_stats["total_tasks_failed"] += 1
+            return
+        if result is not EventResult.OK:
+            # 失敗は _handle_task_error で遅延リトライに回す
+            raise RuntimeError(f"Event {event_type} processing failed via event_router fallback")
+        logger.debug(f"Event {event_type} processed successfully via event_router fallback")
     
     async def _handle_task_error(self, task: ProcessingTask, error: Exception):
-        """タスクエラー処理"""
-        task.retries += 1
+        """
+        タスクエラー処理
         
-        if task.retries <= task.max_retries:
-            # リトライ
-            logger.warning(f"Retrying task {task.task_id} ({task.retries}/{task.max_retries})")
-            
-            # 指数バックオフで再キューイング
-            await asyncio.sleep(0.5 * (2 ** task.retries))
-            
-            try:
-                await self.task_queues[task.priority].put(task)
-            except asyncio.QueueFull:
-                logger.error(f"Failed to requeue task {task.task_id}")
-        else:
-            # 最大リトライ回数到達
-            logger.error(f"Task {task.task_id} failed permanently after {task.retries} retries: {error}")
+        ワーカーをバックオフ中に待機させないよう、失敗したイベントは遅延リトライキューに
+        登録する（最大試行回数を超えたものはデッドレターへ移動される）。
+        """
+        from core.retry_queue import event_retry_queue
+        
+        task.retries += 1
+        try:
+            await event_retry_queue.schedule([task.event_data], error=str(error))
+            logger.warning(f"Task {task.task_id} scheduled for delayed retry: {error}")
+        except Exception as e:
+            logger.error(f"Task {task.task_id} failed permanently (retry scheduling failed: {e}): {error}")
             self.processing_stats["total_tasks_failed"] += 1
     
     async def _monitor_system(self):
@@ -453,8 +587,8 @@ class ParallelEventProcessor:
         self.processing_stats["active_workers"] = active_workers
         
         # キューサイズ
-        for priority, queue in self.task_queues.items():
-            self.processing_stats["queue_sizes"][priority.name] = queue.qsize()
+        for priority in EventPriority:
+            self.processing_stats["queue_sizes"][priority.name] = self.scheduler.qsize(priority)
         
         # 平均処理時間
         if self.workers:
@@ -463,21 +597,52 @@ class ParallelEventProcessor:
                 self.processing_stats["avg_processing_time"] = sum(avg_times) / len(avg_times)
     
     async def _auto_scale_workers(self):
-        """自動ワーカースケーリング"""
-        # 高優先度キューの負荷チェック
-        high_queue_size = self.task_queues[EventPriority.HIGH].qsize()
+        """
+        自動ワーカースケーリング
+        
+        依存サービスのレイテンシから同時実行数の上限を調整し、ワーカー数を上限に追従させる。
+        """
+        await self.limiter.adjust()
+        target_workers = min(self.limiter.current_limit, self.max_workers)
+        
+        # キューの負荷チェック
+        queue_size = self.scheduler.qsize()
         active_workers = self.processing_stats["active_workers"]
+        self._idle_cycles = self._idle_cycles + 1 if queue_size == 0 else 0
         
-        # スケールアップ条件
-        if high_queue_size > 20 and active_workers < self.max_workers:
-            new_worker_id = f"worker_{len(self.workers)}"
+        # スケールアップ条件: 処理待ちがあり、上限までワーカーに余裕がある
+        if queue_size > 0 and active_workers < target_workers:
+            new_worker_id = f"worker_{next(self._worker_sequence)}"
             await self._create_worker(new_worker_id)
             logger.info(f"Scaled up: created {new_worker_id} (total: {active_workers + 1})")
         
-        # スケールダウン条件（簡易版）
-        elif high_queue_size == 0 and active_workers > 2:
-            # 実装簡易化のため、スケールダウンは手動またはより複雑なロジックで
-            pass
+        # スケールダウン条件: 上限を超えている、またはキューが空の状態が続いたらアイドルワーカーを1つ停止
+        elif active_workers > max(target_workers, MIN_WORKERS) or (
+            self._idle_cycles >= SCALE_DOWN_IDLE_CYCLES and active_workers > MIN_WORKERS
+        ):
+            if await self._retire_idle_worker():
+                self._idle_cycles = 0
+    
+    async def _retire_idle_worker(self) -> bool:
+        """
+        アイドル状態のワーカーを1つ停止する
+
+        アイドルワーカーはスケジューラーの取り出し待ちで停止しているため、
+        キャンセルしても処理中のタスクは失われない。
+        """
+        for worker_id, metrics in self.workers.items():
+            if metrics.status != WorkerStatus.IDLE:
+                continue
+            worker_task = self.worker_tasks.pop(worker_id)
+            worker_task.cancel()
+            try:
+                await worker_task
+            except asyncio.CancelledError:
+                pass
+            del self.workers[worker_id]
+            logger.info(f"Scaled down: stopped {worker_id} (total: {len(self.workers)})")
+            return True
+        return False
     
     async def _health_check(self):
         """ヘルスチェック"""
@@ -493,13 +658,16 @@ class ParallelEventProcessor:
     
     async def _wait_for_completion(self):
         """未処理タスクの完了待機"""
-        # 全キューが空になるまで待機
-        while any(not queue.empty() for queue in self.task_queues.values()):
-            await asyncio.sleep(0.1)
+        # 全ワーカーが残りのタスクを処理して停止するまで待機
+        await asyncio.gather(*self.worker_tasks.values(), return_exceptions=True)
     
+    def get_queue_depth(self) -> int:
+        """全優先度キューの処理待ちタスク数"""
+        return self.scheduler.qsize()
+        
     def get_statistics(self) -> Dict[str, Any]:
         """処理統計取得"""
-        stats = dict(self.processing_stats)
+        stats: Dict[str, Any] = dict(self.processing_stats)
         
         # ワーカー詳細追加
         stats["workers"] = {
@@ -513,6 +681,12 @@ class ParallelEventProcessor:
             for worker_id, metrics in self.workers.items()
         }
         
+        # 優先度ごとのキュー待ち時間ヒストグラム
+        stats["queue_wait_ms"] = self.scheduler.get_wait_histograms()
+        
+        # 同時実行数の上限・依存サービスのレイテンシ・変更理由
+        stats["concurrency"] = self.limiter.get_statistics()
+        
         return stats
 
 
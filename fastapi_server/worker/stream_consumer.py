@@ -0,0 +1,368 @@
+"""
+Redis Streams コンシューマーモジュール
+
+EVENT_INGEST_MODE=stream の場合に、進捗イベントをコンシューマーグループ経由で読み込みます。
+
+特徴:
+- XREADGROUP によるブロック単位の読み込み（複数ワーカープロセスで分散処理）
+- 処理・コミット完了後の XACK
+- 起動時に自コンシューマーの未ACKエントリ（XREADGROUP ID 0）を先に再処理
+- XAUTOCLAIM による停止したコンシューマーの未ACKエントリ回収
+- 未ACKエントリを持たない長時間アイドルのコンシューマーの削除
+- 最大配信回数を超えたエントリのデッドレターストリームへの移動（ポイズンメッセージ対策）
+- ACK済みエントリのみの XTRIM MINID（未配信・未ACKのエントリは削除しない）
+"""
+
+import json
+import logging
+import socket
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+
+from core.config import settings
+from core.retry_queue import event_retry_queue
+from db.redis_client import (
+    PROGRESS_CONSUMER_GROUP,
+    PROGRESS_STREAM,
+    ensure_progress_consumer_group,
+)
+
+logger = logging.getLogger(__name__)
+
+# (エントリID, フィールド辞書)
+StreamEntry = Tuple[str, Dict[str, Any]]
+
+
+def _stream_id_key(entry_id: str) -> Tuple[int, int]:
+    """ストリームID（"ミリ秒-連番"）を比較可能なタプルに変換"""
+    millis, _, seq = entry_id.partition("-")
+    return int(millis), int(seq or 0)
+
+
+def default_consumer_name(shard: int = 0) -> str:
+    """
+    ホスト名とシャード番号からコンシューマー名を生成
+
+    再起動しても同じ名前になるため、前回のプロセスが残した未ACKエントリを
+    read_pending で自分のものとして再処理でき、コンシューマーも増え続けない。
+    """
+    return f"{socket.gethostname()}-shard-{shard}"
+
+
+class ProgressStreamConsumer:
+    """進捗ストリームのコンシューマーグループ読み込みを管理するクラス"""
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        consumer_name: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        block_ms: Optional[int] = None,
+        claim_idle_ms: Optional[int] = None,
+        max_deliveries: Optional[int] = None,
+        stream: str = PROGRESS_STREAM,
+        stale_consumer_ms: Optional[int] = None,
+    ):
+        self.redis_client = redis_client
+        # 読み込むストリーム（シャーディング時はシャードごとのストリーム）
+        self.stream = stream
+        self.consumer_name = (
+            consumer_name or settings.WORKER_CONSUMER_NAME or default_consumer_name()
+        )
+        self.batch_size = batch_size or settings.WORKER_STREAM_BATCH_SIZE
+        self.block_ms = block_ms or settings.WORKER_STREAM_BLOCK_MS
+        self.claim_idle_ms = claim_idle_ms or settings.WORKER_STREAM_CLAIM_IDLE_MS
+        self.max_deliveries = max_deliveries or settings.WORKER_STREAM_MAX_DELIVERIES
+        self.stale_consumer_ms = (
+            stale_consumer_ms or settings.WORKER_STREAM_STALE_CONSUMER_MS
+        )
+
+        # XAUTOCLAIMの走査カーソル
+        self._claim_cursor = "0-0"
+        # 自コンシューマーの未ACKエントリの走査カーソル
+        self._pending_cursor = "0"
+
+        # 統計
+        self.stats = {
+            "read_entries": 0,
+            "acked_entries": 0,
+            "claimed_entries": 0,
+            "dropped_entries": 0,
+            "trimmed_entries": 0,
+            "removed_consumers": 0,
+        }
+
+    async def initialize(self):
+        """コンシューマーグループを準備"""
+        await ensure_progress_consumer_group(self.redis_client, self.stream)
+        logger.info(
+            f"Stream consumer '{self.consumer_name}' ready on "
+            f"{self.stream}/{PROGRESS_CONSUMER_GROUP}"
+        )
+
+    async def read_batch(self) -> List[StreamEntry]:
+        """
+        新着エントリを最大 batch_size 件読み込む（最大 block_ms ミリ秒ブロック）
+
+        Returns:
+            (エントリID, フィールド辞書) のリスト
+        """
+        response = await self.redis_client.xreadgroup(
+            groupname=PROGRESS_CONSUMER_GROUP,
+            consumername=self.consumer_name,
+            streams={self.stream: ">"},
+            count=self.batch_size,
+            block=self.block_ms,
+        )
+        entries: List[StreamEntry] = []
+        for _stream, stream_entries in response or []:
+            entries.extend(stream_entries)
+
+        self.stats["read_entries"] += len(entries)
+        return entries
+
+    async def read_pending(self) -> List[StreamEntry]:
+        """
+        自コンシューマーに配信済みで未ACKのエントリを最大 batch_size 件読み込む
+
+        同じ名前の前回のプロセスが処理途中で終了した場合に残るエントリで、新着（">"）より
+        先に処理する。カーソルを進めるため、再処理に失敗したエントリで停止することはない。
+        トリム済みで本文が消えたエントリはACKして除外する。
+
+        Returns:
+            (エントリID, フィールド辞書) のリスト（空の場合は未ACKエントリを読み切った）
+        """
+        while True:
+            response = await self.redis_client.xreadgroup(
+                groupname=PROGRESS_CONSUMER_GROUP,
+                consumername=self.consumer_name,
+                streams={self.stream: self._pending_cursor},
+                count=self.batch_size,
+            )
+            pending: List[StreamEntry] = []
+            for _stream, stream_entries in response or []:
+                pending.extend(stream_entries)
+            if not pending:
+                return []
+
+            self._pending_cursor = pending[-1][0]
+            deleted_ids = [entry_id for entry_id, fields in pending if not fields]
+            if deleted_ids:
+                await self.ack(deleted_ids)
+
+            # 本文が消えたエントリのみの場合は続きを読む
+            entries = [(entry_id, fields) for entry_id, fields in pending if fields]
+            if entries:
+                self.stats["read_entries"] += len(entries)
+                logger.warning(
+                    f"Re-reading {len(entries)} pending stream entries of '{self.consumer_name}'"
+                )
+                return entries
+
+    async def claim_stale(self) -> List[StreamEntry]:
+        """
+        claim_idle_ms 以上ACKされていないエントリを自コンシューマーに回収する
+
+        最大配信回数を超えたエントリはデッドレターストリームに移してACKし、戻り値には含めません。
+        デッドレターへの登録に失敗した場合はACKせず、次回の回収で再度移動を試みます。
+
+        Returns:
+            再処理すべき (エントリID, フィールド辞書) のリスト
+        """
+        response = await self.redis_client.xautoclaim(
+            self.stream,
+            PROGRESS_CONSUMER_GROUP,
+            self.consumer_name,
+            min_idle_time=self.claim_idle_ms,
+            start_id=self._claim_cursor,
+            count=self.batch_size,
+        )
+        # Redis 7 は [next_cursor, entries, deleted_ids] を返す
+        next_cursor, claimed = response[0], response[1]
+        self._claim_cursor = next_cursor or "0-0"
+
+        # トリム済みで本文が消えたエントリ（None）は処理対象外
+        claimed = [(entry_id, fields) for entry_id, fields in claimed if fields]
+        if not claimed:
+            return []
+
+        delivery_counts = await self._get_delivery_counts(
+            [entry_id for entry_id, _ in claimed]
+        )
+
+        entries: List[StreamEntry] = []
+        dropped_ids: List[str] = []
+        for entry_id, fields in claimed:
+            if delivery_counts.get(entry_id, 0) > self.max_deliveries:
+                dropped_ids.append(entry_id)
+            else:
+                entries.append((entry_id, fields))
+
+        if dropped_ids:
+            await self._dead_letter(
+                [
+                    (entry_id, fields)
+                    for entry_id, fields in claimed
+                    if entry_id in dropped_ids
+                ],
+                delivery_counts,
+            )
+
+        self.stats["claimed_entries"] += len(entries)
+        if entries:
+            logger.warning(
+                f"Claimed {len(entries)} stale stream entries for reprocessing"
+            )
+        return entries
+
+    async def _dead_letter(
+        self, entries: List[StreamEntry], delivery_counts: Dict[str, int]
+    ):
+        """最大配信回数を超えたエントリをデッドレターストリームに移してACKする"""
+        events: List[Dict[str, Any]] = []
+        for _entry_id, fields in entries:
+            try:
+                events.append(json.loads(fields.get("data", "")))
+            except (json.JSONDecodeError, TypeError):
+                # 解析できない本文もそのまま保管する
+                events.append({"raw": fields.get("data")})
+        entry_ids = [entry_id for entry_id, _ in entries]
+        try:
+            await event_retry_queue.dead_letter(
+                events,
+                error=f"最大配信回数({self.max_deliveries})を超えました",
+                attempts=[
+                    delivery_counts.get(entry_id, 1) - 1 for entry_id in entry_ids
+                ],
+            )
+        except Exception as e:
+            logger.error(f"Failed to dead-letter {len(entry_ids)} stream entries: {e}")
+            return
+
+        await self.ack(entry_ids)
+        self.stats["dropped_entries"] += len(entry_ids)
+        logger.error(
+            f"Moved {len(entry_ids)} stream entries exceeding "
+            f"{self.max_deliveries} deliveries to dead letter: {entry_ids[:5]}"
+        )
+
+    async def _get_delivery_counts(self, entry_ids: List[str]) -> Dict[str, int]:
+        """
+        エントリごとの配信回数をXPENDINGから取得
+
+        ID範囲での一括取得は範囲内の他のペンディングエントリで件数上限に達すると
+        一部のIDが欠けるため、IDごとに範囲をそのIDのみに絞ってパイプラインで取得する。
+        """
+        pipe = self.redis_client.pipeline(transaction=False)
+        for entry_id in entry_ids:
+            pipe.xpending_range(
+                self.stream,
+                PROGRESS_CONSUMER_GROUP,
+                min=entry_id,
+                max=entry_id,
+                count=1,
+                consumername=self.consumer_name,
+            )
+        results = await pipe.execute()
+        return {
+            item["message_id"]: item["times_delivered"]
+            for pending in results
+            for item in pending
+        }
+
+    async def remove_stale_consumers(self) -> int:
+        """
+        stale_consumer_ms 以上アイドルで未ACKエントリを持たないコンシューマーを削除する
+
+        未ACKエントリを持つコンシューマーは claim_stale で回収されるまで残す。
+
+        Returns:
+            削除したコンシューマー数
+        """
+        consumers = await self.redis_client.xinfo_consumers(
+            self.stream, PROGRESS_CONSUMER_GROUP
+        )
+        removed = 0
+        for consumer in consumers:
+            name = consumer.get("name")
+            if (
+                name == self.consumer_name
+                or consumer.get("pending", 0)
+                or consumer.get("idle", 0) < self.stale_consumer_ms
+            ):
+                continue
+            await self.redis_client.xgroup_delconsumer(
+                self.stream, PROGRESS_CONSUMER_GROUP, name
+            )
+            removed += 1
+
+        if removed:
+            self.stats["removed_consumers"] += removed
+            logger.info(
+                f"Removed {removed} stale consumers from {self.stream}/{PROGRESS_CONSUMER_GROUP}"
+            )
+        return removed
+
+    async def ack(self, entry_ids: List[str]) -> int:
+        """処理済みエントリをACKする"""
+        if not entry_ids:
+            return 0
+        acked = await self.redis_client.xack(
+            self.stream, PROGRESS_CONSUMER_GROUP, *entry_ids
+        )
+        self.stats["acked_entries"] += acked
+        return acked
+
+    async def trim_acked(self) -> int:
+        """
+        コンシューマーグループがACKしたエントリをストリームから削除する
+
+        最後に配信したID（先に取得）と最古のペンディングIDの小さい方より前のエントリは
+        すべて配信済みかつACK済みのため、XTRIM MINID でそれより前のみを削除する。
+
+        Returns:
+            削除したエントリ数
+        """
+        groups = await self.redis_client.xinfo_groups(self.stream)
+        last_delivered = next(
+            (
+                group.get("last-delivered-id")
+                for group in groups
+                if group.get("name") == PROGRESS_CONSUMER_GROUP
+            ),
+            None,
+        )
+        if not last_delivered or _stream_id_key(last_delivered) == (0, 0):
+            return 0
+
+        min_id = last_delivered
+        pending = await self.redis_client.xpending(self.stream, PROGRESS_CONSUMER_GROUP)
+        if pending.get("pending") and pending.get("min"):
+            min_id = min(min_id, pending["min"], key=_stream_id_key)
+
+        trimmed = await self.redis_client.xtrim(
+            self.stream, minid=min_id, approximate=True
+        )
+        self.stats["trimmed_entries"] += trimmed
+        return trimmed
+
+    async def get_lag(self) -> Dict[str, Any]:
+        """コンシューマーグループの未処理件数（lag / pending）を取得"""
+        groups = await self.redis_client.xinfo_groups(self.stream)
+        for group in groups:
+            if group.get("name") == PROGRESS_CONSUMER_GROUP:
+                return {
+                    "pending": group.get("pending", 0),
+                    "lag": group.get("lag"),
+                    "consumers": group.get("consumers", 0),
+                }
+        return {"pending": 0, "lag": None, "consumers": 0}
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """読み込み統計を取得"""
+        return {
+            "consumer_name": self.consumer_name,
+            "stream": self.stream,
+            **self.stats,
+        }